@@ -0,0 +1,77 @@
+"""Compare the startup time of recording a job with slurmise-epilog and slurmise record.
+
+Each command is run as a new process which records a job in a temporary base
+dir, `slurmise record --defer` so neither queries sacct.  The time of an empty
+python process is subtracted, leaving the cost of the imports and the record.
+Exits with 1 when the epilog takes longer than the budget.
+
+Run with `python benchmarks/bench_epilog.py [--repeats R] [--budget MS]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TOML = """
+[slurmise]
+base_dir = "{base_dir}"
+
+[slurmise.job.nupack]
+job_spec = "monomer -T {{threads:numeric}} -C {{complexity:category}}"
+"""
+CMD = "nupack monomer -T 2 -C simple"
+EPILOG_SCRIPT = "import sys; from slurmise.epilog import main; sys.exit(main())"
+
+
+def best_time(args: list[str], repeats: int, env: dict) -> float:
+    """The fastest of repeats runs of args, with {run} replaced by the number of the run."""
+    best = float("inf")
+    for run in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([arg.format(run=run) for arg in args], check=True, env=env, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=50, help="Milliseconds allowed for the epilog")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        toml = Path(tmp) / "slurmise.toml"
+        toml.write_text(TOML.format(base_dir=Path(tmp) / "slurmise_dir"))
+        env = {**os.environ, "SLURMISE_TOML": str(toml)}
+        # installed packages have their bytecode cached, which the first run writes
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+        baseline = best_time([sys.executable, "-c", "pass"], args.repeats, env)
+        commands = {
+            # as run by the console script
+            "slurmise-epilog": [sys.executable, "-c", EPILOG_SCRIPT, "--slurm-id", "{run}", CMD],
+            "slurmise record --defer": [
+                *(sys.executable, "-m", "slurmise", "-t", str(toml)),
+                *("record", "--defer", "--slurm-id", "{run}", CMD),
+            ],
+        }
+        print(f"python startup: {baseline * 1000:.1f} ms")
+        print(f"{'command':>24} {'total (ms)':>11} {'overhead (ms)':>14}")
+        overheads = {}
+        for name, command in commands.items():
+            total = best_time(command, args.repeats, env)
+            overheads[name] = total - baseline
+            print(f"{name:>24} {total * 1000:>11.1f} {overheads[name] * 1000:>14.1f}")
+
+    if overheads["slurmise-epilog"] * 1000 > args.budget:
+        sys.exit(f"slurmise-epilog takes more than {args.budget:g} ms")
+
+
+if __name__ == "__main__":
+    main()
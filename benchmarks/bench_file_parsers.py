@@ -0,0 +1,109 @@
+"""Compare the native streaming file parsers against equivalent awk scripts.
+
+Each parser is timed on a small input, where the cost of starting awk (and
+gzip) dominates, and on a large input, where throughput dominates.
+
+Run with `python benchmarks/bench_file_parsers.py [--records N ...] [--repeats R]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from slurmise.job_parse import file_parsers
+
+# awk scripts as commonly found in slurmise toml files
+AWK_EQUIVALENTS = {
+    "fasta_records": ("fasta", "/^>/ {n++} END {print n}"),
+    "fasta_total_length": ("fasta", "!/^>/ {n += length($0)} END {print n}"),
+    "fastq_reads": ("fastq", "END {print NR / 4}"),
+    "vcf_records": ("vcf", "!/^#/ {n++} END {print n}"),
+    "sam_records": ("sam", "!/^@/ {n++} END {print n}"),
+}
+
+NATIVE_PARSERS = {
+    "fasta_records": file_parsers.FastaRecords(),
+    "fasta_total_length": file_parsers.FastaTotalLength(),
+    "fastq_reads": file_parsers.FastqReads(),
+    "vcf_records": file_parsers.VcfRecords(),
+    "sam_records": file_parsers.SamRecords(),
+}
+
+
+def _sequence(rng: random.Random, length: int) -> str:
+    return "".join(rng.choices("ACGT", k=length))
+
+
+def make_inputs(directory: Path, records: int, seed: int = 42) -> dict[str, Path]:
+    """Write synthetic fasta, fastq, vcf and sam files with `records` entries each."""
+    rng = random.Random(seed)
+    # sample a small pool of sequences to keep generation fast
+    pool = [_sequence(rng, 150) for _ in range(100)]
+    contents = {
+        "fasta": "".join(f">seq{i}\n{pool[i % 100]}\n{pool[(i + 1) % 100][:60]}\n" for i in range(records)),
+        "fastq": "".join(f"@read{i}\n{pool[i % 100]}\n+\n{'I' * 150}\n" for i in range(records)),
+        "vcf": "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+        + "".join(f"1\t{i}\t.\tA\tG\t50\tPASS\t.\n" for i in range(records)),
+        "sam": "@HD\tVN:1.6\n"
+        + "".join(f"read{i}\t0\t1\t{i}\t60\t150M\t*\t0\t0\t{pool[i % 100]}\t{'I' * 150}\n" for i in range(records)),
+    }
+
+    paths = {}
+    for kind, text in contents.items():
+        paths[kind] = directory / f"input.{kind}"
+        paths[kind].write_text(text)
+        paths[f"{kind}.gz"] = directory / f"input.{kind}.gz"
+        with gzip.open(paths[f"{kind}.gz"], "wt", compresslevel=1) as outfile:
+            outfile.write(text)
+    return paths
+
+
+def best_time(func, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, nargs="+", default=[1_000, 200_000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if shutil.which("awk") is None:
+        raise SystemExit("awk is required for the comparison")
+
+    print(f"{'parser':<20} {'records':>8} {'gzip':<5} {'awk (s)':>9} {'native (s)':>11} {'speedup':>8}")
+    for records in args.records:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench_records(Path(tmp), records, args.repeats)
+
+
+def bench_records(directory: Path, records: int, repeats: int) -> None:
+    paths = make_inputs(directory, records)
+    for name, (kind, script) in AWK_EQUIVALENTS.items():
+        awk = file_parsers.AwkParser(name, "numeric", script)
+        native = NATIVE_PARSERS[name]
+        for gzipped in (False, True):
+            path = paths[f"{kind}.gz" if gzipped else kind]
+            if awk.parse_file(path, gzip_file=gzipped) != [native.parse_file(path, gzip_file=gzipped)]:
+                raise SystemExit(f"{name} results differ from awk for {path}")
+            awk_time = best_time(lambda: awk.parse_file(path, gzip_file=gzipped), repeats)  # noqa: B023
+            native_time = best_time(lambda: native.parse_file(path, gzip_file=gzipped), repeats)  # noqa: B023
+            print(
+                f"{name:<20} {records:>8} {gzipped!s:<5} {awk_time:>9.4f} {native_time:>11.4f} "
+                f"{awk_time / native_time:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
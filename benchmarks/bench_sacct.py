@@ -0,0 +1,119 @@
+"""Compare parsing the json and parsable outputs of sacct.
+
+A synthetic job with a number of steps is rendered in both formats, with the
+json shaped like the output of `sacct --json` and its many unused fields.
+Each backend is timed on decoding and parsing the metadata of the last step,
+and the size of each output is reported as a proxy for the memory used.
+
+Run with `python benchmarks/bench_sacct.py [--steps N ...] [--repeats R]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+
+from slurmise import slurm
+
+TRES_TYPES = ("cpu", "mem", "energy", "fs/disk", "vmem", "pages", "gres/gpu", "billing")
+
+
+def _tres(mem: int) -> list[dict]:
+    return [
+        {"type": tres_type.split("/")[0], "name": tres_type.partition("/")[2], "id": i, "count": mem if i == 1 else i}
+        for i, tres_type in enumerate(TRES_TYPES)
+    ]
+
+
+def make_job(steps: int, job_id: int = 58976578) -> tuple[str, str]:
+    """Return the json and parsable sacct outputs of a job with `steps` steps."""
+    mem = 24786677760
+    json_steps = []
+    lines = [f"{job_id}|finetune|COMPLETED|main|97300|96|729088M|||||"]
+    for i in range(steps):
+        step_id = f"{job_id}.{i}"
+        usage = {statistic: _tres(mem) for statistic in ("max", "min", "average", "total")}
+        json_steps.append(
+            {
+                "step": {"id": step_id, "name": f"step{i}"},
+                "time": {
+                    "elapsed": 97201,
+                    "start": {"seconds": 1_700_000_000},
+                    "end": {"seconds": 1_700_097_201},
+                    "total": {"seconds": 3_600_000, "microseconds": 0},
+                },
+                "tasks": {"count": 3},
+                "nodes": {"count": 1, "range": "node001", "list": ["node001"]},
+                "state": ["COMPLETED"],
+                "exit_code": {"status": ["SUCCESS"], "return_code": {"set": True, "infinite": False, "number": 0}},
+                "statistics": {"CPU": {"actual_frequency": 0}, "energy": {"consumed": {"set": True, "number": 0}}},
+                "tres": {
+                    "requested": usage,
+                    "consumed": usage,
+                    "allocated": _tres(mem),
+                },
+                "task": {"distribution": "Cyclic"},
+                "pid": "",
+                "CPU": {"requested_frequency": {"min": {"set": False}, "max": {"set": False}}, "governor": ""},
+                "kill_request_user": "",
+            }
+        )
+        tres_usage = ",".join(f"{tres_type}={mem if j == 1 else j}" for j, tres_type in enumerate(TRES_TYPES))
+        lines.append(f"{step_id}|step{i}|COMPLETED||97201|96||3|{tres_usage}|41-16:00:00|{tres_usage}|{tres_usage}")
+
+    job = {
+        "job_id": job_id,
+        "name": "finetune",
+        "partition": "main",
+        "state": {"current": ["COMPLETED"], "reason": "None"},
+        "required": {
+            "CPUs": 96,
+            "memory_per_cpu": {"set": False, "infinite": False, "number": 0},
+            "memory_per_node": {"set": True, "infinite": False, "number": 729088},
+        },
+        "association": {"account": "lab", "cluster": "cluster", "partition": "", "user": "user"},
+        "tres": {"allocated": _tres(mem), "requested": _tres(mem)},
+        "steps": json_steps,
+    }
+    sacct_json = {"meta": {"plugin": {"type": "openapi/slurmdbd"}, "slurm": {"version": {"major": 23}}}, "jobs": [job]}
+    return json.dumps(sacct_json, indent=2), "\n".join(lines) + "\n"
+
+
+def parse_json(output: str) -> dict:
+    return slurm.parse_sacct_job(json.loads(output)["jobs"][0])
+
+
+def best_time(func, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, nargs="+", default=[3, 100, 1_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'steps':>6} {'json (KB)':>10} {'parsable (KB)':>14} {'json (ms)':>10} {'parsable (ms)':>14} {'speedup':>8}"
+    )
+    for steps in args.steps:
+        json_output, parsable_output = make_job(steps)
+        if parse_json(json_output) != slurm.parse_sacct_parsable(parsable_output):
+            sys.exit(f"Metadata differs between the backends for {steps} steps")
+        json_time = best_time(lambda: parse_json(json_output), args.repeats)  # noqa: B023
+        parsable_time = best_time(lambda: slurm.parse_sacct_parsable(parsable_output), args.repeats)  # noqa: B023
+        print(
+            f"{steps:>6} {len(json_output) / 1024:>10.1f} {len(parsable_output) / 1024:>14.1f} "
+            f"{json_time * 1000:>10.3f} {parsable_time * 1000:>14.3f} {json_time / parsable_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
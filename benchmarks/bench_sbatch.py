@@ -0,0 +1,75 @@
+"""Time building the sbatch command of a job with a fitted model, as on every submission.
+
+A polynomial model is fit on synthetic jobs in a temporary base dir, then the
+command of a job is parsed, its model loaded and evaluated, and its sbatch
+arguments built, in a process which has already imported slurmise.  Exits
+with 1 when the median takes longer than the budget.
+
+Run with `python benchmarks/bench_sbatch.py [--jobs N] [--repeats R] [--budget MS]`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from slurmise.api import Slurmise
+from slurmise.job_data import JobData
+
+TOML = """
+[slurmise]
+base_dir = "{base_dir}"
+
+[slurmise.job.nupack]
+job_spec = "monomer -T {{threads:numeric}} -S {{sequences:numeric}} -C {{complexity:category}}"
+"""
+CMD = "nupack monomer -T 4 -S 300 -C simple"
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=500, help="Recorded jobs the model is fit on")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--budget", type=float, default=50, help="Milliseconds allowed per command")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        toml = Path(tmp) / "slurmise.toml"
+        toml.write_text(TOML.format(base_dir=Path(tmp) / "slurmise_dir"))
+        slurmise = Slurmise(toml)
+        for slurm_id in range(args.jobs):
+            threads, sequences = rng.randint(1, 16), rng.randint(10, 1000)
+            slurmise.raw_record(
+                JobData(
+                    job_name="nupack",
+                    slurm_id=str(slurm_id),
+                    categories={"complexity": "simple"},
+                    numerics={"threads": threads, "sequences": sequences},
+                    memory=sequences * rng.uniform(1.5, 2.5),
+                    runtime=sequences / threads * rng.uniform(0.5, 1.5),
+                ),
+                processed_data=True,
+            )
+        slurmise.update_model(CMD, None)
+
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            command, _ = slurmise.sbatch_command(CMD, ["job.sh"])
+            times.append(time.perf_counter() - start)
+
+    median = statistics.median(times) * 1000
+    print(" ".join(command))
+    print(f"median {median:.1f} ms, fastest {min(times) * 1000:.1f} ms over {args.repeats} commands")
+    if median > args.budget:
+        sys.exit(f"Building the sbatch command takes more than {args.budget:g} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,37 @@
 from __future__ import annotations
 
+import datetime
 import json
+import os
+import shlex
 import sys
+import time
 
 import click
 
-from slurmise import job_data
+from slurmise import job_data, monitoring, profiling
 from slurmise.api import Slurmise
+from slurmise.fit import MODEL_REGISTRY
+
+# bench, ingest and simulate are imported by their commands to keep them out of the
+# start up of every other command.  The choices of their options are listed here,
+# test_main checks they match the modules.
+INGEST_FORMAT_CHOICES = ("snakemake", "nextflow", "csv")
+RUNTIME_UNIT_CHOICES = ("ms", "s", "m", "h", "d")
+MEMORY_UNIT_CHOICES = ("B", "KB", "MB", "GB", "TB")
+SIMULATE_MODEL_CHOICES = ("default", *MODEL_REGISTRY)
+BENCH_SCENARIO_CHOICES = ("record", "query", "iterate", "to_pandas", "fit", "predict", "predict_batch", "cold_start")
+# defaults of slurmise.bench.Workload
+BENCH_WORKLOAD_DEFAULTS = {
+    "jobs": 2,
+    "categories": 1,
+    "category_values": 2,
+    "numerics": 2,
+    "array_numerics": 1,
+    "array_length": 4,
+    "noise": 0.25,
+    "seed": 42,
+}
 
 
 def _parse_json_options(
@@ -32,12 +57,22 @@ def _report_prediction(query_jd: job_data.JobData, query_warns: list[str]) -> No
     """Helper function to report the prediction results."""
     click.echo(f"Predicted runtime: {query_jd.runtime}")
     click.echo(f"Predicted memory: {query_jd.memory}")
+    for metric, value in query_jd.metrics.items():
+        click.echo(f"Predicted {metric}: {value}")
     if query_warns:
         click.echo(click.style("Warnings:", fg="yellow"), err=True, color="red")
         for warn in query_warns:
             click.echo(f"  {warn}", err=True)
 
 
+def _json_default(value):
+    """Convert numpy scalars and arrays from file parsers for json."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    msg = f"Object of type {type(value).__name__} is not JSON serializable"
+    raise TypeError(msg)
+
+
 @click.group()
 @click.option(
     "--toml",
@@ -46,14 +81,24 @@ def _report_prediction(query_jd: job_data.JobData, query_warns: list[str]) -> No
     required=False,
     help="Path to the slurmise configuration file",
 )
+@click.option("--profile", is_flag=True, help="Print the time spent in each part of slurmise to stderr")
+@click.option("--profile-json", type=click.Path(dir_okay=False), help="Write the profile as JSON to this file")
+@click.option("--cprofile", type=click.Path(dir_okay=False), help="Dump cProfile stats of the command to this file")
 @click.pass_context
-def main(ctx, toml):
-    if toml is None:
+def main(ctx, toml, profile, profile_json, cprofile):
+    # bench writes its own configurations
+    if toml is None and ctx.invoked_subcommand != "bench":
         click.echo("Slurmise requires a toml file", err=True)
         click.echo("See readme for more information", err=True)
         sys.exit(1)
+    if profile or profile_json or cprofile:
+        profiling.PROFILER.enable(output=profile_json, cprofile=cprofile)
+    if profiling.PROFILER.enabled:
+        profiling.PROFILER.add("imports", time.perf_counter() - profiling.IMPORTED_AT)
+        ctx.call_on_close(profiling.PROFILER.report)
     ctx.ensure_object(dict)
-    ctx.obj["slurmise"] = Slurmise(toml)
+    if toml is not None:
+        ctx.obj["slurmise"] = Slurmise(toml)
 
 
 @main.command()
@@ -61,12 +106,13 @@ def main(ctx, toml):
 @click.option("--job-name", type=str, help="Name of the job")
 @click.option("--slurm-id", type=str, help="SLURM id of job")
 @click.option("--step-id", type=str, help="SLURM step id")
+@click.option("--defer", is_flag=True, help="Record without querying sacct, see fill-missing")
 @click.pass_context
-def record(ctx, cmd, job_name, slurm_id, step_id):
+def record(ctx, cmd, job_name, slurm_id, step_id, defer):
     """Command to record a job.
     For example: `slurmise record "-o 2 -i 3 -m fast"`
     """
-    ctx.obj["slurmise"].record(cmd, job_name, slurm_id, step_id)
+    ctx.obj["slurmise"].record(cmd, job_name, slurm_id, step_id, defer=defer)
 
 
 @main.command()
@@ -81,6 +127,26 @@ def parse(ctx, cmd, job_name):
     click.echo(parsed_output)
 
 
+@main.command()
+@click.argument("commands", type=click.File("r"), default="-")
+@click.option("--job-name", type=str, help="Name of the job, inferred from each command if not given")
+@click.option("--parse-files", is_flag=True, help="Run file parsers on file variables")
+@click.option("--diagnose", is_flag=True, help="Show how failing commands differ from their job spec")
+@click.pass_context
+def parse_batch(ctx, commands, job_name, parse_files, diagnose):
+    """Parse commands, one per line, from a file or stdin.
+    Prints each result as a line of JSON and exits with 1 if any command failed.
+    For example: `generate_commands | slurmise parse-batch - > parsed.jsonl`
+    """
+    failures = 0
+    for result in ctx.obj["slurmise"].parse_batch(commands, job_name, parse_files, diagnose):
+        failures += "error" in result
+        click.echo(json.dumps(result, default=_json_default))
+    if failures:
+        click.echo(f"{failures} commands failed to parse", err=True)
+        ctx.exit(1)
+
+
 @main.command()
 @click.option("--job-name", type=str, required=True, help="Name of the job")
 @click.option("--slurm-id", type=str, required=True, help="SLURM id of job")
@@ -96,14 +162,163 @@ def parse(ctx, cmd, job_name):
     help="Category run parameters in JSON format without outer {}",
 )
 @click.option("--cmd", type=str, help="Actual command run")
+@click.option("--defer", is_flag=True, help="Record without querying sacct, see fill-missing")
 @click.pass_context
-def raw_record(ctx, job_name, slurm_id, step_id, numerics, categories, cmd):
+def raw_record(ctx, job_name, slurm_id, step_id, numerics, categories, cmd, defer):
     """Record a job"""
     slurm_id = f"{slurm_id}.{step_id}" if step_id is not None else slurm_id
 
     jd = _parse_json_options(categories, numerics, job_name, cmd, slurm_id)
 
-    ctx.obj["slurmise"].raw_record(jd)
+    ctx.obj["slurmise"].raw_record(jd, defer=defer)
+
+
+@main.command()
+@click.argument("trace_format", type=click.Choice(INGEST_FORMAT_CHOICES))
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--job-name", type=str, help="Name of the job of every record, inferred from each record if not given")
+@click.option("--pattern", type=str, help="snakemake: path of benchmarks with wildcards, e.g. '{rule}/{sample}.tsv'")
+@click.option("--native-ids", is_flag=True, help="nextflow: use the native id of tasks as the slurm id")
+@click.option(
+    "--column",
+    "columns",
+    type=str,
+    multiple=True,
+    help="csv: column of a job field or variable as field=column, e.g. 'runtime=elapsed_min'",
+)
+@click.option(
+    "--runtime-unit",
+    type=click.Choice(RUNTIME_UNIT_CHOICES),
+    default="m",
+    show_default=True,
+    help="csv: unit of the runtime column",
+)
+@click.option(
+    "--memory-unit",
+    type=click.Choice(MEMORY_UNIT_CHOICES),
+    default="MB",
+    show_default=True,
+    help="csv: unit of the memory column",
+)
+@click.option("--delimiter", type=str, default=",", show_default=True, help="csv: column delimiter")
+@click.option("--batch-size", type=int, default=10_000, show_default=True, help="Jobs per database write")
+@click.pass_context
+def ingest(
+    ctx,
+    trace_format,
+    paths,
+    job_name,
+    pattern,
+    native_ids,
+    columns,
+    runtime_unit,
+    memory_unit,
+    delimiter,
+    batch_size,
+):
+    """Record the jobs of snakemake benchmarks, nextflow traces or csv files.
+    Directories of snakemake benchmarks are searched recursively.  Exits with 1
+    if any record could not be parsed with its job specification.
+    For example: `slurmise ingest nextflow trace.txt`
+    """
+    from slurmise.ingest import INGEST_FORMATS
+
+    if trace_format == "snakemake":
+        options = {"pattern": pattern}
+    elif trace_format == "nextflow":
+        options = {"native_ids": native_ids}
+    else:
+        if any("=" not in column for column in columns):
+            raise click.BadParameter("Columns must be given as field=column", param_hint="--column")
+        options = {
+            "columns": dict(column.split("=", 1) for column in columns),
+            "runtime_unit": runtime_unit,
+            "memory_unit": memory_unit,
+            "delimiter": delimiter,
+        }
+
+    records = INGEST_FORMATS[trace_format](paths, job_name=job_name, **options)
+    summary = ctx.obj["slurmise"].ingest(records, batch_size=batch_size)
+
+    click.echo(f"Recorded {summary.recorded} jobs, skipped {summary.duplicates} already recorded")
+    if summary.invalid:
+        click.echo(f"{summary.invalid} records could not be parsed:", err=True)
+        for error in summary.errors:
+            click.echo(f"  {error}", err=True)
+        ctx.exit(1)
+
+
+@main.command()
+@click.option("--since", type=click.DateTime(), required=True, help="Start of the jobs to harvest")
+@click.option("--until", type=click.DateTime(), default=None, help="End of the jobs to harvest, defaults to now")
+@click.option("--user", type=str, help="Only harvest jobs of this user")
+@click.option("--partition", type=str, help="Only harvest jobs on this partition")
+@click.option("--window-hours", type=float, default=24, show_default=True, help="Hours of jobs per sacct query")
+@click.option("--restart", is_flag=True, help="Ignore the checkpoint of a previous harvest")
+@click.pass_context
+def harvest(ctx, since, until, user, partition, window_hours, restart):
+    """Record past jobs from sacct which match a configured job.
+    The submit line and name of each job are matched against the job prefixes
+    and names, then parsed with the job spec.  An interrupted harvest resumes
+    from the last completed window when run again with the same since, user
+    and partition.
+    For example: `slurmise harvest --since 2024-01-01 --user $USER`
+    """
+    summary = ctx.obj["slurmise"].harvest(
+        since,
+        until,
+        user=user,
+        partition=partition,
+        window=datetime.timedelta(hours=window_hours),
+        restart=restart,
+    )
+    click.echo(
+        f"Recorded {summary.recorded} of {summary.jobs} jobs from {summary.windows} windows, "
+        f"skipped {summary.duplicates} already recorded, {summary.unmatched} unmatched "
+        f"and {summary.unfinished} unfinished"
+    )
+
+
+@main.command()
+@click.option(
+    "--min-age", type=float, help="Seconds since a job was recorded before it is filled [default: fill_min_age]"
+)
+@click.option(
+    "--max-age", type=float, help="Seconds since a job was recorded after which it isn't filled [default: fill_max_age]"
+)
+@click.pass_context
+def fill_missing(ctx, min_age, max_age):
+    """Set the memory and runtime of jobs recorded with --defer or slurmise-epilog from sacct.
+    All jobs are queried together, run periodically, e.g. from cron.
+    For example: `slurmise fill-missing --min-age 600`
+    """
+    pending = ctx.obj["slurmise"].ingest_pending()
+    if pending:
+        click.echo(f"Recorded {pending} jobs from slurmise-epilog")
+    summary = ctx.obj["slurmise"].fill_missing(min_age=min_age, max_age=max_age)
+    click.echo(
+        f"Filled {summary.filled} jobs, {summary.unfinished} still running or not in sacct, "
+        f"skipped {summary.too_recent} too recent and {summary.expired} expired"
+    )
+
+
+@main.command()
+@click.option(
+    "--textfile",
+    type=click.Path(dir_okay=False),
+    help="Write the metrics to this file for the textfile collector of node_exporter, instead of stdout",
+)
+@click.pass_context
+def metrics(ctx, textfile):
+    """Print counters of predictions and histograms of latency and accuracy for Prometheus.
+    The metrics written by every slurmise process using the base dir are merged.
+    For example, from cron: `slurmise metrics --textfile /var/lib/node_exporter/slurmise.prom`
+    """
+    collected = ctx.obj["slurmise"].collect_metrics()
+    if textfile is None:
+        click.echo(monitoring.exposition(collected), nl=False)
+    else:
+        monitoring.write_textfile(collected, textfile)
 
 
 @main.command()
@@ -144,6 +359,46 @@ def raw_predict(ctx, job_name, numerics, categories, cmd):
     _report_prediction(query_jd, query_warns)
 
 
+@main.command(context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False})
+@click.argument("cmd", nargs=1)
+@click.argument("sbatch_args", nargs=-1, type=click.UNPROCESSED)
+@click.option("--job-name", type=str, help="Name of the job")
+@click.option(
+    "--attempt",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Submission attempt, the allocation is escalated for each retry",
+)
+@click.option("--wrap", is_flag=True, help="Submit CMD with sbatch --wrap instead of a batch script in SBATCH_ARGS")
+@click.option("--dry-run", is_flag=True, help="Print the sbatch command instead of running it")
+@click.pass_context
+def sbatch(ctx, cmd, sbatch_args, job_name, attempt, wrap, dry_run):
+    """Submit a job with sbatch, allocating the predicted memory and time.
+    Arguments after CMD are passed to sbatch, with any memory and time options
+    replaced by the prediction multiplied by the memory and time factors.
+    For example: `slurmise sbatch "nupack monomer -T 2" --partition cpu job.sh`
+    """
+    try:
+        command, warns = ctx.obj["slurmise"].sbatch_command(
+            cmd, sbatch_args, job_name=job_name, attempt=attempt, wrap=wrap
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e)) from e
+    if warns:
+        click.echo(click.style("Warnings:", fg="yellow"), err=True)
+        for warn in warns:
+            click.echo(f"  {warn}", err=True)
+
+    if dry_run:
+        click.echo(shlex.join(command))
+        return
+    profiling.PROFILER.report()
+    monitoring.flush_all()
+    sys.stdout.flush()
+    os.execvp(command[0], command)
+
+
 @main.command()
 @click.argument("cmd", nargs=1)
 @click.option("--job-name", type=str, help="Name of the job")
@@ -153,6 +408,186 @@ def update_model(ctx, cmd, job_name):
 
 
 @main.command()
+@click.option("--incremental", is_flag=True, help="Only update models with new jobs since their last fit")
+@click.pass_context
+def update_all(ctx, incremental):
+    ctx.obj["slurmise"].update_all_models(incremental=incremental)
+
+
+@main.command()
+@click.option(
+    "--from-unit",
+    type=click.Choice(["seconds", "minutes"]),
+    required=True,
+    help="Unit of the recorded runtimes, seconds for jobs recorded from sacct by earlier versions",
+)
+@click.pass_context
+def migrate_runtimes(ctx, from_unit):
+    """Convert the runtimes of a database recorded before they were stored in minutes.
+    Use minutes if every job was recorded with its runtime in minutes, e.g. by raw-record
+    or ingest, to only mark the database.  Refit the models afterwards with update-all.
+    """
+    converted = ctx.obj["slurmise"].migrate_runtimes(from_unit)
+    click.echo(f"Converted the runtimes of {converted} jobs from {from_unit}, refit with `slurmise update-all`")
+
+
+@main.command()
+@click.option(
+    "--model",
+    "models",
+    type=click.Choice(SIMULATE_MODEL_CHOICES),
+    multiple=True,
+    help="Model to replay, may be repeated [default: all]",
+)
+@click.option("--job-name", type=str, help="Only replay jobs of this name")
+@click.option("--min-train", type=int, default=10, show_default=True, help="Earlier jobs before the first fit")
+@click.option("--refit-every", type=int, default=10, show_default=True, help="New jobs between fits")
+@click.option("--workers", type=int, help="Processes replaying groups in parallel [default: cpus]")
+@click.option("--groups", "show_groups", is_flag=True, help="Also report the results of each job group")
+@click.option("--json", "as_json", is_flag=True, help="Print the results of each group and model as JSON lines")
 @click.pass_context
-def update_all(ctx):
-    ctx.obj["slurmise"].update_all_models()
+def simulate(ctx, models, job_name, min_train, refit_every, workers, show_groups, as_json):
+    """Replay recorded jobs in time order to compare the allocations of models.
+    Each job is predicted by a model fit on the jobs before it, reporting the
+    GB-hours of memory over allocated, jobs which would have run out of memory
+    or time, hours of runtime padding and the prediction latency.  The default
+    model allocates the configured defaults.
+    For example: `slurmise simulate --model default --model poly`
+    """
+    from slurmise.simulate import format_results, summarize
+
+    results = ctx.obj["slurmise"].simulate(
+        models or None,
+        job_name=job_name,
+        min_train=min_train,
+        refit_every=refit_every,
+        workers=workers,
+    )
+    if as_json:
+        for result in results:
+            click.echo(json.dumps(result.as_dict()))
+        return
+    if show_groups:
+        for line in format_results(results):
+            click.echo(line)
+        click.echo()
+    for line in format_results(summarize(results).values()):
+        click.echo(line)
+
+
+@main.command()
+@click.option(
+    "--records", type=click.IntRange(min=1), multiple=True, help="Jobs in a database, may be repeated [default: 1000]"
+)
+@click.option(
+    "--scenario",
+    "scenarios",
+    type=click.Choice(BENCH_SCENARIO_CHOICES),
+    multiple=True,
+    help="Scenario to time, may be repeated [default: all]",
+)
+@click.option("--repeats", type=click.IntRange(min=1), default=5, show_default=True, help="Runs of each scenario")
+@click.option("--batch-size", type=click.IntRange(min=1), default=1000, show_default=True, help="Jobs of predict_batch")
+@click.option(
+    "--max-fit-jobs", type=click.IntRange(min=1), default=10_000, show_default=True, help="Jobs models are fit on"
+)
+@click.option(
+    "--jobs", type=click.IntRange(min=1), default=BENCH_WORKLOAD_DEFAULTS["jobs"], show_default=True, help="Job names"
+)
+@click.option(
+    "--categories",
+    type=click.IntRange(min=0),
+    default=BENCH_WORKLOAD_DEFAULTS["categories"],
+    show_default=True,
+    help="Category variables of each job",
+)
+@click.option(
+    "--category-values",
+    type=click.IntRange(min=1),
+    default=BENCH_WORKLOAD_DEFAULTS["category_values"],
+    show_default=True,
+    help="Values of each category",
+)
+@click.option(
+    "--numerics",
+    type=click.IntRange(min=0),
+    default=BENCH_WORKLOAD_DEFAULTS["numerics"],
+    show_default=True,
+    help="Numeric variables of each job",
+)
+@click.option(
+    "--array-numerics",
+    type=click.IntRange(min=0),
+    default=BENCH_WORKLOAD_DEFAULTS["array_numerics"],
+    show_default=True,
+    help="Array-valued numerics of each job",
+)
+@click.option(
+    "--array-length",
+    type=click.IntRange(min=1),
+    default=BENCH_WORKLOAD_DEFAULTS["array_length"],
+    show_default=True,
+    help="Length of array-valued numerics",
+)
+@click.option(
+    "--noise",
+    type=click.FloatRange(min=0),
+    default=BENCH_WORKLOAD_DEFAULTS["noise"],
+    show_default=True,
+    help="Deviation of the noise of resources",
+)
+@click.option(
+    "--seed", type=int, default=BENCH_WORKLOAD_DEFAULTS["seed"], show_default=True, help="Seed of the synthetic jobs"
+)
+@click.option(
+    "--work-dir", type=click.Path(file_okay=False), help="Keep the databases and models in this new directory"
+)
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the results as JSON to this file")
+@click.option("--compare", "baseline", type=click.File("r"), help="Compare with the JSON results of a previous run")
+def bench(
+    records,
+    scenarios,
+    repeats,
+    batch_size,
+    max_fit_jobs,
+    work_dir,
+    output,
+    baseline,
+    **workload,
+):
+    """Time recording, querying, fitting and predicting synthetic jobs.
+    A database is built for each number of records, without a configuration.
+    Databases of millions of records take hours to build.
+    For example: `slurmise bench --records 1000 --records 100000 --output bench.json`
+    """
+    from slurmise.bench import SCENARIOS, Workload, compare, report, run_bench
+    from slurmise.bench import format_results as format_bench_results
+
+    workload = Workload(**workload)
+    records = records or (1000,)
+    results = run_bench(
+        workload,
+        records=records,
+        scenarios=scenarios or SCENARIOS,
+        repeats=repeats,
+        batch_size=batch_size,
+        max_fit_jobs=max_fit_jobs,
+        work_dir=work_dir,
+    )
+    for line in format_bench_results(results):
+        click.echo(line)
+
+    current = report(
+        workload, results, records=list(records), repeats=repeats, batch_size=batch_size, max_fit_jobs=max_fit_jobs
+    )
+    if output is not None:
+        with open(output, "w") as output_file:
+            json.dump(current, output_file, indent=2)
+    if baseline is not None:
+        click.echo()
+        for line in compare(json.load(baseline), current):
+            click.echo(line)
+
+
+if __name__ == "__main__":
+    main()
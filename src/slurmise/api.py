@@ -1,9 +1,29 @@
 from __future__ import annotations
 
+import contextlib
+import datetime
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 import numpy as np
 
-from slurmise import job_database, slurm
+from slurmise import epilog, job_database, monitoring, slurm
 from slurmise.config import SlurmiseConfiguration
+from slurmise.fit.resource_fit import defaulted_targets
+from slurmise.harvest import HarvestCheckpoint, HarvestSummary, JobMatcher, harvest_window, time_windows
+from slurmise.job_data import COMPLETED, JobData
+from slurmise.sacct_cache import SacctCache
+from slurmise.submit import sbatch_arguments, scale_allocation
+
+if TYPE_CHECKING:
+    from slurmise.extras.snake_parsers import ThreadScaler
+    from slurmise.ingest import IngestSummary, TraceRecord
+    from slurmise.simulate import ReplayResult
 
 
 class Slurmise:
@@ -14,6 +34,11 @@ class Slurmise:
     def __init__(self, toml_path=None):
         self.toml_path = toml_path
         self.configuration = SlurmiseConfiguration(toml_path)
+        slurm.SACCT_CLIENT.configure(**self.configuration.sacct_client_options)
+        if self.configuration.monitoring:
+            self.monitor = monitoring.monitor(self.configuration.slurmise_base_dir)
+        else:
+            self.monitor = monitoring.Monitor()
 
     def record(
         self,
@@ -21,13 +46,14 @@ class Slurmise:
         job_name: str | None = None,
         slurm_id: str | None = None,
         step_id: str | None = None,
+        defer: bool = False,
     ):
         parsed_jd = self.configuration.parse_job_cmd(
             cmd=cmd,
             job_name=job_name,
             slurm_id=f"{slurm_id}.{step_id}" if step_id is not None else slurm_id,
         )
-        self.raw_record(parsed_jd)
+        self.raw_record(parsed_jd, defer=defer)
 
     def dry_parse(
         self,
@@ -39,8 +65,78 @@ class Slurmise:
             job_name=job_name,
         )
 
-    def raw_record(self, job_data, processed_data=False):
-        if not processed_data:
+    def parse_batch(
+        self,
+        cmds: Iterable[str],
+        job_name: str | None = None,
+        parse_files: bool = False,
+        diagnose: bool = False,
+    ) -> Iterator[dict]:
+        """Parse many commands, yielding a dict for each non-empty command.
+
+        Parsed commands yield their job name, categories and numerics, failures
+        yield the error message.  File parsers are only run with parse_files, a
+        file which can't be read fails only its command.
+        """
+        for line, cmd in enumerate(cmds, start=1):
+            cmd = cmd.strip()
+            if not cmd:
+                continue
+            try:
+                jd = self.configuration.parse_job_cmd(
+                    cmd=cmd,
+                    job_name=job_name,
+                    parse_files=parse_files,
+                    diagnose=diagnose,
+                )
+            except (OSError, ValueError) as e:
+                yield {"line": line, "cmd": cmd, "error": str(e)}
+            else:
+                yield {
+                    "line": line,
+                    "cmd": cmd,
+                    "job_name": jd.job_name,
+                    "categories": jd.categories,
+                    "numerics": jd.numerics,
+                }
+
+    @contextlib.contextmanager
+    def _database(self, check_runtime_unit: bool = True) -> Iterator[job_database.JobDatabase]:
+        """Open the database, raising a ValueError if its runtimes may not be in minutes, see migrate_runtimes."""
+        with job_database.JobDatabase.get_database(
+            self.configuration.db_filename,
+            sacct_backend=self.configuration.sacct_backend,
+            sacct_cache=self.sacct_cache,
+        ) as database:
+            if check_runtime_unit:
+                database.check_runtime_unit()
+            yield database
+
+    @property
+    def sacct_cache(self) -> SacctCache | None:
+        """The cache of sacct results under the base dir, None if disabled."""
+        if self.configuration.sacct_cache_size <= 0:
+            return None
+        return SacctCache(
+            Path(self.configuration.slurmise_base_dir) / "sacct_cache",
+            ttl=self.configuration.sacct_cache_ttl,
+            max_jobs=self.configuration.sacct_cache_size,
+            backend=self.configuration.sacct_backend,
+        )
+
+    def raw_record(self, job_data, processed_data=False, defer=False):
+        """Record a job, setting its memory, runtime and metrics from sacct unless processed_data.
+
+        With defer, the job is recorded without querying sacct and its memory and
+        runtime are left missing until fill_missing.
+        """
+        with self.monitor.time("slurmise_record_seconds", **self._group_labels(job_data)):
+            self._raw_record(job_data, processed_data=processed_data, defer=defer)
+
+    def _raw_record(self, job_data, processed_data, defer):
+        if defer:
+            job_data.slurm_id = slurm.current_slurm_id(job_data.slurm_id)
+        elif not processed_data:
             if "." in job_data.slurm_id:
                 # If the slurm_id is in the format "1234.0", split it to get the step_id
                 slurm_id, step_name = job_data.slurm_id.split(".")
@@ -48,16 +144,169 @@ class Slurmise:
                 # If no step_id is provided, use the slurm_id as is
                 slurm_id, step_name = job_data.slurm_id, None
 
-            metadata_json = slurm.parse_slurm_job_metadata(slurm_id=slurm_id, step_name=step_name)
-
-            job_data.memory = metadata_json["max_rss"]
-            job_data.runtime = metadata_json["elapsed_seconds"]
+            sacct_cache = self.sacct_cache
+            if sacct_cache is not None:
+                metadata_json = sacct_cache.job_metadata(slurm_id=slurm_id, step_name=step_name)
+            else:
+                metadata_json = slurm.parse_slurm_job_metadata(
+                    slurm_id=slurm_id,
+                    step_name=step_name,
+                    backend=self.configuration.sacct_backend,
+                )
+            slurm.update_job_data(job_data, metadata_json, self.configuration.get_metrics(job_data.job_name))
 
-        with job_database.JobDatabase.get_database(self.configuration.db_filename) as database:
+        with self._database() as database:
             database.record(job_data)
 
+    def raw_record_batch(self, jobs: Iterable[JobData]) -> int:
+        """Record processed jobs with a single open of the database.
+
+        Jobs which are already in the database are skipped, returns the number recorded.
+        """
+        recorded = 0
+        with self._database() as database:
+            for job_data in jobs:
+                if database.job_exists(job_data):
+                    continue
+                database.record(job_data)
+                recorded += 1
+        return recorded
+
+    def ingest(self, records: Iterable[TraceRecord], batch_size: int = 10_000) -> IngestSummary:
+        """Parse and record jobs read from trace files, see slurmise.ingest.
+
+        Records are parsed with the job specifications as they are read and written
+        to the database in batches.  Records which fail to parse are counted as
+        invalid and jobs already in the database as duplicates.
+        """
+        from slurmise.ingest import IngestSummary
+
+        summary = IngestSummary()
+        batch = []
+
+        def record_batch():
+            recorded = self.raw_record_batch(batch)
+            summary.recorded += recorded
+            summary.duplicates += len(batch) - recorded
+            batch.clear()
+
+        for record in records:
+            try:
+                batch.append(record.to_job_data(self.configuration))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                summary.add_error(f"{record.job_name} {record.slurm_id}: {e}")
+                continue
+            if len(batch) >= batch_size:
+                record_batch()
+        if batch:
+            record_batch()
+        return summary
+
+    def harvest(
+        self,
+        since: datetime.datetime,
+        until: datetime.datetime | None = None,
+        user: str | None = None,
+        partition: str | None = None,
+        window: datetime.timedelta = datetime.timedelta(days=1),
+        restart: bool = False,
+    ) -> HarvestSummary:
+        """Record the past jobs in the slurm accounting database which match a configured job.
+
+        sacct is queried for each window of time from since to until, now by default.
+        The jobs of each window are recorded in a batch and the end of the window is
+        saved to harvest_checkpoint.json in the base dir.  Repeating a harvest with
+        the same since, user and partition resumes after the last recorded window,
+        unless restart is set.
+        """
+        if until is None:
+            until = datetime.datetime.now()
+        checkpoint = HarvestCheckpoint(Path(self.configuration.slurmise_base_dir) / "harvest_checkpoint.json")
+        key = checkpoint.query_key(since, user, partition)
+        if restart:
+            checkpoint.clear(key)
+        start = max(since, checkpoint.get(key) or since)
+
+        matcher = JobMatcher(self.configuration)
+        summary = HarvestSummary()
+        backend = self.configuration.sacct_backend
+        # the parsable listing of a window has no metadata, it is queried for the matched jobs
+        fetch_metadata = self._sacct_metadata if backend == "parsable" else None
+        for window_start, window_end in time_windows(start, until, window):
+            sacct_json = slurm.get_sacct_window(
+                window_start, window_end, user=user, partition=partition, backend=backend
+            )
+            jobs = harvest_window(matcher, sacct_json, summary, fetch_metadata=fetch_metadata)
+            recorded = self.raw_record_batch(jobs) if jobs else 0
+            self._observe_residuals(jobs)
+            summary.windows += 1
+            summary.recorded += recorded
+            # jobs running across windows are returned by both
+            summary.duplicates += len(jobs) - recorded
+            checkpoint.set(key, window_end)
+        return summary
+
+    def _sacct_metadata(self, slurm_ids: list[str]) -> dict[tuple[str, str | None], dict]:
+        """The metadata of the last step of jobs, from the sacct cache or sacct with the configured backend."""
+        sacct_cache = self.sacct_cache
+        if sacct_cache is None:
+            return slurm.parse_slurm_jobs_metadata(slurm_ids, backend=self.configuration.sacct_backend)
+        sacct_cache.prefetch((slurm_id, None) for slurm_id in slurm_ids)
+        metadata = {}
+        for slurm_id in slurm_ids:
+            job_metadata = sacct_cache.get(slurm_id)
+            if job_metadata is not None:
+                metadata[slurm_id, None] = job_metadata
+        return metadata
+
+    def ingest_pending(self) -> int:
+        """Record the jobs appended to the pending records by slurmise-epilog.
+
+        Jobs are recorded without their memory and runtime, see fill_missing, and
+        models are fit without them until they are filled.  Returns the number
+        recorded, jobs which are already recorded are skipped.
+        """
+        recorded = 0
+        paths = epilog.take_pending(self.configuration.slurmise_base_dir)
+        if not paths:
+            return recorded
+        with self._database() as database:
+            for path in paths:
+                for job_data, recorded_at in epilog.read_pending(path):
+                    if database.job_exists(job_data):
+                        continue
+                    database.record(job_data, recorded_at=recorded_at)
+                    recorded += 1
+        # only removed once their jobs are stored
+        for path in paths:
+            Path(path).unlink(missing_ok=True)
+        return recorded
+
+    def fill_missing(self, min_age: float | None = None, max_age: float | None = None) -> job_database.FillSummary:
+        """Set the memory, runtime and metrics of deferred records from sacct.
+
+        Every job missing memory or runtime which was recorded between min_age and
+        max_age seconds ago, fill_min_age and fill_max_age of the configuration by
+        default, is queried from sacct in batches.  Jobs which are still running
+        are left for a later fill.
+        """
+        if min_age is None:
+            min_age = self.configuration.fill_min_age
+        if max_age is None:
+            max_age = self.configuration.fill_max_age
+        metrics = {job_name: self.configuration.get_metrics(job_name) for job_name in self.configuration.jobs}
+        with self._database() as database:
+            summary = database.fill_missing(min_age=min_age, max_age=max_age, metrics=metrics)
+        self._observe_residuals(summary.jobs)
+        return summary
+
+    def collect_metrics(self) -> monitoring.MetricSet:
+        """The monitoring metrics of every process using the base dir, including this one."""
+        self.monitor.flush()
+        return monitoring.collect(self.configuration.slurmise_base_dir)
+
     def print(self):
-        with job_database.JobDatabase.get_database(self.configuration.db_filename) as database:
+        with self._database(check_runtime_unit=False) as database:
             database.print()
 
     def predict(self, cmd, job_name):
@@ -67,37 +316,298 @@ class Slurmise:
 
     def raw_predict(self, query_jd):
         query_jd = self.configuration.add_defaults(query_jd)
-        model = self.configuration.get_model_class(query_jd.job_name)
-        query_model = model.load(query=query_jd, path=self.configuration.slurmise_base_dir)
-        query_jd, query_warns = query_model.predict(query_jd)
+        labels = self._group_labels(query_jd)
+        with self.monitor.time("slurmise_predict_seconds", **labels):
+            model = self.configuration.get_model_class(query_jd.job_name)
+            with self.monitor.time("slurmise_model_load_seconds", **labels):
+                query_model = model.load(query=query_jd, path=self._model_path(model, query_jd))
+            query_jd, query_warns = query_model.predict(query_jd)
+        self._count_prediction(query_jd, query_warns)
         query_jd = self.configuration.correct_minimum(query_jd)
         return query_jd, query_warns
 
+    def batch_raw_predict(self, query_jds: Iterable[JobData]) -> list[tuple[JobData, list[str]]]:
+        """Predict many queries, loading and evaluating each model once.
+
+        Queries are grouped by the model of their job name and categories, and
+        the results are returned in the order of the queries, as from raw_predict.
+        """
+        results = []
+        for query_jd, query_warns in self._predict_groups(query_jds):
+            self._count_prediction(query_jd, query_warns)
+            results.append((self.configuration.correct_minimum(query_jd), query_warns))
+        return results
+
+    def _predict_groups(self, query_jds: Iterable[JobData]) -> list[tuple[JobData, list[str]]]:
+        """Predict queries with their defaults, loading each model once, without the minimums."""
+        query_jds = [self.configuration.add_defaults(query_jd) for query_jd in query_jds]
+        groups = {}
+        for index, query_jd in enumerate(query_jds):
+            model = self.configuration.get_model_class(query_jd.job_name)
+            groups.setdefault((model, self._model_path(model, query_jd)), []).append(index)
+
+        results = [None] * len(query_jds)
+        for (model, model_path), indices in groups.items():
+            with self.monitor.time("slurmise_model_load_seconds", **self._group_labels(query_jds[indices[0]])):
+                query_model = model.load(query=query_jds[indices[0]], path=model_path)
+            predicted, warns = query_model.predict_batch([query_jds[index] for index in indices])
+            for index, query_jd, query_warns in zip(indices, predicted, warns, strict=True):
+                results[index] = (query_jd, query_warns)
+        return results
+
+    def _group_labels(self, job_data: JobData) -> dict[str, str]:
+        """Monitoring labels of a job, its name and the categories in monitoring_categories.
+
+        Other categories aren't labels, as every value would be a new time series.
+        """
+        labels = {"job_name": job_data.job_name}
+        categories = ",".join(
+            f"{key}={value}"
+            for key, value in sorted(job_data.categories.items())
+            if key in self.configuration.monitoring_categories
+        )
+        if categories:
+            labels["categories"] = categories
+        return labels
+
+    def _count_prediction(self, query_jd: JobData, query_warns: list[str]) -> None:
+        """Count a prediction, and the resources it returned the default of from its warnings."""
+        labels = self._group_labels(query_jd)
+        self.monitor.inc("slurmise_predictions_total", **labels)
+        for resource in sorted(defaulted_targets(query_warns)):
+            self.monitor.inc("slurmise_prediction_fallbacks_total", resource=resource, **labels)
+
+    def _observe_residuals(self, jobs: Iterable[JobData]) -> None:
+        """Observe the recorded over the predicted resources of completed jobs with their current models.
+
+        Called with the batches of fill_missing and harvest, so each model is loaded
+        once per batch rather than for every recorded job.  Resources which the
+        model doesn't predict, returning the default, and jobs without a
+        configuration are skipped.  Monitoring never fails the caller: if the
+        models can't be loaded or evaluated, the batch is counted in
+        slurmise_residual_errors_total instead.
+        """
+        jobs = [
+            job
+            for job in jobs
+            if job.job_name in self.configuration.jobs
+            and job.outcome == COMPLETED
+            and job.memory is not None
+            and job.runtime is not None
+        ]
+        if not jobs:
+            return
+        queries = [
+            JobData(job_name=job.job_name, categories=dict(job.categories), numerics=dict(job.numerics)) for job in jobs
+        ]
+        try:
+            predictions = self._predict_groups(queries)
+        except Exception:  # noqa: BLE001
+            self.monitor.inc("slurmise_residual_errors_total")
+            return
+        for job, (query_jd, query_warns) in zip(jobs, predictions, strict=True):
+            defaults = defaulted_targets(query_warns)
+            for resource in ("memory", "runtime"):
+                predicted = getattr(query_jd, resource)
+                if resource in defaults or predicted <= 0:
+                    continue
+                self.monitor.observe(
+                    "slurmise_residual_ratio",
+                    getattr(job, resource) / predicted,
+                    resource=resource,
+                    **self._group_labels(job),
+                )
+
+    def sbatch_command(
+        self,
+        cmd: str,
+        sbatch_args: Iterable[str] = (),
+        job_name: str | None = None,
+        attempt: int = 1,
+        wrap: bool = False,
+    ) -> tuple[list[str], list[str]]:
+        """The sbatch command of a job allocating its predicted memory and time, and the prediction warnings.
+
+        :arguments:
+
+            :cmd: Command of the job, which is submitted with --wrap if wrap
+            :sbatch_args: Options of sbatch and the batch script, memory and time options are replaced
+            :attempt: Submission attempt, the allocation is escalated for each retry
+        """
+        query_jd, query_warns = self.predict(cmd, job_name)
+        memory, runtime = scale_allocation(
+            query_jd.memory,
+            query_jd.runtime,
+            memory_factor=self.configuration.memory_factor[query_jd.job_name],
+            time_factor=self.configuration.time_factor[query_jd.job_name],
+            escalation=self.configuration.retry_escalation,
+            attempt=attempt,
+        )
+        args = sbatch_arguments(list(sbatch_args), memory, runtime, wrap=cmd if wrap else None)
+        return ["sbatch", *args], query_warns
+
+    def sbatch(
+        self,
+        cmd: str,
+        sbatch_args: Iterable[str] = (),
+        job_name: str | None = None,
+        attempt: int = 1,
+        wrap: bool = False,
+    ) -> subprocess.CompletedProcess:
+        """Submit a job with sbatch_command, returning the completed sbatch process with its output."""
+        command, _ = self.sbatch_command(cmd, sbatch_args, job_name=job_name, attempt=attempt, wrap=wrap)
+        return subprocess.run(command, check=True, capture_output=True, text=True)
+
     def update_model(self, cmd, job_name):
         query_jd = self.configuration.parse_job_cmd(cmd=cmd, job_name=job_name)
-        with job_database.JobDatabase.get_database(self.configuration.db_filename) as database:
+        with self._database() as database:
             jobs = database.query(query_jd)
 
         self._update_model(query_jd, jobs)
 
-    def _update_model(self, query_jd, jobs):
-        model_path = self.configuration.slurmise_base_dir
+    def _model_path(self, model, query_jd) -> Path:
+        """Each job name and set of categories has its own model under the base dir."""
+        return model._make_model_path(query_jd, base_path=self.configuration.slurmise_base_dir)
+
+    def _update_model(self, query_jd, jobs, incremental: bool = False) -> bool:
+        """Fit and save the model of query_jd, returning False if it was skipped.
+
+        With incremental, models already fit with the same number of jobs are skipped.
+        """
         model = self.configuration.get_model_class(query_jd.job_name)
+        model_path = self._model_path(model, query_jd)
+
+        if incremental:
+            fit_info = model.read_fit_info(model_path)
+            if fit_info is not None and fit_info.get("last_fit_njobs") == len(jobs):
+                return False
 
         try:
             query_model = model.load(query=query_jd, path=model_path)
         except FileNotFoundError:
             query_model = model(query=query_jd, path=model_path)
+        query_model.targets = self.configuration.get_targets(query_jd.job_name)
 
         random_state = np.random.RandomState(42)
-        query_model.fit(jobs, random_state=random_state)
+        with self.monitor.time("slurmise_fit_seconds", **self._group_labels(query_jd)):
+            query_model.fit(jobs, random_state=random_state)
+            query_model.save()
+        return True
 
-        query_model.save()
+    def update_all_models(self, incremental: bool = False) -> int:
+        """Fit the models of every job group in the database, returning the number fit.
 
-    def update_all_models(self):
-        with job_database.JobDatabase.get_database(self.configuration.db_filename) as database:
+        With incremental, only groups with new jobs since their last fit are refit.
+        """
+        updated = 0
+        with self._database() as database:
             for query_jd, jobs in database.iterate_database():
-                self._update_model(query_jd, jobs)
+                updated += self._update_model(query_jd, jobs, incremental=incremental)
+        return updated
+
+    def migrate_runtimes(self, from_unit: str) -> int:
+        """Convert the runtimes of a database recorded before they were stored in minutes.
+
+        Earlier versions recorded the runtimes from sacct in seconds, from_unit is
+        the unit of the recorded runtimes.  Returns the number of jobs converted,
+        the models should be refit afterwards.
+        """
+        with self._database(check_runtime_unit=False) as database:
+            return database.migrate_runtimes(from_unit)
+
+    def update_all_models_in_background(self, incremental: bool = True) -> subprocess.Popen:
+        """Run update_all_models in a separate process which outlives the caller.
+
+        Models are replaced atomically so predictions made while the update runs
+        use the previous models.  Output is appended to update_models.log in the base dir.
+        """
+        if self.toml_path is None:
+            msg = "Updating models in the background requires a toml file"
+            raise ValueError(msg)
+        cmd = [sys.executable, "-m", "slurmise", "--toml", str(self.toml_path), "update-all"]
+        if incremental:
+            cmd.append("--incremental")
+        log_file = Path(self.configuration.slurmise_base_dir) / "update_models.log"
+        with open(log_file, "a") as log:
+            return subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+
+    def simulate(
+        self,
+        models: Iterable[str] | None = None,
+        job_name: str | None = None,
+        min_train: int = 10,
+        refit_every: int = 10,
+        workers: int | None = None,
+    ) -> list[ReplayResult]:
+        """Replay the recorded jobs with each model, see slurmise.simulate.
+
+        Every model is replayed when models is None.  The database is copied so the
+        replay doesn't hold it open, and jobs with missing data are not queried from sacct.
+        """
+        from slurmise.simulate import SIMULATION_MODELS, Allocation, replay_groups
+
+        if models is None:
+            models = SIMULATION_MODELS
+        with tempfile.TemporaryDirectory() as tmp:
+            db_copy = Path(tmp) / Path(self.configuration.db_filename).name
+            with self._database() as database:
+                database.db.flush()
+                shutil.copyfile(self.configuration.db_filename, db_copy)
+
+            with job_database.JobDatabase.get_database(db_copy) as database:
+                groups = [
+                    (
+                        query_jd,
+                        jobs,
+                        Allocation(
+                            default_memory=self.configuration.default_memory[query_jd.job_name],
+                            default_runtime=self.configuration.default_runtime[query_jd.job_name],
+                            minimum_memory=self.configuration.minimum_memory,
+                            minimum_runtime=self.configuration.minimum_runtime,
+                        ),
+                    )
+                    for query_jd, jobs in database.iterate_database(job_name=job_name)
+                ]
+
+        return replay_groups(groups, models, min_train=min_train, refit_every=refit_every, workers=workers)
+
+    def _thread_scaler_path(self, job_name: str) -> Path:
+        return Path(self.configuration.slurmise_base_dir) / "ThreadScaler" / f"{job_name}.json"
+
+    def update_thread_scaler(
+        self,
+        job_name: str,
+        thread_variable: str,
+        thread_range: tuple[int, int] = (1, 20),
+    ) -> ThreadScaler | None:
+        """Fit and save the thread scaler of a job from its recorded jobs.
+
+        Returns None, leaving any saved scaler, if there is not enough data to fit.
+        """
+        with self._database() as database:
+            jobs = [job for _, group in database.iterate_database(job_name=job_name) for job in group]
+
+        from slurmise.extras.snake_parsers import ThreadScaler
+
+        scaler = ThreadScaler.fit(jobs, thread_variable, thread_range=thread_range)
+        if scaler is not None:
+            scaler.save(self._thread_scaler_path(job_name))
+        return scaler
+
+    def load_thread_scaler(self, job_name: str) -> ThreadScaler | None:
+        """Load the saved thread scaler of a job, None if it has never been fit."""
+        path = self._thread_scaler_path(job_name)
+        if not path.exists():
+            return None
+        from slurmise.extras.snake_parsers import ThreadScaler
+
+        return ThreadScaler.load(path)
 
     def job_data_from_dict(
         self,
@@ -0,0 +1,4 @@
+from slurmise.bench.scenarios import SCENARIOS, BenchResult, compare, format_results, report, run_bench
+from slurmise.bench.workload import Workload
+
+__all__ = ["SCENARIOS", "BenchResult", "Workload", "compare", "format_results", "report", "run_bench"]
@@ -0,0 +1,334 @@
+"""Timed scenarios of recording, querying, fitting and predicting synthetic workloads.
+
+For each number of records, a database is built in a new base dir by recording
+the jobs of a workload in batches, timing only the writes.  The other scenarios
+use the group of job0 with the first value of each category:
+
+- query: open the database and query the jobs of the group
+- iterate: open the database and iterate over every group
+- to_pandas: convert the training jobs of the group to a data frame
+- fit.{model}: fit each model on the training jobs, without saving it
+- predict.{model}: predict a single job, as when submitting it
+- predict_batch.{model}: predict a batch of jobs together
+
+The training jobs are the first max_fit_jobs jobs of the group, as fitting
+millions of jobs isn't a realistic use.  Independently of the records,
+cold_start runs `slurmise predict` in a new process with a fit model.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import importlib.metadata
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+import numpy as np
+
+from slurmise.api import Slurmise
+from slurmise.bench.workload import Workload
+from slurmise.fit import MODEL_REGISTRY
+from slurmise.job_data import JobData
+from slurmise.job_database import JobDatabase
+from slurmise.utils import jobs_to_pandas
+
+SCENARIOS = ("record", "query", "iterate", "to_pandas", "fit", "predict", "predict_batch", "cold_start")
+# jobs recorded for the model of the cold start
+COLD_START_RECORDS = 1000
+
+
+@dataclasses.dataclass
+class BenchResult:
+    """The seconds of each run of a scenario.
+
+    :arguments:
+
+        :scenario: Name of the scenario, with the model for fit and predict
+        :records: Jobs in the database, None for scenarios independent of it
+        :items: Jobs handled by each run, e.g. returned by a query
+        :seconds: Duration of each run
+        :info: Other measurements of the scenario
+    """
+
+    scenario: str
+    records: int | None
+    items: int
+    seconds: list[float]
+    info: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def best(self) -> float:
+        return min(self.seconds)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.seconds)
+
+    def as_dict(self) -> dict:
+        return {**dataclasses.asdict(self), "best": self.best, "median": self.median}
+
+
+def _timed(function: Callable, repeats: int, setup: Callable[[], tuple] = tuple) -> tuple[list[float], object]:
+    """The seconds of repeats calls of function, with the arguments from setup, and its last result."""
+    seconds = []
+    result = None
+    for _ in range(repeats):
+        args = setup()
+        start = time.perf_counter()
+        result = function(*args)
+        seconds.append(time.perf_counter() - start)
+    return seconds, result
+
+
+def _new_base_dir(workload: Workload, base_dir: Path) -> Slurmise:
+    base_dir.mkdir(parents=True)
+    toml = base_dir / "slurmise.toml"
+    toml.write_text(workload.toml(str(base_dir)))
+    return Slurmise(toml)
+
+
+def _record(slurmise: Slurmise, workload: Workload, records: int, batch_size: int) -> BenchResult:
+    seconds = 0.0
+    for batch in workload.generate(records, batch_size=batch_size):
+        start = time.perf_counter()
+        slurmise.raw_record_batch(batch)
+        seconds += time.perf_counter() - start
+    return BenchResult("record", records, records, [seconds], {"batch_size": batch_size})
+
+
+def _query_group(workload: Workload) -> JobData:
+    return JobData(job_name="job0", categories={f"c{index}": "v0" for index in range(workload.categories)})
+
+
+def _predict_queries(slurmise: Slurmise, jobs: list[JobData]) -> list[JobData]:
+    """Copies of jobs with the default resources, as parsed before a prediction."""
+    return [
+        dataclasses.replace(
+            job,
+            memory=slurmise.configuration.default_memory[job.job_name],
+            runtime=slurmise.configuration.default_runtime[job.job_name],
+            metrics={},
+        )
+        for job in jobs
+    ]
+
+
+def bench_records(
+    workload: Workload,
+    records: int,
+    base_dir: Path,
+    scenarios: Iterable[str] = SCENARIOS,
+    repeats: int = 5,
+    batch_size: int = 1000,
+    max_fit_jobs: int = 10_000,
+) -> list[BenchResult]:
+    """Build a database of records jobs under base_dir and time the scenarios using it."""
+    scenarios = set(scenarios)
+    slurmise = _new_base_dir(workload, base_dir)
+    db_filename = slurmise.configuration.db_filename
+    # the database is built for every scenario, in the batches of ingest
+    recorded = _record(slurmise, workload, records, batch_size=10_000)
+    results = [recorded] if "record" in scenarios else []
+
+    query = _query_group(workload)
+    with JobDatabase.get_database(db_filename) as database:
+        jobs = database.query(query)
+    train = jobs[:max_fit_jobs]
+
+    def query_database():
+        with JobDatabase.get_database(db_filename) as database:
+            return database.query(query)
+
+    def iterate_database():
+        with JobDatabase.get_database(db_filename) as database:
+            return sum(len(group_jobs) for _, group_jobs in database.iterate_database())
+
+    if "query" in scenarios:
+        seconds, _ = _timed(query_database, repeats)
+        results.append(BenchResult("query", records, len(jobs), seconds))
+    if "iterate" in scenarios:
+        seconds, iterated = _timed(iterate_database, repeats)
+        results.append(BenchResult("iterate", records, iterated, seconds, {"groups": workload.groups}))
+    if "to_pandas" in scenarios:
+        seconds, _ = _timed(jobs_to_pandas, repeats, setup=lambda: (train,))
+        results.append(BenchResult("to_pandas", records, len(train), seconds))
+
+    if scenarios.isdisjoint({"fit", "predict", "predict_batch"}):
+        return results
+    for name, model_class in MODEL_REGISTRY.items():
+        path = base_dir / "models" / name
+
+        def fit(model_class=model_class, path=path):
+            model = model_class(query=query, path=path)
+            model.fit(train, random_state=np.random.RandomState(42))
+            return model
+
+        # predictions need a fit model, which is timed only when asked
+        seconds, model = _timed(fit, repeats if "fit" in scenarios else 1)
+        if "fit" in scenarios:
+            results.append(BenchResult(f"fit.{name}", records, len(train), seconds))
+
+        if "predict" in scenarios:
+            queries = iter(_predict_queries(slurmise, [train[index % len(train)] for index in range(repeats)]))
+            seconds, (_, warnings) = _timed(model.predict, repeats, setup=lambda queries=queries: (next(queries),))
+            results.append(BenchResult(f"predict.{name}", records, 1, seconds, {"fallbacks": int(bool(warnings))}))
+        if "predict_batch" in scenarios:
+            batch = [train[index % len(train)] for index in range(batch_size)]
+            seconds, (_, warnings) = _timed(
+                model.predict_batch, repeats, setup=lambda batch=batch: (_predict_queries(slurmise, batch),)
+            )
+            fallbacks = sum(bool(warning) for warning in warnings)
+            results.append(BenchResult(f"predict_batch.{name}", records, batch_size, seconds, {"fallbacks": fallbacks}))
+    return results
+
+
+def bench_cold_start(workload: Workload, base_dir: Path, repeats: int = 5) -> BenchResult:
+    """Time `slurmise predict` in a new process, from the start of python to the prediction.
+
+    The model is fit on jobs without array-valued numerics, which can't be parsed
+    from a command.  The time of an empty python process is in the info.
+    """
+    workload = dataclasses.replace(workload, array_numerics=0)
+    slurmise = _new_base_dir(workload, base_dir)
+    for batch in workload.generate(COLD_START_RECORDS):
+        slurmise.raw_record_batch(batch)
+    job = next(workload.generate(1, start_id=0))[0]
+    cmd = workload.command(job)
+    slurmise.update_model(cmd, None)
+
+    env = {**os.environ}
+    # installed packages have their bytecode cached, which the first run writes
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    def run(args):
+        subprocess.run(args, check=True, env=env, stdout=subprocess.DEVNULL)
+
+    predict = [sys.executable, "-m", "slurmise", "--toml", str(slurmise.toml_path), "predict", cmd]
+    seconds, _ = _timed(run, repeats, setup=lambda: (predict,))
+    python_seconds, _ = _timed(run, repeats, setup=lambda: ([sys.executable, "-c", "pass"],))
+    return BenchResult("cold_start", None, 1, seconds, {"python_seconds": min(python_seconds)})
+
+
+def run_bench(
+    workload: Workload,
+    records: Iterable[int] = (1000,),
+    scenarios: Iterable[str] = SCENARIOS,
+    repeats: int = 5,
+    batch_size: int = 1000,
+    max_fit_jobs: int = 10_000,
+    work_dir: str | Path | None = None,
+) -> list[BenchResult]:
+    """Time the scenarios for each number of records, see bench_records.
+
+    Databases and models are written under work_dir, or a temporary directory
+    which is removed.
+    """
+    scenarios = list(scenarios)
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        msg = f"Unknown scenarios {', '.join(sorted(unknown))}, expected some of {', '.join(SCENARIOS)}"
+        raise ValueError(msg)
+    if repeats < 1:
+        msg = "Scenarios must be repeated at least once"
+        raise ValueError(msg)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp if work_dir is None else work_dir)
+        results = []
+        for size in records:
+            if set(scenarios) - {"cold_start"}:
+                results += bench_records(
+                    workload,
+                    size,
+                    work_dir / f"records_{size}",
+                    scenarios=scenarios,
+                    repeats=repeats,
+                    batch_size=batch_size,
+                    max_fit_jobs=max_fit_jobs,
+                )
+        if "cold_start" in scenarios:
+            results.append(bench_cold_start(workload, work_dir / "cold_start", repeats=repeats))
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        process = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return process.stdout.strip()
+
+
+def environment() -> dict:
+    """The versions and machine of a benchmark, to compare results across commits."""
+    versions = {}
+    for package in ("slurmise", "numpy", "pandas", "scikit-learn", "h5py"):
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "commit": _git_commit(),
+        "versions": versions,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "date": datetime.datetime.now(tz=datetime.UTC).isoformat(),
+    }
+
+
+def report(workload: Workload, results: Iterable[BenchResult], **settings) -> dict:
+    """The results with the workload, settings and environment, as written by `slurmise bench --output`."""
+    return {
+        "environment": environment(),
+        "workload": dataclasses.asdict(workload),
+        "settings": settings,
+        "results": [result.as_dict() for result in results],
+    }
+
+
+def format_results(results: Iterable[BenchResult]) -> list[str]:
+    """Lines of a table of the results, with times in milliseconds."""
+    lines = [f"{'scenario':<24} {'records':>9} {'items':>7} {'best (ms)':>11} {'median (ms)':>12} {'us/item':>9}"]
+    for result in results:
+        records = "-" if result.records is None else result.records
+        lines.append(
+            f"{result.scenario:<24} {records:>9} {result.items:>7} {result.best * 1000:>11.2f} "
+            f"{result.median * 1000:>12.2f} {result.median * 1e6 / max(result.items, 1):>9.1f}"
+        )
+    return lines
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    """Lines comparing the median times of two reports, for scenarios in both.
+
+    A ratio above 1 is slower than the baseline.
+    """
+    baseline_medians = {(result["scenario"], result["records"]): result["median"] for result in baseline["results"]}
+    baseline_commit = baseline["environment"].get("commit") or "unknown"
+    current_commit = current["environment"].get("commit") or "unknown"
+    lines = [
+        f"baseline {baseline_commit}, current {current_commit}",
+        f"{'scenario':<24} {'records':>9} {'baseline (ms)':>14} {'current (ms)':>13} {'ratio':>7}",
+    ]
+    for result in current["results"]:
+        key = (result["scenario"], result["records"])
+        if key not in baseline_medians:
+            continue
+        records = "-" if result["records"] is None else result["records"]
+        ratio = result["median"] / baseline_medians[key] if baseline_medians[key] else float("inf")
+        lines.append(
+            f"{result['scenario']:<24} {records:>9} {baseline_medians[key] * 1000:>14.2f} "
+            f"{result['median'] * 1000:>13.2f} {ratio:>7.2f}"
+        )
+    return lines
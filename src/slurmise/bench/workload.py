@@ -0,0 +1,128 @@
+"""Synthetic jobs with configurable names, categories, numerics and noise for benchmarks.
+
+Memory and runtime grow linearly with the numerics and are scaled by each
+category, with multiplicative noise so the models are accepted by their
+validation error.  Array-valued numerics are not in the job spec, as they come
+from file parsers, and are only recorded.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from collections.abc import Iterator
+
+import numpy as np
+
+from slurmise.job_data import JobData
+
+
+@dataclasses.dataclass
+class Workload:
+    """The shape of the synthetic jobs.
+
+    :arguments:
+
+        :jobs: Number of job names, job0, job1, ...
+        :categories: Category variables of each job, c0, c1, ...
+        :category_values: Values of each category variable
+        :numerics: Scalar numeric variables of each job, n0, n1, ...
+        :array_numerics: Array-valued numeric variables of each job, a0, a1, ...
+        :array_length: Length of each array-valued numeric
+        :noise: Standard deviation of the multiplicative noise of memory and runtime
+        :seed: Seed of the random numbers, the same workload generates the same jobs
+    """
+
+    jobs: int = 2
+    categories: int = 1
+    category_values: int = 2
+    numerics: int = 2
+    array_numerics: int = 1
+    array_length: int = 4
+    noise: float = 0.25
+    seed: int = 42
+
+    def __post_init__(self):
+        if min(self.jobs, self.category_values, self.array_length) < 1:
+            msg = "A workload needs at least one job name, category value and array element"
+            raise ValueError(msg)
+        if min(self.categories, self.numerics, self.array_numerics) < 0 or self.noise < 0:
+            msg = "The number of variables and the noise can't be negative"
+            raise ValueError(msg)
+
+    @property
+    def job_names(self) -> list[str]:
+        return [f"job{index}" for index in range(self.jobs)]
+
+    @property
+    def groups(self) -> int:
+        """Number of job names and combinations of categories, each with its own model."""
+        return self.jobs * self.category_values**self.categories
+
+    def job_spec(self) -> str:
+        """The job spec of every job name, of its scalar numerics and categories."""
+        return " ".join(
+            [
+                "run",
+                *(f"--n{index} {{n{index}:numeric}}" for index in range(self.numerics)),
+                *(f"--c{index} {{c{index}:category}}" for index in range(self.categories)),
+            ]
+        )
+
+    def toml(self, base_dir: str) -> str:
+        """A configuration of base_dir with the jobs of this workload."""
+        jobs = "".join(f'\n[slurmise.job.{name}]\njob_spec = "{self.job_spec()}"\n' for name in self.job_names)
+        return f'[slurmise]\nbase_dir = "{base_dir}"\n{jobs}'
+
+    def command(self, job: JobData) -> str:
+        """The command of a generated job, as parsed by job_spec."""
+        return " ".join(
+            [
+                job.job_name,
+                "run",
+                *(f"--n{index} {job.numerics[f'n{index}']}" for index in range(self.numerics)),
+                *(f"--c{index} {job.categories[f'c{index}']}" for index in range(self.categories)),
+            ]
+        )
+
+    def generate(self, records: int, batch_size: int = 10_000, start_id: int = 1) -> Iterator[list[JobData]]:
+        """Yield batches of records jobs, with increasing slurm ids from start_id.
+
+        Jobs are spread evenly over the job names and categories at random.
+        Batches are generated together so large databases aren't held in memory,
+        and the same seed and batch size generate the same jobs.
+        """
+        rng = np.random.default_rng(self.seed)
+        # the effect of each variable is fixed by the seed
+        numeric_weights = rng.uniform(1, 10, size=(self.jobs, 2, self.numerics))
+        array_weights = rng.uniform(0.1, 1, size=(self.jobs, 2, self.array_numerics))
+        category_scales = rng.uniform(0.5, 2, size=(self.jobs, 2, self.categories, self.category_values))
+
+        for batch_start in range(0, records, batch_size):
+            size = min(batch_size, records - batch_start)
+            names = rng.integers(self.jobs, size=size)
+            categories = rng.integers(self.category_values, size=(size, self.categories))
+            numerics = rng.integers(1, 100, size=(size, self.numerics))
+            arrays = rng.uniform(0, 100, size=(size, self.array_numerics, self.array_length))
+            noise = rng.lognormal(0, self.noise, size=(size, 2))
+
+            # memory in MB and runtime in minutes
+            resources = 10 + np.einsum("jtn,sn->sjt", numeric_weights, numerics)[np.arange(size), names]
+            resources += np.einsum("jta,sa->sjt", array_weights, arrays.sum(axis=2))[np.arange(size), names]
+            for index in range(self.categories):
+                resources *= category_scales[names, :, index, categories[:, index]]
+            resources = np.maximum(np.rint(resources * noise), 1).astype(int)
+
+            yield [
+                JobData(
+                    job_name=f"job{names[row]}",
+                    slurm_id=str(start_id + batch_start + row),
+                    categories={f"c{index}": f"v{value}" for index, value in enumerate(categories[row])},
+                    numerics={
+                        **{f"n{index}": int(value) for index, value in enumerate(numerics[row])},
+                        **{f"a{index}": array for index, array in enumerate(arrays[row])},
+                    },
+                    memory=int(resources[row, 0]),
+                    runtime=int(resources[row, 1]),
+                )
+                for row in range(size)
+            ]
@@ -4,23 +4,20 @@ import tomllib
 from collections import defaultdict
 from pathlib import Path
 
-from slurmise import job_data
+from slurmise import job_data, profiling, slurm
 from slurmise.fit import model_factory
 from slurmise.job_parse import file_parsers
-from slurmise.job_parse.job_specification import JobSpec
+from slurmise.job_parse.job_specification import JobSpec, match_job_name
+from slurmise.sacct_client import CLIENT_OPTIONS
 
 
 class SlurmiseConfiguration:
     """SlurmiseConfiguration class parses and stores TOML configuration files for slurmise."""
 
+    @profiling.profiled("config")
     def __init__(self, toml_file: Path):
         """Parse a configuration TOML file"""
-        self.file_parsers = {
-            "file_size": file_parsers.FileSizeParser(),
-            "file_lines": file_parsers.FileLinesParser(),
-            "file_basename": file_parsers.FileBasename(),
-            "file_md5": file_parsers.FileMD5(),
-        }
+        self.file_parsers = file_parsers.builtin_parsers()
         with open(toml_file, "rb") as f:
             toml_data = tomllib.load(f)
 
@@ -30,15 +27,9 @@ class SlurmiseConfiguration:
             parsers = toml_data["slurmise"].get("file_parsers", {})
 
             for parser_name, config in parsers.items():
-                return_type = config.get("return_type", "category")
-                if "awk_script" in config:
-                    script_is_file = config.get("script_is_file", False)
-                    self.file_parsers[parser_name] = file_parsers.AwkParser(
-                        parser_name,
-                        return_type,
-                        config["awk_script"],
-                        script_is_file,
-                    )
+                parser = file_parsers.parser_from_config(parser_name, config)
+                if parser is not None:
+                    self.file_parsers[parser_name] = parser
 
             self.jobs = toml_data["slurmise"].get("job", {})
             self.job_prefixes: dict[str, str] = {}
@@ -48,6 +39,37 @@ class SlurmiseConfiguration:
             self.minimum_runtime = toml_data["slurmise"].get("minimum_time", 0)
             self.minimum_memory = toml_data["slurmise"].get("minimum_mem", 0)
 
+            # predictions are multiplied by a safety factor when submitting with sbatch,
+            # and by retry_escalation for each attempt after the first
+            self.memory_factor = defaultdict(lambda: float(toml_data["slurmise"].get("memory_factor", 1.2)))
+            self.time_factor = defaultdict(lambda: float(toml_data["slurmise"].get("time_factor", 1.2)))
+            self.retry_escalation = float(toml_data["slurmise"].get("retry_escalation", 2))
+            if self.retry_escalation < 1:
+                msg = f"retry_escalation must be at least 1, not {self.retry_escalation}"
+                raise ValueError(msg)
+            # counters and histograms of predictions under base_dir, see slurmise.monitoring
+            self.monitoring = bool(toml_data["slurmise"].get("monitoring", True))
+            # categories also used as labels of the metrics, each value is a new time series
+            self.monitoring_categories = set(toml_data["slurmise"].get("monitoring_categories", []))
+
+            self.sacct_backend = toml_data["slurmise"].get("sacct_backend", "json")
+            if self.sacct_backend not in slurm.SACCT_BACKENDS:
+                msg = f"Unknown sacct_backend {self.sacct_backend!r}, expected one of {', '.join(slurm.SACCT_BACKENDS)}"
+                raise ValueError(msg)
+            # parsed sacct results, 0 jobs disables the cache
+            self.sacct_cache_ttl = float(toml_data["slurmise"].get("sacct_cache_ttl", 60))
+            self.sacct_cache_size = int(toml_data["slurmise"].get("sacct_cache_size", 10_000))
+            # seconds since a deferred record was made before fill-missing queries sacct for it,
+            # and after which it is no longer queried
+            self.fill_min_age = float(toml_data["slurmise"].get("fill_min_age", 300))
+            self.fill_max_age = float(toml_data["slurmise"].get("fill_max_age", 7 * 24 * 3600))
+            # options of the sacct client, e.g. sacct_timeout for timeout
+            self.sacct_client_options = {
+                option: toml_data["slurmise"][f"sacct_{option}"]
+                for option in CLIENT_OPTIONS
+                if f"sacct_{option}" in toml_data["slurmise"]
+            }
+
             for job_name, job in self.jobs.items():
                 if "job_spec" in job:
                     self.jobs[job_name]["job_spec_obj"] = JobSpec(
@@ -79,6 +101,21 @@ class SlurmiseConfiguration:
                     self.default_runtime[job_name] = int(job["default_time"])
                 if "default_mem" in job:
                     self.default_memory[job_name] = int(job["default_mem"])
+                if "memory_factor" in job:
+                    self.memory_factor[job_name] = float(job["memory_factor"])
+                if "time_factor" in job:
+                    self.time_factor[job_name] = float(job["time_factor"])
+
+                unknown = set(job.get("metrics", [])) - set(slurm.METRICS)
+                if unknown:
+                    msg = (
+                        f"Unknown metrics {sorted(unknown)} for {job_name}, expected any of {', '.join(slurm.METRICS)}"
+                    )
+                    raise ValueError(msg)
+                unknown = set(job.get("model", {}).get("targets", [])) - {"runtime", "memory", *job.get("metrics", [])}
+                if unknown:
+                    msg = f"Unknown model targets {sorted(unknown)} for {job_name}, targets can be runtime, memory or recorded metrics"
+                    raise ValueError(msg)
 
     def parse_job_cmd(
         self,
@@ -86,13 +123,15 @@ class SlurmiseConfiguration:
         job_name: str | None = None,
         slurm_id: str | None = None,
         step_id: str | None = None,
+        parse_files: bool = True,
+        diagnose: bool = True,
     ) -> job_data.JobData:
         """Parse a job data dataset into a JobData object."""
 
         jd = self._fill_job_name(cmd, job_name, slurm_id, step_id)
         job_spec = self.jobs[jd.job_name]["job_spec_obj"]
 
-        return job_spec.parse_job_cmd(jd)
+        return job_spec.parse_job_cmd(jd, parse_files=parse_files, diagnose=diagnose)
 
     def parse_job_from_dict(
         self,
@@ -125,31 +164,7 @@ class SlurmiseConfiguration:
         step_id: str | None = None,
     ) -> job_data.JobData:
         """From the user supplied input, create a job data object."""
-        if job_name is None:  # try to infer
-            for name, prefix in self.job_prefixes.items():
-                if cmd.startswith(prefix):
-                    job_name = name
-                    cmd = cmd.removeprefix(prefix).lstrip()
-                    break
-
-            else:  # not a prefix. Runs when it does not hit the break.
-                for name in self.jobs.keys():
-                    if cmd.startswith(name):
-                        job_name = name
-                        cmd = cmd.removeprefix(name).lstrip()
-                        break
-
-                else:
-                    msg = f"Unable to match job name to {cmd!r}"
-                    raise ValueError(msg)
-        else:
-            job_prefix = self.job_prefixes.get(job_name, None)
-            if job_prefix is not None:
-                cmd = cmd.removeprefix(job_prefix).lstrip()
-
-        if job_name not in self.jobs:
-            msg = f"Job {job_name} not found in configuration."
-            raise ValueError(msg)
+        job_name, cmd = match_job_name(cmd, self.jobs, self.job_prefixes, job_name)
 
         if step_id is not None:
             slurm_id = ".".join([str(slurm_id), str(step_id)])
@@ -167,6 +182,17 @@ class SlurmiseConfiguration:
         job_data.runtime = max(job_data.runtime, self.minimum_runtime)
         return job_data
 
+    def get_metrics(self, job_name: str) -> list[str]:
+        """The additional metrics recorded for a job, see slurm.METRICS."""
+        if job_name not in self.jobs:
+            return []
+        return list(self.jobs[job_name].get("metrics", []))
+
+    def get_targets(self, job_name: str) -> list[str]:
+        """The resources and metrics a job's model predicts, runtime, memory and its metrics by default."""
+        model_config = self.jobs[job_name].get("model", {})
+        return list(model_config.get("targets", ["runtime", "memory", *self.get_metrics(job_name)]))
+
     def get_model_class(self, job_name: str):
         """Returns the model class a job is using."""
         model_config = self.jobs[job_name].get("model", {})
@@ -0,0 +1,184 @@
+"""Record jobs from slurm epilogs and srun wrappers with minimal startup time.
+
+`slurmise-epilog` parses the command of a job with its job spec and appends it
+to the pending records under the base dir, which `slurmise fill-missing`
+records in bulk and completes from sacct.  Only the standard library and the
+job spec parser are imported, the scientific stack of `slurmise record` is not,
+nor pathlib or dataclasses, which alone take most of the startup budget.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fcntl
+import json
+import os
+import sys
+import time
+import tomllib
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+
+from slurmise.job_parse.job_specification import FILE_KINDS, JobSpec, match_job_name
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from slurmise.job_data import JobData
+
+PENDING_RECORDS = "pending_records.jsonl"
+
+
+def parse_job(slurmise: dict, cmd: str, job_name: str | None = None, slurm_id: str | None = None) -> SimpleNamespace:
+    """Parse a command with the job spec of its job in the slurmise table of a configuration.
+
+    Unlike SlurmiseConfiguration, only the job spec of the matched job is built, and
+    the file parsers only when it has file variables.  The job has the attributes of
+    JobData used by append_pending.
+    """
+    jobs = slurmise.get("job", {})
+    job_prefixes = {name: job["job_prefix"] for name, job in jobs.items() if "job_prefix" in job}
+    job_name, cmd = match_job_name(cmd, jobs, job_prefixes, job_name)
+
+    job = jobs[job_name]
+    if "job_spec" not in job:
+        msg = f"Job {job_name} has no job spec entry for parsing commands"
+        raise ValueError(msg)
+    available_parsers = None
+    if any(f":{kind}}}" in job["job_spec"] for kind in FILE_KINDS):
+        from slurmise.job_parse import file_parsers
+
+        available_parsers = file_parsers.builtin_parsers()
+        for parser_name, config in slurmise.get("file_parsers", {}).items():
+            parser = file_parsers.parser_from_config(parser_name, config)
+            if parser is not None:
+                available_parsers[parser_name] = parser
+    job_spec = JobSpec(
+        job["job_spec"],
+        file_parsers=job.get("file_parsers", {}),
+        available_parsers=available_parsers,
+        model=job.get("model", {}),
+    )
+    parsed = SimpleNamespace(job_name=job_name, slurm_id=slurm_id, cmd=cmd, categories={}, numerics={})
+    return job_spec.parse_job_cmd(parsed, diagnose=False)
+
+
+def append_pending(base_dir: str | os.PathLike, job: JobData | SimpleNamespace) -> None:
+    """Append a parsed job to the pending records of base_dir.
+
+    The file is locked while writing, if take_pending moved it away in the meantime
+    the record is written to a new file.
+    """
+    record = {
+        "job_name": job.job_name,
+        "slurm_id": job.slurm_id,
+        "categories": job.categories,
+        "numerics": job.numerics,
+        "recorded_at": time.time(),
+    }
+    line = (json.dumps(record) + "\n").encode()
+    os.makedirs(base_dir, exist_ok=True)
+    path = os.path.join(base_dir, PENDING_RECORDS)
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                moved = os.fstat(fd).st_ino != os.stat(path).st_ino
+            except FileNotFoundError:
+                moved = True
+            if not moved:
+                os.write(fd, line)
+                return
+        finally:
+            os.close(fd)
+
+
+def take_pending(base_dir: str | os.PathLike) -> list[str]:
+    """Move the pending records of base_dir aside, returning the files to record.
+
+    Files left by an earlier run which failed are returned as well.  The caller
+    removes each file once its records are stored.
+    """
+    path = os.path.join(base_dir, PENDING_RECORDS)
+    if os.path.exists(path):
+        taken = os.path.join(base_dir, f".{PENDING_RECORDS}.{os.getpid()}.{time.time_ns()}")
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            # wait for appends in progress
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.replace(path, taken)
+        finally:
+            os.close(fd)
+    try:
+        names = os.listdir(base_dir)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(base_dir, name) for name in names if name.startswith(f".{PENDING_RECORDS}."))
+
+
+def read_pending(path: str | os.PathLike) -> Iterator[tuple[JobData, float]]:
+    """Yield the jobs of a pending records file with the unix time they were recorded."""
+    from slurmise.job_data import JobData
+
+    with open(path) as records:
+        for line in records:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            job = JobData(
+                job_name=record["job_name"],
+                slurm_id=record["slurm_id"],
+                categories=record["categories"],
+                numerics=record["numerics"],
+            )
+            yield job, record["recorded_at"]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="slurmise-epilog",
+        description=(
+            "Parse the command of a job and append it to the pending records of slurmise, "
+            "see `slurmise fill-missing`.  Errors are reported on stderr with an exit code "
+            "of 0, so a failing record doesn't drain the node running the epilog, unless "
+            "--strict is given."
+        ),
+    )
+    parser.add_argument("cmd", nargs="?", help="Command of the job [default: $SLURMISE_CMD]")
+    parser.add_argument("--toml", "-t", help="Path to the slurmise configuration file [default: $SLURMISE_TOML]")
+    parser.add_argument("--job-name", help="Name of the job, inferred from the command if not given")
+    parser.add_argument("--slurm-id", help="SLURM id of the job [default: $SLURM_JOB_ID]")
+    parser.add_argument("--step-id", help="SLURM step id [default: $SLURM_STEP_ID]")
+    parser.add_argument("--strict", action="store_true", help="Exit with 1 when the job can't be recorded")
+    args = parser.parse_args(argv)
+
+    toml_file = args.toml or os.environ.get("SLURMISE_TOML")
+    cmd = args.cmd if args.cmd is not None else os.environ.get("SLURMISE_CMD")
+    slurm_id = args.slurm_id or os.environ.get("SLURM_JOB_ID")
+    step_id = args.step_id or os.environ.get("SLURM_STEP_ID")
+    try:
+        if toml_file is None:
+            msg = "Slurmise requires a toml file, give --toml or set SLURMISE_TOML"
+            raise ValueError(msg)
+        if cmd is None:
+            msg = "No command to record, give it as an argument or set SLURMISE_CMD"
+            raise ValueError(msg)
+        if slurm_id is None:
+            msg = "Not running in a SLURM job, give --slurm-id or set SLURM_JOB_ID"
+            raise ValueError(msg)
+        if step_id is not None:
+            slurm_id = f"{slurm_id}.{step_id}"
+
+        with open(toml_file, "rb") as f:
+            slurmise = tomllib.load(f)["slurmise"]
+        job = parse_job(slurmise, cmd, job_name=args.job_name, slurm_id=slurm_id)
+        append_pending(slurmise["base_dir"], job)
+    except (OSError, KeyError, ValueError, tomllib.TOMLDecodeError) as e:
+        print(f"slurmise-epilog: unable to record job {slurm_id}: {e}", file=sys.stderr)
+        return 1 if args.strict else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
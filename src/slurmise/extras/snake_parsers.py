@@ -1,10 +1,15 @@
+from __future__ import annotations
+
 import inspect
-from dataclasses import dataclass, replace
+import json
+import os
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
 from typing import Any, Protocol
 
 import numpy as np
 
-from slurmise.job_data import JobData
+from slurmise.job_data import COMPLETED, JobData
 
 
 class ResourceFunction(Protocol):
@@ -27,9 +32,14 @@ def wildcards(name: str) -> ResourceFunction:
     return get_wildcard
 
 
-def threads() -> ResourceFunction:
+def threads(cores: Any = None) -> ResourceFunction:
+    """Get the threads of a rule.
+
+    Slurmise passes the original cores of a rule when it replaces them with thread scaling.
+    """
+
     def get_threads(rule, wildcards, input):
-        threads = rule.resources["_cores"]
+        threads = rule.resources["_cores"] if cores is None else cores
         # is a value, return it directly
         if not callable(threads):
             return threads
@@ -69,18 +79,97 @@ def params(name: str) -> ResourceFunction:
     return get_params
 
 
+THREAD_OBJECTIVES = ("memory", "core_hours", "walltime")
+
+
 @dataclass()
 class ThreadScaler:
     memory_per_thread: float
     runtime_overhead: float = 1
     memory_overhead: float = 1
     thread_range: tuple[int, int] = (1, 20)
+    objective: str = "memory"
+    core_hour_budget: float | None = None
+    # whether the overheads are fractional scales (True) or offsets (False), None decides by value
+    fractional: bool | None = None
 
     def __post_init__(self):
         if self.runtime_overhead < 1:
             self.runtime_overhead = 1
         if self.memory_overhead < 1:
             self.memory_overhead = 1
+        if self.objective not in THREAD_OBJECTIVES:
+            msg = f"Unknown thread objective {self.objective!r}, expected one of {', '.join(THREAD_OBJECTIVES)}"
+            raise ValueError(msg)
+
+    def scale(self, job_data: JobData, current_threads: int, threads) -> tuple[np.ndarray, np.ndarray]:
+        """The runtime and memory of a job when run with each of threads.
+
+        :arguments:
+            :job_data: The job, with the runtime and memory when run with current_threads.
+            :current_threads: The threads the job estimates are for.
+            :threads: A thread count or array of thread counts to scale to.
+
+        :returns:
+            Arrays of runtime and memory matching threads.  The runtime is
+            assumed to scale linearly with threads and memory is assumed to be
+            constant, with the overheads applied for each additional thread.
+        """
+        threads = np.asarray(threads, dtype=float)
+        # get single thread estimates
+        memory = job_data.memory
+        runtime = job_data.runtime * current_threads
+
+        if self._is_offset(self.runtime_overhead):
+            runtime = runtime / threads + (threads - 1) * self.runtime_overhead
+        else:  # a fractional scale, e.g. 1.2 is 20% more per thread
+            runtime = runtime / threads * self.runtime_overhead ** (threads - 1)
+
+        if self._is_offset(self.memory_overhead):
+            memory = memory + (threads - 1) * self.memory_overhead
+        else:  # a fractional scale
+            memory = memory * self.memory_overhead ** (threads - 1)
+
+        return runtime, memory
+
+    def _is_offset(self, overhead: float) -> bool:
+        """Whether overhead is added per thread rather than a fractional scale, by value when not set."""
+        if self.fractional is None:
+            return overhead >= 2
+        return not self.fractional
+
+    def choose_threads(self, job_data: JobData, current_threads: int) -> int:
+        """Select the number of threads for a job based on the objective.
+
+        :arguments:
+            :job_data: The job, with the runtime and memory when run with current_threads.
+            :current_threads: The current request for threads for this job.
+
+        :returns:
+            For the memory objective, enough threads to keep the memory per thread
+            below memory_per_thread.  For core_hours, the threads with the lowest
+            runtime * threads.  For walltime, the threads with the lowest runtime
+            which keep the core hours within core_hour_budget, or the lowest core
+            hours if none do.  Every thread count in the range is evaluated at
+            once and ties go to fewer threads.
+        """
+        if self.objective == "memory":
+            return int(np.ceil(np.clip(job_data.memory / self.memory_per_thread, *self.thread_range)))
+
+        candidates = np.arange(self.thread_range[0], self.thread_range[1] + 1)
+        runtime, _ = self.scale(job_data, current_threads, candidates)
+        core_hours = runtime * candidates / 60  # runtime is in minutes
+
+        if self.objective == "walltime":
+            within_budget = (
+                np.ones_like(candidates, dtype=bool)
+                if self.core_hour_budget is None
+                else core_hours <= self.core_hour_budget
+            )
+            if within_budget.any():
+                return int(candidates[np.argmin(np.where(within_budget, runtime, np.inf))])
+
+        return int(candidates[np.argmin(core_hours)])
 
     def update_job_data(self, job_data: JobData, current_threads: int) -> tuple[JobData, int]:
         """Update the provided job data to reflect scaling threads.
@@ -91,25 +180,92 @@ class ThreadScaler:
 
         :returns:
             The job data memory and time will be updated to reflect any change
-            in the number of threads. If overheads are equal to 1, this is a
-            simple linear scaling based on the memory_per_thread.  Otherwise,
-            the overhead is factored in as well.  The returned thread value is
-            clipped to the range of the scaler object.
+            in the number of threads, selected with choose_threads. If overheads
+            are equal to 1, this is a simple linear scaling.  Otherwise, the
+            overhead is factored in as well.  The returned thread value is
+            within the range of the scaler object.
         """
-        # get single thread estimates
-        memory = job_data.memory
-        runtime = job_data.runtime * current_threads
+        threads = self.choose_threads(job_data, current_threads)
+        runtime, memory = self.scale(job_data, current_threads, threads)
 
-        threads = np.ceil(np.clip(memory / self.memory_per_thread, *self.thread_range))
+        return replace(job_data, runtime=int(runtime), memory=int(memory)), threads
 
-        if self.runtime_overhead >= 2:  # take as an offset
-            runtime = int(runtime / threads + (threads - 1) * self.runtime_overhead)
-        else:  # a fractional scale, e.g. 1.2 is 20% more per thread
-            runtime = int(runtime / threads * self.runtime_overhead ** (threads - 1))
+    @classmethod
+    def fit(
+        cls,
+        jobs: list[JobData],
+        thread_variable: str,
+        thread_range: tuple[int, int] = (1, 20),
+    ) -> ThreadScaler | None:
+        """Estimate the scaling of a rule from its recorded jobs.
 
-        if self.runtime_overhead >= 2:  # take as an offset
-            memory = int(memory + (threads - 1) * self.memory_overhead)
-        else:  # a fractional scale
-            memory = int(memory * self.memory_overhead ** (threads - 1))
+        :arguments:
+            :jobs: Recorded jobs of the rule, with the actual threads as a numeric.
+            :thread_variable: The name of the numeric holding the threads.
+            :thread_range: The range of threads for the returned scaler.
+
+        :returns:
+            A scaler with fractional overheads, or None when there are too few
+            completed jobs or only a single thread count.  The overheads are fit by
+            least squares of log(runtime * threads) and log(memory) on threads - 1,
+            with an intercept for each set of categories and the log of every
+            other positive, scalar numeric to account for differing inputs.
+            The memory_per_thread is the median memory per thread of the jobs.
+        """
+        jobs = [
+            job
+            for job in jobs
+            if job.outcome == COMPLETED
+            and np.ndim(job.numerics.get(thread_variable)) == 0
+            and job.numerics.get(thread_variable, 0) >= 1
+            and job.runtime is not None
+            and job.memory is not None
+            and np.all(np.asarray(job.runtime) > 0)
+            and np.all(np.asarray(job.memory) > 0)
+        ]
+        if len(jobs) < 3:
+            return None
+
+        threads = np.array([job.numerics[thread_variable] for job in jobs], dtype=float)
+        if len(np.unique(threads)) < 2:
+            return None
+        runtime = np.array([np.asarray(job.runtime).item() for job in jobs], dtype=float)
+        memory = np.array([np.asarray(job.memory).item() for job in jobs], dtype=float)
+
+        groups = [tuple(sorted(job.categories.items())) for job in jobs]
+        _, group_index = np.unique([str(group) for group in groups], return_inverse=True)
+        columns = [np.eye(group_index.max() + 1)[group_index], (threads - 1)[:, None]]
+
+        other_numerics = {name for job in jobs for name in job.numerics} - {thread_variable}
+        for name in sorted(other_numerics):
+            values = [job.numerics.get(name) for job in jobs]
+            if all(value is not None and np.ndim(value) == 0 and value > 0 for value in values):
+                columns.append(np.log(np.array(values, dtype=float))[:, None])
+
+        design = np.hstack(columns)
+        targets = np.column_stack([np.log(runtime * threads), np.log(memory)])
+        coefficients, *_ = np.linalg.lstsq(design, targets, rcond=None)
+        # the coefficients of threads - 1 follow the group intercepts
+        runtime_overhead, memory_overhead = np.exp(coefficients[group_index.max() + 1])
+
+        return cls(
+            memory_per_thread=float(np.median(memory / threads)),
+            runtime_overhead=float(runtime_overhead),
+            memory_overhead=float(memory_overhead),
+            thread_range=thread_range,
+            fractional=True,
+        )
+
+    def save(self, path: str | Path) -> None:
+        """Save the scaler as json, replacing any existing file atomically."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(asdict(self)))
+        os.replace(tmp_path, path)
 
-        return replace(job_data, runtime=runtime, memory=memory), int(threads)
+    @classmethod
+    def load(cls, path: str | Path) -> ThreadScaler:
+        info = json.loads(Path(path).read_text())
+        info["thread_range"] = tuple(info["thread_range"])
+        return cls(**info)
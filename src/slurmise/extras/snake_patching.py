@@ -1,15 +1,23 @@
+import copy
+import hashlib
 import json
+import re
 import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from pathlib import Path
 
+from snakemake.exceptions import WildcardError
 from snakemake.logging import logger
 from snakemake.path_modifier import PathModifier
 from snakemake.workflow import Workflow
 
 from slurmise.api import Slurmise
 from slurmise.extras import snake_parsers
-from slurmise.job_data import JobData
-from slurmise.job_parse.file_parsers import FileMD5
+from slurmise.ingest.snakemake_benchmarks import read_benchmark_file
+from slurmise.job_data import FAILED, OOM, TIMEOUT, JobData
 
 SLURMISE_DEFAULTS = {
     "attempt_exp": 1,
@@ -17,6 +25,13 @@ SLURMISE_DEFAULTS = {
     "runtime_scale": 1.25,
 }
 
+MODEL_REFRESH_POLICIES = ("blocking", "background", "off")
+
+# messages in the logs of failed jobs from slurm, the kernel and common languages
+OOM_PATTERN = re.compile(rb"out[ _-]of[ _-]memory|oom[ _-]kill|MemoryError|std::bad_alloc", re.IGNORECASE)
+TIMEOUT_PATTERN = re.compile(rb"due to time limit|time limit exceeded|\bTIMEOUT\b", re.IGNORECASE)
+LOG_TAIL_BYTES = 64 * 1024
+
 
 def patch_snakemake_workflow(
     slurmise: Slurmise,
@@ -25,15 +40,38 @@ def patch_snakemake_workflow(
     benchmark_dir: str | Path = "slurmise/benchmarks",
     keep_benchmarks: bool = False,
     record_benchmarks: bool = True,
+    model_refresh: str = "blocking",
 ):
+    """Predict the memory and runtime of rules with slurmise and record their benchmarks.
+
+    model_refresh sets how models are updated when the workflow starts: `blocking`
+    refits every model before any job runs, `background` refits models with new jobs
+    in a separate process while jobs use the existing models, `off` never refits.
+    """
+    if model_refresh not in MODEL_REFRESH_POLICIES:
+        msg = f"Unknown model_refresh {model_refresh!r}, expected one of {', '.join(MODEL_REFRESH_POLICIES)}"
+        raise ValueError(msg)
     benchmark_dir = Path(benchmark_dir)
+    memo = PredictionMemo(slurmise)
 
     original_onstart = workflow._onstart
 
     def onstart_slurmise_update(log):
         original_onstart(log)
-        logger.info("SLURMISE: Updating all models")
-        slurmise.update_all_models()
+        if model_refresh == "blocking":
+            logger.info("SLURMISE: Updating all models")
+            slurmise.update_all_models()
+            # predictions made before the update are stale
+            memo.refresh()
+        elif model_refresh == "background":
+            logger.info("SLURMISE: Updating models in the background")
+            slurmise.update_all_models_in_background(incremental=True)
+
+        if model_refresh != "off":
+            # fit scalers for the next run, these only read the jobs of one rule
+            for rule_name, thread_variable in auto_scaled_rules.items():
+                if slurmise.update_thread_scaler(rule_name, thread_variable) is None:
+                    logger.info(f"SLURMISE: Not enough jobs with varying threads to fit thread scaling of {rule_name}")
 
     workflow.onstart(onstart_slurmise_update)
 
@@ -45,51 +83,79 @@ def patch_snakemake_workflow(
             logger.info("SLURMISE: Skipping recording completed jobs")
             return
         logger.info("SLURMISE: Recording completed jobs")
-        md5_parser = FileMD5()
-        for file in benchmark_dir.rglob("*.jsonl"):
-            benchmark_data = json.loads(file.read_text())
-            slurmise_data = json.loads(benchmark_data["params"]["slurmise_data"])
+        record_jobs()
 
-            try:
-                runtime = (float(benchmark_data["s"]) / 60,)
-            except ValueError:
-                runtime = 0
-            try:
-                memory = (float(benchmark_data["max_rss"]),)
-            except ValueError:
-                memory = 0
+    workflow.onsuccess(onsuccess_slurmise_update)
 
-            # if a value is a thread, update it to true value
-            slurmise_data = _correct_threads(slurmise_data, benchmark_data)
+    original_onerror = workflow._onerror
 
-            job_data = JobData(
-                job_name=benchmark_data["rule_name"],
-                slurm_id=md5_parser.parse_file(file),
-                categories=slurmise_data["categories"],
-                numerics=slurmise_data["numerics"],
-                runtime=runtime,
-                memory=memory,
+    def onerror_slurmise_update(log):
+        original_onerror(log)
+        if not record_benchmarks:
+            return
+        logger.info("SLURMISE: Recording completed and failed jobs")
+        scheduler = getattr(workflow, "scheduler", None)
+        for job in getattr(scheduler, "failed", ()):
+            if job.rule.name not in rules:
+                continue
+            memo.add_failure(
+                rules[job.rule.name],
+                job.rule,
+                job.wildcards,
+                job.input,
+                job.attempt,
+                memory=job.resources.get("mem_mb"),
+                runtime=job.resources.get("runtime"),
+                log_files=job.log,
+                threads=job.threads,
             )
+        record_jobs()
 
-            slurmise.raw_record(job_data, processed_data=True)
-        if not keep_benchmarks:
+    workflow.onerror(onerror_slurmise_update)
+
+    def record_jobs():
+        record_benchmark_dir(slurmise, benchmark_dir)
+        failures = memo.pop_failures()
+        if failures:
+            recorded = slurmise.raw_record_batch(failures)
+            logger.info(f"SLURMISE: Recorded {recorded} failed attempts")
+        if not keep_benchmarks and benchmark_dir.exists():
             shutil.rmtree(benchmark_dir)
 
-    workflow.onsuccess(onsuccess_slurmise_update)
+    # snakemake has no public hook between building the DAG and evaluating resources
+    if hasattr(workflow, "_build_dag"):
+        original_build_dag = workflow._build_dag
+
+        def build_dag_slurmise_prefetch():
+            original_build_dag()
+            # predict every job of the patched rules at once instead of as snakemake requests them
+            try:
+                needrun_jobs = workflow.dag.needrun_jobs()
+            except AttributeError as e:
+                logger.warning(f"SLURMISE: Predicting each job, the jobs of the DAG are not available: {e!r}")
+                return
+            jobs = [
+                (rules[job.rule.name], job.rule, job.wildcards, job.input)
+                for job in needrun_jobs
+                if job.rule.name in rules
+            ]
+            if jobs:
+                start = time.perf_counter()
+                predicted = memo.prefetch(jobs)
+                logger.info(f"SLURMISE: Predicted {predicted} jobs in {time.perf_counter() - start:.2f} s")
+
+        workflow._build_dag = build_dag_slurmise_prefetch
+    else:
+        logger.warning("SLURMISE: This snakemake version can't be hooked to predict jobs together, predicting each job")
 
     if record_benchmarks:
         # force extended benchmark recording
         workflow.output_settings.benchmark_extended = True
 
-    def make_predictor(variables, rule, resource):
-        def slurmise_predict(wildcards, input, attempt=1):
-            vars = {
-                name: func(rule, wildcards, input)
-                for name, func in variables.items()
-                if not name.startswith("SLURMISE")
-            }
-            job_data = slurmise.job_data_from_dict(vars, rule.name)
+    def make_predictor(variables, rule, resource, current_threads=None):
+        def slurmise_predict(wildcards, input, threads=None, attempt=1):
             if resource == "logging":
+                job_data = memo.job_data(variables, rule, wildcards, input)
                 # if we are recording threads need to mark in benchmark file
                 for name, func in variables.items():
                     if name.startswith("SLURMISE"):
@@ -104,26 +170,74 @@ def patch_snakemake_workflow(
                 }
                 return json.dumps(job_data_variables)
 
-            job_data = slurmise.raw_predict(job_data)[0]
-
-            exp = variables.get("SLURMISE_attempt_exp", SLURMISE_DEFAULTS["attempt_exp"])
-            scale = variables.get(
-                f"SLURMISE_{resource}_scale",
-                SLURMISE_DEFAULTS[f"{resource}_scale"],
-            )
+            job_data = memo.prediction(variables, rule, wildcards, input)
+
+            thread_scaler = variables["SLURMISE_thread_scaling"]
+            if thread_scaler is not None and threads is not None:
+                # estimate for the threads given to the job, which snakemake may have lowered
+                runtime, memory = thread_scaler.scale(job_data, current_threads(rule, wildcards, input), threads)
+                job_data.runtime, job_data.memory = float(runtime), float(memory)
+
+            if attempt > 1 and record_benchmarks:
+                # snakemake is retrying the job as the previous attempt failed
+                try:
+                    log_files = rule.expand_log(dict(wildcards.items()))
+                except WildcardError:
+                    log_files = []
+                memo.add_failure(
+                    variables,
+                    rule,
+                    wildcards,
+                    input,
+                    attempt - 1,
+                    memory=_scale_prediction(variables, job_data, "memory", attempt - 1),
+                    runtime=_scale_prediction(variables, job_data, "runtime", attempt - 1),
+                    log_files=log_files,
+                    threads=threads,
+                )
 
-            return scale * getattr(job_data, resource) * attempt**exp
+            return _scale_prediction(variables, job_data, resource, attempt)
 
         return slurmise_predict
 
+    def make_thread_predictor(variables, rule, thread_scaler, current_threads):
+        def slurmise_threads(wildcards, input):
+            job_data = memo.prediction(variables, rule, wildcards, input)
+            return thread_scaler.choose_threads(job_data, current_threads(rule, wildcards, input))
+
+        return slurmise_threads
+
+    auto_scaled_rules = {}
     for rule_name, variables in rules.items():
         rule = workflow.get_rule(rule_name)
 
         thread_scaling = variables.get("SLURMISE_thread_scaling", None)
         if isinstance(thread_scaling, (int, float)):
             thread_scaling = snake_parsers.ThreadScaler(memory_per_thread=thread_scaling)
+        elif thread_scaling == "auto":
+            thread_variable = _thread_variable(variables)
+            if thread_variable is None:
+                raise ValueError(f"Automatic thread scaling of rule {rule.name} requires a variable from sp.threads().")
+            auto_scaled_rules[rule_name] = thread_variable
+            # use the scaler fit during a previous run, if any
+            thread_scaling = slurmise.load_thread_scaler(rule_name)
+        if thread_scaling is not None:
+            overrides = {
+                key: variables[f"SLURMISE_{key}"]
+                for key in ("thread_objective", "core_hour_budget")
+                if f"SLURMISE_{key}" in variables
+            }
+            if "thread_objective" in overrides:
+                overrides["objective"] = overrides.pop("thread_objective")
+            thread_scaling = replace(thread_scaling, **overrides)
         variables["SLURMISE_thread_scaling"] = thread_scaling
 
+        # the threads requested by the rule, before slurmise scales them
+        current_threads = snake_parsers.threads(cores=rule.resources["_cores"])
+        thread_variable = _thread_variable(variables)
+        if thread_variable is not None:
+            variables[thread_variable] = current_threads
+
         if record_benchmarks:
             # set benchmark to record stats
             if rule.benchmark is not None:
@@ -149,8 +263,219 @@ def patch_snakemake_workflow(
             # get the slurmise parsed data for recroding in the benchmark file
             rule.params.update({"slurmise_data": make_predictor(variables, rule, "logging")})
 
-        rule.resources["mem_mb"] = make_predictor(variables, rule, "memory")
-        rule.resources["runtime"] = make_predictor(variables, rule, "runtime")
+        rule.resources["mem_mb"] = make_predictor(variables, rule, "memory", current_threads)
+        rule.resources["runtime"] = make_predictor(variables, rule, "runtime", current_threads)
+        if thread_scaling is not None:
+            rule.resources["_cores"] = make_thread_predictor(variables, rule, thread_scaling, current_threads)
+
+
+class PredictionMemo:
+    """Parse and predict each snakemake job once.
+
+    The mem_mb and runtime resources and the slurmise_data param are evaluated
+    separately by snakemake, and again on every retry attempt.  Results are
+    keyed on the rule, wildcards and input files of the job so the variable
+    functions, file parsers and models only run once per job.  Copies are
+    returned as callers are free to modify them.
+
+    Failed attempts of jobs are collected with add_failure until they are recorded.
+    """
+
+    def __init__(self, slurmise: Slurmise):
+        self.slurmise = slurmise
+        self._job_data: dict[tuple, JobData] = {}
+        self._predictions: dict[tuple, JobData] = {}
+        self._failures: dict[tuple, JobData] = {}
+        # failed attempts are not unique across runs of the workflow
+        self._run_id = uuid.uuid4().hex
+
+    @staticmethod
+    def make_key(rule, wildcards, input) -> tuple:
+        return (rule.name, tuple(wildcards.keys()), tuple(wildcards), tuple(input))
+
+    def _parse(self, key, variables, rule, wildcards, input) -> JobData:
+        if key not in self._job_data:
+            vars = {
+                name: func(rule, wildcards, input)
+                for name, func in variables.items()
+                if not name.startswith("SLURMISE")
+            }
+            self._job_data[key] = self.slurmise.job_data_from_dict(vars, rule.name)
+        return self._job_data[key]
+
+    def job_data(self, variables, rule, wildcards, input) -> JobData:
+        key = self.make_key(rule, wildcards, input)
+        return copy.deepcopy(self._parse(key, variables, rule, wildcards, input))
+
+    def prediction(self, variables, rule, wildcards, input) -> JobData:
+        key = self.make_key(rule, wildcards, input)
+        if key not in self._predictions:
+            # raw_predict sets the resources on the query in place
+            query = copy.deepcopy(self._parse(key, variables, rule, wildcards, input))
+            self._predictions[key] = self.slurmise.raw_predict(query)[0]
+        return copy.deepcopy(self._predictions[key])
+
+    def prefetch(self, jobs, max_workers: int | None = None) -> int:
+        """Parse and predict many jobs before snakemake requests their resources.
+
+        jobs is an iterable of (variables, rule, wildcards, input).  Variables are
+        parsed in a thread pool and all new jobs are predicted with one batch, which
+        evaluates each model once.  Jobs which fail to parse are skipped here and
+        raise when snakemake evaluates them.  Returns the number of predicted jobs.
+        """
+        pending = {}
+        for variables, rule, wildcards, input in jobs:
+            key = self.make_key(rule, wildcards, input)
+            if key not in self._predictions:
+                pending[key] = (variables, rule, wildcards, input)
+
+        def try_parse(key):
+            try:
+                self._parse(key, *pending[key])
+            except Exception:  # noqa: BLE001
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parsed = [key for key, ok in zip(pending, executor.map(try_parse, pending), strict=True) if ok]
+        return self._predict_batch(parsed)
+
+    def refresh(self) -> int:
+        """Predict every parsed job again with one batch, e.g. after models are updated."""
+        self._predictions.clear()
+        return self._predict_batch(list(self._job_data))
+
+    def _predict_batch(self, keys) -> int:
+        # batch_raw_predict sets the resources on the queries in place
+        queries = [copy.deepcopy(self._job_data[key]) for key in keys]
+        for key, (prediction, _) in zip(keys, self.slurmise.batch_raw_predict(queries), strict=True):
+            self._predictions[key] = prediction
+        return len(keys)
+
+    def add_failure(self, variables, rule, wildcards, input, attempt, memory, runtime, log_files, threads=None) -> None:
+        """Store a failed attempt of a job with the memory, runtime and threads it was given.
+
+        The outcome is determined from the log files of the job.
+        """
+        key = self.make_key(rule, wildcards, input)
+        if (key, attempt) in self._failures:
+            return
+        job_data = self.job_data(variables, rule, wildcards, input)
+        job_data.slurm_id = hashlib.md5(f"{self._run_id}:{key}:{attempt}".encode()).hexdigest()
+        job_data.memory = memory
+        job_data.runtime = runtime
+        job_data.outcome = classify_failure(log_files)
+        thread_variable = _thread_variable(variables)
+        if threads is not None and thread_variable in job_data.numerics:
+            job_data.numerics[thread_variable] = threads
+        self._failures[(key, attempt)] = job_data
+
+    def pop_failures(self) -> list[JobData]:
+        failures = list(self._failures.values())
+        self._failures.clear()
+        return failures
+
+    def clear(self) -> None:
+        self._job_data.clear()
+        self._predictions.clear()
+
+
+def _scale_prediction(variables, job_data: JobData, resource: str, attempt: int) -> float:
+    """The amount of resource to request for an attempt of a job."""
+    exp = variables.get("SLURMISE_attempt_exp", SLURMISE_DEFAULTS["attempt_exp"])
+    scale = variables.get(
+        f"SLURMISE_{resource}_scale",
+        SLURMISE_DEFAULTS[f"{resource}_scale"],
+    )
+
+    return scale * getattr(job_data, resource) * attempt**exp
+
+
+def classify_failure(log_files) -> str:
+    """Determine if a failed job ran out of memory or time from the end of its log files."""
+    outcome = FAILED
+    for log_file in log_files:
+        try:
+            with open(log_file, "rb") as log:
+                log.seek(0, 2)
+                log.seek(max(log.tell() - LOG_TAIL_BYTES, 0))
+                tail = log.read()
+        except OSError:
+            continue
+        if OOM_PATTERN.search(tail):
+            return OOM
+        if TIMEOUT_PATTERN.search(tail):
+            outcome = TIMEOUT
+    return outcome
+
+
+def read_benchmark(file: Path) -> list[JobData]:
+    """Convert a benchmark file of a rule patched by slurmise to processed job data.
+
+    The file is read with the ingest benchmark reader, so repeats without a
+    measurement (NA) are skipped and invalid runtimes or memory raise a ValueError.
+    """
+    jobs = []
+    for record in read_benchmark_file(file):
+        if record.error is not None:
+            raise ValueError(record.error)
+        slurmise_data = json.loads(record.variables["slurmise_data"])
+        # if a value is a thread, update it to true value
+        slurmise_data = _correct_threads(slurmise_data, record.variables)
+        jobs.append(
+            JobData(
+                job_name=record.job_name,
+                slurm_id=record.slurm_id,
+                categories=slurmise_data["categories"],
+                numerics=slurmise_data["numerics"],
+                runtime=record.runtime,
+                memory=record.memory,
+            )
+        )
+    return jobs
+
+
+def _try_read_benchmark(file: Path) -> list[JobData] | Exception:
+    try:
+        return read_benchmark(file)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return e
+
+
+def record_benchmark_dir(slurmise: Slurmise, benchmark_dir: str | Path, max_workers: int | None = None) -> int:
+    """Record all benchmark files in benchmark_dir, returning the number of new jobs.
+
+    Files are read in a thread pool and written with a single open of the database.
+    Files which can't be read and jobs already in the database are skipped.
+    """
+    start = time.perf_counter()
+    files = sorted(Path(benchmark_dir).rglob("*.jsonl"))
+    jobs = []
+    unreadable = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file, result in zip(files, executor.map(_try_read_benchmark, files), strict=True):
+            if isinstance(result, Exception):
+                unreadable += 1
+                logger.warning(f"SLURMISE: Skipping benchmark {file}: {result!r}")
+            else:
+                jobs.extend(result)
+
+    recorded = slurmise.raw_record_batch(jobs)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"SLURMISE: Recorded {recorded} of {len(files)} benchmarks in {elapsed:.2f} s "
+        f"({len(files) / max(elapsed, 1e-9):.0f} files/s), skipped {unreadable} unreadable "
+        f"and {len(jobs) - recorded} already recorded"
+    )
+    return recorded
+
+
+def _thread_variable(variables) -> str | None:
+    """The name of the variable recording threads, if any."""
+    for name, func in variables.items():
+        if not name.startswith("SLURMISE") and getattr(func, "__name__", None) == "get_threads":
+            return name
+    return None
 
 
 def _mark_threads(job_data, variable_name):
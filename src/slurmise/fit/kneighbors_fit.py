@@ -7,6 +7,7 @@ import joblib
 from sklearn.neighbors import KNeighborsRegressor
 from sklearn.pipeline import Pipeline
 
+from slurmise import profiling
 from slurmise.fit.resource_fit import ResourceFit
 from slurmise.job_data import JobData
 
@@ -18,6 +19,7 @@ class KNNFit(ResourceFit):
     memory_model: InitVar[Pipeline | None] = None
     _runtime_model_name: ClassVar[str] = "knn_runtime_model.pkl"
     _memory_model_name: ClassVar[str] = "knn_memory_model.pkl"
+    _metric_model_name: ClassVar[str] = "knn_{metric}_model.pkl"
 
     def __post_init__(self, runtime_model, memory_model):
         self.runtime_model = runtime_model
@@ -26,13 +28,14 @@ class KNNFit(ResourceFit):
         super().__post_init__()
 
     @classmethod
+    @profiling.profiled("model.load")
     def load(cls, query: JobData | None = None, path: str | None = None) -> KNNFit:
         fit_obj = super().load(query=query, path=path, nneighbors=5)
 
-        runtime_model = fit_obj.path / KNNFit._runtime_model_name
+        runtime_model = fit_obj._model_file(KNNFit._runtime_model_name)
         fit_obj.runtime_model = joblib.load(str(runtime_model)) if runtime_model.exists() else None
 
-        memory_model = fit_obj.path / KNNFit._memory_model_name
+        memory_model = fit_obj._model_file(KNNFit._memory_model_name)
         fit_obj.memory_model = joblib.load(str(memory_model)) if memory_model.exists() else None
 
         return fit_obj
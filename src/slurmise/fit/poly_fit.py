@@ -8,6 +8,7 @@ from sklearn.linear_model import LinearRegression
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import PolynomialFeatures
 
+from slurmise import profiling
 from slurmise.fit.resource_fit import ResourceFit
 from slurmise.job_data import JobData
 
@@ -19,6 +20,7 @@ class PolynomialFit(ResourceFit):
     memory_model: InitVar[Pipeline | None] = None
     _runtime_model_name: ClassVar[str] = "poly_runtime_model.pkl"
     _memory_model_name: ClassVar[str] = "poly_memory_model.pkl"
+    _metric_model_name: ClassVar[str] = "poly_{metric}_model.pkl"
 
     def __post_init__(self, runtime_model, memory_model):
         self.runtime_model = runtime_model
@@ -30,13 +32,14 @@ class PolynomialFit(ResourceFit):
         super().save()
 
     @classmethod
+    @profiling.profiled("model.load")
     def load(cls, query: JobData | None = None, path: str | None = None) -> PolynomialFit:
         fit_obj = super().load(query=query, path=path, degree=2)
 
-        runtime_model = fit_obj.path / PolynomialFit._runtime_model_name
+        runtime_model = fit_obj._model_file(PolynomialFit._runtime_model_name)
         fit_obj.runtime_model = joblib.load(str(runtime_model)) if runtime_model.exists() else None
 
-        memory_model = fit_obj.path / PolynomialFit._memory_model_name
+        memory_model = fit_obj._model_file(PolynomialFit._memory_model_name)
         fit_obj.memory_model = joblib.load(str(memory_model)) if memory_model.exists() else None
 
         return fit_obj
@@ -3,12 +3,17 @@ from __future__ import annotations
 import datetime
 import hashlib
 import json
+import os
 import pathlib
+import re
+import shutil
+import time
 from dataclasses import asdict, dataclass, field
-from typing import Optional
+from typing import ClassVar, Optional
 
 import joblib
 import numpy as np
+import pandas as pd
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.metrics import mean_squared_error
@@ -16,21 +21,44 @@ from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 
-from slurmise.job_data import JobData
+from slurmise import profiling
+from slurmise.job_data import COMPLETED, OOM, TIMEOUT, JobData
 from slurmise.utils import jobs_to_pandas
 
 BASEMODELPATH = pathlib.Path.home() / ".slurmise/models/"
 
+# targets with their own models, other targets are metrics of the jobs
+RESOURCE_TARGETS = ("runtime", "memory")
+# warnings of predictions which returned the default of a target, see defaulted_targets
+NOT_FIT_WARNING = "Not enough fitting data points in the fits. Returning default values."
+DEFAULT_WARNING = "Returing default {target} value."
+# directories of each save of the model files, named by the time and process of the save
+VERSION_REGEX = re.compile(r"version-\d+\.\d+")
+
+
+def defaulted_targets(warnmsgs: list[str]) -> set[str]:
+    """The resource targets a prediction returned the defaults of, as the model isn't fit or was rejected."""
+    if NOT_FIT_WARNING in warnmsgs:
+        return set(RESOURCE_TARGETS)
+    return {target for target in RESOURCE_TARGETS if DEFAULT_WARNING.format(target=target) in warnmsgs}
+
 
 @dataclass(kw_only=True)
 class ResourceFit:
     query: JobData
     last_fit_dsize: int = 0
+    last_fit_njobs: int = 0
     fit_timestamp: datetime.datetime = field(default_factory=datetime.datetime.now)
     model_metrics: dict = field(default_factory=dict)
     path: Optional[pathlib.Path] = None
+    targets: list[str] = field(default_factory=lambda: list(RESOURCE_TARGETS))
+    # directory of the model files under path, None for models saved directly in path
+    model_version: str | None = None
+    _metric_model_name: ClassVar[str] = "{metric}_model.pkl"
 
     def __post_init__(self):
+        # models of the metric targets, which are not fields so they are not saved in fits.json
+        self.metric_models = {}
         if isinstance(self.path, str):
             self.path = pathlib.Path(self.path)
         elif isinstance(self.path, pathlib.Path):
@@ -45,10 +73,11 @@ class ResourceFit:
         """
         This method generates a hash of the model's query information.
         """
+        # categories are sorted and stored as strings in the database
         hash_info = {
             "class": cls.__name__,
             "job_name": query.job_name,
-            **query.categories,
+            **{key: str(value) for key, value in sorted(query.categories.items())},
         }
         hash_info_tuple = tuple(hash_info.items())
 
@@ -56,46 +85,106 @@ class ResourceFit:
         return hashlib.md5(str(hash_info_tuple).encode("utf-8")).hexdigest()  # noqa: S324
 
     @classmethod
-    def _make_model_path(cls, query) -> pathlib.Path:
+    def _make_model_path(cls, query, base_path: str | pathlib.Path | None = None) -> pathlib.Path:
         """
         This method returns the path to the model's directory.
 
-        The model's path is a function of the model's type and the hash of its query.
+        The model's path is a function of the model's type and the hash of its query,
+        placed under base_path or the BASEMODELPATH.
         """
         hash_val = cls._get_model_info_hash(query)
-        return pathlib.Path(BASEMODELPATH) / cls.__name__ / hash_val
+        if base_path is None:
+            base_path = BASEMODELPATH
+        return pathlib.Path(base_path) / cls.__name__ / hash_val
+
+    @staticmethod
+    def read_fit_info(path: str | pathlib.Path) -> dict | None:
+        """Read the saved information of a model without loading it, None if never saved."""
+        fits_file = pathlib.Path(path) / "fits.json"
+        if not fits_file.exists():
+            return None
+        with open(fits_file) as load_file:
+            return json.load(load_file)
+
+    def _atomic_write(self, filename: str, write):
+        """Call write with a temporary file which replaces filename when complete.
+
+        Processes loading the model concurrently see either the old or new file.
+        """
+        tmp_path = self.path / f".{filename}.{os.getpid()}.tmp"
+        try:
+            write(str(tmp_path))
+            os.replace(tmp_path, self.path / filename)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def _model_file(self, filename: str) -> pathlib.Path:
+        """The path of a model file of the saved version."""
+        if self.model_version is None:
+            return self.path / filename
+        return self.path / self.model_version / filename
 
     def save(self, model_params: dict | None = None):
         """This method saves the basic information of the model, such as its query,
         when it was last fit, the dataset size of the latest fit, and the type of
         the model.
+
+        The models are written to a new version directory, which fits.json names
+        when it is replaced, so processes loading the model concurrently read
+        fits.json and the models of the same save.  The previous version is kept
+        for loads which read fits.json before it was replaced.
         """
         if model_params is None:
             model_params = {}
 
         self.path.mkdir(parents=True, exist_ok=True)
-        with open(str(self.path / "fits.json"), "w") as save_file:
-            # This converts the dataclass to a dictionary. If it is called from a subclass,
-            # the subclass's attributes will be included in the dictionary.
-            info = asdict(self)
+        previous_info = self.read_fit_info(self.path)
+        previous_version = None if previous_info is None else previous_info.get("model_version")
 
-            # Convert path to string
-            info["path"] = str(info["path"])
+        self.model_version = f"version-{time.time_ns()}.{os.getpid()}"
+        version_path = self.path / self.model_version
+        version_path.mkdir()
+        if self.runtime_model is not None:
+            joblib.dump(self.runtime_model, version_path / self._runtime_model_name)
+        if self.memory_model is not None:
+            joblib.dump(self.memory_model, version_path / self._memory_model_name)
+        for metric, model in self.metric_models.items():
+            joblib.dump(model, version_path / self._metric_model_name.format(metric=metric))
 
-            # Convert datetime to string
-            info["fit_timestamp"] = info["fit_timestamp"].isoformat()
+        # This converts the dataclass to a dictionary. If it is called from a subclass,
+        # the subclass's attributes will be included in the dictionary.
+        info = asdict(self)
 
-            info.update(model_params)
-            json.dump(info, save_file)
+        # Convert path to string
+        info["path"] = str(info["path"])
 
-        if self.runtime_model is not None:
-            modelpath = self.path / self._runtime_model_name
-            joblib.dump(self.runtime_model, str(modelpath))
-        if self.memory_model is not None:
-            modelpath = self.path / self._memory_model_name
-            joblib.dump(self.memory_model, str(modelpath))
+        # Convert datetime to string
+        info["fit_timestamp"] = info["fit_timestamp"].isoformat()
+
+        info.update(model_params)
+
+        def write_info(path):
+            with open(path, "w") as save_file:
+                json.dump(info, save_file)
+
+        self._atomic_write("fits.json", write_info)
+        self._remove_old_versions(keep={self.model_version, previous_version})
+
+    def _remove_old_versions(self, keep: set[str | None]) -> None:
+        """Remove the model files of saves before the versions to keep."""
+        for entry in self.path.iterdir():
+            if entry.is_dir() and VERSION_REGEX.fullmatch(entry.name) and entry.name not in keep:
+                shutil.rmtree(entry, ignore_errors=True)
+        if None not in keep:
+            # models saved directly in path, before versions
+            filenames = [self._runtime_model_name, self._memory_model_name]
+            filenames += [self._metric_model_name.format(metric=metric) for metric in self.targets]
+            for filename in filenames:
+                (self.path / filename).unlink(missing_ok=True)
 
     @classmethod
+    @profiling.profiled("model.load")
     def load(cls, query: JobData | None = None, path: str | None = None, **kwargs) -> ResourceFit:
         """
         This method loads a model from a file. The model is loaded from the path
@@ -138,7 +227,12 @@ class ResourceFit:
         # a ResourceFit subclass, it includes all attributes of the subclass(es) and the
         # ResourceFit class.
 
-        return cls(**info)
+        fit_obj = cls(**info)
+        for metric in fit_obj.targets:
+            metric_model = fit_obj._model_file(cls._metric_model_name.format(metric=metric))
+            if metric not in RESOURCE_TARGETS and metric_model.exists():
+                fit_obj.metric_models[metric] = joblib.load(str(metric_model))
+        return fit_obj
 
     @classmethod
     def mean_percent_error(cls, y_true, y_pred) -> ColumnTransformer:
@@ -166,80 +260,141 @@ class ResourceFit:
 
         return preprocessor
 
+    @profiling.profiled("model.fit")
     def fit(self, jobs: list[JobData], random_state: np.random.RandomState | None, **kwargs):  # noqa: ARG002
+        """Fit a model of each target, runtime, memory and any metrics of the jobs.
+
+        Jobs without a metric are not used for its model, metrics without any jobs are not fit.
+        Jobs missing their memory or runtime, e.g. deferred records which aren't filled
+        from sacct yet, are skipped.
+        """
+        njobs = len(jobs)
+        jobs = [job for job in jobs if job.memory is not None and job.runtime is not None]
+        if not jobs:
+            # predictions return the defaults until there are enough jobs
+            self.last_fit_dsize = 0
+            self.last_fit_njobs = njobs
+            self.model_metrics = {}
+            self.runtime_model = self.memory_model = None
+            self.metric_models = {}
+            return
         X, categories, numerics = jobs_to_pandas(jobs)  # noqa: N806
 
-        Y = X[["runtime", "memory"]]  # noqa: N806
+        target_columns = [
+            target if target in RESOURCE_TARGETS else f"metrics.{target}"
+            for target in self.targets
+            if target in RESOURCE_TARGETS or f"metrics.{target}" in X
+        ]
+        Y = X[target_columns]  # noqa: N806
 
-        # Drop the runtime and memory columns
-        X = X.drop(columns=["runtime", "memory"])  # noqa: N806
+        # Drop the runtime, memory and metric columns
+        X = X.drop(columns=[column for column in X if column in RESOURCE_TARGETS or column.startswith("metrics.")])  # noqa: N806
+
+        # Only completed jobs are used for testing, oom and timeout jobs are lower bounds
+        outcomes = np.array([job.outcome for job in jobs])
+        completed = outcomes == COMPLETED
+        bounds = {"runtime": outcomes == TIMEOUT, "memory": outcomes == OOM}
 
         # Split test and train data
-        X_train, X_test, y_train, y_test = train_test_split(X, Y, test_size=0.2, random_state=random_state)  # noqa: N806
+        X_train, X_test, y_train, y_test = train_test_split(  # noqa: N806
+            X[completed], Y[completed], test_size=0.2, random_state=random_state
+        )
 
         self.last_fit_dsize = len(X_train)
-
-        self.runtime_model = self._make_model(categories, numerics)
-        self.memory_model = self._make_model(categories, numerics)
-
-        self.runtime_model.fit(X_train, y_train["runtime"])
-        self.memory_model.fit(X_train, y_train["memory"])
-
-        # Evaluate the model on test
-        Y_pred_runtime = self.runtime_model.predict(X_test)  # noqa: N806
-        Y_pred_memory = self.memory_model.predict(X_test)  # noqa: N806
-
-        self.model_metrics = {
-            "runtime": {
-                "mpe": self.mean_percent_error(y_test["runtime"], Y_pred_runtime),
-                "mse": mean_squared_error(y_test["runtime"], Y_pred_runtime),
-            },
-            "memory": {
-                "mpe": self.mean_percent_error(y_test["memory"], Y_pred_memory),
-                "mse": mean_squared_error(y_test["memory"], Y_pred_memory),
-            },
-        }
+        # the jobs of the group, as compared by incremental updates
+        self.last_fit_njobs = njobs
+
+        self.model_metrics = {}
+        self.runtime_model = self.memory_model = None
+        self.metric_models = {}
+        for column in target_columns:
+            train = y_train[column].notna().to_numpy()
+            test = y_test[column].notna().to_numpy()
+            if not train.any():
+                continue
+            model = self._make_model(categories, numerics)
+            if column in RESOURCE_TARGETS:
+                self._fit_with_lower_bounds(
+                    model, X_train, y_train[column], X[bounds[column]], Y[column][bounds[column]]
+                )
+                setattr(self, f"{column}_model", model)
+            else:
+                model.fit(X_train[train], y_train[column][train])
+                self.metric_models[column.removeprefix("metrics.")] = model
+
+            # Evaluate the model on test
+            if test.any():
+                y_pred = model.predict(X_test[test])
+                self.model_metrics[column.removeprefix("metrics.")] = {
+                    "mpe": self.mean_percent_error(y_test[column][test], y_pred),
+                    "mse": mean_squared_error(y_test[column][test], y_pred),
+                }
         # TODO: Warning if model metrics are larger than a threshold.
 
+    @staticmethod
+    def _fit_with_lower_bounds(model, X_train, y_train, X_bound, y_bound):
+        """Fit the model, then refit with the lower bound jobs it under predicts.
+
+        An oom or timeout job used at least the resources it was killed at, so it is
+        only added to the training data when the model predicts less than that.
+        """
+        model.fit(X_train, y_train)
+        if len(X_bound) == 0:
+            return
+
+        under_predicted = model.predict(X_bound) < y_bound.to_numpy()
+        if under_predicted.any():
+            model.fit(
+                pd.concat([X_train, X_bound[under_predicted]]),
+                pd.concat([y_train, y_bound[under_predicted]]),
+            )
+
+    @profiling.profiled("model.predict")
     def predict(self, job: JobData) -> tuple[JobData, list[str]]:
-        # TODO: check if it can be abstracted.
+        jobs, warnmsgs = self.predict_batch([job])
+        return jobs[0], warnmsgs[0]
 
+    @profiling.profiled("model.predict")
+    def predict_batch(self, jobs: list[JobData]) -> tuple[list[JobData], list[list[str]]]:
+        """Predict the resources of several jobs with a single evaluation of each model.
+
+        The jobs should share the categories of this model.  The resources of each
+        job are updated in place as with predict, and the warnings of each job are
+        returned in the same order.
+        """
         if self.last_fit_dsize < 10:
             return (
-                job,
-                "Not enough fitting data points in the fits. Returning default values.",
+                jobs,
+                [[NOT_FIT_WARNING] for _ in jobs],
             )
-
-        X, _, _ = jobs_to_pandas([job])  # noqa: N806
-        warnmsg = []
-        if self.model_metrics["runtime"]["mpe"] < 10:
-            warnmsg += [
-                f"Runtime prediction for job {job.job_name} is not within 10% of actual value.",
-                "Returing default runtime value.",
-            ]
-        else:
-            predicted_runtime = self.runtime_model.predict(X)[0]
-            if predicted_runtime > 0 and predicted_runtime < 100 * job.runtime:
-                job.runtime = predicted_runtime
-            else:
-                warnmsg += [
-                    f"Predicted runtime for job {job.job_name} is either negative or more than 100 times larger than default.",
-                    "Returing default runtime value.",
-                ]
-
-        if self.model_metrics["memory"]["mpe"] < 10:
-            warnmsg += [
-                f"Memory prediction for job {job.job_name} is not within 10% of actual value.",
-                "Returing default memory value.",
-            ]
-        else:
-            predicted_memory = self.memory_model.predict(X)[0]
-            if predicted_memory > 0 and predicted_memory < 100 * job.memory:
-                job.memory = predicted_memory
-            else:
-                warnmsg += [
-                    f"Predicted memory for job {job.job_name} is either negative or more than 100 times larger than default.",
-                    "Returing default memory value.",
-                ]
-
-        return job, warnmsg
+        if not jobs:
+            return jobs, []
+
+        X, _, _ = jobs_to_pandas(jobs)  # noqa: N806
+        warnmsgs = [[] for _ in jobs]
+        for target in RESOURCE_TARGETS:
+            if target not in self.model_metrics:
+                continue
+            if self.model_metrics[target]["mpe"] < 10:
+                for job, warnmsg in zip(jobs, warnmsgs, strict=True):
+                    warnmsg += [
+                        f"{target.capitalize()} prediction for job {job.job_name} is not within 10% of actual value.",
+                        DEFAULT_WARNING.format(target=target),
+                    ]
+                continue
+
+            predicted_values = getattr(self, f"{target}_model").predict(X)
+            for job, warnmsg, predicted_value in zip(jobs, warnmsgs, predicted_values, strict=True):
+                if predicted_value > 0 and predicted_value < 100 * getattr(job, target):
+                    setattr(job, target, predicted_value)
+                else:
+                    warnmsg += [
+                        f"Predicted {target} for job {job.job_name} is either negative or more than 100 times larger than default.",
+                        DEFAULT_WARNING.format(target=target),
+                    ]
+
+        for metric, model in self.metric_models.items():
+            for job, predicted_metric in zip(jobs, model.predict(X), strict=True):
+                job.metrics[metric] = max(float(predicted_metric), 0.0)
+
+        return jobs, warnmsgs
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import re
+from collections.abc import Callable, Iterator, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+
+from slurmise import slurm
+from slurmise.job_data import JobData
+
+# characters which may precede a command in a submit line, e.g. sbatch --wrap="cmd"
+COMMAND_BOUNDARY = r"(?:^|(?<=[\s'\"=]))"
+
+
+@dataclass
+class HarvestSummary:
+    """Counts of the jobs returned by sacct during a harvest."""
+
+    windows: int = 0
+    jobs: int = 0
+    recorded: int = 0
+    duplicates: int = 0
+    unmatched: int = 0
+    unfinished: int = 0
+
+
+class JobMatcher:
+    """Match jobs from sacct to the configured jobs and parse them with their job spec.
+
+    The submit line and then the name of each job are searched for the prefix or
+    name of a configured job.  The text from the match to the end of the line, or
+    the closing quote of a wrapped command, is parsed as the command of the job.
+    """
+
+    def __init__(self, configuration):
+        self.configuration = configuration
+        starts = {*configuration.jobs, *configuration.job_prefixes.values()}
+        # longer starts first, so a job prefix takes precedence over a job name it starts with
+        alternatives = "|".join(re.escape(start) for start in sorted(starts, key=len, reverse=True))
+        self.regex = re.compile(rf"{COMMAND_BOUNDARY}(?:{alternatives})(?=[\s'\"]|$)") if starts else None
+
+    def commands(self, sacct_job: dict) -> Iterator[str]:
+        """Yield the possible commands of a job from sacct."""
+        if self.regex is None:
+            return
+        for text in (sacct_job.get("submit_line") or "", sacct_job.get("name") or ""):
+            match = self.regex.search(text)
+            if match is None:
+                continue
+            cmd = text[match.start() :]
+            quote = text[match.start() - 1] if match.start() > 0 else ""
+            if quote in ("'", '"'):
+                cmd = cmd.split(quote, 1)[0]
+            yield cmd.strip()
+
+    def match(self, sacct_job: dict) -> JobData | None:
+        """Parse the first command of the job which matches its job spec, None if none do."""
+        for cmd in self.commands(sacct_job):
+            try:
+                return self.configuration.parse_job_cmd(cmd=cmd, slurm_id=str(sacct_job["job_id"]), diagnose=False)
+            except (ValueError, OSError):
+                continue
+        return None
+
+
+def time_windows(
+    since: datetime.datetime,
+    until: datetime.datetime,
+    window: datetime.timedelta,
+) -> Iterator[tuple[datetime.datetime, datetime.datetime]]:
+    """Split the time from since to until into consecutive windows."""
+    start = since
+    while start < until:
+        end = min(start + window, until)
+        yield start, end
+        start = end
+
+
+class HarvestCheckpoint:
+    """The end of the last harvested window of each query, stored as json.
+
+    A query is the user, partition and start time of a harvest, so a harvest
+    which is interrupted, or repeated with a later end time, resumes where the
+    previous one stopped.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    @staticmethod
+    def query_key(since: datetime.datetime, user: str | None, partition: str | None) -> str:
+        return json.dumps([since.isoformat(), user, partition])
+
+    def _read(self) -> dict:
+        if not self.path.exists():
+            return {}
+        return json.loads(self.path.read_text())
+
+    def _write(self, checkpoints: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(checkpoints, indent=2))
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> datetime.datetime | None:
+        completed = self._read().get(key)
+        return None if completed is None else datetime.datetime.fromisoformat(completed)
+
+    def set(self, key: str, completed: datetime.datetime) -> None:
+        checkpoints = self._read()
+        checkpoints[key] = completed.isoformat()
+        self._write(checkpoints)
+
+    def clear(self, key: str) -> None:
+        checkpoints = self._read()
+        if checkpoints.pop(key, None) is not None:
+            self._write(checkpoints)
+
+
+def harvest_window(
+    matcher: JobMatcher,
+    sacct_json: dict,
+    summary: HarvestSummary,
+    fetch_metadata: Callable[[list[str]], Mapping[tuple[str, str | None], dict]] | None = None,
+) -> list[JobData]:
+    """Parse the finished jobs of a sacct query which match a configured job.
+
+    The metadata of each job is parsed from sacct_json, unless fetch_metadata is
+    given, which returns the metadata of the matched job ids as
+    slurm.parse_slurm_jobs_metadata, e.g. for the listing of the parsable backend.
+    """
+    matched = []
+    for sacct_job in sacct_json.get("jobs", []):
+        summary.jobs += 1
+        try:
+            state = sacct_job["state"]["current"][0]
+        except (KeyError, IndexError, TypeError):
+            state = None
+        if state in slurm.UNFINISHED_STATES:
+            summary.unfinished += 1
+            continue
+
+        job_data = matcher.match(sacct_job)
+        if job_data is None:
+            summary.unmatched += 1
+            continue
+        matched.append((job_data, sacct_job))
+
+    fetched = None
+    if fetch_metadata is not None and matched:
+        fetched = fetch_metadata([job_data.slurm_id for job_data, _ in matched])
+    jobs = []
+    for job_data, sacct_job in matched:
+        try:
+            metadata = slurm.parse_sacct_job(sacct_job) if fetched is None else fetched[job_data.slurm_id, None]
+        except (KeyError, IndexError, TypeError, ValueError):
+            # e.g. cancelled before any step ran
+            summary.unmatched += 1
+            continue
+        jobs.append(slurm.update_job_data(job_data, metadata, matcher.configuration.get_metrics(job_data.job_name)))
+    return jobs
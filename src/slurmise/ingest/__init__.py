@@ -0,0 +1,12 @@
+from slurmise.ingest.csv_mapping import read_csv
+from slurmise.ingest.nextflow_trace import read_traces
+from slurmise.ingest.snakemake_benchmarks import read_benchmarks
+from slurmise.ingest.trace_record import IngestSummary, TraceRecord
+
+INGEST_FORMATS = {
+    "snakemake": read_benchmarks,
+    "nextflow": read_traces,
+    "csv": read_csv,
+}
+
+__all__ = ["INGEST_FORMATS", "IngestSummary", "TraceRecord", "read_benchmarks", "read_csv", "read_traces"]
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import csv
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from slurmise.ingest.trace_record import MEMORY_UNITS, RUNTIME_UNITS, TraceRecord, read_usage, stable_id
+
+# fields of a job which can be mapped to a column, other names are variables
+CSV_FIELDS = ("job_name", "slurm_id", "runtime", "memory", "cmd")
+
+
+def read_csv(
+    paths: Iterable[str | Path],
+    columns: dict[str, str] | None = None,
+    job_name: str | None = None,
+    runtime_unit: str = "m",
+    memory_unit: str = "MB",
+    delimiter: str = ",",
+) -> Iterator[TraceRecord]:
+    """Read jobs from csv files with a header.
+
+    :arguments:
+        :paths: The csv files.
+        :columns: Mapping of the job fields (job_name, slurm_id, runtime, memory
+            and cmd) and variables to their column.  Unmapped fields and variables
+            use the column of the same name.
+        :job_name: The job of every row, instead of a column.
+        :runtime_unit: The unit of the runtime column, one of ms, s, m, h or d.
+        :memory_unit: The unit of the memory column, one of B, KB, MB, GB or TB.
+        :delimiter: The column delimiter.
+
+    Rows without a slurm id are given an id derived from their file, row and values.
+    """
+    columns = columns or {}
+    if runtime_unit not in RUNTIME_UNITS:
+        msg = f"Unknown runtime unit {runtime_unit!r}, expected one of {', '.join(RUNTIME_UNITS)}"
+        raise ValueError(msg)
+    if memory_unit not in MEMORY_UNITS:
+        msg = f"Unknown memory unit {memory_unit!r}, expected one of {', '.join(MEMORY_UNITS)}"
+        raise ValueError(msg)
+
+    fields = {name: columns.get(name, name) for name in CSV_FIELDS}
+    variable_columns = {name: column for name, column in columns.items() if name not in CSV_FIELDS}
+
+    for path in paths:
+        with open(path, newline="") as csv_file:
+            for row_number, row in enumerate(csv.DictReader(csv_file, delimiter=delimiter)):
+                variables = {**row, **{name: row.get(column) for name, column in variable_columns.items()}}
+                runtime, memory, error = read_usage(row.get(fields["runtime"]), row.get(fields["memory"]))
+                yield TraceRecord(
+                    job_name=job_name or row.get(fields["job_name"]),
+                    slurm_id=row.get(fields["slurm_id"]) or stable_id(Path(path).resolve(), row_number, *row.values()),
+                    runtime=runtime * RUNTIME_UNITS[runtime_unit],
+                    memory=memory * MEMORY_UNITS[memory_unit],
+                    cmd=row.get(fields["cmd"]) or None,
+                    variables=variables,
+                    error=error,
+                )
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import csv
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from slurmise.ingest.trace_record import MEMORY_UNITS, RUNTIME_UNITS, TraceRecord, stable_id
+from slurmise.job_data import COMPLETED, FAILED
+
+# tasks with other statuses, e.g. CACHED or ABORTED, did not run
+NEXTFLOW_OUTCOMES = {
+    "COMPLETED": COMPLETED,
+    "FAILED": FAILED,
+}
+
+DURATION_REGEX = re.compile(r"(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)\b")
+MEMORY_REGEX = re.compile(r"(\d+(?:\.\d+)?)\s*([KMGT]?B)\b")
+# nextflow writes - for values which are not available
+MISSING = ("", "-")
+
+
+def is_missing(value: str | None) -> bool:
+    """Whether a value of a trace is not available, e.g. the peak_rss of very short tasks."""
+    return value is None or value.strip() in MISSING
+
+
+def parse_duration(value: str | None) -> float:
+    """Convert a nextflow duration, e.g. `1h 2m 3.5s` or milliseconds in raw traces, to minutes.
+
+    Raises a ValueError when the duration is missing or unreadable.
+    """
+    if not is_missing(value):
+        try:
+            return float(value) * RUNTIME_UNITS["ms"]
+        except ValueError:
+            pass
+        parts = DURATION_REGEX.findall(value)
+        if parts:
+            return sum(float(amount) * RUNTIME_UNITS[unit] for amount, unit in parts)
+    msg = f"Invalid runtime {value!r}"
+    raise ValueError(msg)
+
+
+def parse_memory(value: str | None) -> float:
+    """Convert a nextflow memory, e.g. `1.2 GB` or bytes in raw traces, to MB.
+
+    Raises a ValueError when the memory is missing or unreadable.
+    """
+    if not is_missing(value):
+        try:
+            return float(value) * MEMORY_UNITS["B"]
+        except ValueError:
+            pass
+        match = MEMORY_REGEX.search(value)
+        if match is not None:
+            return float(match.group(1)) * MEMORY_UNITS[match.group(2)]
+    msg = f"Invalid memory {value!r}"
+    raise ValueError(msg)
+
+
+def process_name(row: dict) -> str:
+    """The simple name of the process of a task, without the workflow or tag.
+
+    E.g. `NFCORE_RNASEQ:RNASEQ:FASTQC (sample1)` is `FASTQC`.
+    """
+    name = row.get("process") or row.get("name", "")
+    name = name.split(" (", 1)[0]
+    return name.rsplit(":", 1)[-1]
+
+
+def read_traces(
+    paths: Iterable[str | Path],
+    job_name: str | None = None,
+    native_ids: bool = False,
+) -> Iterator[TraceRecord]:
+    """Read the completed and failed tasks of nextflow trace files.
+
+    :arguments:
+        :paths: The trace files, tab separated with a header.
+        :job_name: The job of every task, otherwise the simple process name is used.
+        :native_ids: Use the native id of tasks, the slurm job id with the slurm
+            executor, as the slurm id.  Otherwise ids are derived from the task.
+
+    Every column of the trace is available as a variable, e.g. the `tag` or `cpus`,
+    and the `script` column, if present, is parsed as the command.  The runtime is
+    the `realtime`, or the `duration` when it is missing, and tasks without a
+    readable runtime or `peak_rss` are invalid.
+    """
+    for path in paths:
+        with open(path, newline="") as trace:
+            for row in csv.DictReader(trace, delimiter="\t"):
+                outcome = NEXTFLOW_OUTCOMES.get(row.get("status"))
+                if outcome is None:
+                    continue
+                slurm_id = row.get("native_id") if native_ids else None
+                script = row.get("script")
+                realtime = row.get("realtime")
+                try:
+                    runtime = parse_duration(row.get("duration") if is_missing(realtime) else realtime)
+                    memory = parse_memory(row.get("peak_rss"))
+                    error = None
+                except ValueError as e:
+                    runtime, memory, error = 0, 0, str(e)
+                yield TraceRecord(
+                    job_name=job_name or process_name(row),
+                    slurm_id=slurm_id or stable_id(*row.values()),
+                    runtime=runtime,
+                    memory=memory,
+                    cmd=script.strip() if script else None,
+                    variables=dict(row),
+                    outcome=outcome,
+                    error=error,
+                )
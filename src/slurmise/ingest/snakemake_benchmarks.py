@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import ast
+import csv
+import json
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from slurmise.ingest.trace_record import TraceRecord, read_usage, stable_id
+
+# columns of extended benchmarks holding python dicts in tsv files
+EXTENDED_DICT_COLUMNS = ("wildcards", "params", "resources")
+# snakemake writes NA for the usage of jobs which ended before they were measured
+NOT_MEASURED = "NA"
+
+
+def pattern_regex(pattern: str) -> re.Pattern:
+    """Convert a snakemake style path pattern, e.g. `{rule}/{sample}.tsv`, to a regex.
+
+    Each wildcard matches a single path component and the pattern matches the end of a path.
+    """
+    parts = re.split(r"\{(\w+)\}", pattern)
+    regex = "".join(re.escape(part) if index % 2 == 0 else f"(?P<{part}>[^/]+)" for index, part in enumerate(parts))
+    return re.compile(f"(?:^|/){regex}$")
+
+
+def iterate_files(paths: Iterable[str | Path]) -> Iterator[Path]:
+    """Yield each file and every file below each directory, in sorted order."""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            yield from sorted(file for file in path.rglob("*") if file.is_file())
+        else:
+            yield path
+
+
+def read_benchmarks(
+    paths: Iterable[str | Path],
+    job_name: str | None = None,
+    pattern: str | None = None,
+) -> Iterator[TraceRecord]:
+    """Read snakemake benchmark files, in tsv or jsonl format, one record per line.
+
+    :arguments:
+        :paths: Benchmark files or directories containing them.
+        :job_name: The job of every benchmark.  Otherwise the rule name of extended
+            benchmarks or the `rule` wildcard of the pattern is used.
+        :pattern: The path of the benchmarks with wildcards, e.g. `{rule}/{sample}.tsv`.
+            The wildcards are used as variables and files which don't match are skipped.
+
+    Lines with a runtime or memory of NA, which snakemake writes for jobs it could
+    not measure, are skipped.
+    """
+    regex = None if pattern is None else pattern_regex(pattern)
+    for file in iterate_files(paths):
+        path_wildcards = {}
+        if regex is not None:
+            match = regex.search(file.as_posix())
+            if match is None:
+                continue
+            path_wildcards = match.groupdict()
+        yield from read_benchmark_file(file, job_name, path_wildcards)
+
+
+def read_benchmark_file(
+    file: Path,
+    job_name: str | None = None,
+    path_wildcards: dict | None = None,
+) -> Iterator[TraceRecord]:
+    """Read a single benchmark file, see read_benchmarks."""
+    path_wildcards = path_wildcards or {}
+    with open(file, newline="") as benchmark:
+        lines = [line for line in benchmark if line.strip()]
+    if not lines:
+        return
+
+    # repeats of a benchmark are separate lines
+    if lines[0].lstrip().startswith("{"):
+        rows = [json.loads(line) for line in lines]
+        raw_lines = lines
+    else:
+        rows = list(csv.DictReader(lines, delimiter="\t", quoting=csv.QUOTE_NONE))
+        raw_lines = lines[1:]
+        for row in rows:
+            for column in EXTENDED_DICT_COLUMNS:
+                row[column] = _literal_dict(row.get(column))
+
+    for line_number, (row, raw_line) in enumerate(zip(rows, raw_lines, strict=True)):
+        if NOT_MEASURED in (row.get("s"), row.get("max_rss")):
+            continue
+        threads = row.get("threads")
+        variables = {
+            **(row.get("resources") or {}),
+            **(row.get("params") or {}),
+            **({} if threads in (None, "-") else {"threads": threads}),
+            **path_wildcards,
+            **(row.get("wildcards") or {}),
+        }
+        runtime, memory, error = read_usage(row.get("s"), row.get("max_rss"))
+        yield TraceRecord(
+            job_name=job_name or row.get("rule_name") or path_wildcards.get("rule"),
+            slurm_id=stable_id(file.resolve(), line_number, raw_line),
+            runtime=runtime / 60,
+            memory=memory,
+            variables=variables,
+            error=error,
+        )
+
+
+def _literal_dict(value: str | None) -> dict:
+    """Extended tsv benchmarks write dicts with their python representation."""
+    if not value or value == "-":
+        return {}
+    try:
+        result = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return {}
+    return result if isinstance(result, dict) else {}
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+
+from slurmise.job_data import COMPLETED, JobData
+
+# conversions to the minutes and MB used by slurmise
+RUNTIME_UNITS = {
+    "ms": 1 / 60_000,
+    "s": 1 / 60,
+    "m": 1,
+    "h": 60,
+    "d": 24 * 60,
+}
+MEMORY_UNITS = {
+    "B": 1 / 1024**2,
+    "KB": 1 / 1024,
+    "MB": 1,
+    "GB": 1024,
+    "TB": 1024**2,
+}
+
+MAX_ERRORS = 10
+
+
+@dataclass
+class TraceRecord:
+    """A job read from a trace file, before it is parsed with its job specification.
+
+    The runtime is in minutes and memory in MB.  When cmd is set and the job has
+    a job_spec, the job is parsed from the command, otherwise from the variables.
+    Variables which are not part of the job specification are ignored.  Records
+    with an error, e.g. an unreadable runtime, raise it when parsed.
+    """
+
+    job_name: str | None
+    slurm_id: str
+    runtime: float
+    memory: float
+    cmd: str | None = None
+    variables: dict = field(default_factory=dict)
+    outcome: str = COMPLETED
+    error: str | None = None
+
+    def to_job_data(self, configuration) -> JobData:
+        """Parse the record with the job specifications of the configuration."""
+        if self.error is not None:
+            raise ValueError(self.error)
+        job_spec = configuration.jobs.get(self.job_name, {}).get("job_spec_obj")
+        if self.cmd is not None and (job_spec is None or job_spec.job_spec_str is not None):
+            job = configuration.parse_job_cmd(
+                cmd=self.cmd,
+                job_name=self.job_name,
+                slurm_id=self.slurm_id,
+                diagnose=False,
+            )
+        else:
+            if self.job_name not in configuration.jobs:
+                msg = f"Job {self.job_name} not found in configuration."
+                raise ValueError(msg)
+            token_kinds = configuration.jobs[self.job_name]["job_spec_obj"].token_kinds
+            variables = {name: value for name, value in self.variables.items() if name in token_kinds}
+            job = configuration.parse_job_from_dict(variables, self.job_name, slurm_id=self.slurm_id)
+
+        job.runtime = self.runtime
+        job.memory = self.memory
+        job.outcome = self.outcome
+        return job
+
+
+@dataclass
+class IngestSummary:
+    """Counts of the records of an ingest, with the first few errors."""
+
+    recorded: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def add_error(self, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+
+def stable_id(*parts) -> str:
+    """An id for jobs without a slurm id, the same each time a trace is ingested."""
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def to_float(value: str | float | None, name: str) -> float:
+    """Convert the value of column name from a trace, raising a ValueError when it is missing or not a number."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        msg = f"Invalid {name} {value!r}"
+        raise ValueError(msg) from None
+
+
+def read_usage(runtime: str | float | None, memory: str | float | None) -> tuple[float, float, str | None]:
+    """The runtime and memory of a trace row, or zeros and the error of TraceRecord if either is invalid."""
+    try:
+        return to_float(runtime, "runtime"), to_float(memory, "memory"), None
+    except ValueError as e:
+        return 0, 0, str(e)
@@ -1,9 +1,20 @@
 from __future__ import annotations
 
 from dataclasses import astuple, dataclass, field
+from typing import TYPE_CHECKING
 
-import h5py
-import numpy as np
+if TYPE_CHECKING:
+    import h5py
+
+# how a job ended, jobs which did not complete give lower bounds of their resources
+COMPLETED = "completed"
+FAILED = "failed"
+OOM = "oom"
+TIMEOUT = "timeout"
+OUTCOMES = (COMPLETED, FAILED, OOM, TIMEOUT)
+
+# metrics are stored as attributes of a job in the database, e.g. metric_cpu_efficiency
+METRIC_ATTR_PREFIX = "metric_"
 
 
 def array_safe_eq(a, b) -> bool:
@@ -12,6 +23,9 @@ def array_safe_eq(a, b) -> bool:
     When a and be are dictionaries call recursively for all key, value pairs.
     """
 
+    # numpy is imported here so the epilog can parse jobs without it
+    import numpy as np
+
     if a is b:
         return True
     if isinstance(a, np.ndarray) and isinstance(b, np.ndarray):
@@ -51,6 +65,9 @@ class JobData:
         :numerics: These are parameters that are used as the free variables for fits, such input size, number of iterations etc.
         :memory: The maximum amount of memory in MBs this job used.
         :runtime: The time this job needed to complete in minutes.
+        :outcome: How the job ended, one of OUTCOMES.  For oom (out of memory) or timeout jobs,
+            the memory or runtime is the amount the job was given before it was killed.
+        :metrics: Additional accounting metrics of the job, such as cpu_efficiency, see slurm.METRICS.
     """
 
     job_name: str
@@ -60,6 +77,13 @@ class JobData:
     memory: int | None = None  # in MBs
     runtime: int | None = None  # in minutes
     cmd: str | None = None  # TODO: NOT STORED OR RETURNED
+    outcome: str = COMPLETED
+    metrics: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.outcome not in OUTCOMES:
+            msg = f"Unknown outcome {self.outcome!r}, expected one of {', '.join(OUTCOMES)}"
+            raise ValueError(msg)
 
     @staticmethod
     def from_dataset(job_name: str, slurm_id: str, dataset: h5py.Dataset, categories: dict) -> JobData:
@@ -80,6 +104,12 @@ class JobData:
             memory = memory[()]
         numerics = {key: value[()] for key, value in dataset.items() if key not in ("runtime", "memory")}
         categories = dict(**categories)
+        outcome = dataset.attrs.get("outcome", COMPLETED)
+        metrics = {
+            key.removeprefix(METRIC_ATTR_PREFIX): value
+            for key, value in dataset.attrs.items()
+            if key.startswith(METRIC_ATTR_PREFIX)
+        }
 
         return JobData(
             job_name=job_name,
@@ -88,6 +118,8 @@ class JobData:
             categories=categories,
             memory=memory,
             runtime=runtime,
+            outcome=outcome,
+            metrics=metrics,
         )
 
     def __eq__(self, other):
@@ -4,13 +4,36 @@ import contextlib
 import dataclasses
 import os
 import time
+from collections.abc import Iterable, Mapping
 from typing import Any, Generator
 
 import h5py
 import numpy as np
 
-from slurmise import slurm
-from slurmise.job_data import JobData
+from slurmise import profiling, slurm
+from slurmise.job_data import COMPLETED, METRIC_ATTR_PREFIX, JobData
+from slurmise.sacct_cache import SacctCache
+
+# unix time a job was first recorded, used to find deferred records old enough to fill
+RECORDED_AT_ATTR = "recorded_at"
+# unit of the runtimes of a database, databases without it recorded the runtimes
+# from sacct in seconds and are converted by migrate_runtimes
+RUNTIME_UNIT_ATTR = "runtime_unit"
+RUNTIME_UNIT = "minutes"
+# factors converting runtimes to minutes
+RUNTIME_UNIT_FACTORS = {"seconds": 1 / 60, "minutes": 1}
+
+
+@dataclasses.dataclass
+class FillSummary:
+    """Counts of the jobs with missing memory or runtime seen by fill_missing."""
+
+    filled: int = 0
+    unfinished: int = 0
+    too_recent: int = 0
+    expired: int = 0
+    # the filled jobs
+    jobs: list[JobData] = dataclasses.field(default_factory=list, repr=False)
 
 
 class JobDatabase:
@@ -19,19 +42,31 @@ class JobDatabase:
     It saves the database in HDF5 file.
     """
 
-    def __init__(self, db_file: str, max_retries: int = 5):
+    def __init__(
+        self,
+        db_file: str,
+        max_retries: int = 5,
+        sacct_backend: str = "json",
+        sacct_cache: SacctCache | None = None,
+    ):
         """
         The DB file is an HDF5 file.
         Use **get_database** and a context manager to have the file automatically
-        closed.
+        closed.  The sacct_backend, or sacct_cache if given, is used to update jobs
+        with missing data.
         """
+        self.sacct_backend = sacct_backend
+        self.sacct_cache = sacct_cache
 
         attempt = 0
         while True:
             attempt += 1
             try:
                 self._db_file = db_file
-                self.db = h5py.File(db_file, "a")
+                with profiling.span("database.open"):
+                    self.db = h5py.File(db_file, "a")
+                if len(self.db) == 0 and RUNTIME_UNIT_ATTR not in self.db.attrs:
+                    self.db.attrs[RUNTIME_UNIT_ATTR] = RUNTIME_UNIT
                 break
             except BlockingIOError:
                 if attempt > max_retries:
@@ -47,13 +82,20 @@ class JobDatabase:
 
     @staticmethod
     @contextlib.contextmanager
-    def get_database(db_file: str, max_retries: int = 5) -> JobDatabase:  # type: ignore
+    def get_database(
+        db_file: str,
+        max_retries: int = 5,
+        sacct_backend: str = "json",
+        sacct_cache: SacctCache | None = None,
+    ) -> JobDatabase:  # type: ignore
         """
         Use in context manager to automatically open and close db file.
 
         :arguments:
 
             :db_file: HDF5 file to use as database
+            :sacct_backend: How sacct is queried to update jobs with missing data
+            :sacct_cache: Cache of sacct results to update jobs with missing data
 
         :yields:
 
@@ -64,23 +106,33 @@ class JobDatabase:
             Closes h5py database
         """
 
-        db = JobDatabase(db_file, max_retries)
+        db = JobDatabase(db_file, max_retries, sacct_backend, sacct_cache)
         try:
             yield db
         finally:
             db._close()
 
-    def record(self, job_data: JobData, ignore_existing_job: bool = False) -> None:
+    @profiling.profiled("database.record")
+    def record(self, job_data: JobData, ignore_existing_job: bool = False, recorded_at: float | None = None) -> None:
         """
         It records JobData information in the database. A tree is created based
         on the job name, categories and slurm id. The leaves of the tree
-        are the memory, runtime and numerics of the JobData.
+        are the memory, runtime and numerics of the JobData.  The job is marked
+        as recorded at recorded_at, or now, unless it is already in the database.
         """
         table_name = JobDatabase.get_table_name(job_data)
         if ignore_existing_job and self.job_exists(job_data):
             return
 
         table = self.db.require_group(name=table_name)
+        if RECORDED_AT_ATTR not in table.attrs:
+            table.attrs[RECORDED_AT_ATTR] = time.time() if recorded_at is None else recorded_at
+
+        if job_data.outcome != COMPLETED:
+            table.attrs["outcome"] = job_data.outcome
+
+        for metric, value in job_data.metrics.items():
+            table.attrs[f"{METRIC_ATTR_PREFIX}{metric}"] = value
 
         if job_data.memory is not None:
             val = np.asarray(job_data.memory)
@@ -94,6 +146,46 @@ class JobDatabase:
             val = np.asarray(value)
             _ = table.create_dataset(name=var, shape=val.shape, data=val)
 
+    def check_runtime_unit(self) -> None:
+        """Raise a ValueError if the runtimes of the database are not known to be in minutes.
+
+        Databases created before the unit was stored recorded the runtimes from
+        sacct in seconds, and fitting them would mix seconds and minutes.
+        """
+        if self.db.attrs.get(RUNTIME_UNIT_ATTR) != RUNTIME_UNIT:
+            msg = (
+                f"The runtimes of {self.db_file} were recorded before they were stored in minutes, "
+                "convert them with `slurmise migrate-runtimes`"
+            )
+            raise ValueError(msg)
+
+    def migrate_runtimes(self, from_unit: str) -> int:
+        """Convert the runtime of every job from from_unit to minutes, returning the number converted.
+
+        The database is marked as in minutes, a database which already is isn't changed.
+        """
+        if from_unit not in RUNTIME_UNIT_FACTORS:
+            msg = f"Unknown runtime unit {from_unit!r}, expected one of {', '.join(RUNTIME_UNIT_FACTORS)}"
+            raise ValueError(msg)
+        if self.db.attrs.get(RUNTIME_UNIT_ATTR) == RUNTIME_UNIT:
+            return 0
+
+        converted = 0
+        factor = RUNTIME_UNIT_FACTORS[from_unit]
+        for job_name in list(self.db.keys()):
+            for _, entries in JobDatabase.iterate_jobs(self.db[job_name]):
+                for entry in entries.values():
+                    if "runtime" not in entry:
+                        continue
+                    if factor != 1:
+                        # seconds may be stored as integers, replace rather than assign
+                        runtime = np.asarray(entry["runtime"][()] * factor)
+                        del entry["runtime"]
+                        entry.create_dataset(name="runtime", shape=runtime.shape, data=runtime)
+                    converted += 1
+        self.db.attrs[RUNTIME_UNIT_ATTR] = RUNTIME_UNIT
+        return converted
+
     def job_exists(self, job_data: JobData) -> bool:
         table_name = JobDatabase.get_table_name(job_data)
         return table_name in self.db
@@ -102,6 +194,7 @@ class JobDatabase:
         msg = "Later feature"
         raise NotImplementedError(msg)
 
+    @profiling.profiled("database.query")
     def query(self, job_data: JobData, update_missing: bool = False) -> list[JobData]:
         """
         Query returns a list of JobData objects based on the requested JobData.
@@ -163,21 +256,53 @@ class JobDatabase:
         msg = "Storing fits is not supported yet"
         raise NotImplementedError(msg)
 
-    def update_missing_data(self, jobs: list[JobData]) -> list[JobData]:
+    def update_missing_data(
+        self,
+        jobs: list[JobData],
+        metrics: Iterable[str] = (),
+        skip_unfinished: bool = False,
+        sacct_metadata: Mapping[tuple[str, str | None], dict] | None = None,
+    ) -> list[JobData]:
         """
         Update missing mem and runtime for jobs with incomplete data in the db.
         Takes a list of JobData which was queried from the db, updates the db, and returns the updated job list.
+        With a sacct cache, the jobs missing from the cache are queried from sacct together.
 
-        TODO: gather slurm_ids of jobs that need updating and do it in one call
+        :arguments:
+
+            :jobs: Jobs queried from the db, only those missing memory or runtime are updated
+            :metrics: The metrics, see slurm.METRICS, to record along with memory and runtime
+            :skip_unfinished: Leave jobs which are still running or unknown to sacct missing
+            :sacct_metadata: Metadata of the jobs already queried with slurm.parse_slurm_jobs_metadata
         """
-        updated_jobs = []
+        missing = {}
         for job in jobs:
             if job.memory is None or job.runtime is None:
                 if "." in job.slurm_id:
                     slurm_id, step_id = job.slurm_id.split(".")
                 else:
                     slurm_id, step_id = job.slurm_id, None
-                job_info = slurm.parse_slurm_job_metadata(slurm_id=slurm_id, step_id=step_id)
+                missing[job.slurm_id] = (slurm_id, step_id)
+        if missing and sacct_metadata is None and self.sacct_cache is not None:
+            self.sacct_cache.prefetch(missing.values())
+
+        updated_jobs = []
+        for job in jobs:
+            if job.slurm_id in missing:
+                slurm_id, step_id = missing[job.slurm_id]
+                try:
+                    job_info = self._job_metadata(slurm_id, step_id, sacct_metadata)
+                except ValueError:
+                    if not skip_unfinished:
+                        raise
+                    job_info = None
+                if job_info is None or (skip_unfinished and job_info.get("state") in slurm.UNFINISHED_STATES):
+                    updated_jobs.append(job)
+                    continue
+
+                outcome = slurm.outcome_from_state(job_info["state"]) if "state" in job_info else job.outcome
+                reported = job_info.get("metrics", {})
+                job_metrics = {metric: reported[metric] for metric in metrics if metric in reported}
 
                 # job dataclass is immutable, so this creates a new object with the updated values
                 # ternary's are to avoid updating if the value is already present which causes a "dataset already exists" error
@@ -185,21 +310,113 @@ class JobDatabase:
                     dataclasses.replace(
                         job,
                         memory=job_info["max_rss"] if job.memory is None else None,
-                        runtime=(job_info["elapsed_seconds"] if job.runtime is None else None),
+                        runtime=(slurm.runtime_minutes(job_info) if job.runtime is None else None),
                         numerics={},
+                        outcome=outcome,
+                        metrics=job_metrics,
                     )
                 )
 
                 job = dataclasses.replace(
                     job,
                     memory=job_info["max_rss"] if job.memory is None else job.memory,
-                    runtime=(job_info["elapsed_seconds"] if job.runtime is None else job.runtime),
+                    runtime=(slurm.runtime_minutes(job_info) if job.runtime is None else job.runtime),
+                    outcome=outcome,
+                    metrics={**job.metrics, **job_metrics},
                 )
 
             updated_jobs.append(job)
 
         return updated_jobs
 
+    def _job_metadata(
+        self,
+        slurm_id: str,
+        step_id: str | None,
+        sacct_metadata: Mapping[tuple[str, str | None], dict] | None = None,
+    ) -> dict | None:
+        """The metadata of a job step from sacct_metadata, the sacct cache or sacct, None if not in sacct_metadata."""
+        if sacct_metadata is not None:
+            return sacct_metadata.get((slurm_id, step_id))
+        if self.sacct_cache is not None:
+            return self.sacct_cache.job_metadata(slurm_id=slurm_id, step_name=step_id)
+        return slurm.parse_slurm_job_metadata(
+            slurm_id=slurm_id,
+            step_name=step_id,
+            backend=self.sacct_backend,
+        )
+
+    def fill_missing(
+        self,
+        min_age: float = 0,
+        max_age: float | None = None,
+        metrics: Mapping[str, Iterable[str]] | None = None,
+        batch_size: int = slurm.SACCT_BATCH_SIZE,
+    ) -> FillSummary:
+        """
+        Update every job with missing memory or runtime, querying sacct for all of them at once.
+
+        Jobs recorded less than min_age seconds ago are skipped, as their accounting
+        may be incomplete, and so are jobs recorded more than max_age seconds ago,
+        which sacct is unlikely to still return.  Jobs which are still running or
+        unknown to sacct are left missing for a later fill.
+
+        :arguments:
+
+            :min_age: Seconds since a job was recorded before it is filled
+            :max_age: Seconds since a job was recorded after which it is no longer filled, None to fill all
+            :metrics: The metrics to record of each job name
+            :batch_size: Number of jobs per sacct query
+        """
+        if metrics is None:
+            metrics = {}
+        now = time.time()
+        summary = FillSummary()
+
+        groups = []
+        for job_name in list(self.db.keys()):
+            for categories, entries in JobDatabase.iterate_jobs(self.db[job_name]):
+                categories = dict(cat.split("=") for cat in categories)
+                jobs = []
+                for slurm_id, entry in entries.items():
+                    if "memory" in entry and "runtime" in entry:
+                        continue
+                    # jobs recorded before recorded_at was stored are always filled
+                    age = now - entry.attrs[RECORDED_AT_ATTR] if RECORDED_AT_ATTR in entry.attrs else None
+                    if age is not None and age < min_age:
+                        summary.too_recent += 1
+                    elif age is not None and max_age is not None and age > max_age:
+                        summary.expired += 1
+                    else:
+                        jobs.append(JobData.from_dataset(job_name, slurm_id, entry, categories))
+                if jobs:
+                    groups.append((job_name, jobs))
+
+        slurm_ids = sorted({job.slurm_id.split(".")[0] for _, jobs in groups for job in jobs})
+        if not slurm_ids:
+            return summary
+        sacct_metadata = None
+        if self.sacct_cache is not None:
+            self.sacct_cache.prefetch(((slurm_id, None) for slurm_id in slurm_ids), batch_size=batch_size)
+        else:
+            sacct_metadata = slurm.parse_slurm_jobs_metadata(
+                slurm_ids, backend=self.sacct_backend, batch_size=batch_size
+            )
+
+        for job_name, jobs in groups:
+            for job in self.update_missing_data(
+                jobs,
+                metrics=metrics.get(job_name, ()),
+                skip_unfinished=True,
+                sacct_metadata=sacct_metadata,
+            ):
+                if job.memory is None or job.runtime is None:
+                    summary.unfinished += 1
+                else:
+                    summary.filled += 1
+                    summary.jobs.append(job)
+        return summary
+
     @staticmethod
     def get_table_name(job_data: JobData) -> str:
         table_name = JobDatabase.get_group_name(job_data)
@@ -236,18 +453,25 @@ class JobDatabase:
     def print(self):
         JobDatabase.print_hdf5(self.db)
 
-    def iterate_database(self, update_missing: bool = False) -> Generator[tuple[JobData, list[JobData]]]:
+    def iterate_database(
+        self, update_missing: bool = False, job_name: str | None = None
+    ) -> Generator[tuple[JobData, list[JobData]]]:
         """
         Yield key (query job) value (list of jobs) pairs of entire database.
+        When job_name is given, only the jobs of that name are yielded.
         """
-        for job_name in self.db.keys():
-            entry = self.db[job_name]
+        if job_name is None:
+            job_names = list(self.db.keys())
+        else:
+            job_names = [job_name] if job_name in self.db else []
+        for name in job_names:
+            entry = self.db[name]
             for categories, jobs in JobDatabase.iterate_jobs(entry):
                 categories = dict(cat.split("=") for cat in categories)
-                query = JobData(job_name=job_name, categories=categories)
+                query = JobData(job_name=name, categories=categories)
                 jobs = [
                     JobData.from_dataset(
-                        job_name=job_name,
+                        job_name=name,
                         slurm_id=slurm_id,
                         categories=categories,
                         dataset=slurm_data,
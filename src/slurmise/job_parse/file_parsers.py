@@ -1,14 +1,190 @@
 from __future__ import annotations
 
-import gzip
-import hashlib
-import subprocess
+import fnmatch
+import math
+import os
+import re
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass, field
 from pathlib import Path
 
 NUMERIC = "NUMERIC"
 CATEGORY = "CATEGORY"
 
+# read size for the streaming parsers, large enough to amortize python overhead
+CHUNK_SIZE = 1024 * 1024
+NEWLINE = ord("\n")
+CARRIAGE_RETURN = ord("\r")
+FASTA_HEADER = ord(">")
+
+# gzip, hashlib, numpy and subprocess are imported by the parsers which use
+# them, so parsing a job spec, e.g. in the epilog, doesn't pay for their import
+
+
+def _as_array(buf: bytes | bytearray):
+    """A numpy view of the bytes of buf, comparing and counting bytes with numpy
+    is several times faster than bytes.count, or awk, on large files."""
+    import numpy as np
+
+    return np.frombuffer(buf, dtype=np.uint8)
+
+
+def count_byte(buf: bytes | bytearray, value: int) -> int:
+    """Number of bytes of buf equal to value."""
+    import numpy as np
+
+    return int(np.count_nonzero(_as_array(buf) == value))
+
+
+def line_starts(buf: bytes | bytearray, value: int, previous: int = NEWLINE) -> int:
+    """Number of lines of buf starting with the byte value.
+
+    previous is the byte before buf, a newline for the start of a file.
+    """
+    import numpy as np
+
+    data = _as_array(buf)
+    positions = np.flatnonzero(data == value)
+    if len(positions) == 0:
+        return 0
+    before = data[positions - 1]
+    if positions[0] == 0:
+        before[0] = previous
+    return int(np.count_nonzero(before == NEWLINE))
+
+
+def iter_chunks(path: Path, gzip_file: bool = False, chunk_size: int | None = None) -> Iterator[bytearray]:
+    """Yield the (decompressed) contents of path in large binary chunks.
+
+    The same buffer is reused between chunks, callers must copy any data they
+    want to keep.
+    """
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    import gzip
+
+    buf = bytearray(chunk_size)
+    with gzip.open(path, "rb") if gzip_file else open(path, "rb", buffering=0) as infile:
+        while size := infile.readinto(buf):
+            yield buf if size == chunk_size else buf[:size]
+
+
+def count_lines(path: Path, gzip_file: bool = False, header_prefix: bytes | None = None) -> int:
+    """Count the lines of a file, skipping the leading header lines starting with
+    header_prefix (e.g. # for VCF).  Unlike `FileLinesParser`, empty files have
+    0 lines and a final line without a newline is still counted."""
+    lines = 0
+    skipped = 0
+    in_header = header_prefix is not None
+    at_line_start = True
+    last = b"\n"
+    for buf in iter_chunks(path, gzip_file):
+        lines += count_byte(buf, NEWLINE)
+
+        # headers precede all records, only scan until the first record
+        pos = 0
+        while in_header and pos < len(buf):
+            if at_line_start:
+                if buf[pos : pos + 1] != header_prefix:
+                    in_header = False
+                    break
+                skipped += 1
+            end = buf.find(b"\n", pos)
+            if end == -1:  # header line continues in the next chunk
+                at_line_start = False
+                break
+            pos = end + 1
+            at_line_start = True
+
+        last = buf[-1:]
+
+    if last != b"\n":  # unterminated final line
+        lines += 1
+    return lines - skipped
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The q-th percentile of values, linearly interpolated like numpy's default."""
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+REDUCERS: dict[str, Callable[[list[float]], float]] = {
+    "sum": sum,
+    "mean": lambda values: sum(values) / len(values),
+    "min": min,
+    "max": max,
+    "count": len,
+    "median": lambda values: percentile(values, 50),
+}
+PERCENTILE_REDUCER = re.compile(r"p(?P<q>\d{1,2}(?:\.\d+)?|100)")
+
+
+def get_reducer(name: str) -> Callable[[list[float]], float]:
+    """Look up a reducer by name.  Percentiles are given as pNN, e.g. p90."""
+    if name in REDUCERS:
+        return REDUCERS[name]
+    if match := PERCENTILE_REDUCER.fullmatch(name):
+        q = float(match.group("q"))
+        return lambda values: percentile(values, q)
+    msg = f"Unknown reducer {name!r}. Available: {list(REDUCERS.keys())} or a percentile like 'p90'"
+    raise ValueError(msg)
+
+
+@dataclass(frozen=True)
+class DirectoryStats:
+    total_bytes: int = 0
+    file_count: int = 0
+    largest_file: int = 0
+
+
+DIRECTORY_STATS = tuple(DirectoryStats.__dataclass_fields__)
+# (directory, max_depth, glob) -> (mtime of directory, stats)
+_directory_stats_cache: dict[tuple[str, int | None, str | None], tuple[int, DirectoryStats]] = {}
+
+
+def directory_stats(path: Path, max_depth: int | None = None, glob: str | None = None) -> DirectoryStats:
+    """Walk a directory to find the total size, number and largest of its files.
+
+    :arguments:
+        :path: The directory to walk.
+        :max_depth: How many levels of subdirectories to descend, 0 only
+            considers files directly in path.  None has no limit.
+        :glob: Only count files with names matching this pattern.
+
+    Results are cached per process, keyed on the mtime of path.  Note the mtime
+    only changes when entries directly in path are added or removed.
+    """
+    key = (os.fspath(path), max_depth, glob)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _directory_stats_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    total_bytes = file_count = largest_file = 0
+    # iterative to avoid recursion limits on deep trees
+    stack = [(os.fspath(path), 0)]
+    while stack:
+        directory, depth = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # never follow directory links, which could loop
+                if entry.is_dir(follow_symlinks=False):
+                    if max_depth is None or depth < max_depth:
+                        stack.append((entry.path, depth + 1))
+                elif entry.is_file() and (glob is None or fnmatch.fnmatch(entry.name, glob)):
+                    size = entry.stat().st_size
+                    total_bytes += size
+                    file_count += 1
+                    largest_file = max(largest_file, size)
+
+    stats = DirectoryStats(total_bytes=total_bytes, file_count=file_count, largest_file=largest_file)
+    _directory_stats_cache[key] = (mtime, stats)
+    return stats
+
 
 @dataclass()
 class FileParser:
@@ -34,6 +210,8 @@ class FileMD5(FileParser):
         super().__init__(name="file_md5", return_type=CATEGORY)
 
     def parse_file(self, path: Path, gzip_file: bool = False):  # noqa: ARG002
+        import hashlib
+
         md5_hash = hashlib.md5()  # noqa: S324
         md5_hash.update(path.read_bytes())
         return md5_hash.hexdigest()
@@ -55,6 +233,8 @@ class FileLinesParser(FileParser):
 
     def parse_file(self, path: Path, gzip_file: bool = False):
         if gzip_file:
+            import gzip
+
             with gzip.open(path, "rb") as infile:
                 # gzip files have no raw read, use slower loop
                 for lines, _ in enumerate(infile):  # noqa: B007
@@ -72,6 +252,116 @@ class FileLinesParser(FileParser):
             return lines
 
 
+@dataclass()
+class FastaRecords(FileParser):
+    def __init__(self):
+        super().__init__(name="fasta_records", return_type=NUMERIC)
+
+    def parse_file(self, path: Path, gzip_file: bool = False):
+        records = 0
+        last = NEWLINE
+        for buf in iter_chunks(path, gzip_file):
+            records += line_starts(buf, FASTA_HEADER, previous=last)
+            last = buf[-1]
+        return records
+
+
+@dataclass()
+class FastaTotalLength(FileParser):
+    def __init__(self):
+        super().__init__(name="fasta_total_length", return_type=NUMERIC)
+
+    def parse_file(self, path: Path, gzip_file: bool = False):
+        import numpy as np
+
+        total = 0
+        # if the next chunk starts a line, or continues a header line
+        line_start = True
+        in_header = False
+        for buf in iter_chunks(path, gzip_file):
+            data = _as_array(buf)
+            size = len(data)
+            newlines = np.flatnonzero(data == NEWLINE)
+            total += size - len(newlines) - np.count_nonzero(data == CARRIAGE_RETURN)
+
+            # the first line continues the last line of the previous chunk
+            first_end = newlines[0] if len(newlines) else size
+            in_header = data[0] == FASTA_HEADER if line_start else in_header
+            if in_header:
+                total -= self._header_length(data, np.array([0]), np.array([first_end]))
+            if len(newlines) == 0:
+                line_start = False
+                continue
+
+            starts = newlines + 1
+            ends = np.append(newlines[1:], size)
+            line_start = starts[-1] == size
+            if line_start:
+                starts, ends = starts[:-1], ends[:-1]
+            headers = data[starts] == FASTA_HEADER
+            total -= self._header_length(data, starts[headers], ends[headers])
+            in_header = not line_start and bool(headers[-1])
+        return int(total)
+
+    @staticmethod
+    def _header_length(data, starts, ends) -> int:
+        """Number of bytes of the header lines from starts to ends, without carriage
+        returns, which are already removed from the total."""
+        import numpy as np
+
+        length = int((ends - starts).sum())
+        return length - int(np.count_nonzero(data[ends[ends > starts] - 1] == CARRIAGE_RETURN))
+
+
+@dataclass()
+class FastqReads(FileParser):
+    def __init__(self):
+        super().__init__(name="fastq_reads", return_type=NUMERIC)
+
+    def parse_file(self, path: Path, gzip_file: bool = False):
+        # every record is exactly four lines
+        return count_lines(path, gzip_file) // 4
+
+
+@dataclass()
+class VcfRecords(FileParser):
+    def __init__(self):
+        super().__init__(name="vcf_records", return_type=NUMERIC)
+
+    def parse_file(self, path: Path, gzip_file: bool = False):
+        return count_lines(path, gzip_file, header_prefix=b"#")
+
+
+@dataclass()
+class SamRecords(FileParser):
+    def __init__(self):
+        super().__init__(name="sam_records", return_type=NUMERIC)
+
+    def parse_file(self, path: Path, gzip_file: bool = False):
+        return count_lines(path, gzip_file, header_prefix=b"@")
+
+
+@dataclass()
+class DirectoryParser(FileParser):
+    """Summarize the files in a directory variable with one of `DIRECTORY_STATS`."""
+
+    stat: str = "total_bytes"
+    max_depth: int | None = None
+    glob: str | None = None
+
+    def __init__(self, name, stat, max_depth=None, glob=None):
+        if stat not in DIRECTORY_STATS:
+            msg = f"Unknown directory stat {stat!r} for parser {name!r}. Available: {list(DIRECTORY_STATS)}"
+            raise ValueError(msg)
+        super().__init__(name=name, return_type=NUMERIC)
+        self.stat = stat
+        self.max_depth = max_depth
+        self.glob = glob
+
+    def parse_file(self, path: Path, gzip_file: bool = False):
+        return getattr(directory_stats(path, self.max_depth, self.glob), self.stat)
+
+
 @dataclass()
 class AwkParser(FileParser):
     args: list[str] = field(default_factory=list)
@@ -85,6 +375,8 @@ class AwkParser(FileParser):
             self.args.insert(1, "-f")
 
     def parse_file(self, path: Path, gzip_file: bool = False):
+        import subprocess
+
         if gzip_file:
             # use `gzip -dc` instead of `zcat` because zcat fails on macos expecting a .gz.Z extension
             zcat = subprocess.Popen(("gzip", "-dc", path), stdout=subprocess.PIPE)
@@ -96,3 +388,80 @@ class AwkParser(FileParser):
         if self.return_type == NUMERIC:
             return [float(token) for token in result.split()]
         return result.strip()
+
+
+@dataclass()
+class ReducedFileParser(FileParser):
+    """Wrap a numeric parser to reduce its values to a single number.
+
+    For a `file_list` the values of all listed files are reduced together, so
+    jobs with a different number of files produce the same, fixed-width
+    numerics.  Parsers returning lists (e.g. awk) are flattened first.
+    """
+
+    parser: FileParser | None = None
+    reducer: str = "sum"
+
+    def __init__(self, parser: FileParser, reducer: str):
+        if parser.return_type != NUMERIC:
+            msg = f"Reducer {reducer!r} requires a numeric parser, {parser.name!r} is {parser.return_type.lower()}"
+            raise ValueError(msg)
+        super().__init__(name=f"{parser.name}_{reducer}", return_type=NUMERIC)
+        self.parser = parser
+        self.reducer = reducer
+        self._reduce = get_reducer(reducer)
+
+    def parse_file(self, path: Path, gzip_file: bool = False):
+        return self.reduce([self.parser.parse_file(path, gzip_file=gzip_file)])
+
+    def parse_files(self, paths: Iterable[Path], gzip_file: bool = False):
+        return self.reduce([self.parser.parse_file(path, gzip_file=gzip_file) for path in paths])
+
+    def reduce(self, values: list) -> float:
+        flat = []
+        for value in values:
+            if isinstance(value, list):
+                flat.extend(value)
+            else:
+                flat.append(value)
+
+        if not flat and self.reducer not in ("sum", "count"):
+            return math.nan
+        return self._reduce(flat)
+
+
+def builtin_parsers() -> dict[str, FileParser]:
+    """The file parsers available to every job, by name."""
+    return {
+        "file_size": FileSizeParser(),
+        "file_lines": FileLinesParser(),
+        "file_basename": FileBasename(),
+        "file_md5": FileMD5(),
+        "fasta_records": FastaRecords(),
+        "fasta_total_length": FastaTotalLength(),
+        "fastq_reads": FastqReads(),
+        "vcf_records": VcfRecords(),
+        "sam_records": SamRecords(),
+        "dir_total_bytes": DirectoryParser("dir_total_bytes", "total_bytes"),
+        "dir_file_count": DirectoryParser("dir_file_count", "file_count"),
+        "dir_largest_file": DirectoryParser("dir_largest_file", "largest_file"),
+    }
+
+
+def parser_from_config(name: str, config: dict) -> FileParser | None:
+    """A custom parser of the slurmise.file_parsers table, None without an awk_script or directory_stat."""
+    if "awk_script" in config:
+        return AwkParser(
+            name,
+            config.get("return_type", "category"),
+            config["awk_script"],
+            config.get("script_is_file", False),
+        )
+    if "directory_stat" in config:
+        return DirectoryParser(
+            name,
+            config["directory_stat"],
+            max_depth=config.get("max_depth", None),
+            glob=config.get("glob", None),
+        )
+    return None
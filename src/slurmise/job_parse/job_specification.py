@@ -1,10 +1,15 @@
 from __future__ import annotations
 
 import re
-from pathlib import Path
+from typing import TYPE_CHECKING
 
-from slurmise import job_data
-from slurmise.job_parse.file_parsers import NUMERIC, FileParser
+from slurmise import profiling
+
+if TYPE_CHECKING:
+    from collections.abc import Collection
+
+    from slurmise import job_data
+    from slurmise.job_parse.file_parsers import FileParser
 
 # matches tokens like {threads:numeric}
 JOB_SPEC_REGEX = re.compile(r"{(?:(?P<name>[^:}]+):)?(?P<kind>[^}]+)}")
@@ -12,10 +17,58 @@ KIND_TO_REGEX = {
     "file": ".+?",
     "gzip_file": ".+?",
     "file_list": ".+?",
+    "directory": ".+?",
     "numeric": "[-0-9.]+",
     "category": ".+?",
     "ignore": ".+?",
 }
+# kinds which are processed by file parsers
+FILE_KINDS = ("file", "gzip_file", "file_list", "directory")
+
+# bounds on the cost of diagnosing a command which doesn't match its job spec
+FUZZY_MAX_ERRORS = 30  # edits allowed in the fuzzy regex match
+FUZZY_TIMEOUT = 0.5  # seconds before giving up on the fuzzy regex match
+FUZZY_MAX_LENGTH = 2000  # longer commands skip straight to the token diff
+TOKEN_DIFF_MAX_CELLS = 250_000  # larger token alignments compare by position
+
+
+def match_job_name(
+    cmd: str,
+    job_names: Collection[str],
+    job_prefixes: dict[str, str],
+    job_name: str | None = None,
+) -> tuple[str, str]:
+    """Return the job name of a command and the command without its job prefix or name.
+
+    Without a job_name, it is inferred from the job prefixes and then the job
+    names the command starts with.
+    """
+    if job_name is None:  # try to infer
+        for name, prefix in job_prefixes.items():
+            if cmd.startswith(prefix):
+                job_name = name
+                cmd = cmd.removeprefix(prefix).lstrip()
+                break
+
+        else:  # not a prefix. Runs when it does not hit the break.
+            for name in job_names:
+                if cmd.startswith(name):
+                    job_name = name
+                    cmd = cmd.removeprefix(name).lstrip()
+                    break
+
+            else:
+                msg = f"Unable to match job name to {cmd!r}"
+                raise ValueError(msg)
+    else:
+        job_prefix = job_prefixes.get(job_name, None)
+        if job_prefix is not None:
+            cmd = cmd.removeprefix(job_prefix).lstrip()
+
+    if job_name not in job_names:
+        msg = f"Job {job_name} not found in configuration."
+        raise ValueError(msg)
+    return job_name, cmd
 
 
 class JobSpec:
@@ -41,8 +94,11 @@ class JobSpec:
         self.file_parsers: dict[str, list[FileParser]] = {}
         self.model = model
         self.job_regex = None
+        self.compiled_regex = None
         if job_spec is not None:
             self.job_regex = self.build_regex(available_parsers, file_parsers)
+            # compile once, the re module cache is too small for many job specs
+            self.compiled_regex = re.compile(self.job_regex)
 
     @staticmethod
     def from_variables(
@@ -58,7 +114,7 @@ class JobSpec:
                 raise ValueError(f"Unknown variable type {kind} for variable {name}")
             result.token_kinds[name] = kind
 
-            if kind in ("file", "gzip_file", "file_list"):
+            if kind in FILE_KINDS:
                 result.update_file_parsers(name, available_parsers, file_parsers)
 
         return result
@@ -89,22 +145,31 @@ class JobSpec:
                 self.token_kinds[name] = kind
                 job_spec = job_spec.replace(match.group(0), f"(?P<{name}>{KIND_TO_REGEX[kind]})", 1)
 
-                if kind in ("file", "gzip_file", "file_list"):
+                if kind in FILE_KINDS:
                     self.update_file_parsers(name, available_parsers, file_parsers)
 
         return f"^{job_spec}$"
 
     def update_file_parsers(self, name, available_parsers, file_parsers):
-        try:
-            self.file_parsers[name] = [available_parsers[parser_type] for parser_type in file_parsers[name].split(",")]
-        except KeyError:
-            # find the missing parser
-            if name not in file_parsers:
-                raise ValueError(f"File {name!r} has no assigned file parser")
-            for parser_type in file_parsers[name].split(","):
-                if parser_type not in available_parsers:
-                    error = f"The parser {parser_type!r} is not available for file {name!r}"
-                    raise ValueError(error)
+        """Set the parsers of file variable name.  Each parser can be followed by
+        a reducer, e.g. "file_size:sum,file_lines:p90"."""
+        if file_parsers is None or name not in file_parsers:
+            raise ValueError(f"File {name!r} has no assigned file parser")
+
+        parsers = []
+        for parser_type in file_parsers[name].split(","):
+            parser_type, _, reducer = parser_type.partition(":")
+            if available_parsers is None or parser_type not in available_parsers:
+                error = f"The parser {parser_type!r} is not available for file {name!r}"
+                raise ValueError(error)
+            parser = available_parsers[parser_type]
+            if reducer:
+                from slurmise.job_parse.file_parsers import ReducedFileParser
+
+                parser = ReducedFileParser(parser, reducer)
+            parsers.append(parser)
+
+        self.file_parsers[name] = parsers
 
     def validate_variables(self, variables: dict) -> str | None:
         # check keys match
@@ -123,16 +188,30 @@ class JobSpec:
                 )
         return None
 
-    def parse_job_cmd(self, job: job_data.JobData) -> job_data.JobData:
-        if self.job_regex is None:
+    @profiling.profiled("job_spec.parse")
+    def parse_job_cmd(
+        self,
+        job: job_data.JobData,
+        parse_files: bool = True,
+        diagnose: bool = True,
+    ) -> job_data.JobData:
+        """Parse the command of job into its variables.
+
+        parse_files: When false, skip file variables instead of running their parsers.
+        diagnose: When true, failures include an alignment of the spec and command.
+        """
+        if self.compiled_regex is None:
             raise ValueError(f"Job {job.job_name} has no job spec entry for parsing commands")
-        match = re.match(self.job_regex, job.cmd)
+        match = self.compiled_regex.match(job.cmd)
         if match is None:
+            if not diagnose:
+                raise ValueError(f"Job spec for {job.job_name} does not match command")
             result = self.align_and_indicate_differences(job.cmd)
             raise ValueError(f"Job spec for {job.job_name} does not match command:\n{result}")
-        return self.parse_job_from_dict(match.groupdict(), job)
+        return self.parse_job_from_dict(match.groupdict(), job, parse_files=parse_files)
 
-    def parse_job_from_dict(self, input_dict: dict, job: job_data.JobData):
+    @profiling.profiled("job_spec.parse")
+    def parse_job_from_dict(self, input_dict: dict, job: job_data.JobData, parse_files: bool = True):
         token_keys = set(self.token_kinds.keys())
         input_keys = set(input_dict.keys())
         if len(extras := token_keys - input_keys) != 0:
@@ -145,18 +224,28 @@ class JobSpec:
                 job.numerics[name] = float(input_dict[name])
             elif kind == "category":
                 job.categories[name] = input_dict[name]
-            elif kind in ("file", "gzip_file", "file_list"):
+            elif kind in FILE_KINDS:
+                if not parse_files:
+                    continue
+                # the epilog imports job specs without the file parsers and pathlib
+                from pathlib import Path
+
+                from slurmise.job_parse.file_parsers import NUMERIC, ReducedFileParser
+
                 for parser in self.file_parsers[name]:
-                    match kind:
-                        case "file":
-                            file_value = parser.parse_file(Path(input_dict[name]))
-                        case "gzip_file":
-                            file_value = parser.parse_file(Path(input_dict[name]), gzip_file=True)
-                        case "file_list":
-                            file_value = []
-                            with open(Path(input_dict[name])) as f:
-                                for file in f:
-                                    file_value.append(parser.parse_file(Path(file.strip())))
+                    with profiling.span(f"file_parser.{parser.name}"):
+                        match kind:
+                            case "file" | "directory":
+                                file_value = parser.parse_file(Path(input_dict[name]))
+                            case "gzip_file":
+                                file_value = parser.parse_file(Path(input_dict[name]), gzip_file=True)
+                            case "file_list":
+                                with open(Path(input_dict[name])) as f:
+                                    files = [Path(file.strip()) for file in f]
+                                if isinstance(parser, ReducedFileParser):
+                                    file_value = parser.parse_files(files)
+                                else:
+                                    file_value = [parser.parse_file(file) for file in files]
 
                     if parser.return_type == NUMERIC:
                         job.numerics[f"{name}_{parser.name}"] = file_value
@@ -168,13 +257,25 @@ class JobSpec:
 
         return job
 
-    def align_and_indicate_differences(self, cmd: str, try_exact_match: bool = False) -> str:
+    def align_and_indicate_differences(
+        self,
+        cmd: str,
+        try_exact_match: bool = False,
+        max_errors: int = FUZZY_MAX_ERRORS,
+        timeout: float = FUZZY_TIMEOUT,
+    ) -> str:
         """
         Compares two strings and aligns with indicators for differences.
 
+        The fuzzy regex match can take exponential time, so it is limited to
+        max_errors edits and timeout seconds.  If it fails, the job spec and
+        command are compared token by token instead.
+
         Args:
             cmd: The user supplied string.
             try_exact_match: Attempt to match regex exactly, fall back to fuzzy.
+            max_errors: The maximum number of edits in the fuzzy match.
+            timeout: The maximum time, in seconds, of the fuzzy match.
 
         Returns:
             multi-line, aligned string of differences
@@ -203,15 +304,20 @@ class JobSpec:
             match = re.match(raw_regex, cmd)
 
         # unable or unwilling to exact match
-        if not match:
+        if not match and len(cmd) <= FUZZY_MAX_LENGTH:
             parsable = False
             # ?b is for best match
-            # {e} indicates to allow errors
-            match = regex.fullmatch(f"(?b)(?:{raw_regex})" + r"{e}", cmd)
+            # {e<=N} indicates to allow up to N errors
+            try:
+                match = regex.fullmatch(f"(?b)(?:{raw_regex}){{e<={max_errors}}}", cmd, timeout=timeout)
+            except TimeoutError:
+                match = None
 
-        # still no matches
+        # still no matches, fall back to comparing tokens
         if not match:
-            raise ValueError("TODO: handle no matches")
+            result = ["Failed to parse"] if try_exact_match else []
+            result.append("Unable to align characters, showing differing tokens:")
+            return "\n".join(result + self._token_differences(job_spec_str, cmd))
 
         simple_spec = re.sub(r"{([^:}]+)(:[^}]+)?}", r"{\1}", job_spec_str)
         spec_with_matches = simple_spec.format(**match.groupdict())
@@ -347,3 +453,81 @@ class JobSpec:
         ]
 
         return "\n".join(result)
+
+    @staticmethod
+    def _token_differences(job_spec_str: str, cmd: str) -> list[str]:
+        """
+        Align the whitespace separated tokens of the job spec and command with
+        an edit distance, in O(spec tokens x cmd tokens) time.
+
+        Returns:
+            The aligned spec, indicator and cmd lines.
+        """
+        spec_tokens = job_spec_str.split()
+        cmd_tokens = cmd.split()
+
+        def token_regex(token):
+            pattern = JOB_SPEC_REGEX.sub(lambda match: KIND_TO_REGEX.get(match.group("kind"), ".+?"), token)
+            try:
+                return re.compile(pattern)
+            except re.error:
+                return re.compile(re.escape(token))
+
+        spec_regexes = [token_regex(token) for token in spec_tokens]
+        n_spec, n_cmd = len(spec_tokens), len(cmd_tokens)
+
+        def matches(i, j):
+            return spec_regexes[i].fullmatch(cmd_tokens[j]) is not None
+
+        if n_spec * n_cmd > TOKEN_DIFF_MAX_CELLS:
+            # too large to align, compare by position
+            opcodes = [
+                ("equal" if i < n_spec and i < n_cmd and matches(i, i) else "replace", i, i)
+                for i in range(max(n_spec, n_cmd))
+            ]
+        else:
+            # edit distance between token lists, substitutions and indels cost 1
+            cost = [[0] * (n_cmd + 1) for _ in range(n_spec + 1)]
+            for i in range(n_spec + 1):
+                cost[i][0] = i
+            for j in range(n_cmd + 1):
+                cost[0][j] = j
+            for i in range(1, n_spec + 1):
+                for j in range(1, n_cmd + 1):
+                    cost[i][j] = min(
+                        cost[i - 1][j - 1] + (0 if matches(i - 1, j - 1) else 1),
+                        cost[i - 1][j] + 1,
+                        cost[i][j - 1] + 1,
+                    )
+
+            opcodes = []
+            i, j = n_spec, n_cmd
+            while i > 0 or j > 0:
+                if i > 0 and j > 0 and cost[i][j] == cost[i - 1][j - 1] + (0 if matches(i - 1, j - 1) else 1):
+                    i, j = i - 1, j - 1
+                    opcodes.append(("equal" if cost[i][j] == cost[i + 1][j + 1] else "replace", i, j))
+                elif i > 0 and cost[i][j] == cost[i - 1][j] + 1:
+                    i -= 1
+                    opcodes.append(("delete", i, None))
+                else:
+                    j -= 1
+                    opcodes.append(("insert", None, j))
+            opcodes.reverse()
+
+        indicators = {"equal": " ", "replace": "╳", "delete": "∧", "insert": "∨"}
+        aligned_spec = []
+        aligned_cmd = []
+        indicator_line = []
+        for tag, i, j in opcodes:
+            spec_token = spec_tokens[i] if i is not None and i < n_spec else ""
+            cmd_token = cmd_tokens[j] if j is not None and j < n_cmd else ""
+            if tag == "replace" and not spec_token:
+                tag = "insert"
+            elif tag == "replace" and not cmd_token:
+                tag = "delete"
+            width = max(len(spec_token), len(cmd_token))
+            aligned_spec.append(spec_token.ljust(width))
+            aligned_cmd.append(cmd_token.ljust(width))
+            indicator_line.append(indicators[tag] * width)
+
+        return [" ".join(aligned_spec), " ".join(indicator_line), " ".join(aligned_cmd)]
@@ -0,0 +1,252 @@
+"""Counters and histograms of predictions, model latency and accuracy, exported for Prometheus.
+
+Each process accumulates its metrics in memory and writes them at exit to a new
+file under base_dir/monitoring, so processes never write the same file.
+Reading the metrics merges those files into a single file under a lock, and
+`slurmise metrics` prints them in the Prometheus text format, or writes them for
+the textfile collector of node_exporter.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import time
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+
+MONITORING_DIR = "monitoring"
+MERGED_FILE = "merged.json"
+DELTA_SUFFIX = ".delta.json"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATIO_BUCKETS = (0.25, 0.5, 0.75, 0.9, 1, 1.1, 1.25, 1.5, 2, 4)
+
+# name: (type, help, buckets of histograms)
+METRICS = {
+    "slurmise_predictions_total": ("counter", "Predictions served", None),
+    "slurmise_prediction_fallbacks_total": (
+        "counter",
+        "Predictions of a resource which returned the default, as the model isn't fit or was rejected",
+        None,
+    ),
+    "slurmise_model_load_seconds": ("histogram", "Time to load a model", LATENCY_BUCKETS),
+    "slurmise_predict_seconds": ("histogram", "Time to load a model and predict, excluding parsing", LATENCY_BUCKETS),
+    "slurmise_record_seconds": ("histogram", "Time to record a job, including sacct", LATENCY_BUCKETS),
+    "slurmise_fit_seconds": ("histogram", "Time to fit and save a model", LATENCY_BUCKETS),
+    "slurmise_residual_ratio": (
+        "histogram",
+        "Recorded over predicted resource of completed jobs, above 1 is under predicted",
+        RATIO_BUCKETS,
+    ),
+    "slurmise_residual_errors_total": (
+        "counter",
+        "Batches of recorded jobs whose residuals were skipped, as their models failed to load or predict",
+        None,
+    ),
+}
+
+
+def _labels_key(labels: Mapping[str, str]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class MetricSet:
+    """Values of counters and histograms, keyed by name and labels."""
+
+    def __init__(self):
+        self.counters: dict[tuple, float] = {}
+        # histograms hold the count of each bucket, with +Inf last, the sum and the count
+        self.histograms: dict[tuple, list] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.counters or self.histograms)
+
+    def inc(self, name: str, labels: Mapping[str, str], value: float = 1) -> None:
+        key = (name, _labels_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Mapping[str, str]) -> None:
+        buckets = METRICS[name][2]
+        key = (name, _labels_key(labels))
+        if key not in self.histograms:
+            self.histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram = self.histograms[key]
+        index = next((index for index, bound in enumerate(buckets) if value <= bound), len(buckets))
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def merge(self, other: MetricSet) -> None:
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, (counts, total, count) in other.histograms.items():
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(counts), 0.0, 0]
+            histogram = self.histograms[key]
+            if len(histogram[0]) != len(counts):
+                # the buckets were changed, keep the newest
+                histogram[0] = [0] * len(counts)
+            histogram[0] = [mine + theirs for mine, theirs in zip(histogram[0], counts, strict=True)]
+            histogram[1] += total
+            histogram[2] += count
+
+    def to_dict(self) -> dict:
+        return {
+            "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+            "histograms": [
+                [name, dict(labels), counts, total, count]
+                for (name, labels), (counts, total, count) in self.histograms.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> MetricSet:
+        metric_set = cls()
+        for name, labels, value in data.get("counters", []):
+            metric_set.counters[(name, _labels_key(labels))] = value
+        for name, labels, counts, total, count in data.get("histograms", []):
+            metric_set.histograms[(name, _labels_key(labels))] = [counts, total, count]
+        return metric_set
+
+
+class Monitor:
+    """The metrics of this process, written to a new file under directory by flush.
+
+    Without a directory, metrics are kept in memory only.
+    """
+
+    def __init__(self, directory: str | Path | None = None):
+        self.directory = None if directory is None else Path(directory)
+        self.metrics = MetricSet()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        self.metrics.inc(name, labels, value)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self.metrics.observe(name, value, labels)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the seconds the block takes, unless it raises."""
+        start = time.perf_counter()
+        yield
+        self.metrics.observe(name, time.perf_counter() - start, labels)
+
+    def flush(self) -> None:
+        """Write the metrics since the last flush to a new file under directory."""
+        if self.directory is None or not self.metrics:
+            return
+        metrics, self.metrics = self.metrics, MetricSet()
+        try:
+            self.directory.mkdir(exist_ok=True)
+        except FileNotFoundError:
+            # the base dir was removed, e.g. a temporary directory
+            return
+        name = f"{socket.gethostname()}.{os.getpid()}.{time.time_ns()}{DELTA_SUFFIX}"
+        _atomic_write_text(self.directory / name, json.dumps(metrics.to_dict()))
+
+
+_MONITORS: dict[Path, Monitor] = {}
+
+
+def monitor(base_dir: str | Path) -> Monitor:
+    """The monitor of base_dir in this process, which is flushed at exit."""
+    directory = Path(base_dir) / MONITORING_DIR
+    if not _MONITORS:
+        atexit.register(flush_all)
+    if directory not in _MONITORS:
+        _MONITORS[directory] = Monitor(directory)
+    return _MONITORS[directory]
+
+
+def flush_all() -> None:
+    """Flush the monitors of every base dir, e.g. before replacing the process."""
+    for process_monitor in _MONITORS.values():
+        process_monitor.flush()
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    """Write text to a temporary file which replaces path when complete."""
+    tmp_path = path.parent / f".{path.name}.{os.getpid()}.tmp"
+    try:
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def collect(base_dir: str | Path) -> MetricSet:
+    """Merge the metrics written by every process under base_dir, returning the totals.
+
+    The files of each process are merged into a single file, which lists the
+    files it includes so a merge interrupted before removing them doesn't count
+    them again.
+    """
+    directory = Path(base_dir) / MONITORING_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    merged_path = directory / MERGED_FILE
+    with open(directory / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        merged_data = json.loads(merged_path.read_text()) if merged_path.exists() else {}
+        merged = MetricSet.from_dict(merged_data)
+        for name in merged_data.get("merged", []):
+            (directory / name).unlink(missing_ok=True)
+
+        deltas = sorted(directory.glob(f"*{DELTA_SUFFIX}"))
+        if not deltas:
+            return merged
+        for path in deltas:
+            merged.merge(MetricSet.from_dict(json.loads(path.read_text())))
+        merged_data = {**merged.to_dict(), "merged": [path.name for path in deltas]}
+        _atomic_write_text(merged_path, json.dumps(merged_data))
+        for path in deltas:
+            path.unlink(missing_ok=True)
+    return merged
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = ((key, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for key, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def exposition(metrics: MetricSet) -> str:
+    """The metrics in the Prometheus text format."""
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        if kind == "counter":
+            series = sorted((labels, value) for (metric, labels), value in metrics.counters.items() if metric == name)
+        else:
+            series = sorted((labels, value) for (metric, labels), value in metrics.histograms.items() if metric == name)
+        if not series:
+            continue
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip([*buckets, "+Inf"], counts, strict=False):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels((*labels, ('le', le)))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def write_textfile(metrics: MetricSet, path: str | Path) -> None:
+    """Write the metrics for the node_exporter textfile collector, replacing the file atomically."""
+    _atomic_write_text(Path(path), exposition(metrics))
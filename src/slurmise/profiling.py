@@ -0,0 +1,197 @@
+"""Time spans of the hot paths of slurmise, e.g. parsing, the database, models and sacct.
+
+Profiling is enabled by `slurmise --profile` or the SLURMISE_PROFILE environment
+variable, which reports the total time of each span at exit.  SLURMISE_PROFILE
+is 1 to print the totals to stderr, or a path to write them as JSON, and
+SLURMISE_CPROFILE is a path to dump cProfile stats.  Times are inclusive of
+nested spans, and a span nested in a span of the same name isn't counted again.
+While disabled, a span only checks the enabled flag.
+
+Only the standard library is imported, so the epilog can be profiled as well.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+PROFILE_ENV = "SLURMISE_PROFILE"
+CPROFILE_ENV = "SLURMISE_CPROFILE"
+
+# when this module, imported before the rest of slurmise by the CLI, was imported
+IMPORTED_AT = time.perf_counter()
+
+
+class _Span:
+    __slots__ = ("name", "nested", "profiler", "start")
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        active = self.profiler._active_spans()
+        self.nested = self.name in active
+        if not self.nested:
+            active.add(self.name)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.nested:
+            self.profiler.add(self.name, time.perf_counter() - self.start)
+            self.profiler._active_spans().discard(self.name)
+
+
+_DISABLED = contextlib.nullcontext()
+
+
+class Profiler:
+    """Total calls and seconds of named spans, reported at exit when enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.output: Path | None = None
+        self.spans: dict[str, tuple[int, float]] = {}
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cprofile = None
+        self._cprofile_output: Path | None = None
+        self._registered = False
+
+    def _active_spans(self) -> set[str]:
+        try:
+            return self._local.active
+        except AttributeError:
+            self._local.active = set()
+            return self._local.active
+
+    def span(self, name: str):
+        """A context manager adding its duration to the span name, if enabled."""
+        if not self.enabled:
+            return _DISABLED
+        return _Span(self, name)
+
+    def add(self, name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            total_calls, total_seconds = self.spans.get(name, (0, 0.0))
+            self.spans[name] = (total_calls + calls, total_seconds + seconds)
+
+    def enable(self, output: str | Path | None = None, cprofile: str | Path | None = None) -> None:
+        """Record spans and report them at exit, to stderr or as JSON to output.
+
+        With cprofile, the process is also profiled with cProfile and its stats
+        dumped to the path.
+        """
+        from pathlib import Path
+
+        if not self.enabled:
+            self.started_at = time.perf_counter()
+        self.enabled = True
+        if output is not None:
+            self.output = Path(output)
+        if cprofile is not None and self._cprofile is None:
+            import cProfile
+
+            self._cprofile_output = Path(cprofile)
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        if not self._registered:
+            atexit.register(self.report)
+            self._registered = True
+
+    def summary(self) -> dict:
+        """The calls and seconds of each span, and the seconds since profiling was enabled."""
+        with self._lock:
+            spans = dict(self.spans)
+        return {
+            "wall_seconds": time.perf_counter() - self.started_at,
+            "spans": {
+                name: {"calls": calls, "total_seconds": seconds}
+                for name, (calls, seconds) in sorted(spans.items(), key=lambda span: -span[1][1])
+            },
+        }
+
+    def format(self) -> list[str]:
+        """Lines of a table of the spans, slowest first."""
+        summary = self.summary()
+        lines = [
+            f"slurmise profile, {summary['wall_seconds'] * 1000:.1f} ms since enabled",
+            f"{'span':<32} {'calls':>7} {'total (ms)':>11} {'mean (ms)':>10}",
+        ]
+        for name, span in summary["spans"].items():
+            total = span["total_seconds"] * 1000
+            lines.append(f"{name:<32} {span['calls']:>7} {total:>11.2f} {total / span['calls']:>10.3f}")
+        return lines
+
+    def report(self) -> None:
+        """Write the spans to stderr or the JSON output, dump any cProfile stats and disable profiling."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(str(self._cprofile_output))
+            self._cprofile = None
+        if self.output is None:
+            print("\n".join(self.format()), file=sys.stderr)
+        else:
+            self.output.write_text(json.dumps(self.summary(), indent=2))
+
+    def reset(self) -> None:
+        """Disable profiling and forget the recorded spans."""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile = None
+        self.enabled = False
+        self.output = None
+        with self._lock:
+            self.spans = {}
+
+
+PROFILER = Profiler()
+
+
+def span(name: str):
+    """A context manager timing a span of the global profiler."""
+    return PROFILER.span(name)
+
+
+def profiled(name: str) -> Callable:
+    """Decorate a function to time each call as a span of the global profiler."""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with _Span(PROFILER, name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enable_from_environment() -> None:
+    """Enable profiling if SLURMISE_PROFILE or SLURMISE_CPROFILE is set."""
+    profile = os.environ.get(PROFILE_ENV, "")
+    cprofile = os.environ.get(CPROFILE_ENV) or None
+    if profile in ("", "0") and cprofile is None:
+        return
+    PROFILER.enable(output=None if profile in ("", "0", "1") else profile, cprofile=cprofile)
+
+
+enable_from_environment()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from slurmise import slurm
+
+# touched by each eviction, the cache is scanned at most once per evict_interval
+EVICTED_MARKER = ".evicted"
+
+
+class SacctCache:
+    """Parsed sacct metadata of job steps, stored as one json file per job.
+
+    The metadata of a job in a terminal state can no longer change and is kept
+    until it is evicted.  The metadata of other jobs, e.g. a job recording itself
+    while it runs, is queried again after ttl seconds.  When there are more than
+    max_jobs files, the least recently fetched are removed.  Storing new jobs
+    checks for this at most every evict_interval seconds, so the cache may exceed
+    max_jobs by the jobs stored in the meantime.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        ttl: float = 60,
+        max_jobs: int = 10_000,
+        backend: str = "json",
+        evict_interval: float = 60,
+    ):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.backend = backend
+        self.evict_interval = evict_interval
+
+    @staticmethod
+    def _step_key(step_name: str | None) -> str:
+        # the last step of a job is requested without a step name
+        return "" if step_name is None else step_name
+
+    def _job_path(self, slurm_id: str) -> Path:
+        return self.directory / f"{slurm_id}.json"
+
+    def _read(self, slurm_id: str) -> dict:
+        try:
+            return json.loads(self._job_path(slurm_id).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _is_fresh(self, entry: dict) -> bool:
+        if entry["metadata"].get("state") in slurm.TERMINAL_STATES:
+            return True
+        return time.time() - entry["fetched"] < self.ttl
+
+    def get(self, slurm_id: str, step_name: str | None = None) -> dict | None:
+        """The cached metadata of a job step, None if it is missing or expired."""
+        entry = self._read(slurm_id).get(self._step_key(step_name))
+        if entry is None or not self._is_fresh(entry):
+            return None
+        return entry["metadata"]
+
+    def put(self, metadata: dict[tuple[str, str | None], dict]) -> None:
+        """Store metadata keyed by job id and step name, as from slurm.parse_slurm_jobs_metadata."""
+        by_job = {}
+        for (slurm_id, step_name), step_metadata in metadata.items():
+            by_job.setdefault(str(slurm_id), {})[self._step_key(step_name)] = step_metadata
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fetched = time.time()
+        new_jobs = 0
+        for slurm_id, steps in by_job.items():
+            entries = self._read(slurm_id)
+            new_jobs += not entries
+            entries.update({step: {"fetched": fetched, "metadata": data} for step, data in steps.items()})
+            path = self._job_path(slurm_id)
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(entries))
+            os.replace(tmp_path, path)
+        if new_jobs:
+            self._evict_periodically()
+
+    def _evict_periodically(self) -> None:
+        """Evict if no process did in the last evict_interval seconds, listing the cache is O(jobs)."""
+        marker = self.directory / EVICTED_MARKER
+        try:
+            if time.time() - marker.stat().st_mtime < self.evict_interval:
+                return
+        except FileNotFoundError:
+            pass
+        # touched first, so concurrent processes don't all scan the cache
+        marker.touch()
+        self.evict()
+
+    def evict(self) -> int:
+        """Remove the least recently fetched jobs above max_jobs, returning the number removed."""
+        paths = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        if len(paths) <= self.max_jobs:
+            return 0
+        paths.sort(key=lambda entry: entry.stat().st_mtime)
+        removed = paths[: len(paths) - self.max_jobs]
+        for entry in removed:
+            # another process may have removed it already
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry.path)
+        return len(removed)
+
+    def job_metadata(self, slurm_id: str | None = None, step_name: str | None = None) -> dict:
+        """Return the metadata of a job step as slurm.parse_slurm_job_metadata, querying sacct on a miss."""
+        slurm_id = slurm.current_slurm_id(slurm_id)
+        metadata = self.get(slurm_id, step_name)
+        if metadata is None:
+            metadata = slurm.parse_slurm_job_metadata(slurm_id=slurm_id, step_name=step_name, backend=self.backend)
+            self.put({(slurm_id, step_name): metadata})
+        return metadata
+
+    def prefetch(
+        self,
+        job_steps: Iterable[tuple[str, str | None]],
+        batch_size: int = slurm.SACCT_BATCH_SIZE,
+    ) -> int:
+        """Query sacct in concurrent batches for the job steps which are missing or expired.
+
+        Every step of the queried jobs is cached.  Returns the number of jobs queried.
+        """
+        missing = {}
+        for slurm_id, step_name in job_steps:
+            slurm_id = str(slurm_id)
+            if slurm_id not in missing and self.get(slurm_id, step_name) is None:
+                missing[slurm_id] = None
+        if missing:
+            self.put(slurm.parse_slurm_jobs_metadata(list(missing), backend=self.backend, batch_size=batch_size))
+        return len(missing)
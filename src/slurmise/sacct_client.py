@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections.abc import Coroutine, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from slurmise import profiling
+
+# options of the client which can be set in the configuration, as sacct_<option>
+CLIENT_OPTIONS = ("max_concurrency", "timeout", "retries", "backoff", "max_backoff", "failure_threshold", "reset_after")
+
+
+class SacctClient:
+    """Run sacct commands as subprocesses with bounded parallelism, timeouts and retries.
+
+    Each command is attempted up to retries + 1 times, waiting a random time up to
+    backoff * 2**attempt seconds, capped at max_backoff, between attempts.  After
+    failure_threshold consecutive failed attempts, slurmdbd is assumed to be
+    overloaded and commands fail immediately until reset_after seconds have passed.
+    All failures raise ValueError.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff: float = 1,
+        max_backoff: float = 30,
+        failure_threshold: int = 5,
+        reset_after: float = 60,
+    ):
+        self.configure(
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            retries=retries,
+            backoff=backoff,
+            max_backoff=max_backoff,
+            failure_threshold=failure_threshold,
+            reset_after=reset_after,
+        )
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+
+    def configure(self, **options) -> None:
+        """Update the options of the client, keeping the state of the circuit breaker."""
+        for option, value in options.items():
+            if option not in CLIENT_OPTIONS:
+                msg = f"Unknown sacct client option {option!r}"
+                raise ValueError(msg)
+            setattr(self, option, value)
+
+    def _check_circuit(self) -> None:
+        if self.opened_at is None:
+            return
+        remaining = self.opened_at + self.reset_after - time.monotonic()
+        if remaining > 0:
+            msg = (
+                f"Error running sacct cmd: {self.consecutive_failures} consecutive failures, "
+                f"not retrying for {remaining:.0f} s"
+            )
+            raise ValueError(msg)
+        # let the next attempt through, a failure opens the circuit again
+        self.opened_at = None
+
+    def _record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    async def _attempt(self, cmd: Sequence[str]) -> bytes:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            msg = f"Error running sacct cmd: {e}"
+            raise ValueError(msg) from e
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+            msg = f"Error running sacct cmd: {' '.join(cmd)} timed out after {self.timeout} s"
+            raise TimeoutError(msg) from None
+
+        if process.returncode != 0:
+            msg = f"Error running sacct cmd: {' '.join(cmd)} returned {process.returncode}: {stderr.decode().strip()}"
+            raise RuntimeError(msg)
+        return stdout
+
+    async def run(self, cmd: Sequence[str], semaphore: asyncio.Semaphore | None = None) -> bytes:
+        """Return the output of a sacct command, retrying failures and timeouts."""
+        attempt = 0
+        while True:
+            self._check_circuit()
+            try:
+                if semaphore is None:
+                    stdout = await self._attempt(cmd)
+                else:
+                    async with semaphore:
+                        stdout = await self._attempt(cmd)
+            except (TimeoutError, RuntimeError) as e:
+                self._record_failure()
+                if attempt >= self.retries:
+                    raise ValueError(str(e)) from e
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt)))
+                attempt += 1
+            else:
+                self.consecutive_failures = 0
+                return stdout
+
+    async def run_all(self, cmds: Sequence[Sequence[str]]) -> list[bytes]:
+        """Return the outputs of several sacct commands, running up to max_concurrency at once."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.gather(*(self.run(cmd, semaphore) for cmd in cmds))
+
+    @profiling.profiled("sacct")
+    def check_output(self, cmd: Sequence[str]) -> bytes:
+        """Run a single sacct command from synchronous code."""
+        return run_coroutine(self.run(cmd))
+
+    @profiling.profiled("sacct")
+    def check_outputs(self, cmds: Sequence[Sequence[str]]) -> list[bytes]:
+        """Run several sacct commands concurrently from synchronous code."""
+        return run_coroutine(self.run_all(cmds))
+
+
+def run_coroutine(coroutine: Coroutine) -> Any:
+    """Run a coroutine to completion, in a new thread if an event loop is already running."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -0,0 +1,234 @@
+"""Replay recorded jobs in time order to measure how well models allocate resources.
+
+Each job is predicted by a model trained only on the jobs before it, as it would
+have been when the job was submitted, and its prediction is compared with the
+memory and runtime it used.  The "default" model predicts the configured
+defaults of every job, the allocation without slurmise.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import re
+import time
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from slurmise.fit import MODEL_REGISTRY, model_factory
+from slurmise.job_data import COMPLETED, JobData
+
+# predicts the configured defaults without a model
+DEFAULT_MODEL = "default"
+SIMULATION_MODELS = (DEFAULT_MODEL, *MODEL_REGISTRY)
+
+
+@dataclasses.dataclass
+class Allocation:
+    """The default and minimum resources of a job, see SlurmiseConfiguration."""
+
+    default_memory: int
+    default_runtime: int
+    minimum_memory: int = 0
+    minimum_runtime: int = 0
+
+
+@dataclasses.dataclass
+class ReplayResult:
+    """Allocation metrics of a model replayed over the jobs of a group.
+
+    Memory is in MB and runtime in minutes, so over allocation is in GB-hours
+    and padding in hours.  Only completed jobs are evaluated, jobs which ran out
+    of memory or time are used for training only.
+    """
+
+    model: str
+    job_name: str = ""
+    categories: dict = dataclasses.field(default_factory=dict)
+    jobs: int = 0
+    evaluated: int = 0
+    fits: int = 0
+    over_allocated_gb_hours: float = 0.0
+    oom_failures: int = 0
+    timeout_failures: int = 0
+    padding_hours: float = 0.0
+    fit_seconds: float = 0.0
+    predictions: int = 0
+    predict_seconds: float = 0.0
+
+    @property
+    def mean_latency_ms(self) -> float:
+        """The mean time to predict a single job, in milliseconds."""
+        return 1000 * self.predict_seconds / self.predictions if self.predictions else 0.0
+
+    def add(self, other: ReplayResult) -> None:
+        """Add the counts and totals of another result."""
+        for result_field in dataclasses.fields(self):
+            if result_field.name not in ("model", "job_name", "categories"):
+                setattr(self, result_field.name, getattr(self, result_field.name) + getattr(other, result_field.name))
+
+    def as_dict(self) -> dict:
+        return {**dataclasses.asdict(self), "mean_latency_ms": self.mean_latency_ms}
+
+
+def time_order(job: JobData) -> tuple:
+    """Sort key of jobs by submission, slurm assigns increasing job ids.
+
+    Ids which aren't numeric, e.g. from ingested traces, follow in lexical order.
+    """
+    match = re.fullmatch(r"(\d+)(?:[._](.*))?", str(job.slurm_id))
+    if match is None:
+        return (1, 0, str(job.slurm_id))
+    return (0, int(match.group(1)), match.group(2) or "")
+
+
+def replay_group(
+    query: JobData,
+    jobs: list[JobData],
+    allocation: Allocation,
+    model: str,
+    min_train: int = 10,
+    refit_every: int = 10,
+) -> ReplayResult:
+    """Replay the jobs of a group in time order with one model.
+
+    The model is first fit once min_train earlier jobs are available and then
+    refit after every refit_every new jobs.  Until then, the defaults are
+    predicted.  The jobs between fits are predicted together, timing a single
+    prediction for the latency.  Fits are not saved.
+    """
+    result = ReplayResult(model=model, job_name=query.job_name, categories=dict(query.categories), jobs=len(jobs))
+    jobs = sorted(jobs, key=time_order)
+    model_class = None if model == DEFAULT_MODEL else model_factory(model)
+    random_state = np.random.RandomState(42)
+
+    fit_points = []
+    if model_class is not None:
+        fit_points = list(range(min_train, len(jobs), refit_every))
+    segments = zip([0, *fit_points], [*fit_points, len(jobs)], strict=True)
+
+    fit = None
+    for segment_start, segment_end in segments:
+        if segment_start in fit_points:
+            start = time.perf_counter()
+            candidate = model_class(query=query)
+            try:
+                candidate.fit(jobs[:segment_start], random_state=random_state)
+            except ValueError:
+                # e.g. too few completed jobs to split, keep the previous fit
+                pass
+            else:
+                fit = candidate
+                result.fits += 1
+            result.fit_seconds += time.perf_counter() - start
+
+        completed = [job for job in jobs[segment_start:segment_end] if job.outcome == COMPLETED]
+        predicted = [
+            dataclasses.replace(job, memory=allocation.default_memory, runtime=allocation.default_runtime, metrics={})
+            for job in completed
+        ]
+        if fit is not None and predicted:
+            # the latency of predicting a single job, as when submitting it
+            start = time.perf_counter()
+            predicted[0], _ = fit.predict(predicted[0])
+            result.predict_seconds += time.perf_counter() - start
+            result.predictions += 1
+            fit.predict_batch(predicted[1:])
+
+        for job, prediction in zip(completed, predicted, strict=True):
+            _score(result, job, prediction, allocation)
+
+    return result
+
+
+def _score(result: ReplayResult, job: JobData, prediction: JobData, allocation: Allocation) -> None:
+    """Add the allocation of a prediction for a completed job to result.
+
+    Runtimes are in minutes, as recorded from every source including sacct, see slurm.runtime_minutes.
+    """
+    memory = max(prediction.memory, allocation.minimum_memory)
+    runtime = max(prediction.runtime, allocation.minimum_runtime)
+
+    result.evaluated += 1
+    if memory < job.memory:
+        result.oom_failures += 1
+    elif runtime >= job.runtime:
+        result.over_allocated_gb_hours += (memory - job.memory) / 1024 * job.runtime / 60
+    if runtime < job.runtime:
+        result.timeout_failures += 1
+    else:
+        result.padding_hours += (runtime - job.runtime) / 60
+
+
+def _replay_models(
+    query: JobData,
+    jobs: list[JobData],
+    allocation: Allocation,
+    models: Iterable[str],
+    min_train: int,
+    refit_every: int,
+) -> list[ReplayResult]:
+    return [replay_group(query, jobs, allocation, model, min_train, refit_every) for model in models]
+
+
+def replay_groups(
+    groups: Iterable[tuple[JobData, list[JobData], Allocation]],
+    models: Iterable[str] = SIMULATION_MODELS,
+    min_train: int = 10,
+    refit_every: int = 10,
+    workers: int | None = None,
+) -> list[ReplayResult]:
+    """Replay each group with every model, in parallel processes across groups.
+
+    Groups are the query, jobs and allocation of a job name and its categories.
+    Jobs without memory or runtime are skipped.  With a single worker, groups are
+    replayed in this process.  Results are ordered by group and then model.
+    """
+    models = list(models)
+    unknown = set(models) - set(SIMULATION_MODELS)
+    if unknown:
+        msg = f"Unknown models {sorted(unknown)}, expected any of {', '.join(SIMULATION_MODELS)}"
+        raise ValueError(msg)
+    if refit_every < 1:
+        msg = f"Models must be refit after at least one job, not {refit_every}"
+        raise ValueError(msg)
+
+    tasks = []
+    for query, jobs, allocation in groups:
+        jobs = [job for job in jobs if job.memory is not None and job.runtime is not None]
+        if jobs:
+            tasks.append((query, jobs, allocation, models, min_train, refit_every))
+
+    if workers == 1 or len(tasks) <= 1:
+        results = [_replay_models(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_replay_models, *zip(*tasks, strict=True)))
+    return [result for group_results in results for result in group_results]
+
+
+def summarize(results: Iterable[ReplayResult]) -> dict[str, ReplayResult]:
+    """The totals of the results of each model over all groups."""
+    totals = {}
+    for result in results:
+        totals.setdefault(result.model, ReplayResult(model=result.model)).add(result)
+    return totals
+
+
+def format_results(results: Iterable[ReplayResult]) -> list[str]:
+    """Lines of a table of results, with the group of each unless it is a summary."""
+    header = (
+        f"{'group':<40} {'model':>8} {'jobs':>6} {'fits':>5} {'over GBh':>10} "
+        f"{'oom':>5} {'timeout':>7} {'pad h':>9} {'ms/job':>7}"
+    )
+    lines = [header]
+    for result in results:
+        categories = ",".join(f"{key}={value}" for key, value in sorted(result.categories.items()))
+        group = f"{result.job_name}[{categories}]" if categories else result.job_name or "all"
+        lines.append(
+            f"{group:<40} {result.model:>8} {result.evaluated:>6} {result.fits:>5} "
+            f"{result.over_allocated_gb_hours:>10.2f} {result.oom_failures:>5} {result.timeout_failures:>7} "
+            f"{result.padding_hours:>9.2f} {result.mean_latency_ms:>7.2f}"
+        )
+    return lines
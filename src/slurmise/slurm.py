@@ -1,12 +1,90 @@
 from __future__ import annotations
 
+import contextlib
+import datetime
 import json
 import os
-import subprocess
+from collections.abc import Iterable
 from math import ceil
 
+from slurmise.job_data import COMPLETED, FAILED, OOM, TIMEOUT, JobData
+from slurmise.sacct_client import SacctClient
 
-def parse_slurm_job_metadata(slurm_id: str | None = None, step_name: str | None = None) -> dict:
+# slurm job states of jobs that did not complete, running jobs are recording themselves
+SLURM_STATE_OUTCOMES = {
+    "OUT_OF_MEMORY": OOM,
+    "TIMEOUT": TIMEOUT,
+    "DEADLINE": TIMEOUT,
+    "FAILED": FAILED,
+    "NODE_FAIL": FAILED,
+    "BOOT_FAIL": FAILED,
+    "CANCELLED": FAILED,
+    "PREEMPTED": FAILED,
+}
+
+
+SACCT_BACKENDS = ("json", "parsable")
+
+# fields requested by the parsable backend, the job name is last as it can contain the delimiter
+SACCT_PARSABLE_FORMAT = (
+    "JobIDRaw",
+    "State",
+    "Partition",
+    "ElapsedRaw",
+    "ReqCPUS",
+    "ReqMem",
+    "NTasks",
+    "TRESUsageInMax",
+    "TotalCPU",
+    "TRESUsageInTot",
+    "TRESUsageOutTot",
+    "JobName",
+)
+# fields listing the jobs of a time window with the parsable backend, separated by
+# SACCT_WINDOW_DELIMITER rather than | as both the name and submit line may contain it
+SACCT_WINDOW_FORMAT = ("JobIDRaw", "State", "JobName", "SubmitLine")
+SACCT_WINDOW_DELIMITER = "\x1f"
+MEMORY_UNITS_MB = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024**2}
+
+# states of jobs which have not finished, their accounting data is incomplete
+UNFINISHED_STATES = ("PENDING", "RUNNING", "REQUEUED", "RESIZING", "SUSPENDED")
+
+# accounting metrics which can be recorded and predicted in addition to memory and runtime:
+# the cpu time over elapsed time times the cpus, the bytes read and written to disk
+# and the peak virtual memory, all in MB
+METRICS = ("cpu_efficiency", "disk_read", "disk_write", "max_vmem")
+
+# the number of jobs requested by each sacct command when querying many jobs
+SACCT_BATCH_SIZE = 500
+
+# runs every sacct command of the process, so its circuit breaker sees all failures
+SACCT_CLIENT = SacctClient()
+
+# states of jobs whose accounting data can no longer change
+TERMINAL_STATES = (
+    "COMPLETED",
+    "FAILED",
+    "TIMEOUT",
+    "OUT_OF_MEMORY",
+    "CANCELLED",
+    "DEADLINE",
+    "NODE_FAIL",
+    "BOOT_FAIL",
+)
+
+
+def outcome_from_state(state: str | None) -> str:
+    """Convert a slurm job state, such as `CANCELLED by 123`, to a job outcome."""
+    if not state:
+        return COMPLETED
+    return SLURM_STATE_OUTCOMES.get(state.split()[0], COMPLETED)
+
+
+def parse_slurm_job_metadata(
+    slurm_id: str | None = None,
+    step_name: str | None = None,
+    backend: str = "json",
+) -> dict:
     """
     Return a dictionary of metadata for the current SLURM job.
     Parameters:
@@ -14,69 +92,375 @@ def parse_slurm_job_metadata(slurm_id: str | None = None, step_name: str | None
             the job ID from the SLURM_JOBID environment variable.
         step_id (str | None): The SLURM step ID. If None, the function defaults to the last step
             of the job. If provided, it specifies which step's metadata to return.
+        backend (str): How to query sacct, `json` parses the full json document while
+            `parsable` only requests the fields of the metadata.
     Returns:
         dict: A dictionary containing metadata for the specified SLURM job and step.
     """
+    if backend not in SACCT_BACKENDS:
+        msg = f"Unknown sacct backend {backend!r}, expected one of {', '.join(SACCT_BACKENDS)}"
+        raise ValueError(msg)
+
+    if backend == "parsable":
+        sacct_output = get_slurm_job_sacct_parsable(slurm_id)
+        try:
+            return parse_sacct_parsable(sacct_output, step_name)
+        except Exception as e:
+            msg = f"Could not parse output from sacct cmd:\n\n {sacct_output}"
+            raise ValueError(msg) from e
 
     sacct_json = get_slurm_job_sacct(slurm_id)
 
     try:
-        job_id = sacct_json["jobs"][0]["job_id"]
-        job_name = sacct_json["jobs"][0]["name"]
-        state = sacct_json["jobs"][0]["state"]["current"][0]
-        partition = sacct_json["jobs"][0]["partition"]
-        cpus = sacct_json["jobs"][0]["required"]["CPUs"]
-        memory_per_cpu = sacct_json["jobs"][0]["required"]["memory_per_cpu"]
-        memory_per_node = sacct_json["jobs"][0]["required"]["memory_per_node"]
-        max_rss = 0
-        steps = {}
-        jobstep_ids = []
-        for step in sacct_json["jobs"][0]["steps"]:
-            steps[step["step"]["id"]] = step
-            jobstep_ids.append(step["step"]["id"])
-
-        if step_name is None:
-            step_id = jobstep_ids[-1]
-            step_name = step_id.split(".")[-1]
-        else:
-            step_id = f"{job_id}.{step_name}"
-
-        # In addition, the max requested memory is updated as slurm steps are completed.
-        elapsed_seconds = int(steps[step_id]["time"]["elapsed"])
-        task_count = steps[step_id]["tasks"]["count"]
-        for item in steps[step_id]["tres"]["requested"]["max"]:
-            if item["type"] == "mem":
-                max_rss = max(max_rss, ceil(item["count"] / (2**20)) * task_count)  # convert to MB
+        return parse_sacct_job(sacct_json["jobs"][0], step_name)
     except Exception as e:
         msg = f"Could not parse json from sacct cmd:\n\n {sacct_json}"
         raise ValueError(msg) from e
 
+
+def parse_sacct_job(job: dict, step_name: str | None = None) -> dict:
+    """Return the metadata of a job from the json output of sacct, see parse_slurm_job_metadata.
+
+    Raises KeyError, IndexError or TypeError if the job is missing information.
+    """
+    job_id = job["job_id"]
+    max_rss = 0
+    steps = {}
+    jobstep_ids = []
+    for step in job["steps"]:
+        steps[step["step"]["id"]] = step
+        jobstep_ids.append(step["step"]["id"])
+
+    if step_name is None:
+        step_id = jobstep_ids[-1]
+        step_name = step_id.split(".")[-1]
+    else:
+        step_id = f"{job_id}.{step_name}"
+
+    # In addition, the max requested memory is updated as slurm steps are completed.
+    step = steps[step_id]
+    elapsed_seconds = int(step["time"]["elapsed"])
+    task_count = step["tasks"]["count"]
+    for item in step["tres"]["requested"]["max"]:
+        if item["type"] == "mem":
+            max_rss = max(max_rss, ceil(item["count"] / (2**20)) * task_count)  # convert to MB
+
+    # requested is the usage in (TRESUsageIn) and consumed the usage out of sacct
+    usage = {
+        "in_max": _json_tres(step["tres"]["requested"]["max"]),
+        "in_tot": _json_tres(step["tres"]["requested"].get("total", [])),
+        "out_tot": _json_tres(step["tres"].get("consumed", {}).get("total", [])),
+    }
+    cpu_seconds = None
+    if "total" in step["time"]:
+        cpu_seconds = step["time"]["total"]["seconds"] + step["time"]["total"].get("microseconds", 0) / 1e6
+
     return {
         "slurm_id": job_id,
         "step_id": step_name,
-        "job_name": job_name,
-        "state": state,
-        "partition": partition,
+        "job_name": job["name"],
+        "state": job["state"]["current"][0],
+        "partition": job["partition"],
         "elapsed_seconds": elapsed_seconds,
-        "CPUs": cpus,
-        "memory_per_cpu": memory_per_cpu,
-        "memory_per_node": memory_per_node,
+        "CPUs": job["required"]["CPUs"],
+        "memory_per_cpu": job["required"]["memory_per_cpu"],
+        "memory_per_node": job["required"]["memory_per_node"],
         "max_rss": max_rss,
+        "metrics": _metrics(usage, cpu_seconds, elapsed_seconds, job["required"]["CPUs"], task_count),
     }
 
 
-def get_slurm_job_sacct(slurm_id: str | None = None) -> dict:
-    """Return the JSON output of the sacct command for the current SLURM job."""
+def parse_slurm_jobs_metadata(
+    slurm_ids: list[str],
+    backend: str = "json",
+    batch_size: int = SACCT_BATCH_SIZE,
+) -> dict[tuple[str, str | None], dict]:
+    """Return the metadata of every step of many jobs, querying sacct for batch_size jobs at once.
+
+    The batches are queried concurrently by SACCT_CLIENT.  The metadata is keyed
+    by the job id and step name, with a step name of None for the last step, as
+    returned by parse_slurm_job_metadata.  Jobs which sacct doesn't return, or
+    without steps, are missing.
+    """
+    if backend not in SACCT_BACKENDS:
+        msg = f"Unknown sacct backend {backend!r}, expected one of {', '.join(SACCT_BACKENDS)}"
+        raise ValueError(msg)
+    if not slurm_ids:
+        return {}
+
+    cmds = [
+        sacct_job_cmd(",".join(slurm_ids[start : start + batch_size]), backend)
+        for start in range(0, len(slurm_ids), batch_size)
+    ]
+    metadata = {}
+    for output in SACCT_CLIENT.check_outputs(cmds):
+        if backend == "parsable":
+            metadata.update(parse_sacct_parsable_jobs(output.decode()))
+        else:
+            metadata.update(parse_sacct_json_jobs(json.loads(output.decode())))
+    return metadata
+
+
+def parse_sacct_json_jobs(sacct_json: dict) -> dict[tuple[str, str | None], dict]:
+    """Return the metadata of every step of the jobs in the json output of sacct."""
+    metadata = {}
+    for job in sacct_json.get("jobs", []):
+        job_id = str(job.get("job_id"))
+        for step_name in (None, *(step["step"]["id"].split(".")[-1] for step in job.get("steps", []))):
+            with contextlib.suppress(KeyError, IndexError, TypeError):
+                metadata[job_id, step_name] = parse_sacct_job(job, step_name)
+    return metadata
+
+
+def parse_sacct_parsable_jobs(sacct_output: str) -> dict[tuple[str, str | None], dict]:
+    """Return the metadata of every step of the jobs in the parsable output of sacct."""
+    job_lines = {}
+    step_lines = {}
+    for line in sacct_output.splitlines():
+        if not line:
+            continue
+        job_id, _, step_name = line.partition("|")[0].partition(".")
+        if step_name:
+            step_lines.setdefault(job_id, {})[step_name] = line
+        else:
+            job_lines[job_id] = line
+
+    metadata = {}
+    for job_id, job_line in job_lines.items():
+        steps = step_lines.get(job_id, {})
+        output = "\n".join([job_line, *steps.values()])
+        for step_name in (None, *steps):
+            with contextlib.suppress(KeyError, IndexError, ValueError):
+                metadata[job_id, step_name] = parse_sacct_parsable(output, step_name)
+    return metadata
+
+
+def runtime_minutes(metadata: dict) -> float:
+    """The runtime of a job from its slurm metadata, in the minutes of JobData rather than the seconds of sacct."""
+    return metadata["elapsed_seconds"] / 60
+
+
+def update_job_data(job_data: JobData, metadata: dict, metrics: Iterable[str] = ()) -> JobData:
+    """Set the memory, runtime, outcome and the given METRICS of a job from its slurm metadata.
+
+    Metrics which sacct didn't report are left unset.
+    """
+    job_data.memory = metadata["max_rss"]
+    job_data.runtime = runtime_minutes(metadata)
+    job_data.outcome = outcome_from_state(metadata["state"])
+    reported = metadata.get("metrics", {})
+    job_data.metrics.update({metric: reported[metric] for metric in metrics if metric in reported})
+    return job_data
+
+
+def parse_sacct_parsable(sacct_output: str, step_name: str | None = None) -> dict:
+    """Return the metadata of a job from the parsable output of sacct, see parse_slurm_job_metadata.
+
+    The first line is the job and the following lines its steps, with the fields
+    of SACCT_PARSABLE_FORMAT.  The values match those parsed from the json output.
+    """
+    job = None
+    steps = {}
+    for line in sacct_output.splitlines():
+        if not line:
+            continue
+        row = dict(zip(SACCT_PARSABLE_FORMAT, line.split("|", len(SACCT_PARSABLE_FORMAT) - 1), strict=True))
+        if job is None:
+            job = row
+        else:
+            steps[row["JobIDRaw"]] = row
+
+    job_id = job["JobIDRaw"]
+    if step_name is None:
+        step_id = list(steps)[-1]
+        step_name = step_id.split(".")[-1]
+    else:
+        step_id = f"{job_id}.{step_name}"
+
+    step = steps[step_id]
+    task_count = int(step["NTasks"])
+    usage = {
+        "in_max": _parsable_tres(step["TRESUsageInMax"]),
+        "in_tot": _parsable_tres(step["TRESUsageInTot"]),
+        "out_tot": _parsable_tres(step["TRESUsageOutTot"]),
+    }
+    max_rss = 0
+    if "mem" in usage["in_max"]:
+        max_rss = ceil(usage["in_max"]["mem"] / (2**20)) * task_count  # convert to MB
+    cpu_seconds = _parse_cpu_time(step["TotalCPU"]) if step["TotalCPU"] else None
+
+    return {
+        "slurm_id": int(job_id),
+        "step_id": step_name,
+        "job_name": job["JobName"],
+        "state": job["State"].split()[0],
+        "partition": job["Partition"],
+        "elapsed_seconds": int(step["ElapsedRaw"]),
+        "CPUs": int(job["ReqCPUS"]),
+        **_parse_req_mem(job["ReqMem"]),
+        "max_rss": max_rss,
+        "metrics": _metrics(usage, cpu_seconds, int(step["ElapsedRaw"]), int(job["ReqCPUS"]), task_count),
+    }
+
+
+def _json_tres(items: list[dict]) -> dict[str, int]:
+    """The counts of a tres usage list of the json output, keyed as type/name, e.g. fs/disk."""
+    return {f"{item['type']}/{item['name']}" if item.get("name") else item["type"]: item["count"] for item in items}
+
+
+def _parsable_tres(tres_usage: str) -> dict[str, int]:
+    """The counts of a tres usage field of the parsable output, e.g. cpu=00:10:00,mem=1024,fs/disk=5000.
+
+    The cpu time is a duration, which is not used.
+    """
+    counts = {}
+    for tres in tres_usage.split(","):
+        tres_type, _, count = tres.partition("=")
+        if count.isdigit():
+            counts[tres_type] = int(count)
+    return counts
+
+
+def _parse_cpu_time(cpu_time: str) -> float:
+    """Convert a sacct time, [D-][HH:]MM:SS[.mmm], to seconds."""
+    days, _, clock = cpu_time.rpartition("-")
+    seconds = 0.0
+    for part in clock.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds + int(days or 0) * 86400
+
+
+def _metrics(
+    usage: dict[str, dict[str, int]],
+    cpu_seconds: float | None,
+    elapsed_seconds: int,
+    cpus: int,
+    task_count: int,
+) -> dict[str, float]:
+    """The METRICS of a step which sacct reported."""
+    metrics = {}
+    if cpu_seconds is not None and elapsed_seconds > 0 and cpus > 0:
+        metrics["cpu_efficiency"] = cpu_seconds / (elapsed_seconds * cpus)
+    if "fs/disk" in usage["in_tot"]:
+        metrics["disk_read"] = usage["in_tot"]["fs/disk"] / 2**20
+    if "fs/disk" in usage["out_tot"]:
+        metrics["disk_write"] = usage["out_tot"]["fs/disk"] / 2**20
+    if "vmem" in usage["in_max"]:
+        # the peak of a task, as for max_rss
+        metrics["max_vmem"] = ceil(usage["in_max"]["vmem"] / 2**20) * task_count
+    return metrics
+
+
+def _parse_req_mem(req_mem: str) -> dict:
+    """Convert the ReqMem of sacct to the memory_per_cpu and memory_per_node of the json output.
+
+    Older versions of slurm add `c` or `n` for memory per cpu or node, newer versions
+    report the memory per node.
+    """
+    per_cpu = req_mem.endswith("c")
+    req_mem = req_mem.rstrip("cn")
+    number = 0
+    if req_mem:
+        unit = req_mem[-1] if req_mem[-1] in MEMORY_UNITS_MB else "M"
+        number = int(float(req_mem.rstrip(unit)) * MEMORY_UNITS_MB[unit])
+    memory = {"set": True, "infinite": False, "number": number}
+    unset = {"set": False, "infinite": False, "number": 0}
+    return {
+        "memory_per_cpu": memory if per_cpu else unset,
+        "memory_per_node": unset if per_cpu else memory,
+    }
+
+
+def current_slurm_id(slurm_id: str | None) -> str:
     if slurm_id is None:
         if "SLURM_JOBID" not in os.environ:
             msg = "Not running in a SLURM job"
             raise ValueError(msg)
         slurm_id = os.environ["SLURM_JOBID"]
+    return slurm_id
+
+
+def sacct_job_cmd(slurm_id: str, backend: str = "json") -> list[str]:
+    """The sacct command querying a job, or a comma separated list of jobs, with a backend."""
+    if backend == "parsable":
+        # only the fields used for the metadata, without conversion of units
+        return [
+            "sacct",
+            "-j",
+            slurm_id,
+            "--parsable2",
+            "--noheader",
+            "--noconvert",
+            f"--format={','.join(SACCT_PARSABLE_FORMAT)}",
+        ]
+    return ["sacct", "-j", slurm_id, "--json"]
+
+
+def get_slurm_job_sacct(slurm_id: str | None = None) -> dict:
+    """Return the JSON output of the sacct command for the current SLURM job."""
+    output = SACCT_CLIENT.check_output(sacct_job_cmd(current_slurm_id(slurm_id)))
+    return json.loads(output.decode())
+
+
+def get_slurm_job_sacct_parsable(slurm_id: str | None = None) -> str:
+    """Return the parsable output of the sacct command for the current SLURM job."""
+    output = SACCT_CLIENT.check_output(sacct_job_cmd(current_slurm_id(slurm_id), backend="parsable"))
+    return output.decode()
+
+
+def get_sacct_window(
+    start: datetime.datetime,
+    end: datetime.datetime,
+    user: str | None = None,
+    partition: str | None = None,
+    backend: str = "json",
+) -> dict:
+    """Return the jobs of sacct between start and end, in the format of the JSON output of sacct.
+
+    The parsable backend only lists the id, state, name and submit line of each
+    job, see parse_sacct_window, their metadata is queried separately.
+    """
+    if backend not in SACCT_BACKENDS:
+        msg = f"Unknown sacct backend {backend!r}, expected one of {', '.join(SACCT_BACKENDS)}"
+        raise ValueError(msg)
+    if backend == "parsable":
+        cmd = [
+            "sacct",
+            "--allocations",
+            "--parsable2",
+            "--noheader",
+            f"--delimiter={SACCT_WINDOW_DELIMITER}",
+            f"--format={','.join(SACCT_WINDOW_FORMAT)}",
+        ]
+    else:
+        cmd = ["sacct", "--json"]
+    cmd += ["--starttime", start.isoformat(timespec="seconds"), "--endtime", end.isoformat(timespec="seconds")]
+    if user is not None:
+        cmd += ["--user", user]
+    if partition is not None:
+        cmd += ["--partition", partition]
+
+    output = SACCT_CLIENT.check_output(cmd).decode()
+    if backend == "parsable":
+        return parse_sacct_window(output)
+    return json.loads(output)
 
-    try:
-        json_encoded_str = subprocess.check_output(["sacct", "-j", slurm_id, "--json"])
-    except subprocess.CalledProcessError as e:
-        msg = f"Error running sacct cmd: {e}"
-        raise ValueError(msg) from e
 
-    return json.loads(json_encoded_str.decode())
+def parse_sacct_window(sacct_output: str) -> dict:
+    """Convert the parsable listing of the jobs of a window to the fields of the JSON output used by harvest."""
+    jobs = []
+    for line in sacct_output.splitlines():
+        fields = line.split(SACCT_WINDOW_DELIMITER, len(SACCT_WINDOW_FORMAT) - 1)
+        # e.g. the continuation of a submit line with a newline
+        if len(fields) != len(SACCT_WINDOW_FORMAT) or not fields[0].isdigit():
+            continue
+        row = dict(zip(SACCT_WINDOW_FORMAT, fields, strict=True))
+        jobs.append(
+            {
+                "job_id": int(row["JobIDRaw"]),
+                "name": row["JobName"],
+                "submit_line": row["SubmitLine"],
+                "state": {"current": row["State"].split()[:1]},
+            }
+        )
+    return {"jobs": jobs}
@@ -0,0 +1,108 @@
+"""Build sbatch command lines which allocate the memory and time predicted by slurmise."""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Sequence
+
+# options which set the memory of a job, any given are replaced by --mem
+MEMORY_OPTIONS = ("--mem", "--mem-per-cpu", "--mem-per-gpu")
+TIME_OPTIONS = ("--time", "-t")
+
+# sbatch options without a value, or with an optional value given as --option=value.
+# The value of any other option may be the next argument.
+SHORT_FLAGS = frozenset("hHIkOQsVvW")
+LONG_FLAGS = frozenset(
+    {
+        "--contiguous",
+        "--exclusive",
+        "--get-user-env",
+        "--help",
+        "--hold",
+        "--ignore-pbs",
+        "--immediate",
+        "--nice",
+        "--no-kill",
+        "--no-requeue",
+        "--overcommit",
+        "--oversubscribe",
+        "--parsable",
+        "--quiet",
+        "--reboot",
+        "--requeue",
+        "--spread-job",
+        "--test-only",
+        "--usage",
+        "--use-min-nodes",
+        "--verbose",
+        "--version",
+        "--wait",
+    }
+)
+
+
+def split_script(args: Sequence[str]) -> tuple[list[str], list[str]]:
+    """Split sbatch arguments into the options and the batch script with its arguments."""
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if not arg.startswith("-") or arg == "-":
+            break
+        index += 1
+        if arg.startswith("--"):
+            if "=" not in arg and arg not in LONG_FLAGS:
+                index += 1
+        elif len(arg) == 2 and arg[1] not in SHORT_FLAGS:
+            index += 1
+    return list(args[:index]), list(args[index:])
+
+
+def scale_allocation(
+    memory: float,
+    runtime: float,
+    memory_factor: float = 1.0,
+    time_factor: float = 1.0,
+    escalation: float = 1.0,
+    attempt: int = 1,
+) -> tuple[int, int]:
+    """The memory in MB and time in minutes to request for a predicted memory and runtime.
+
+    The prediction is multiplied by its safety factor, and by escalation for each
+    attempt after the first, e.g. after a job ran out of memory or time.
+    """
+    if attempt < 1:
+        msg = f"Attempts are counted from 1, not {attempt}"
+        raise ValueError(msg)
+    scale = escalation ** (attempt - 1)
+    return math.ceil(memory * memory_factor * scale), max(math.ceil(runtime * time_factor * scale), 1)
+
+
+def sbatch_arguments(args: Sequence[str], memory: int, runtime: int, wrap: str | None = None) -> list[str]:
+    """Set the memory and time of sbatch arguments, replacing any memory and time options.
+
+    The options are given before any batch script, or the command to wrap is
+    given with --wrap instead of a script.
+    """
+    options, script = split_script(args)
+    if wrap is not None and script:
+        msg = f"A batch script can't be given with a wrapped command, got {' '.join(script)}"
+        raise ValueError(msg)
+
+    kept = []
+    index = 0
+    while index < len(options):
+        arg = options[index]
+        name = arg.split("=", 1)[0]
+        if name in (*MEMORY_OPTIONS, *TIME_OPTIONS):
+            index += 1 if "=" in arg else 2
+        elif arg.startswith("-t") and not arg.startswith("--"):
+            # -t10
+            index += 1
+        else:
+            kept.append(arg)
+            index += 1
+
+    resources = [f"--mem={memory}M", f"--time={runtime}"]
+    if wrap is not None:
+        return [*resources, *kept, f"--wrap={wrap}"]
+    return [*resources, *kept, *script]
@@ -12,7 +12,8 @@ def jobs_to_pandas(jobs: list[JobData]):
     """
     Convert a list of JobData objects to a pandas DataFrame. The DataFrame will have
     columns for each category and numeric feature, and will not include the job_name,
-    slurm_id, or cmd fields since they are not features.
+    slurm_id, cmd, or outcome fields since they are not features.  Like memory and
+    runtime, metrics are targets rather than features, in columns such as metrics.cpu_efficiency.
 
     :param jobs: A list of JobData objects
     :type jobs: list[JobData]
@@ -62,7 +63,7 @@ def jobs_to_pandas(jobs: list[JobData]):
     df.columns = [col.replace("numerics.", "") for col in df.columns]
 
     # Drop job_name and slurm_id columns since they are not features
-    cols_to_drop = {"job_name", "slurm_id", "cmd"}.intersection(df.columns)
+    cols_to_drop = {"job_name", "slurm_id", "cmd", "outcome"}.intersection(df.columns)
     df = df.drop(columns=cols_to_drop)
 
     # Sort columns to ensure consistent ordering across platforms
@@ -70,6 +71,12 @@ def jobs_to_pandas(jobs: list[JobData]):
 
     # Transform features
     categories = sorted([name for name in df.columns if df[name].dtype == "category"])
-    numerics = sorted([name for name in df.columns if name not in categories and name not in ["memory", "runtime"]])
+    numerics = sorted(
+        [
+            name
+            for name in df.columns
+            if name not in categories and name not in ["memory", "runtime"] and not name.startswith("metrics.")
+        ]
+    )
 
     return df, categories, numerics
@@ -1,4 +1,7 @@
+import json
+import os
 import shutil
+import sys
 from pathlib import Path
 from typing import NamedTuple
 
@@ -6,6 +9,7 @@ import pytest
 
 from slurmise.job_data import JobData
 from slurmise.job_database import JobDatabase
+from slurmise.sacct_client import SacctClient
 
 
 class TomlReturn(NamedTuple):
@@ -13,6 +17,13 @@ class TomlReturn(NamedTuple):
     db: str
 
 
+def copy_nupack_db(db_path):
+    """Copy the nupack database, which predates storing the runtime unit and is in minutes."""
+    shutil.copyfile("./tests/nupack2.h5", db_path)
+    with JobDatabase.get_database(db_path) as database:
+        database.migrate_runtimes("minutes")
+
+
 @pytest.fixture
 def simple_toml(tmp_path):
     d = tmp_path
@@ -46,10 +57,7 @@ def nupack_toml(tmp_path):
 
     db_path = d / "slurmise_dir" / "nupack2.h5"
     Path.mkdir(db_path.parent, exist_ok=True, parents=True)
-    shutil.copyfile(
-        "./tests/nupack2.h5",
-        db_path,
-    )
+    copy_nupack_db(db_path)
 
     return TomlReturn(p, db_path)
 
@@ -73,10 +81,7 @@ def nupackdefaults_toml(tmp_path):
 
     db_path = d / "slurmise_dir" / "nupack2.h5"
     Path.mkdir(db_path.parent, exist_ok=True, parents=True)
-    shutil.copyfile(
-        "./tests/nupack2.h5",
-        db_path,
-    )
+    copy_nupack_db(db_path)
 
     return TomlReturn(p, db_path)
 
@@ -161,3 +166,73 @@ def small_db_toml(tmp_path, small_db):
     """
     )
     return TomlReturn(p, small_db.db_file)
+
+
+FAKE_SACCT = """#!{python}
+import json, os, sys, time
+from pathlib import Path
+
+responses = Path(os.environ["FAKE_SACCT_DIR"])
+with open(responses / "calls.log", "a") as log:
+    log.write(json.dumps(sys.argv[1:]) + "\\n")
+calls = len((responses / "calls.log").read_text().splitlines())
+time.sleep(float(os.environ.get("FAKE_SACCT_SLEEP", 0)))
+if calls <= int(os.environ.get("FAKE_SACCT_FAILURES", 0)):
+    sys.exit("sacct: error: slurmdbd: Socket timed out on send/recv operation")
+
+job_ids = sys.argv[sys.argv.index("-j") + 1].split(",")
+if "--json" in sys.argv:
+    jobs = []
+    for job_id in job_ids:
+        path = responses / f"{{job_id}}.json"
+        if path.exists():
+            jobs.extend(json.loads(path.read_text())["jobs"])
+    print(json.dumps({{"jobs": jobs}}))
+else:
+    for job_id in job_ids:
+        path = responses / f"{{job_id}}.txt"
+        if path.exists():
+            sys.stdout.write(path.read_text())
+"""
+
+
+class FakeSacct:
+    """A sacct script on PATH which returns the added jobs and logs its arguments.
+
+    The first `failures` calls exit with an error and every call sleeps for `sleep` seconds.
+    """
+
+    def __init__(self, directory: Path, monkeypatch):
+        self.directory = directory
+        self.monkeypatch = monkeypatch
+        bin_dir = directory / "bin"
+        bin_dir.mkdir()
+        script = bin_dir / "sacct"
+        script.write_text(FAKE_SACCT.format(python=sys.executable))
+        script.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        monkeypatch.setenv("FAKE_SACCT_DIR", str(directory))
+
+    def add_job(self, job_id, sacct_json: dict, parsable: str) -> None:
+        (self.directory / f"{job_id}.json").write_text(json.dumps(sacct_json))
+        (self.directory / f"{job_id}.txt").write_text(parsable)
+
+    def set(self, failures: int = 0, sleep: float = 0) -> None:
+        self.monkeypatch.setenv("FAKE_SACCT_FAILURES", str(failures))
+        self.monkeypatch.setenv("FAKE_SACCT_SLEEP", str(sleep))
+
+    @property
+    def calls(self) -> list[list[str]]:
+        log = self.directory / "calls.log"
+        if not log.exists():
+            return []
+        return [json.loads(line) for line in log.read_text().splitlines()]
+
+
+@pytest.fixture
+def fake_sacct_bin(tmp_path, monkeypatch):
+    """A fake sacct on PATH, with a fresh sacct client which retries without waiting."""
+    directory = tmp_path / "fake_sacct"
+    directory.mkdir()
+    monkeypatch.setattr("slurmise.slurm.SACCT_CLIENT", SacctClient(backoff=0, timeout=10))
+    return FakeSacct(directory, monkeypatch)
@@ -1,3 +1,5 @@
+import json
+from dataclasses import replace
 from pathlib import Path
 
 import numpy as np
@@ -5,8 +7,9 @@ import pytest
 
 from slurmise.fit.poly_fit import PolynomialFit
 from slurmise.fit.resource_fit import ResourceFit
-from slurmise.job_data import JobData
+from slurmise.job_data import FAILED, OOM, TIMEOUT, JobData
 from slurmise.job_database import JobDatabase
+from slurmise.utils import jobs_to_pandas
 
 
 @pytest.fixture(autouse=True)
@@ -100,3 +103,100 @@ def test_fit_and_predict(nupack_data, model, kwargs, expected_metrics):
                 expected_metrics[key][metric],
                 rtol=1e-6,
             )
+
+
+def test_fit_with_lower_bounds(nupack_data):
+    query, jobs = nupack_data
+
+    def fit(jobs):
+        poly_fit = PolynomialFit(query=query)
+        poly_fit.fit(jobs, random_state=np.random.RandomState(42))
+        return poly_fit
+
+    def predict(poly_fit, job):
+        X = jobs_to_pandas([job])[0].drop(columns=["runtime", "memory"])
+        return poly_fit.runtime_model.predict(X)[0], poly_fit.memory_model.predict(X)[0]
+
+    baseline = fit(jobs)
+    runtime, memory = predict(baseline, jobs[0])
+
+    # failed jobs are not used
+    failed = [replace(job, slurm_id=f"failed_{job.slurm_id}", outcome=FAILED, memory=1e9) for job in jobs[:10]]
+    with_failed = fit(jobs + failed)
+    assert with_failed.model_metrics == baseline.model_metrics
+    assert with_failed.last_fit_njobs == len(jobs) + 10
+
+    # oom jobs at less memory than predicted don't change the fit
+    ooms = [replace(job, slurm_id=f"oom_{job.slurm_id}", outcome=OOM, memory=1) for job in jobs[:10]]
+    assert predict(fit(jobs + ooms), jobs[0]) == (runtime, memory)
+
+    # oom jobs which needed more memory than predicted raise the prediction of memory only
+    ooms = [replace(job, slurm_id=f"oom_{job.slurm_id}", outcome=OOM, memory=1e6) for job in jobs[:10]]
+    oom_runtime, oom_memory = predict(fit(jobs + ooms), jobs[0])
+    assert oom_runtime == runtime
+    assert oom_memory > memory
+
+    timeouts = [replace(job, slurm_id=f"timeout_{job.slurm_id}", outcome=TIMEOUT, runtime=1e6) for job in jobs[:10]]
+    timeout_runtime, timeout_memory = predict(fit(jobs + timeouts), jobs[0])
+    assert timeout_runtime > runtime
+    assert timeout_memory == memory
+
+
+def test_fit_metric_targets(nupack_data, tmp_path):
+    query, jobs = nupack_data
+    # a metric recorded for all but the first jobs, e.g. those before it was configured
+    jobs = [
+        replace(job, metrics={} if i < 20 else {"cpu_efficiency": min(job.runtime / 100, 1.0)})
+        for i, job in enumerate(jobs)
+    ]
+
+    poly_fit = PolynomialFit(query=query, path=tmp_path, targets=["memory", "cpu_efficiency"])
+    poly_fit.fit(jobs, random_state=np.random.RandomState(42))
+    assert set(poly_fit.model_metrics) == {"memory", "cpu_efficiency"}
+    assert poly_fit.runtime_model is None
+    assert set(poly_fit.metric_models) == {"cpu_efficiency"}
+    poly_fit.save()
+    assert (tmp_path / poly_fit.model_version / "poly_cpu_efficiency_model.pkl").exists()
+
+    loaded = PolynomialFit.load(path=tmp_path)
+    assert loaded.targets == ["memory", "cpu_efficiency"]
+    job = replace(jobs[0], runtime=60, memory=1000, metrics={})
+    predicted, _ = loaded.predict(job)
+    assert predicted.runtime == 60
+    assert predicted.metrics["cpu_efficiency"] >= 0
+    assert predicted.metrics == PolynomialFit.load(path=tmp_path).predict(replace(job, metrics={}))[0].metrics
+
+    # metrics which none of the jobs recorded are not fit
+    poly_fit = PolynomialFit(query=query, path=tmp_path, targets=["runtime", "memory", "disk_read"])
+    poly_fit.fit(jobs, random_state=np.random.RandomState(42))
+    assert set(poly_fit.model_metrics) == {"runtime", "memory"}
+    assert poly_fit.metric_models == {}
+
+
+def test_save_versions(nupack_data, tmp_path):
+    query, jobs = nupack_data
+    path = tmp_path / "model"
+    # a model saved before versions, directly in path
+    legacy = PolynomialFit(query=query, path=path)
+    legacy.fit(jobs, random_state=np.random.RandomState(42))
+    legacy.save()
+    for filename in ("poly_runtime_model.pkl", "poly_memory_model.pkl"):
+        (path / legacy.model_version / filename).rename(path / filename)
+    (path / legacy.model_version).rmdir()
+    info = PolynomialFit.read_fit_info(path)
+    del info["model_version"]
+    (path / "fits.json").write_text(json.dumps(info))
+    assert PolynomialFit.load(path=path).runtime_model is not None
+
+    versions = []
+    for _ in range(3):
+        poly_fit = PolynomialFit(query=query, path=path)
+        poly_fit.fit(jobs[:-10], random_state=np.random.RandomState(42))
+        poly_fit.save()
+        versions.append(poly_fit.model_version)
+        # fits.json names the models of the same save
+        assert PolynomialFit.read_fit_info(path)["model_version"] == poly_fit.model_version
+        assert PolynomialFit.load(path=path).last_fit_njobs == len(jobs) - 10
+
+    # the previous save is kept for loads which read its fits.json
+    assert sorted(entry.name for entry in path.iterdir()) == sorted([*versions[1:], "fits.json"])
@@ -1,10 +1,12 @@
 import multiprocessing
 import time
+from pathlib import Path
 from unittest import mock
 
 import pytest
 
 from slurmise.api import Slurmise
+from slurmise.job_data import JobData
 
 
 def slurmise_record(toml, process_id, error_queue):
@@ -78,3 +80,116 @@ def test_update_all_models(toml_fixture, request):
         # because there is only one job with "filesizes" numeric feature.
         if str(e).startswith("Cannot have number of splits n_splits="):
             pass
+
+
+def test_update_all_models_incremental(nupack_toml):
+    slurmise = Slurmise(nupack_toml.toml)
+    query = slurmise.configuration.parse_job_cmd("nupack monomer -c 3 -S 6543")
+    model = slurmise.configuration.get_model_class("nupack")
+    model_path = slurmise._model_path(model, query)
+    assert model_path.parent.parent == Path(slurmise.configuration.slurmise_base_dir)
+
+    assert slurmise.update_all_models(incremental=True) == 1
+    fit_info = model.read_fit_info(model_path)
+    assert fit_info["last_fit_njobs"] > 0
+    # no temporary files are left after saving
+    assert not list(model_path.glob(".*"))
+
+    # nothing new to fit
+    assert slurmise.update_all_models(incremental=True) == 0
+    assert slurmise.update_all_models() == 1
+
+    slurmise.raw_record(
+        JobData(job_name="nupack", slurm_id="new_job", numerics={"cpus": 3, "sequences": 6543}, runtime=5, memory=100),
+        processed_data=True,
+    )
+    assert slurmise.update_all_models(incremental=True) == 1
+    assert model.read_fit_info(model_path)["last_fit_njobs"] == fit_info["last_fit_njobs"] + 1
+
+
+def test_update_model_deferred(nupack_toml):
+    slurmise = Slurmise(nupack_toml.toml)
+    # a deferred job has no memory or runtime until it is filled from sacct
+    slurmise.raw_record(
+        JobData(job_name="nupack", slurm_id="deferred", numerics={"cpus": 3, "sequences": 6543}), defer=True
+    )
+    slurmise.update_model("nupack monomer -c 3 -S 6543", None)
+    assert slurmise.update_all_models() == 1
+    predicted, _ = slurmise.predict("nupack monomer -c 3 -S 6543", None)
+    assert predicted.runtime > 0
+
+
+def test_update_model_only_deferred(simple_toml):
+    slurmise = Slurmise(simple_toml.toml)
+    slurmise.raw_record(
+        JobData(job_name="nupack", slurm_id="1", categories={"complexity": "simple"}, numerics={"threads": 2}),
+        defer=True,
+    )
+    assert slurmise.update_all_models() == 1
+    # the defaults are predicted until jobs are filled
+    predicted, warns = slurmise.predict("nupack monomer -T 2 -C simple", None)
+    assert (predicted.memory, predicted.runtime) == (1000, 60)
+    assert warns
+
+
+def test_update_all_models_in_background(nupack_toml):
+    slurmise = Slurmise(nupack_toml.toml)
+    query = slurmise.configuration.parse_job_cmd("nupack monomer -c 3 -S 6543")
+    model_path = slurmise._model_path(slurmise.configuration.get_model_class("nupack"), query)
+
+    process = slurmise.update_all_models_in_background()
+    assert process.wait(timeout=120) == 0
+    assert (model_path / "fits.json").exists()
+
+    query_jd, _ = slurmise.raw_predict(query)
+    assert query_jd.runtime != slurmise.configuration.default_runtime["nupack"]
+
+    slurmise.toml_path = None
+    with pytest.raises(ValueError, match="requires a toml file"):
+        slurmise.update_all_models_in_background()
+
+
+def test_batch_raw_predict(nupack_toml):
+    slurmise = Slurmise(nupack_toml.toml)
+    slurmise.update_all_models()
+    cmds = [f"nupack monomer -c {cpus} -S {sequences}" for cpus in (1, 3, 8) for sequences in (100, 6543, 20000)]
+
+    expected = [slurmise.raw_predict(slurmise.configuration.parse_job_cmd(cmd)) for cmd in cmds]
+
+    model = slurmise.configuration.get_model_class("nupack")
+    with mock.patch.object(model, "load", wraps=model.load) as load:
+        results = slurmise.batch_raw_predict(slurmise.configuration.parse_job_cmd(cmd) for cmd in cmds)
+    assert load.call_count == 1
+
+    assert len(results) == len(expected)
+    for (query_jd, warns), (expected_jd, expected_warns) in zip(results, expected, strict=True):
+        assert query_jd.numerics == expected_jd.numerics
+        assert query_jd.runtime == pytest.approx(expected_jd.runtime)
+        assert query_jd.memory == pytest.approx(expected_jd.memory)
+        assert warns == expected_warns
+
+    assert slurmise.batch_raw_predict([]) == []
+
+
+def test_update_thread_scaler(simple_toml):
+    slurmise = Slurmise(simple_toml.toml)
+    assert slurmise.load_thread_scaler("nupack") is None
+    # no jobs recorded yet
+    assert slurmise.update_thread_scaler("nupack", "threads") is None
+
+    slurmise.raw_record_batch(
+        JobData(
+            job_name="nupack",
+            slurm_id=str(threads),
+            categories={"complexity": "simple"},
+            numerics={"threads": threads},
+            runtime=100 / threads * 1.1 ** (threads - 1),
+            memory=1000,
+        )
+        for threads in range(1, 9)
+    )
+    scaler = slurmise.update_thread_scaler("nupack", "threads", thread_range=(1, 8))
+    assert scaler.runtime_overhead == pytest.approx(1.1)
+    assert scaler.memory_overhead == pytest.approx(1)
+    assert slurmise.load_thread_scaler("nupack") == scaler
+    assert (Path(slurmise.configuration.slurmise_base_dir) / "ThreadScaler" / "nupack.json").exists()
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from slurmise.__main__ import main
+from slurmise.api import Slurmise
+from slurmise.bench import SCENARIOS, Workload, compare, report, run_bench
+
+
+def test_workload_generate(tmp_path):
+    workload = Workload(jobs=3, categories=2, category_values=2, array_numerics=2, array_length=3)
+    batches = list(workload.generate(25, batch_size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    jobs = [job for batch in batches for job in batch]
+    assert [job.slurm_id for job in jobs] == [str(slurm_id) for slurm_id in range(1, 26)]
+    assert {job.job_name for job in jobs} == {"job0", "job1", "job2"}
+    assert set(jobs[0].categories) == {"c0", "c1"}
+    assert jobs[0].numerics["a1"].shape == (3,)
+    assert all(job.memory >= 1 and job.runtime >= 1 for job in jobs)
+
+    # the same seed generates the same jobs
+    again = next(workload.generate(25, batch_size=10))
+    assert [(job.memory, job.runtime) for job in again] == [(job.memory, job.runtime) for job in jobs[:10]]
+    assert np.array_equal(again[7].numerics["a0"], jobs[7].numerics["a0"])
+
+    toml = tmp_path / "slurmise.toml"
+    toml.write_text(workload.toml(str(tmp_path)))
+    parsed = Slurmise(toml).configuration.parse_job_cmd(workload.command(jobs[0]), None)
+    assert parsed.job_name == jobs[0].job_name
+    assert parsed.categories == jobs[0].categories
+    assert parsed.numerics == {"n0": jobs[0].numerics["n0"], "n1": jobs[0].numerics["n1"]}
+
+    with pytest.raises(ValueError, match="at least one job name"):
+        Workload(jobs=0)
+
+
+def test_run_bench(tmp_path):
+    scenarios = [scenario for scenario in SCENARIOS if scenario != "cold_start"]
+    results = run_bench(Workload(), records=(200,), scenarios=scenarios, repeats=2, batch_size=20, work_dir=tmp_path)
+    by_name = {result.scenario: result for result in results}
+    assert list(by_name) == [
+        *("record", "query", "iterate", "to_pandas"),
+        *("fit.poly", "predict.poly", "predict_batch.poly", "fit.knn", "predict.knn", "predict_batch.knn"),
+    ]
+    assert by_name["record"].seconds[0] > 0
+    assert len(by_name["query"].seconds) == 2
+    assert by_name["iterate"].items == 200
+    assert by_name["predict_batch.knn"].items == 20
+    # the models are used rather than the defaults
+    assert by_name["predict.knn"].info["fallbacks"] == 0
+    assert by_name["predict_batch.knn"].info["fallbacks"] == 0
+    assert by_name["predict_batch.poly"].info["fallbacks"] < 20
+    assert (tmp_path / "records_200" / "slurmise.h5").exists()
+
+    with pytest.raises(ValueError, match="Unknown scenarios"):
+        run_bench(Workload(), scenarios=["sort"])
+
+
+def test_cold_start():
+    (result,) = run_bench(Workload(), scenarios=["cold_start"], repeats=1)
+    assert result.records is None
+    assert result.best > result.info["python_seconds"]
+
+
+def test_bench_cli(tmp_path):
+    output = tmp_path / "bench.json"
+    runner = CliRunner()
+    args = ["bench", "--records", "100", "--scenario", "query", "--scenario", "iterate", "--repeats", "2"]
+    result = runner.invoke(main, [*args, "--jobs", "1", "--categories", "0", "--output", output])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[1].split()[:3] == ["query", "100", "100"]
+
+    baseline = json.loads(output.read_text())
+    assert baseline["workload"]["jobs"] == 1
+    assert baseline["settings"]["records"] == [100]
+    assert [result["scenario"] for result in baseline["results"]] == ["query", "iterate"]
+    assert len(baseline["results"][0]["seconds"]) == 2
+
+    result = runner.invoke(main, [*args, "--compare", output])
+    assert result.exit_code == 0
+    assert "ratio" in result.output
+
+
+def test_compare():
+    results = run_bench(Workload(), records=(50,), scenarios=["query"], repeats=1)
+    baseline = report(Workload(), results)
+    current = report(Workload(), results)
+    current["results"][0]["median"] *= 2
+    current["results"].append({"scenario": "iterate", "records": 50, "median": 1})
+    lines = compare(baseline, current)
+    assert len(lines) == 3
+    assert lines[2].split()[:2] == ["query", "50"]
+    assert lines[2].split()[-1] == "2.00"
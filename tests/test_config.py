@@ -146,6 +146,11 @@ def basic_toml(tmpdir):
     awk_script = "/^>/"
     script_is_file = false
 
+    [slurmise.file_parsers.fastq_bytes]
+    directory_stat = "total_bytes"
+    max_depth = 1
+    glob = "*.fastq.gz"
+
     # this is ignored in parsing as the argument doesn't match an awk parser
     [slurmise.file_parsers.unknown_type]
     no_awk_script = "/^>/"
@@ -224,9 +229,18 @@ def test_awk_parsers(basic_toml):
         "file_lines": file_parsers.FileLinesParser(),
         "file_basename": file_parsers.FileBasename(),
         "file_md5": file_parsers.FileMD5(),
+        "fasta_records": file_parsers.FastaRecords(),
+        "fasta_total_length": file_parsers.FastaTotalLength(),
+        "fastq_reads": file_parsers.FastqReads(),
+        "vcf_records": file_parsers.VcfRecords(),
+        "sam_records": file_parsers.SamRecords(),
+        "dir_total_bytes": file_parsers.DirectoryParser("dir_total_bytes", "total_bytes"),
+        "dir_file_count": file_parsers.DirectoryParser("dir_file_count", "file_count"),
+        "dir_largest_file": file_parsers.DirectoryParser("dir_largest_file", "largest_file"),
         "get_epochs": file_parsers.AwkParser("get_epochs", "numeric", "'/^epochs:/ {print $2}'", False),
         "fasta_lengths": file_parsers.AwkParser("fasta_lengths", "numeric", "/a/path/to/file", True),
         "script_string": file_parsers.AwkParser("script_string", "category", "/^>/", False),
+        "fastq_bytes": file_parsers.DirectoryParser("fastq_bytes", "total_bytes", max_depth=1, glob="*.fastq.gz"),
     }
 
 
@@ -300,3 +314,60 @@ def test_minimum_resources_non_default(tmpdir):
 
     assert job_data.memory == 100
     assert job_data.runtime == 5
+
+
+def test_sacct_backend(tmpdir):
+    toml_str = """
+    [slurmise]
+    base_dir = "slurmise_dir"
+    sacct_backend = "parsable"
+    """
+    config = SlurmiseConfiguration(write_toml(tmpdir, toml_str))
+    assert config.sacct_backend == "parsable"
+
+    toml_str = """
+    [slurmise]
+    base_dir = "slurmise_dir"
+    sacct_backend = "xml"
+    """
+    with pytest.raises(ValueError, match="Unknown sacct_backend"):
+        SlurmiseConfiguration(write_toml(tmpdir.mkdir("other"), toml_str))
+
+
+def test_metrics_and_targets(tmpdir):
+    toml_str = """
+    [slurmise]
+    base_dir = "slurmise_dir"
+    [slurmise.job.nupack]
+    job_spec = "monomer -T {threads:numeric}"
+    metrics = ["cpu_efficiency", "disk_read"]
+    [slurmise.job.other]
+    job_spec = "-T {threads:numeric}"
+    metrics = ["max_vmem"]
+    model = {targets = ["memory", "max_vmem"]}
+    """
+    config = SlurmiseConfiguration(write_toml(tmpdir, toml_str))
+    assert config.get_metrics("nupack") == ["cpu_efficiency", "disk_read"]
+    assert config.get_targets("nupack") == ["runtime", "memory", "cpu_efficiency", "disk_read"]
+    assert config.get_targets("other") == ["memory", "max_vmem"]
+    assert config.get_metrics("unknown") == []
+
+    toml_str = """
+    [slurmise]
+    base_dir = "slurmise_dir"
+    [slurmise.job.nupack]
+    job_spec = "monomer -T {threads:numeric}"
+    metrics = ["gpu_efficiency"]
+    """
+    with pytest.raises(ValueError, match="Unknown metrics"):
+        SlurmiseConfiguration(write_toml(tmpdir.mkdir("metrics"), toml_str))
+
+    toml_str = """
+    [slurmise]
+    base_dir = "slurmise_dir"
+    [slurmise.job.nupack]
+    job_spec = "monomer -T {threads:numeric}"
+    model = {targets = ["runtime", "cpu_efficiency"]}
+    """
+    with pytest.raises(ValueError, match="Unknown model targets"):
+        SlurmiseConfiguration(write_toml(tmpdir.mkdir("targets"), toml_str))
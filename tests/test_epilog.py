@@ -0,0 +1,107 @@
+import json
+import subprocess
+import sys
+
+from click.testing import CliRunner
+
+from slurmise import epilog, job_database
+from slurmise.__main__ import main
+from slurmise.api import Slurmise
+from slurmise.job_data import JobData
+from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+
+def pending_records(simple_toml):
+    path = simple_toml.db.parent / epilog.PENDING_RECORDS
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_epilog_record(simple_toml, monkeypatch):
+    assert epilog.main(["-t", str(simple_toml.toml), "--slurm-id", "1", "nupack monomer -T 2 -C simple"]) == 0
+
+    monkeypatch.setenv("SLURMISE_TOML", str(simple_toml.toml))
+    monkeypatch.setenv("SLURM_JOB_ID", "2")
+    monkeypatch.setenv("SLURM_STEP_ID", "0")
+    monkeypatch.setenv("SLURMISE_CMD", "monomer -T 4 -C complex")
+    assert epilog.main(["--job-name", "nupack"]) == 0
+
+    records = pending_records(simple_toml)
+    assert [(record["slurm_id"], record["categories"], record["numerics"]) for record in records] == [
+        ("1", {"complexity": "simple"}, {"threads": 2}),
+        ("2.0", {"complexity": "complex"}, {"threads": 4}),
+    ]
+
+
+def test_epilog_errors(simple_toml, capsys, monkeypatch):
+    monkeypatch.delenv("SLURM_JOB_ID", raising=False)
+    # errors don't fail the epilog unless strict
+    assert epilog.main(["-t", str(simple_toml.toml), "--slurm-id", "1", "git checkout main"]) == 0
+    assert "Unable to match job name" in capsys.readouterr().err
+    assert epilog.main(["-t", str(simple_toml.toml), "--strict", "nupack monomer -T 2 -C simple"]) == 1
+    assert "Not running in a SLURM job" in capsys.readouterr().err
+    assert not (simple_toml.db.parent / epilog.PENDING_RECORDS).exists()
+
+
+def test_epilog_imports():
+    """The epilog doesn't import the scientific stack, asyncio or dataclasses."""
+    heavy = ("numpy", "h5py", "pandas", "sklearn", "asyncio", "click", "dataclasses", "slurmise.job_parse.file_parsers")
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, slurmise.epilog; print([m for m in {heavy} if m in sys.modules])"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_take_pending(simple_toml):
+    base_dir = simple_toml.db.parent
+    job = JobData(job_name="nupack", slurm_id="1", categories={"complexity": "simple"}, numerics={"threads": 2})
+    epilog.append_pending(base_dir, job)
+    taken = epilog.take_pending(base_dir)
+    assert len(taken) == 1
+    # appends after taking go to a new file
+    epilog.append_pending(base_dir, job)
+    assert (base_dir / epilog.PENDING_RECORDS).exists()
+    # taken files which were not removed are taken again
+    assert len(epilog.take_pending(base_dir)) == 2
+    assert [read_job for read_job, _ in epilog.read_pending(taken[0])] == [job]
+
+
+def test_epilog_file_parsers(tmp_path):
+    """File parsers are only imported for job specs with file variables."""
+    fasta = tmp_path / "seqs.fa"
+    fasta.write_text(">a\nACGT\n")
+    slurmise = {"job": {"count": {"job_spec": "count {seqs:file}", "file_parsers": {"seqs": "file_size"}}}}
+    job = epilog.parse_job(slurmise, f"count count {fasta}", slurm_id="1")
+    assert job.numerics == {"seqs_file_size": fasta.stat().st_size}
+
+
+def test_fill_missing_ingests_pending(simple_toml, fake_sacct_bin):
+    sacct_json = generate_job_metadata(job_id=1)
+    sacct_json["jobs"][0]["state"]["current"] = ["COMPLETED"]
+    fake_sacct_bin.add_job(1, sacct_json, generate_job_parsable(job_id=1, state="COMPLETED"))
+    for slurm_id in ("1", "1", "2"):
+        epilog.main(["-t", str(simple_toml.toml), "--slurm-id", slurm_id, "nupack monomer -T 2 -C simple"])
+
+    runner = CliRunner()
+    result = runner.invoke(main, ["--toml", simple_toml.toml, "fill-missing", "--min-age", "0"])
+    assert result.exit_code == 0
+    assert "Recorded 2 jobs from slurmise-epilog" in result.output
+    assert "Filled 1 jobs, 1 still running or not in sacct" in result.output
+    assert list(simple_toml.db.parent.glob(f"*{epilog.PENDING_RECORDS}*")) == []
+
+    with job_database.JobDatabase.get_database(simple_toml.db) as db:
+        jobs = sorted(
+            db.query(JobData(job_name="nupack", categories={"complexity": "simple"})), key=lambda job: job.slurm_id
+        )
+        assert [(job.slurm_id, job.runtime) for job in jobs] == [("1", 97201 / 60), ("2", None)]
+
+
+def test_pending_jobs_refit(nupack_toml):
+    # jobs from the epilog have no memory or runtime until filled, fits skip them
+    epilog.main(["-t", str(nupack_toml.toml), "--slurm-id", "1", "nupack monomer -c 2 -S 30"])
+    assert Slurmise(nupack_toml.toml).ingest_pending() == 1
+
+    result = CliRunner().invoke(main, ["--toml", nupack_toml.toml, "update-all"])
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,187 @@
+import datetime
+import json
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from slurmise import job_database
+from slurmise.__main__ import main
+from slurmise.api import Slurmise
+from slurmise.harvest import JobMatcher, time_windows
+from slurmise.job_data import COMPLETED, OOM
+from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+SACCT_FIXTURE = Path(__file__).parent / "sacct_harvest.json"
+
+
+@pytest.fixture
+def fake_sacct(monkeypatch):
+    """Replay the recorded sacct output, returning the jobs submitted in each window."""
+    sacct_json = json.loads(SACCT_FIXTURE.read_text())
+    queries = []
+
+    def get_sacct_window(start, end, user=None, partition=None, backend="json"):
+        queries.append((start, end, user, partition))
+        jobs = []
+        for job in sacct_json["jobs"]:
+            submission = datetime.datetime.fromtimestamp(job["time"]["submission"], datetime.UTC).replace(tzinfo=None)
+            if start <= submission < end:
+                jobs.append(job)
+        if backend == "parsable":
+            # only the fields of the listing
+            jobs = [{key: job[key] for key in ("job_id", "name", "submit_line", "state")} for job in jobs]
+        return {**sacct_json, "jobs": jobs}
+
+    monkeypatch.setattr("slurmise.slurm.get_sacct_window", get_sacct_window)
+    return queries
+
+
+def recorded_jobs(slurmise):
+    with job_database.JobDatabase.get_database(slurmise.configuration.db_filename) as database:
+        return {job.slurm_id: job for _, jobs in database.iterate_database() for job in jobs}
+
+
+def test_time_windows():
+    since = datetime.datetime(2024, 1, 1)
+    windows = list(time_windows(since, datetime.datetime(2024, 1, 3, 12), datetime.timedelta(days=1)))
+    assert windows == [
+        (since, datetime.datetime(2024, 1, 2)),
+        (datetime.datetime(2024, 1, 2), datetime.datetime(2024, 1, 3)),
+        (datetime.datetime(2024, 1, 3), datetime.datetime(2024, 1, 3, 12)),
+    ]
+    assert list(time_windows(since, since, datetime.timedelta(days=1))) == []
+
+
+def test_job_matcher(simple_toml):
+    matcher = JobMatcher(Slurmise(simple_toml.toml).configuration)
+    jobs = {job["job_id"]: job for job in json.loads(SACCT_FIXTURE.read_text())["jobs"]}
+
+    # wrapped in quotes
+    assert list(matcher.commands(jobs[1001])) == ["nupack monomer -T 2 -C simple"]
+    job_data = matcher.match(jobs[1001])
+    assert job_data.job_name == "nupack"
+    assert job_data.slurm_id == "1001"
+    assert job_data.numerics == {"threads": 2}
+    assert job_data.categories == {"complexity": "simple"}
+    # after the options of srun
+    assert matcher.match(jobs[1002]).numerics == {"threads": 4}
+    # from the job name
+    assert matcher.match(jobs[1003]).numerics == {"threads": 8}
+    # no configured job
+    assert matcher.match(jobs[1004]) is None
+    # doesn't match the job spec
+    assert matcher.match(jobs[1007]) is None
+
+
+def test_harvest(simple_toml, fake_sacct):
+    slurmise = Slurmise(simple_toml.toml)
+    summary = slurmise.harvest(
+        datetime.datetime(2024, 1, 1),
+        datetime.datetime(2024, 1, 4),
+        user="slurmise",
+    )
+    assert summary.windows == 3
+    assert summary.jobs == 7
+    assert summary.recorded == 3
+    assert summary.unmatched == 3
+    assert summary.unfinished == 1
+    assert [query[2] for query in fake_sacct] == ["slurmise"] * 3
+
+    jobs = recorded_jobs(slurmise)
+    assert set(jobs) == {"1001", "1002", "1003"}
+    assert jobs["1001"].memory == 2048
+    assert jobs["1001"].runtime == 10
+    assert jobs["1001"].outcome == COMPLETED
+    assert jobs["1002"].outcome == OOM
+    assert jobs["1002"].memory == 4096
+
+    # the checkpoint skips the harvested windows
+    fake_sacct.clear()
+    summary = slurmise.harvest(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 5), user="slurmise")
+    assert summary.windows == 1
+    assert fake_sacct[0][0] == datetime.datetime(2024, 1, 4)
+
+    # a different query starts from the beginning, recorded jobs are skipped
+    summary = slurmise.harvest(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 4))
+    assert summary.windows == 3
+    assert summary.recorded == 0
+    assert summary.duplicates == 3
+
+
+def test_harvest_parsable(simple_toml, fake_sacct, fake_sacct_bin):
+    simple_toml.toml.write_text(
+        simple_toml.toml.read_text().replace("[slurmise]\n", '[slurmise]\n    sacct_backend = "parsable"\n')
+    )
+    for job_id, state in ((1001, "COMPLETED"), (1002, "OUT_OF_MEMORY"), (1003, "COMPLETED")):
+        parsable = generate_job_parsable(job_id=job_id, state=state, elapsed=job_id - 1000 + 59)
+        fake_sacct_bin.add_job(job_id, generate_job_metadata(job_id=job_id), parsable)
+
+    slurmise = Slurmise(simple_toml.toml)
+    summary = slurmise.harvest(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 4))
+    assert summary.recorded == 3
+    assert summary.unmatched == 3
+
+    # the metadata of the matched jobs of each window is queried with the parsable backend
+    calls = fake_sacct_bin.calls
+    assert len(calls) == 2
+    assert all("--parsable2" in call for call in calls)
+    assert calls[0][calls[0].index("-j") + 1] == "1001,1002"
+    jobs = recorded_jobs(slurmise)
+    assert jobs["1001"].runtime == 1
+    assert jobs["1002"].outcome == OOM
+    assert jobs["1003"].runtime == 62 / 60
+
+
+def test_harvest_resumes(simple_toml, fake_sacct, monkeypatch):
+    slurmise = Slurmise(simple_toml.toml)
+    since = datetime.datetime(2024, 1, 1)
+    until = datetime.datetime(2024, 1, 4)
+
+    original_record_batch = slurmise.raw_record_batch
+
+    def interrupted_record_batch(jobs):
+        if len(fake_sacct) == 2:
+            raise KeyboardInterrupt
+        return original_record_batch(jobs)
+
+    monkeypatch.setattr(slurmise, "raw_record_batch", interrupted_record_batch)
+    with pytest.raises(KeyboardInterrupt):
+        slurmise.harvest(since, until)
+    assert set(recorded_jobs(slurmise)) == {"1001", "1002"}
+
+    monkeypatch.setattr(slurmise, "raw_record_batch", original_record_batch)
+    fake_sacct.clear()
+    summary = slurmise.harvest(since, until)
+    assert [query[0] for query in fake_sacct] == [datetime.datetime(2024, 1, 2), datetime.datetime(2024, 1, 3)]
+    assert summary.recorded == 1
+    assert set(recorded_jobs(slurmise)) == {"1001", "1002", "1003"}
+
+    fake_sacct.clear()
+    summary = slurmise.harvest(since, until, restart=True)
+    assert len(fake_sacct) == 3
+    assert summary.duplicates == 3
+
+
+def test_harvest_cli(simple_toml, fake_sacct):
+    runner = CliRunner()
+    result = runner.invoke(
+        main,
+        [
+            "--toml",
+            simple_toml.toml,
+            "harvest",
+            "--since",
+            "2024-01-01",
+            "--until",
+            "2024-01-04",
+            "--partition",
+            "main",
+            "--window-hours",
+            "12",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Recorded 3 of 7 jobs from 6 windows" in result.output
+    assert "3 unmatched and 1 unfinished" in result.output
+    assert {query[3] for query in fake_sacct} == {"main"}
@@ -0,0 +1,293 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from slurmise import job_database
+from slurmise.__main__ import main
+from slurmise.api import Slurmise
+from slurmise.ingest import TraceRecord, read_benchmarks, read_csv, read_traces
+from slurmise.ingest.nextflow_trace import parse_duration, parse_memory, process_name
+from slurmise.ingest.snakemake_benchmarks import pattern_regex
+from slurmise.job_data import COMPLETED, FAILED
+
+BENCHMARK_HEADER = "s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time\n"
+
+NEXTFLOW_TRACE = (
+    "task_id\thash\tnative_id\tname\tstatus\texit\tcpus\trealtime\tpeak_rss\ttag\n"
+    "1\t3f/2a1b2c\t1001\tWF:ALIGN (sample1)\tCOMPLETED\t0\t4\t1h 30m\t1.5 GB\tsample1\n"
+    "2\t4a/9f8e7d\t1002\tWF:ALIGN (sample2)\tFAILED\t137\t4\t2m 30s\t512 MB\tsample2\n"
+    "3\t5b/1c2d3e\t1003\tWF:ALIGN (sample3)\tCACHED\t0\t4\t1m\t100 MB\tsample3\n"
+)
+
+
+@pytest.fixture
+def ingest_toml(tmp_path):
+    toml = tmp_path / "slurmise.toml"
+    toml.write_text(
+        f"""
+    [slurmise]
+    base_dir = "{tmp_path / "slurmise_dir"}"
+
+    [slurmise.job.align]
+    variables.sample = "category"
+    variables.threads = "numeric"
+
+    [slurmise.job.ALIGN]
+    variables.tag = "category"
+    variables.cpus = "numeric"
+
+    [slurmise.job.nupack]
+    job_spec = "monomer -T {{threads:numeric}} -C {{complexity:category}}"
+    """
+    )
+    return toml
+
+
+def test_pattern_regex():
+    regex = pattern_regex("{rule}/{sample}.tsv")
+    assert regex.search("benchmarks/align/s1.tsv").groupdict() == {"rule": "align", "sample": "s1"}
+    assert regex.search("align/s1.tsv").groupdict() == {"rule": "align", "sample": "s1"}
+    assert regex.search("benchmarks/align/s1.tsv.bak") is None
+    assert regex.search("s1.tsv") is None
+
+
+def test_read_benchmarks(tmp_path, monkeypatch):
+    benchmarks = tmp_path / "benchmarks"
+    (benchmarks / "align").mkdir(parents=True)
+    # two repeats of a benchmark
+    (benchmarks / "align" / "s1.tsv").write_text(
+        BENCHMARK_HEADER
+        + "120.0\t0:02:00\t512.5\t600\t500\t500\t1\t1\t90\t100\n"
+        + "60.0\t0:01:00\tNA\tNA\tNA\tNA\tNA\tNA\tNA\tNA\n"
+    )
+    (benchmarks / "align" / "s2.jsonl").write_text(
+        json.dumps({"s": 30, "max_rss": 100, "rule_name": "align", "wildcards": {"sample": "s2"}, "threads": 2}) + "\n"
+    )
+    (benchmarks / "README").write_text("not a benchmark")
+
+    records = list(read_benchmarks([benchmarks], pattern="{rule}/{sample}.{ext}"))
+    # the repeat snakemake could not measure is skipped
+    assert len(records) == 2
+    first, third = records
+    assert first.job_name == "align"
+    assert first.variables == {"rule": "align", "sample": "s1", "ext": "tsv"}
+    assert first.runtime == 2
+    assert first.memory == 512.5
+    assert first.error is None
+
+    assert third.job_name == "align"
+    assert third.variables["sample"] == "s2"
+    assert third.variables["threads"] == 2
+    assert third.runtime == 0.5
+
+    # ids are the same when reading again, also from a relative path
+    assert [record.slurm_id for record in read_benchmarks([benchmarks], pattern="{rule}/{sample}.{ext}")] == [
+        record.slurm_id for record in records
+    ]
+    monkeypatch.chdir(tmp_path)
+    assert [record.slurm_id for record in read_benchmarks(["benchmarks"], pattern="{rule}/{sample}.{ext}")] == [
+        record.slurm_id for record in records
+    ]
+
+
+def test_read_benchmarks_extended_tsv(tmp_path):
+    benchmark = tmp_path / "s1.tsv"
+    extended_header = BENCHMARK_HEADER.strip() + "\tjobid\trule_name\twildcards\tparams\tthreads\tcpu_usage\n"
+    benchmark.write_text(
+        extended_header + "60.0\t0:01:00\t100\t1\t1\t1\t1\t1\t1\t1\t3\talign\t{'sample': 's1'}\t-\t4\t1\n"
+    )
+
+    (record,) = read_benchmarks([benchmark])
+    assert record.job_name == "align"
+    assert record.variables == {"sample": "s1", "threads": "4"}
+
+
+@pytest.mark.parametrize(
+    ("value", "minutes"),
+    [
+        ("1h 30m", 90),
+        ("2m 30s", 2.5),
+        ("1d 1h", 1500),
+        ("500ms", 500 / 60_000),
+        ("60000", 1),  # raw traces are in milliseconds
+        ("0", 0),
+    ],
+)
+def test_parse_duration(value, minutes):
+    assert parse_duration(value) == pytest.approx(minutes)
+
+
+@pytest.mark.parametrize("value", ["-", "", None, "soon"])
+def test_parse_duration_missing(value):
+    with pytest.raises(ValueError, match="Invalid runtime"):
+        parse_duration(value)
+
+
+@pytest.mark.parametrize(
+    ("value", "megabytes"),
+    [
+        ("1.5 GB", 1536),
+        ("512 MB", 512),
+        ("2048 KB", 2),
+        ("1048576", 1),  # raw traces are in bytes
+    ],
+)
+def test_parse_memory(value, megabytes):
+    assert parse_memory(value) == pytest.approx(megabytes)
+    with pytest.raises(ValueError, match="Invalid memory '-'"):
+        parse_memory("-")
+
+
+def test_process_name():
+    assert process_name({"name": "NFCORE_RNASEQ:RNASEQ:FASTQC (sample1)"}) == "FASTQC"
+    assert process_name({"process": "WF:ALIGN", "name": "WF:ALIGN (1)"}) == "ALIGN"
+
+
+def test_read_traces(tmp_path):
+    trace = tmp_path / "trace.txt"
+    trace.write_text(NEXTFLOW_TRACE)
+
+    records = list(read_traces([trace]))
+    # cached tasks did not run
+    assert [record.outcome for record in records] == [COMPLETED, FAILED]
+    completed = records[0]
+    assert completed.job_name == "ALIGN"
+    assert completed.runtime == 90
+    assert completed.memory == 1536
+    assert completed.variables["tag"] == "sample1"
+    assert completed.slurm_id not in ("1001", "1002")
+
+    assert [record.slurm_id for record in read_traces([trace], native_ids=True)] == ["1001", "1002"]
+
+
+def test_read_traces_missing_values(tmp_path):
+    trace = tmp_path / "trace.txt"
+    trace.write_text(
+        "task_id\tname\tstatus\tduration\trealtime\tpeak_rss\n"
+        "1\tWF:ALIGN (s1)\tCOMPLETED\t2m\t-\t1 GB\n"
+        "2\tWF:ALIGN (s2)\tCOMPLETED\t-\t-\t1 GB\n"
+        "3\tWF:ALIGN (s3)\tCOMPLETED\t2m\t1m\t-\n"
+    )
+
+    records = list(read_traces([trace]))
+    # the duration is used when the realtime is missing
+    assert records[0].runtime == 2
+    assert records[0].error is None
+    assert [record.error for record in records[1:]] == ["Invalid runtime '-'", "Invalid memory '-'"]
+    for record in records[1:]:
+        with pytest.raises(ValueError, match="Invalid"):
+            record.to_job_data(None)
+
+
+def test_read_csv(tmp_path):
+    jobs = tmp_path / "jobs.csv"
+    jobs.write_text("id,elapsed,rss_gb,sample,threads\n1,3600,2,s1,4\n2,60,0.5,s2,1\n")
+
+    records = list(
+        read_csv(
+            [jobs],
+            columns={"slurm_id": "id", "runtime": "elapsed", "memory": "rss_gb", "complexity": "sample"},
+            job_name="align",
+            runtime_unit="s",
+            memory_unit="GB",
+        )
+    )
+    assert [record.slurm_id for record in records] == ["1", "2"]
+    assert records[0].runtime == 60
+    assert records[0].memory == 2048
+    assert records[0].variables["sample"] == "s1"
+    assert records[0].variables["complexity"] == "s1"
+
+    with pytest.raises(ValueError, match="Unknown runtime unit"):
+        list(read_csv([jobs], runtime_unit="weeks"))
+
+
+def test_ingest_invalid_usage(ingest_toml, tmp_path):
+    jobs = tmp_path / "jobs.csv"
+    jobs.write_text("id,runtime,memory,sample,threads\n1,60,100,s1,4\n2,,100,s1,4\n3,60,lots,s1,4\n")
+    benchmark = tmp_path / "align.jsonl"
+    benchmark.write_text(
+        json.dumps({"s": 30, "max_rss": 100, "wildcards": {"sample": "s2"}, "threads": 2})
+        + "\n"
+        + json.dumps({"s": 30, "wildcards": {"sample": "s3"}, "threads": 2})
+        + "\n"
+    )
+
+    records = list(read_csv([jobs], columns={"slurm_id": "id"}, job_name="align"))
+    assert [record.error for record in records] == [None, "Invalid runtime ''", "Invalid memory 'lots'"]
+
+    slurmise = Slurmise(ingest_toml)
+    summary = slurmise.ingest([*records, *read_benchmarks([benchmark], job_name="align")])
+    assert summary.recorded == 2
+    assert summary.invalid == 3
+    assert "2: Invalid runtime ''" in summary.errors[0]
+    assert "Invalid memory None" in summary.errors[2]
+
+
+def test_ingest(ingest_toml):
+    slurmise = Slurmise(ingest_toml)
+    records = [
+        TraceRecord(job_name="align", slurm_id="1", runtime=2, memory=100, variables={"sample": "s1", "threads": 4}),
+        TraceRecord(job_name="align", slurm_id="2", runtime=3, memory=200, variables={"sample": "s1", "threads": 8}),
+        # parsed from the command
+        TraceRecord(job_name=None, slurm_id="3", runtime=4, memory=300, cmd="nupack monomer -T 2 -C simple"),
+        TraceRecord(job_name="align", slurm_id="4", runtime=5, memory=400, variables={"sample": "s2"}),
+        TraceRecord(job_name="unknown", slurm_id="5", runtime=1, memory=1),
+    ]
+
+    summary = slurmise.ingest(records, batch_size=2)
+    assert summary.recorded == 3
+    assert summary.duplicates == 0
+    assert summary.invalid == 2
+    assert "Dict missing variable: 'threads'" in summary.errors[0]
+    assert "Job unknown not found" in summary.errors[1]
+
+    with job_database.JobDatabase.get_database(slurmise.configuration.db_filename) as database:
+        jobs = {job.slurm_id: job for _, group in database.iterate_database() for job in group}
+    assert jobs["1"].categories == {"sample": "s1"}
+    assert jobs["1"].numerics == {"threads": 4}
+    assert jobs["1"].runtime == 2
+    assert jobs["3"].categories == {"complexity": "simple"}
+
+    summary = slurmise.ingest(records[:3])
+    assert summary.recorded == 0
+    assert summary.duplicates == 3
+
+
+def test_ingest_cli(ingest_toml, tmp_path):
+    trace = tmp_path / "trace.txt"
+    trace.write_text(NEXTFLOW_TRACE)
+
+    runner = CliRunner()
+    result = runner.invoke(main, ["--toml", ingest_toml, "ingest", "nextflow", str(trace), "--native-ids"])
+    assert result.exit_code == 0, result.output
+    assert "Recorded 2 jobs, skipped 0 already recorded" in result.output
+
+    jobs = tmp_path / "jobs.csv"
+    jobs.write_text("id,minutes,mb,sample,threads\n10,1,10,s1,2\n11,1,10,s1,\n")
+    result = runner.invoke(
+        main,
+        [
+            "--toml",
+            ingest_toml,
+            "ingest",
+            "csv",
+            str(jobs),
+            "--job-name",
+            "align",
+            "--column",
+            "slurm_id=id",
+            "--column",
+            "runtime=minutes",
+            "--column",
+            "memory=mb",
+        ],
+    )
+    assert result.exit_code == 1
+    assert "Recorded 1 jobs" in result.output
+    assert "1 records could not be parsed" in result.output
+
+    result = runner.invoke(main, ["--toml", ingest_toml, "ingest", "csv", str(jobs), "--column", "runtime"])
+    assert result.exit_code == 2
+    assert "field=column" in result.output
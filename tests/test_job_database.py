@@ -1,3 +1,4 @@
+import h5py
 import numpy as np
 import pytest
 
@@ -415,10 +416,11 @@ def test_delete_all_children(small_db):
 
 
 def test_update_missing_mem_elapsed(empty_h5py_file, monkeypatch):
-    def mock_parse_slurm_job_metadata(slurm_id, step_id):  # noqa: ARG001
+    def mock_parse_slurm_job_metadata(slurm_id, step_name, backend):
         return {
             "max_rss": 101,
-            "elapsed_seconds": 100,
+            # recorded in minutes
+            "elapsed_seconds": 6000,
         }
 
     monkeypatch.setattr(
@@ -519,3 +521,96 @@ def test_update_missing_mem_elapsed(empty_h5py_file, monkeypatch):
             update_missing=False,
         )
         assert results == expected_output
+
+
+def test_record_outcome(empty_h5py_file):
+    jobs = [
+        JobData(job_name="test_job", slurm_id="1", runtime=5, memory=100),
+        JobData(job_name="test_job", slurm_id="2", runtime=6, memory=128, outcome="oom"),
+        JobData(job_name="test_job", slurm_id="3", runtime=60, memory=128, outcome="timeout"),
+    ]
+    with JobDatabase.get_database(empty_h5py_file) as db:
+        for job in jobs:
+            db.record(job)
+        # completed jobs don't store an outcome
+        assert "outcome" not in db.db["test_job/1"].attrs
+
+        result = sorted(db.query(JobData(job_name="test_job")), key=lambda job: job.slurm_id)
+
+    assert [job.outcome for job in result] == ["completed", "oom", "timeout"]
+    assert result == jobs
+
+    with pytest.raises(ValueError, match="Unknown outcome 'crashed'"):
+        JobData(job_name="test_job", outcome="crashed")
+
+
+def test_record_metrics(empty_h5py_file):
+    jobs = [
+        JobData(job_name="test_job", slurm_id="1", runtime=5, memory=100, metrics={"cpu_efficiency": 0.75}),
+        JobData(job_name="test_job", slurm_id="2", runtime=6, memory=128),
+    ]
+    with JobDatabase.get_database(empty_h5py_file) as db:
+        for job in jobs:
+            db.record(job)
+        # metrics are attributes, not numerics of the job
+        assert db.db["test_job/1"].attrs["metric_cpu_efficiency"] == 0.75
+
+        result = sorted(db.query(JobData(job_name="test_job")), key=lambda job: job.slurm_id)
+
+    assert [job.metrics for job in result] == [{"cpu_efficiency": 0.75}, {}]
+    assert result == jobs
+
+
+def test_fill_missing(empty_h5py_file, fake_sacct_bin):
+    from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+    for job_id, state in ((1, "OUT_OF_MEMORY"), (2, "RUNNING"), (3, "COMPLETED")):
+        sacct_json = generate_job_metadata(job_id=job_id)
+        sacct_json["jobs"][0]["state"]["current"] = [state]
+        fake_sacct_bin.add_job(job_id, sacct_json, generate_job_parsable(job_id=job_id, state=state))
+
+    with JobDatabase.get_database(empty_h5py_file) as db:
+        for slurm_id in ("1", "2", "4", "5", "6"):
+            db.record(JobData(job_name="test_job", slurm_id=slurm_id, numerics={"n": 1}))
+        db.record(JobData(job_name="test_job", slurm_id="3", numerics={"n": 1}, memory=10, runtime=20))
+        db.db["test_job/5"].attrs["recorded_at"] -= 10_000
+        for slurm_id in ("1", "2", "6"):
+            db.db[f"test_job/{slurm_id}"].attrs["recorded_at"] -= 100
+
+        summary = db.fill_missing(min_age=50, max_age=1000)
+        assert (summary.filled, summary.unfinished, summary.too_recent, summary.expired) == (1, 2, 1, 1)
+        # the jobs old enough are queried at once
+        assert [call[:2] for call in fake_sacct_bin.calls] == [["-j", "1,2,6"]]
+
+        jobs = {job.slurm_id: job for job in db.query(JobData(job_name="test_job"))}
+
+    assert (jobs["1"].memory, jobs["1"].runtime, jobs["1"].outcome) == (70917, 97201 / 60, "oom")
+    assert jobs["2"].memory is None
+    assert jobs["3"] == JobData(job_name="test_job", slurm_id="3", numerics={"n": 1}, memory=10, runtime=20)
+    assert jobs["4"].runtime is None
+    assert jobs["5"].runtime is None
+
+
+def test_migrate_runtimes(empty_h5py_file):
+    # a database recorded before the runtime unit was stored, with seconds from sacct
+    with h5py.File(empty_h5py_file, "w") as db:
+        db.create_dataset("test_job/1/runtime", data=np.asarray(120))
+        db.create_dataset("test_job/1/memory", data=np.asarray(100))
+        db.create_group("test_job/2")
+
+    with JobDatabase.get_database(empty_h5py_file) as db:
+        with pytest.raises(ValueError, match="migrate-runtimes"):
+            db.check_runtime_unit()
+        with pytest.raises(ValueError, match="Unknown runtime unit 'hours'"):
+            db.migrate_runtimes("hours")
+        assert db.migrate_runtimes("seconds") == 1
+        db.check_runtime_unit()
+        # already in minutes
+        assert db.migrate_runtimes("seconds") == 0
+        (job,) = [job for job in db.query(JobData(job_name="test_job")) if job.runtime is not None]
+        assert job.runtime == 2
+
+
+def test_new_database_runtime_unit(empty_h5py_file):
+    with JobDatabase.get_database(empty_h5py_file) as db:
+        db.check_runtime_unit()
@@ -1,6 +1,12 @@
+import dataclasses
+import json
+import subprocess
+import sys
+
 import numpy as np
 from click.testing import CliRunner
 
+from slurmise import __main__ as cli
 from slurmise import job_database
 from slurmise.__main__ import main
 from slurmise.job_data import JobData
@@ -18,6 +24,32 @@ def test_missing_toml():
     assert "See readme for more information" in result.output
 
 
+def test_lazy_command_imports():
+    """bench, ingest and simulate are only imported by their commands."""
+    lazy = ("slurmise.bench", "slurmise.ingest", "slurmise.simulate")
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, slurmise.__main__; print([m for m in {lazy} if m in sys.modules])"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_lazy_command_choices():
+    from slurmise.bench import SCENARIOS, Workload
+    from slurmise.ingest import INGEST_FORMATS
+    from slurmise.ingest.trace_record import MEMORY_UNITS, RUNTIME_UNITS
+    from slurmise.simulate import SIMULATION_MODELS
+
+    assert cli.INGEST_FORMAT_CHOICES == tuple(INGEST_FORMATS)
+    assert cli.RUNTIME_UNIT_CHOICES == tuple(RUNTIME_UNITS)
+    assert cli.MEMORY_UNIT_CHOICES == tuple(MEMORY_UNITS)
+    assert cli.SIMULATE_MODEL_CHOICES == SIMULATION_MODELS
+    assert cli.BENCH_SCENARIO_CHOICES == SCENARIOS
+    assert cli.BENCH_WORKLOAD_DEFAULTS == dataclasses.asdict(Workload())
+
+
 def test_record(simple_toml, monkeypatch):
     mock_metadata = {
         "slurm_id": "1234",
@@ -51,7 +83,7 @@ def test_record(simple_toml, monkeypatch):
             JobData(
                 job_name="nupack",
                 slurm_id="1234",
-                runtime=97201,
+                runtime=97201 / 60,
                 memory=232,
                 categories={"complexity": "simple"},
                 numerics={"threads": 2},
@@ -116,7 +148,7 @@ def test_raw_record(simple_toml, monkeypatch):
                 categories={"a": 1, "b": 2},
                 numerics={"n": 3, "q": 17.4},
                 memory=232,
-                runtime=97201,
+                runtime=97201 / 60,
                 cmd=None,
             ),
         ]
@@ -295,6 +327,28 @@ def test_update_all_predict(nupack_toml):
     np.testing.assert_allclose(float(predicted_memory[1]), 10168.72, rtol=0.01)
 
 
+def test_migrate_runtimes(nupack_toml):
+    # as recorded by earlier versions, without the runtime unit
+    with job_database.JobDatabase.get_database(nupack_toml.db) as database:
+        del database.db.attrs[job_database.RUNTIME_UNIT_ATTR]
+        runtimes = [job.runtime for _, jobs in database.iterate_database() for job in jobs]
+
+    runner = CliRunner()
+    result = runner.invoke(main, ["--toml", nupack_toml.toml, "update-all"])
+    assert result.exit_code == 1
+    assert "slurmise migrate-runtimes" in str(result.exception)
+
+    result = runner.invoke(main, ["--toml", nupack_toml.toml, "migrate-runtimes", "--from-unit", "seconds"])
+    assert result.exit_code == 0
+    assert f"Converted the runtimes of {len(runtimes)} jobs from seconds" in result.output
+    with job_database.JobDatabase.get_database(nupack_toml.db) as database:
+        migrated = [job.runtime for _, jobs in database.iterate_database() for job in jobs]
+    np.testing.assert_allclose(migrated, np.asarray(runtimes) / 60)
+
+    result = runner.invoke(main, ["--toml", nupack_toml.toml, "update-all"])
+    assert result.exit_code == 0
+
+
 def test_predict_nomodel(nupackdefaults_toml):
     """Test the predict commands of slurmise with no model.
     Running predict before updating (creating) a model will cause the job
@@ -337,3 +391,119 @@ def test_parse(simple_toml):
     assert result.exit_code == 0
 
     assert result.stdout.startswith("Able to parse")
+
+
+def test_parse_batch(simple_toml, tmp_path):
+    commands = tmp_path / "commands.txt"
+    commands.write_text("nupack monomer -T 2 -C simple\n\nnupack monomer -T 4 -C complex\n")
+
+    runner = CliRunner()
+    result = runner.invoke(main, ["--toml", simple_toml.toml, "parse-batch", str(commands)])
+    assert result.exit_code == 0
+
+    assert [json.loads(line) for line in result.stdout.splitlines()] == [
+        {
+            "line": 1,
+            "cmd": "nupack monomer -T 2 -C simple",
+            "job_name": "nupack",
+            "categories": {"complexity": "simple"},
+            "numerics": {"threads": 2},
+        },
+        {
+            "line": 3,
+            "cmd": "nupack monomer -T 4 -C complex",
+            "job_name": "nupack",
+            "categories": {"complexity": "complex"},
+            "numerics": {"threads": 4},
+        },
+    ]
+
+
+def test_parse_batch_stdin_with_failures(simple_toml):
+    runner = CliRunner()
+    result = runner.invoke(
+        main,
+        ["--toml", simple_toml.toml, "parse-batch", "--job-name", "nupack"],
+        input="monomer -T 2 -C simple\ndimer -T 2 -C simple\n",
+    )
+    assert result.exit_code == 1
+    assert "1 commands failed to parse" in result.stderr
+
+    parsed, failed = (json.loads(line) for line in result.stdout.splitlines())
+    assert parsed["numerics"] == {"threads": 2}
+    assert failed == {
+        "line": 2,
+        "cmd": "dimer -T 2 -C simple",
+        "error": "Job spec for nupack does not match command",
+    }
+
+
+def test_parse_batch_skips_file_parsers(tmp_path):
+    toml = tmp_path / "slurmise.toml"
+    toml.write_text(
+        f"""
+    [slurmise]
+    base_dir = "{tmp_path / "slurmise_dir"}"
+
+    [slurmise.job.count]
+    job_spec = "-n {{n:numeric}} {{infile:file}}"
+    file_parsers.infile = "file_lines"
+    """
+    )
+    infile = tmp_path / "input.txt"
+    infile.write_text("a\nb\n")
+
+    runner = CliRunner()
+    # the missing file is not opened
+    result = runner.invoke(main, ["--toml", toml, "parse-batch", "-"], input="count -n 3 missing.txt\n")
+    assert result.exit_code == 0
+    assert json.loads(result.stdout)["numerics"] == {"n": 3}
+
+    result = runner.invoke(main, ["--toml", toml, "parse-batch", "--parse-files", "-"], input=f"count -n 3 {infile}\n")
+    assert result.exit_code == 0
+    assert json.loads(result.stdout)["numerics"] == {"n": 3, "infile_file_lines": 3}
+
+    # a missing file fails only its command
+    missing = tmp_path / "missing.txt"
+    result = runner.invoke(
+        main,
+        ["--toml", toml, "parse-batch", "--parse-files", "-"],
+        input=f"count -n 3 {missing}\ncount -n 4 {infile}\n",
+    )
+    assert result.exit_code == 1
+    failed, parsed = (json.loads(line) for line in result.stdout.splitlines())
+    assert failed["line"] == 1
+    assert str(missing) in failed["error"]
+    assert parsed["numerics"] == {"n": 4, "infile_file_lines": 3}
+
+
+def test_record_defer_and_fill_missing(simple_toml, fake_sacct_bin, monkeypatch):
+    from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+    sacct_json = generate_job_metadata(job_id=1234)
+    sacct_json["jobs"][0]["state"]["current"] = ["COMPLETED"]
+    fake_sacct_bin.add_job(1234, sacct_json, generate_job_parsable(job_id=1234, state="COMPLETED"))
+    monkeypatch.setenv("SLURM_JOBID", "1234")
+
+    runner = CliRunner()
+    result = runner.invoke(main, ["--toml", simple_toml.toml, "record", "--defer", "nupack monomer -T 2 -C simple"])
+    assert result.exit_code == 0
+    # sacct isn't queried while recording
+    assert fake_sacct_bin.calls == []
+
+    query = JobData(job_name="nupack", categories={"complexity": "simple"})
+    with job_database.JobDatabase.get_database(simple_toml.db) as db:
+        assert [(job.slurm_id, job.runtime) for job in db.query(query)] == [("1234", None)]
+
+    # too recent for the default fill_min_age
+    result = runner.invoke(main, ["--toml", simple_toml.toml, "fill-missing"])
+    assert result.exit_code == 0
+    assert "Filled 0 jobs" in result.output
+    assert "skipped 1 too recent" in result.output
+
+    result = runner.invoke(main, ["--toml", simple_toml.toml, "fill-missing", "--min-age", "0"])
+    assert result.exit_code == 0
+    assert "Filled 1 jobs" in result.output
+    assert len(fake_sacct_bin.calls) == 1
+    with job_database.JobDatabase.get_database(simple_toml.db) as db:
+        assert [(job.slurm_id, job.runtime) for job in db.query(query)] == [("1234", 97201 / 60)]
@@ -0,0 +1,219 @@
+import multiprocessing
+
+import pytest
+from click.testing import CliRunner
+
+from slurmise import monitoring
+from slurmise.__main__ import main
+from slurmise.api import Slurmise
+from slurmise.fit.resource_fit import DEFAULT_WARNING
+from slurmise.job_data import JobData
+from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+
+def _record_in_process(base_dir):
+    process_monitor = monitoring.Monitor(base_dir / monitoring.MONITORING_DIR)
+    for _ in range(10):
+        process_monitor.inc("slurmise_predictions_total", job_name="nupack", categories="")
+        process_monitor.observe("slurmise_model_load_seconds", 0.003, job_name="nupack", categories="")
+    process_monitor.flush()
+
+
+def test_collect(tmp_path):
+    first = monitoring.Monitor(tmp_path / monitoring.MONITORING_DIR)
+    first.inc("slurmise_predictions_total", job_name="nupack", categories="")
+    first.observe("slurmise_model_load_seconds", 0.003, job_name="nupack", categories="")
+    first.flush()
+    # flushing again without new metrics doesn't write a file
+    first.flush()
+    second = monitoring.Monitor(tmp_path / monitoring.MONITORING_DIR)
+    second.inc("slurmise_predictions_total", 2, job_name="nupack", categories="")
+    second.observe("slurmise_model_load_seconds", 100, job_name="nupack", categories="")
+    second.flush()
+    assert len(list((tmp_path / monitoring.MONITORING_DIR).glob(f"*{monitoring.DELTA_SUFFIX}"))) == 2
+
+    collected = monitoring.collect(tmp_path)
+    key = ("slurmise_predictions_total", (("categories", ""), ("job_name", "nupack")))
+    assert collected.counters[key] == 3
+    counts, total, count = collected.histograms[("slurmise_model_load_seconds", key[1])]
+    assert (counts[2], counts[-1], total, count) == (1, 1, 100.003, 2)
+    # merged files are removed and not counted again
+    assert list((tmp_path / monitoring.MONITORING_DIR).glob(f"*{monitoring.DELTA_SUFFIX}")) == []
+    assert monitoring.collect(tmp_path).counters[key] == 3
+
+
+def test_collect_interrupted(tmp_path):
+    directory = tmp_path / monitoring.MONITORING_DIR
+    process_monitor = monitoring.Monitor(directory)
+    process_monitor.inc("slurmise_predictions_total", job_name="nupack", categories="")
+    process_monitor.flush()
+    delta = next(directory.glob(f"*{monitoring.DELTA_SUFFIX}"))
+    contents = delta.read_text()
+    monitoring.collect(tmp_path)
+
+    # a merge which stopped before removing the file it merged
+    delta.write_text(contents)
+    collected = monitoring.collect(tmp_path)
+    assert sum(collected.counters.values()) == 1
+    assert not delta.exists()
+
+
+def test_collect_concurrent(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_record_in_process, args=(tmp_path,)) for _ in range(8)]
+    for process in processes:
+        process.start()
+    # merging while processes write
+    monitoring.collect(tmp_path)
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    collected = monitoring.collect(tmp_path)
+    assert sum(collected.counters.values()) == 80
+    assert sum(count for _, _, count in collected.histograms.values()) == 80
+
+
+def test_exposition():
+    metrics = monitoring.MetricSet()
+    metrics.inc("slurmise_prediction_fallbacks_total", {"job_name": 'a"b', "resource": "memory"})
+    for ratio in (0.8, 1.0, 3):
+        metrics.observe("slurmise_residual_ratio", ratio, {"job_name": "a", "resource": "runtime"})
+
+    lines = monitoring.exposition(metrics).splitlines()
+    description = monitoring.METRICS["slurmise_prediction_fallbacks_total"][1]
+    assert lines[:3] == [
+        f"# HELP slurmise_prediction_fallbacks_total {description}",
+        "# TYPE slurmise_prediction_fallbacks_total counter",
+        'slurmise_prediction_fallbacks_total{job_name="a\\"b",resource="memory"} 1',
+    ]
+    assert "# TYPE slurmise_residual_ratio histogram" in lines
+    labels = 'job_name="a",resource="runtime"'
+    assert f'slurmise_residual_ratio_bucket{{{labels},le="0.75"}} 0' in lines
+    assert f'slurmise_residual_ratio_bucket{{{labels},le="0.9"}} 1' in lines
+    assert f'slurmise_residual_ratio_bucket{{{labels},le="1"}} 2' in lines
+    assert f'slurmise_residual_ratio_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f"slurmise_residual_ratio_sum{{{labels}}} 4.8" in lines
+    assert f"slurmise_residual_ratio_count{{{labels}}} 3" in lines
+    assert monitoring.exposition(monitoring.MetricSet()) == ""
+
+
+def test_slurmise_metrics(nupack_toml, fake_sacct_bin, monkeypatch):
+    slurmise = Slurmise(nupack_toml.toml)
+    slurmise.predict("nupack monomer -c 2 -S 30", None)
+    slurmise.update_model("nupack monomer -c 2 -S 30", None)
+    predicted, _ = slurmise.predict("nupack monomer -c 2 -S 30", None)
+
+    # recording a single job doesn't evaluate the models
+    slurmise.raw_record(
+        JobData(job_name="nupack", slurm_id="1", numerics={"cpus": 2, "sequences": 30}, memory=1, runtime=1),
+        processed_data=True,
+    )
+
+    def add_completed_job(job_id, elapsed=97201):
+        sacct_json = generate_job_metadata(job_id=job_id, elapsed=elapsed)
+        sacct_json["jobs"][0]["state"]["current"] = ["COMPLETED"]
+        fake_sacct_bin.add_job(job_id, sacct_json, generate_job_parsable(job_id=job_id, state="COMPLETED"))
+
+    # filled jobs are observed with the batch
+    add_completed_job(2, elapsed=round(predicted.runtime * 2 * 60))
+    slurmise.raw_record(JobData(job_name="nupack", slurm_id="2", numerics={"cpus": 2, "sequences": 30}), defer=True)
+    assert slurmise.fill_missing(min_age=0).filled == 1
+
+    collected = slurmise.collect_metrics()
+    counters = {(name, dict(labels).get("resource")): value for (name, labels), value in collected.counters.items()}
+    assert counters[("slurmise_predictions_total", None)] == 2
+    # before the fit both resources are defaults, after it only memory is rejected
+    assert counters[("slurmise_prediction_fallbacks_total", "memory")] == 2
+    assert counters[("slurmise_prediction_fallbacks_total", "runtime")] == 1
+    histograms = {(name, dict(labels).get("resource")): value for (name, labels), value in collected.histograms.items()}
+    assert histograms[("slurmise_model_load_seconds", None)][2] == 3
+    assert histograms[("slurmise_fit_seconds", None)][2] == 1
+    assert histograms[("slurmise_record_seconds", None)][2] == 2
+    assert histograms[("slurmise_residual_ratio", "runtime")][1] == pytest.approx(2, rel=0.01)
+    assert histograms[("slurmise_residual_ratio", "runtime")][2] == 1
+    assert ("slurmise_residual_ratio", "memory") not in histograms
+
+    # monitoring never fails a fill
+    def fail(queries):
+        raise OSError("corrupt model")
+
+    monkeypatch.setattr(slurmise, "_predict_groups", fail)
+    add_completed_job(3)
+    slurmise.raw_record(JobData(job_name="nupack", slurm_id="3", numerics={"cpus": 2, "sequences": 30}), defer=True)
+    assert slurmise.fill_missing(min_age=0).filled == 1
+    slurmise.monitor.flush()
+    counters = {name: value for (name, _), value in slurmise.collect_metrics().counters.items()}
+    assert counters["slurmise_residual_errors_total"] == 1
+
+
+def test_prediction_fallbacks(simple_toml, monkeypatch):
+    slurmise = Slurmise(simple_toml.toml)
+    # not fit, both resources are defaults
+    slurmise.predict("nupack monomer -T 2 -C simple", None)
+
+    # a model predicting the default runtime and rejecting the memory
+    def predict(self, job):
+        return job, [DEFAULT_WARNING.format(target="memory")]
+
+    model = slurmise.configuration.get_model_class("nupack")
+    monkeypatch.setattr(model, "predict", predict)
+    predicted, _ = slurmise.predict("nupack monomer -T 2 -C simple", None)
+    assert predicted.runtime == 60
+
+    counters = {
+        dict(labels).get("resource"): value
+        for (name, labels), value in slurmise.monitor.metrics.counters.items()
+        if name == "slurmise_prediction_fallbacks_total"
+    }
+    assert counters == {"memory": 2, "runtime": 1}
+
+
+def test_metrics_cli(simple_toml, tmp_path):
+    slurmise = Slurmise(simple_toml.toml)
+    slurmise.predict("nupack monomer -T 2 -C simple", None)
+    slurmise.monitor.flush()
+
+    runner = CliRunner()
+    result = runner.invoke(main, ["--toml", simple_toml.toml, "metrics"])
+    assert result.exit_code == 0
+    # categories are only labels when listed in monitoring_categories
+    assert 'slurmise_predictions_total{job_name="nupack"} 1' in result.output
+
+    textfile = tmp_path / "slurmise.prom"
+    result = runner.invoke(main, ["--toml", simple_toml.toml, "metrics", "--textfile", textfile])
+    assert result.exit_code == 0
+    assert result.output == ""
+    assert "slurmise_model_load_seconds_count" in textfile.read_text()
+
+
+def test_monitoring_categories(simple_toml):
+    simple_toml.toml.write_text(
+        simple_toml.toml.read_text().replace("[slurmise]\n", '[slurmise]\n    monitoring_categories = ["complexity"]\n')
+    )
+    slurmise = Slurmise(simple_toml.toml)
+    slurmise.predict("nupack monomer -T 2 -C simple", None)
+    labels = [
+        dict(labels) for name, labels in slurmise.monitor.metrics.counters if name == "slurmise_predictions_total"
+    ]
+    assert labels == [{"job_name": "nupack", "categories": "complexity=simple"}]
+
+
+def test_monitoring_disabled(tmp_path):
+    toml = tmp_path / "slurmise.toml"
+    toml.write_text(
+        f"""
+    [slurmise]
+    base_dir = "{tmp_path / "slurmise_dir"}"
+    monitoring = false
+
+    [slurmise.job.nupack]
+    job_spec = "monomer -T {{threads:numeric}}"
+    """
+    )
+    slurmise = Slurmise(toml)
+    slurmise.predict("nupack monomer -T 2", None)
+    slurmise.monitor.flush()
+    assert not (tmp_path / "slurmise_dir" / monitoring.MONITORING_DIR).exists()
+    # still counted in memory
+    assert slurmise.monitor.metrics.counters
@@ -1,6 +1,8 @@
 import gzip
 import shutil
+import time
 
+import numpy as np
 import pytest
 
 from slurmise.job_data import JobData
@@ -146,7 +148,51 @@ def test_try_exact_fails():
     assert result.startswith("Failed to parse")
 
 
-@pytest.mark.skip
+def test_fuzzy_match_is_bounded():
+    """Many lazy groups with a few typos take minutes to fuzzy match without bounds."""
+    spec = JobSpec(" ".join(f"--opt{i} {{c{i}:category}}" for i in range(12)))
+    cmd = " ".join(f"--opt{i} value_{i}_abcdefgh" for i in range(12))
+    cmd = cmd.replace("--opt5", "--otp5").replace("--opt9 ", "--opt9=")
+
+    start = time.perf_counter()
+    with pytest.raises(ValueError, match="Job spec for test does not match command:") as ve:
+        spec.parse_job_cmd(JobData(job_name="test", cmd=cmd))
+    assert time.perf_counter() - start < 5
+    assert "showing differing tokens" in str(ve.value)
+    print(f"\n{ve.value}")
+
+
+def test_fuzzy_match_max_errors_falls_back_to_tokens():
+    spec = JobSpec("cmd -T {threads:numeric} -S {another:category}")
+    result = spec.align_and_indicate_differences("cnd -t 5 -S simple", try_exact_match=True, max_errors=1)
+    assert [line.rstrip() for line in result.split("\n")] == [
+        "Failed to parse",
+        "Unable to align characters, showing differing tokens:",
+        "cmd -T {threads:numeric} -S {another:category}",
+        "╳╳╳ ╳╳",
+        "cnd -t 5                 -S simple",
+    ]
+
+
+def test_token_differences_insert_and_delete():
+    result = JobSpec._token_differences("cmd -T {threads:numeric} extra", "cmd -v -T 3")
+    assert result == [
+        "cmd    -T {threads:numeric} extra",
+        "    ∨∨                      ∧∧∧∧∧",
+        "cmd -v -T 3                      ",
+    ]
+
+
+def test_token_differences_by_position(monkeypatch):
+    monkeypatch.setattr("slurmise.job_parse.job_specification.TOKEN_DIFF_MAX_CELLS", 1)
+    result = JobSpec._token_differences("cmd -T {threads:numeric}", "cmd -t 3 extra")
+    assert result == [
+        "cmd -T {threads:numeric}      ",
+        "    ╳╳                   ∨∨∨∨∨",
+        "cmd -t 3                 extra",
+    ]
+
+
 def test_long_job_spec():
     spec = JobSpec(
         "--cpu_bind=cores --export=ALL --ntasks-per-node={cpus:numeric} "
@@ -164,14 +210,20 @@ def test_long_job_spec():
         "--maxiter=10 -v --tiled=1 --site act"
     )
 
-    print(spec.align_and_indicate_differences(cmd))
-
-    from datetime import datetime
+    job = spec.parse_job_cmd(JobData(job_name="test", cmd=cmd))
+    assert job.categories == {
+        "query": "timestamp_start",
+        "footprint": "somefile.fits",
+        "maps": "context.yaml",
+        "bands": "aband",
+    }
+    assert job.numerics == {"cpus": 1, "iters": 10}
 
-    start = datetime.now()
+    cmd = cmd.replace("--maxiter=10", "--maxiter 10").replace("--site act", "--site sct")
+    start = time.perf_counter()
     with pytest.raises(ValueError, match="Job spec for test does not match command:") as ve:
         spec.parse_job_cmd(JobData(job_name="test", cmd=cmd))
-    print(datetime.now() - start)
+    assert time.perf_counter() - start < 5
     print(f"\n{ve.value}")
 
 
@@ -429,6 +481,77 @@ def test_job_spec_with_builtin_parsers_file_list(tmp_path):
     }
 
 
+def test_job_spec_with_file_list_reducers(tmp_path):
+    """
+    [slurmise.job.builtin_files]
+    job_spec = "--input1 {input1:file_list}"
+    file_parsers.input1 = "file_lines:sum,file_lines:max,file_size:mean,file_size:count,file_size:p90"
+    """
+
+    available_parsers = {
+        "file_lines": file_parsers.FileLinesParser(),
+        "file_size": file_parsers.FileSizeParser(),
+    }
+
+    spec = JobSpec(
+        "--input1 {lines:file_list}",
+        file_parsers={"lines": "file_lines:sum,file_lines:max,file_size:mean,file_size:count,file_size:p90"},
+        available_parsers=available_parsers,
+    )
+
+    # lists of different lengths produce the same numerics
+    for num_files in (3, 5):
+        file_list = tmp_path / f"listing_{num_files}.txt"
+        with file_list.open("w") as fl:
+            for i in range(num_files):
+                input_file = tmp_path / f"input_{i}.txt"
+                fl.write(f"{input_file}\n")
+                input_file.write_text("line\n" * (i + 1))
+
+        jd = spec.parse_job_cmd(JobData(job_name="test", cmd=f"--input1 {file_list}"))
+        sizes = [5 * (i + 1) for i in range(num_files)]
+        assert jd.numerics == {
+            "lines_file_lines_sum": sum(i + 2 for i in range(num_files)),
+            "lines_file_lines_max": num_files + 1,
+            "lines_file_size_mean": sum(sizes) / num_files,
+            "lines_file_size_count": num_files,
+            "lines_file_size_p90": pytest.approx(np.percentile(sizes, 90)),
+        }
+
+
+def test_reducer_on_single_file_flattens_lists():
+    awk = file_parsers.AwkParser("layers", "numeric", "")
+    reduced = file_parsers.ReducedFileParser(awk, "max")
+    assert reduced.name == "layers_max"
+    assert reduced.reduce([[12, 14], [36], 18]) == 36
+    assert reduced.reduce([]) != reduced.reduce([])  # nan
+    assert file_parsers.ReducedFileParser(awk, "count").reduce([]) == 0
+
+
+@pytest.mark.parametrize("q", [0, 10, 50, 90, 99.5, 100])
+def test_percentile_matches_numpy(q):
+    values = [3, 1, 4, 1, 5, 9, 2, 6]
+    assert file_parsers.percentile(values, q) == pytest.approx(np.percentile(values, q))
+
+
+def test_job_spec_with_unknown_reducer():
+    with pytest.raises(ValueError, match="Unknown reducer 'p900'"):
+        JobSpec(
+            "--input1 {lines:file_list}",
+            file_parsers={"lines": "file_size:p900"},
+            available_parsers={"file_size": file_parsers.FileSizeParser()},
+        )
+
+
+def test_job_spec_with_category_reducer():
+    with pytest.raises(ValueError, match="Reducer 'max' requires a numeric parser, 'file_md5' is category"):
+        JobSpec(
+            "--input1 {lines:file_list}",
+            file_parsers={"lines": "file_md5:max"},
+            available_parsers={"file_md5": file_parsers.FileMD5()},
+        )
+
+
 def test_job_spec_with_multiple_builtin_parsers(tmp_path):
     """
     [slurmise.job.builtin_files]
@@ -722,3 +845,198 @@ def test_job_spec_model_default_is_none():
 def test_from_variables_stores_model():
     spec = JobSpec.from_variables({"threads": "numeric"}, model={"model": "knn"})
     assert spec.model == {"model": "knn"}
+
+
+FASTA_CONTENTS = """>sequence 1
+1234567890
+1234567890
+1234567890
+1234567890
+>sequence 2
+1234567890
+1234567890
+12345
+>sequence 3
+1234567890
+1234567890
+1234567890
+1234567890
+123
+>sequence 4
+1
+"""
+
+FASTQ_CONTENTS = """@read1
+ACGT
++
+IIII
+@read2
+ACGTACGT
++
+IIIIIIII
+@read3
+A
++
+I"""
+
+VCF_CONTENTS = """##fileformat=VCFv4.2
+##contig=<ID=1,length=1000>
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO
+1\t10\t.\tA\tG\t50\tPASS\t.
+1\t20\t.\tC\tT\t50\tPASS\t.
+1\t30\t.\tG\tA\t50\tPASS\t.
+"""
+
+SAM_CONTENTS = """@HD\tVN:1.6\tSO:coordinate
+@SQ\tSN:1\tLN:1000
+read1\t0\t1\t10\t60\t4M\t*\t0\t0\tACGT\tIIII
+read2\t16\t1\t20\t60\t4M\t*\t0\t0\tACGT\tIIII"""
+
+
+@pytest.mark.parametrize("gzipped", [False, True])
+@pytest.mark.parametrize("chunk_size", [None, 1, 3, 7])
+@pytest.mark.parametrize(
+    ("parser", "contents", "expected"),
+    [
+        (file_parsers.FastaRecords(), FASTA_CONTENTS, 4),
+        (file_parsers.FastaTotalLength(), FASTA_CONTENTS, 109),
+        (file_parsers.FastaTotalLength(), FASTA_CONTENTS.replace("\n", "\r\n"), 109),
+        (file_parsers.FastqReads(), FASTQ_CONTENTS, 3),
+        (file_parsers.VcfRecords(), VCF_CONTENTS, 3),
+        (file_parsers.SamRecords(), SAM_CONTENTS, 2),
+        (file_parsers.SamRecords(), "", 0),
+    ],
+)
+def test_native_parsers(parser, contents, expected, gzipped, chunk_size, tmp_path, monkeypatch):
+    if chunk_size is not None:
+        # force records to be split across chunks
+        monkeypatch.setattr(file_parsers, "CHUNK_SIZE", chunk_size)
+
+    input_file = tmp_path / "input.txt"
+    if gzipped:
+        with gzip.open(input_file, "wb") as outfile:
+            outfile.write(contents.encode())
+    else:
+        input_file.write_bytes(contents.encode())
+
+    assert parser.parse_file(input_file, gzip_file=gzipped) == expected
+
+
+@pytest.mark.skipif(
+    not shutil.which("awk"),
+    reason="AWK is not available on this system",
+)
+def test_native_parsers_match_awk(tmp_path):
+    input_file = tmp_path / "input.fa"
+    input_file.write_text(FASTA_CONTENTS)
+    awk_records = file_parsers.AwkParser("records", "numeric", "/^>/ {n++} END {print n}")
+    awk_length = file_parsers.AwkParser("length", "numeric", "!/^>/ {n += length($0)} END {print n}")
+
+    assert awk_records.parse_file(input_file) == [file_parsers.FastaRecords().parse_file(input_file)]
+    assert awk_length.parse_file(input_file) == [file_parsers.FastaTotalLength().parse_file(input_file)]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_fasta_total_length_chunks(newline, chunk_size, tmp_path, monkeypatch):
+    # headers and line endings split across chunks
+    monkeypatch.setattr(file_parsers, "CHUNK_SIZE", chunk_size)
+    input_file = tmp_path / "input.fa"
+    input_file.write_bytes(FASTA_CONTENTS.replace("\n", newline).encode())
+    assert file_parsers.FastaTotalLength().parse_file(input_file) == 109
+
+
+def test_job_spec_with_native_parsers(tmp_path):
+    spec = JobSpec(
+        "--reads {reads:gzip_file} --reference {reference:file}",
+        file_parsers={"reads": "fastq_reads", "reference": "fasta_records,fasta_total_length"},
+        available_parsers={
+            "fastq_reads": file_parsers.FastqReads(),
+            "fasta_records": file_parsers.FastaRecords(),
+            "fasta_total_length": file_parsers.FastaTotalLength(),
+        },
+    )
+
+    reads = tmp_path / "reads.fq.gz"
+    with gzip.open(reads, "wt") as outfile:
+        outfile.write(FASTQ_CONTENTS)
+    reference = tmp_path / "reference.fa"
+    reference.write_text(FASTA_CONTENTS)
+
+    jd = spec.parse_job_cmd(JobData(job_name="test", cmd=f"--reads {reads} --reference {reference}"))
+    assert jd.categories == {}
+    assert jd.numerics == {
+        "reads_fastq_reads": 3,
+        "reference_fasta_records": 4,
+        "reference_fasta_total_length": 109,
+    }
+
+
+@pytest.fixture
+def sample_directory(tmp_path):
+    sample = tmp_path / "sample"
+    (sample / "lane1" / "qc").mkdir(parents=True)
+    (sample / "lane2").mkdir()
+    (sample / "README").write_text("x" * 10)
+    (sample / "lane1" / "reads.fastq.gz").write_text("x" * 100)
+    (sample / "lane1" / "qc" / "report.fastq.gz").write_text("x" * 1000)
+    (sample / "lane2" / "reads.fastq.gz").write_text("x" * 50)
+    return sample
+
+
+@pytest.mark.parametrize(
+    ("max_depth", "glob", "expected"),
+    [
+        (None, None, file_parsers.DirectoryStats(total_bytes=1160, file_count=4, largest_file=1000)),
+        (0, None, file_parsers.DirectoryStats(total_bytes=10, file_count=1, largest_file=10)),
+        (1, None, file_parsers.DirectoryStats(total_bytes=160, file_count=3, largest_file=100)),
+        (None, "*.fastq.gz", file_parsers.DirectoryStats(total_bytes=1150, file_count=3, largest_file=1000)),
+        (1, "*.fastq.gz", file_parsers.DirectoryStats(total_bytes=150, file_count=2, largest_file=100)),
+    ],
+)
+def test_directory_stats(sample_directory, max_depth, glob, expected):
+    assert file_parsers.directory_stats(sample_directory, max_depth=max_depth, glob=glob) == expected
+
+
+def test_directory_stats_cached_on_mtime(sample_directory, monkeypatch):
+    calls = []
+    scandir = file_parsers.os.scandir
+    monkeypatch.setattr(file_parsers.os, "scandir", lambda path: calls.append(path) or scandir(path))
+
+    first = file_parsers.directory_stats(sample_directory)
+    assert len(calls) == 4
+    assert file_parsers.directory_stats(sample_directory) == first
+    assert len(calls) == 4
+
+    # adding an entry updates the mtime and invalidates the cache
+    (sample_directory / "new_file").write_text("x" * 5)
+    assert file_parsers.directory_stats(sample_directory).total_bytes == first.total_bytes + 5
+    assert len(calls) == 8
+
+
+def test_directory_parser_unknown_stat():
+    with pytest.raises(ValueError, match="Unknown directory stat 'mean_bytes' for parser 'bad'"):
+        file_parsers.DirectoryParser("bad", "mean_bytes")
+
+
+def test_job_spec_with_directory(sample_directory):
+    spec = JobSpec(
+        "--sample {sample:directory} -T {threads:numeric}",
+        file_parsers={"sample": "dir_total_bytes,dir_file_count,dir_largest_file,reads"},
+        available_parsers={
+            "dir_total_bytes": file_parsers.DirectoryParser("dir_total_bytes", "total_bytes"),
+            "dir_file_count": file_parsers.DirectoryParser("dir_file_count", "file_count"),
+            "dir_largest_file": file_parsers.DirectoryParser("dir_largest_file", "largest_file"),
+            "reads": file_parsers.DirectoryParser("reads", "total_bytes", max_depth=1, glob="reads.*"),
+        },
+    )
+
+    jd = spec.parse_job_cmd(JobData(job_name="test", cmd=f"--sample {sample_directory} -T 4"))
+    assert jd.categories == {}
+    assert jd.numerics == {
+        "threads": 4,
+        "sample_dir_total_bytes": 1160,
+        "sample_dir_file_count": 4,
+        "sample_dir_largest_file": 1000,
+        "sample_reads": 150,
+    }
@@ -0,0 +1,88 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from slurmise import profiling
+from slurmise.__main__ import main
+
+
+@pytest.fixture
+def profiler():
+    yield profiling.PROFILER
+    profiling.PROFILER.reset()
+
+
+def test_spans(profiler):
+    @profiling.profiled("outer")
+    def outer(depth):
+        with profiling.span("inner"):
+            pass
+        if depth:
+            outer(depth - 1)
+
+    outer(1)
+    assert profiler.spans == {}
+
+    profiler.enable()
+    outer(2)
+    # recursive calls of outer are counted once, inner for every call
+    assert {name: calls for name, (calls, _) in profiler.spans.items()} == {"outer": 1, "inner": 3}
+    assert profiler.spans["outer"][1] >= profiler.spans["inner"][1]
+
+
+def test_report(profiler, tmp_path, capsys):
+    profiler.enable()
+    with profiler.span("database.open"):
+        pass
+    profiler.report()
+    err = capsys.readouterr().err
+    assert "database.open" in err
+    assert err.splitlines()[2].split()[:2] == ["database.open", "1"]
+    # reporting disables profiling, so the report at exit is skipped
+    assert not profiler.enabled
+
+    output = tmp_path / "profile.json"
+    profiler.enable(output=output)
+    with profiler.span("sacct"):
+        pass
+    profiler.report()
+    summary = json.loads(output.read_text())
+    assert set(summary["spans"]) == {"database.open", "sacct"}
+    assert summary["spans"]["sacct"]["calls"] == 1
+    assert capsys.readouterr().err == ""
+
+
+def test_profile_cli(profiler, nupack_toml, tmp_path):
+    output = tmp_path / "profile.json"
+    cprofile = tmp_path / "profile.prof"
+    runner = CliRunner()
+    result = runner.invoke(
+        main,
+        [
+            *("--toml", nupack_toml.toml, "--profile-json", output, "--cprofile", cprofile),
+            *("update-model", "nupack monomer -c 2 -S 30"),
+        ],
+    )
+    assert result.exit_code == 0
+    assert not profiler.enabled
+
+    spans = json.loads(output.read_text())["spans"]
+    assert {"imports", "config", "job_spec.parse", "database.open", "database.query", "model.fit"} <= set(spans)
+    assert pstats.Stats(str(cprofile)).total_calls > 0
+
+
+def test_profile_environment(tmp_path):
+    output = tmp_path / "profile.json"
+    code = "from slurmise import profiling\nwith profiling.span('parse'): pass"
+    env = {**os.environ, profiling.PROFILE_ENV: "1"}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    assert "parse" in result.stderr
+
+    env[profiling.PROFILE_ENV] = str(output)
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
+    assert list(json.loads(output.read_text())["spans"]) == ["parse"]
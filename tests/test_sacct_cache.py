@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+from slurmise import slurm
+from slurmise.api import Slurmise
+from slurmise.job_data import JobData
+from slurmise.job_database import JobDatabase
+from slurmise.sacct_cache import SacctCache
+from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+
+def metadata(slurm_id, state="COMPLETED", max_rss=100):
+    return {"slurm_id": int(slurm_id), "step_id": "0", "state": state, "max_rss": max_rss, "elapsed_seconds": 60}
+
+
+@pytest.fixture
+def fake_sacct(monkeypatch):
+    """Count the calls to sacct, returning a completed job for each job id."""
+    calls = []
+
+    def parse_slurm_job_metadata(slurm_id=None, step_name=None, backend="json"):
+        calls.append(slurm_id)
+        return metadata(slurm_id)
+
+    def parse_slurm_jobs_metadata(slurm_ids, backend="json", batch_size=500):
+        calls.extend(slurm_ids[start : start + batch_size] for start in range(0, len(slurm_ids), batch_size))
+        return {
+            (slurm_id, step_name): metadata(slurm_id)
+            for slurm_id in slurm_ids
+            if slurm_id != "404"
+            for step_name in (None, "0")
+        }
+
+    monkeypatch.setattr("slurmise.slurm.parse_slurm_job_metadata", parse_slurm_job_metadata)
+    monkeypatch.setattr("slurmise.slurm.parse_slurm_jobs_metadata", parse_slurm_jobs_metadata)
+    return calls
+
+
+def test_sacct_cache_terminal_states(tmp_path):
+    cache = SacctCache(tmp_path / "cache", ttl=0)
+    cache.put({("1", None): metadata(1), ("2", "0"): metadata(2, state="RUNNING")})
+
+    assert cache.get("1") == metadata(1)
+    assert cache.get("1", "0") is None
+    # running jobs expire after the ttl
+    assert cache.get("2", "0") is None
+    assert SacctCache(tmp_path / "cache", ttl=60).get("2", "0") == metadata(2, state="RUNNING")
+
+    # steps are added to the job
+    cache.put({("1", "0"): metadata(1, max_rss=200)})
+    assert cache.get("1")["max_rss"] == 100
+    assert cache.get("1", "0")["max_rss"] == 200
+
+
+def test_sacct_cache_job_metadata(tmp_path, fake_sacct):
+    cache = SacctCache(tmp_path / "cache")
+    assert cache.job_metadata("1", "0") == metadata(1)
+    assert cache.job_metadata("1", "0") == metadata(1)
+    assert fake_sacct == ["1"]
+
+
+def test_sacct_cache_evict(tmp_path):
+    cache = SacctCache(tmp_path / "cache", max_jobs=2, evict_interval=0)
+    for fetched, slurm_id in enumerate(("1", "2")):
+        cache.put({(slurm_id, None): metadata(slurm_id)})
+        os.utime(tmp_path / "cache" / f"{slurm_id}.json", (fetched, fetched))
+    cache.put({("3", None): metadata(3)})
+    assert cache.get("1") is None
+    assert cache.get("2") is not None
+    assert cache.get("3") is not None
+
+
+def test_sacct_cache_evict_interval(tmp_path, monkeypatch):
+    cache = SacctCache(tmp_path / "cache", max_jobs=1)
+    evictions = []
+    monkeypatch.setattr(cache, "evict", lambda: evictions.append(True))
+    cache.put({("1", None): metadata(1)})
+    # the cache was just evicted, and updating a job doesn't add one
+    cache.put({("2", None): metadata(2)})
+    cache.put({("1", None): metadata(1)})
+    assert len(evictions) == 1
+
+    marker = tmp_path / "cache" / ".evicted"
+    os.utime(marker, (0, 0))
+    cache.put({("1", None): metadata(1)})
+    assert len(evictions) == 1
+    cache.put({("3", None): metadata(3)})
+    assert len(evictions) == 2
+
+
+def test_sacct_cache_prefetch(tmp_path, fake_sacct):
+    cache = SacctCache(tmp_path / "cache")
+    cache.put({("1", "0"): metadata(1)})
+
+    job_steps = [("1", "0"), ("2", "0"), ("2", None), ("3", "0"), ("404", None)]
+    assert cache.prefetch(job_steps, batch_size=2) == 3
+    assert fake_sacct == [["2", "3"], ["404"]]
+    assert cache.get("3") == metadata(3)
+
+    # only the jobs sacct didn't return are queried again
+    fake_sacct.clear()
+    assert cache.prefetch(job_steps) == 1
+    assert fake_sacct == [["404"]]
+
+
+@pytest.mark.parametrize("backend", ["json", "parsable"])
+def test_parse_slurm_jobs_metadata(fake_sacct_bin, backend):
+    fake_sacct_bin.add_job(1, generate_job_metadata(job_id=1), generate_job_parsable(job_id=1))
+    fake_sacct_bin.add_job(2, generate_job_metadata(job_id=2, elapsed=5), generate_job_parsable(job_id=2, elapsed=5))
+
+    jobs_metadata = slurm.parse_slurm_jobs_metadata(["1", "2", "3"], backend=backend)
+    assert jobs_metadata["2", None]["elapsed_seconds"] == 5
+    assert jobs_metadata["2", None] == jobs_metadata["2", "extern"]
+    assert jobs_metadata["1", "extern"]["max_rss"] == 70917
+    assert ("3", None) not in jobs_metadata
+    assert [call[:2] for call in fake_sacct_bin.calls] == [["-j", "1,2,3"]]
+
+    # batches are separate calls
+    assert slurm.parse_slurm_jobs_metadata(["1", "2", "3"], backend=backend, batch_size=2) == jobs_metadata
+    assert sorted(call[1] for call in fake_sacct_bin.calls[1:]) == ["1,2", "3"]
+    assert slurm.parse_slurm_jobs_metadata([], backend=backend) == {}
+
+
+def test_update_missing_data_prefetch(empty_h5py_file, tmp_path, fake_sacct):
+    cache = SacctCache(tmp_path / "cache")
+    with JobDatabase.get_database(empty_h5py_file, sacct_cache=cache) as db:
+        for slurm_id in ("1.0", "2.0", "3.0"):
+            db.record(JobData(job_name="test_job", slurm_id=slurm_id, categories={"option": "a"}))
+
+        jobs = db.query(JobData(job_name="test_job", categories={"option": "a"}), update_missing=True)
+        assert [job.memory for job in jobs] == [100, 100, 100]
+        assert fake_sacct == [["1", "2", "3"]]
+
+
+def test_raw_record_uses_cache(simple_toml, fake_sacct):
+    slurmise = Slurmise(simple_toml.toml)
+    slurmise.record("nupack monomer -T 2 -C simple", slurm_id="1", step_id="0")
+    assert fake_sacct == ["1"]
+    # later queries of the completed job don't run sacct
+    assert Slurmise(simple_toml.toml).sacct_cache.job_metadata("1", "0") == metadata(1)
+    assert fake_sacct == ["1"]
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from slurmise import slurm
+from slurmise.api import Slurmise
+from slurmise.sacct_client import SacctClient
+from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+CMD = ["sacct", "-j", "1", "--json"]
+
+
+@pytest.fixture
+def fake_job(fake_sacct_bin):
+    fake_sacct_bin.add_job(1, generate_job_metadata(job_id=1), generate_job_parsable(job_id=1))
+    return fake_sacct_bin
+
+
+def test_check_output(fake_job):
+    client = SacctClient()
+    assert b'"job_id": 1' in client.check_output(CMD)
+    assert fake_job.calls == [CMD[1:]]
+
+
+def test_retry(fake_job):
+    fake_job.set(failures=2)
+    client = SacctClient(retries=2, backoff=0)
+    assert client.check_output(CMD)
+    assert len(fake_job.calls) == 3
+    assert client.consecutive_failures == 0
+
+    fake_job.set(failures=10)
+    with pytest.raises(ValueError, match="Socket timed out"):
+        client.check_output(CMD)
+    assert len(fake_job.calls) == 6
+
+
+def test_timeout(fake_job):
+    fake_job.set(sleep=5)
+    client = SacctClient(timeout=0.2, retries=1, backoff=0)
+    start = time.perf_counter()
+    with pytest.raises(ValueError, match="timed out after 0.2 s"):
+        client.check_output(CMD)
+    assert time.perf_counter() - start < 2
+    assert len(fake_job.calls) == 2
+
+
+def test_circuit_breaker(fake_job):
+    fake_job.set(failures=3)
+    client = SacctClient(retries=5, backoff=0, failure_threshold=2, reset_after=0.5)
+    with pytest.raises(ValueError, match="2 consecutive failures"):
+        client.check_output(CMD)
+    assert len(fake_job.calls) == 2
+
+    # open, sacct isn't run
+    with pytest.raises(ValueError, match="consecutive failures"):
+        client.check_output(CMD)
+    assert len(fake_job.calls) == 2
+
+    # after reset_after a single attempt is let through, its failure opens the circuit again
+    time.sleep(0.5)
+    with pytest.raises(ValueError, match="consecutive failures"):
+        client.check_output(CMD)
+    assert len(fake_job.calls) == 3
+
+    time.sleep(0.5)
+    assert client.check_output(CMD)
+    assert client.opened_at is None
+
+
+def test_max_concurrency(fake_job):
+    fake_job.set(sleep=0.5)
+    client = SacctClient(max_concurrency=3)
+    start = time.perf_counter()
+    assert len(client.check_outputs([CMD] * 6)) == 6
+    elapsed = time.perf_counter() - start
+    # two rounds of three
+    assert 1 <= elapsed < 2.5
+
+
+def test_missing_sacct(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    with pytest.raises(ValueError, match="Error running sacct cmd"):
+        SacctClient().check_output(CMD)
+
+
+def test_check_output_in_event_loop(fake_job):
+    async def main():
+        return SacctClient().check_output(CMD)
+
+    assert asyncio.run(main())
+
+
+def test_parse_slurm_job_metadata_retries(fake_job):
+    fake_job.set(failures=1)
+    assert slurm.parse_slurm_job_metadata("1")["slurm_id"] == 1
+    assert slurm.parse_slurm_job_metadata("1", backend="parsable")["slurm_id"] == 1
+    assert [call[:2] for call in fake_job.calls] == [["-j", "1"]] * 3
+
+
+@pytest.mark.usefixtures("fake_sacct_bin")
+def test_configure_from_toml(tmp_path):
+    toml = tmp_path / "slurmise.toml"
+    toml.write_text(
+        f"""
+    [slurmise]
+    base_dir = "{tmp_path / "slurmise_dir"}"
+    sacct_timeout = 5
+    sacct_max_concurrency = 2
+    """
+    )
+    Slurmise(toml)
+    assert slurm.SACCT_CLIENT.timeout == 5
+    assert slurm.SACCT_CLIENT.max_concurrency == 2
+    assert slurm.SACCT_CLIENT.retries == 3
@@ -0,0 +1,136 @@
+import json
+import math
+
+import pytest
+from click.testing import CliRunner
+
+from slurmise import simulate
+from slurmise.__main__ import main
+from slurmise.api import Slurmise
+from slurmise.job_data import COMPLETED, OOM, JobData
+from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+
+def linear_jobs(count, job_name="linear", categories=None, noise=0.0):
+    """Jobs with memory and runtime linear in n, every fifth ran out of memory."""
+    return [
+        JobData(
+            job_name=job_name,
+            slurm_id=str(1000 - n),
+            categories=categories or {},
+            numerics={"n": n},
+            memory=(100 * n + 50) * (1 + noise * math.sin(n)),
+            runtime=(n + 5) * (1 + noise * math.cos(n)),
+            outcome=OOM if n % 5 == 4 else COMPLETED,
+        )
+        for n in range(count, 0, -1)
+    ]
+
+
+def allocations(result):
+    return (result.evaluated, result.fits, result.oom_failures, result.timeout_failures, result.padding_hours)
+
+
+def test_time_order():
+    ids = ["12", "3_1", "3_0", "trace-b", "3", "trace-a", "12.batch"]
+    jobs = sorted((JobData(job_name="a", slurm_id=slurm_id) for slurm_id in ids), key=simulate.time_order)
+    assert [job.slurm_id for job in jobs] == ["3", "3_0", "3_1", "12", "12.batch", "trace-a", "trace-b"]
+
+
+def test_replay_default():
+    allocation = simulate.Allocation(default_memory=1000, default_runtime=10, minimum_runtime=12)
+    result = simulate.replay_group(JobData(job_name="linear"), linear_jobs(20), allocation, "default")
+
+    completed = [n for n in range(1, 21) if n % 5 != 4]
+    assert (result.jobs, result.evaluated, result.fits, result.predictions) == (20, 16, 0, 0)
+    assert result.oom_failures == sum(100 * n + 50 > 1000 for n in completed)
+    assert result.timeout_failures == sum(n + 5 > 12 for n in completed)
+    assert result.padding_hours == pytest.approx(sum(12 - n - 5 for n in completed if n + 5 <= 12) / 60)
+    over = sum((1000 - 100 * n - 50) / 1024 * (n + 5) / 60 for n in completed if 100 * n + 50 <= 1000 and n <= 7)
+    assert result.over_allocated_gb_hours == pytest.approx(over)
+
+
+def test_replay_model():
+    allocation = simulate.Allocation(default_memory=1000, default_runtime=10)
+    # noisy enough for the predictions to be used, see ResourceFit.predict_batch
+    jobs = linear_jobs(60, noise=0.3)
+    result = simulate.replay_group(JobData(job_name="linear"), jobs, allocation, "poly", min_train=20, refit_every=15)
+    default = simulate.replay_group(JobData(job_name="linear"), jobs, allocation, "default")
+
+    assert result.fits == 3
+    assert result.predictions == 3
+    assert result.mean_latency_ms > 0
+    # later jobs are larger, so the models allocate closer than the defaults
+    assert result.oom_failures < default.oom_failures
+    assert result.timeout_failures < default.timeout_failures
+
+
+def test_replay_groups():
+    allocation = simulate.Allocation(default_memory=1000, default_runtime=10)
+    groups = [
+        (JobData(job_name="linear", categories={"size": size}), linear_jobs(30, categories={"size": size}), allocation)
+        for size in ("small", "large")
+    ]
+    results = simulate.replay_groups(groups, ["default", "poly"], refit_every=10, workers=2)
+    assert [(result.categories, result.model) for result in results] == [
+        ({"size": "small"}, "default"),
+        ({"size": "small"}, "poly"),
+        ({"size": "large"}, "default"),
+        ({"size": "large"}, "poly"),
+    ]
+    inline = simulate.replay_groups(groups, ["default", "poly"], refit_every=10, workers=1)
+    assert [allocations(result) for result in results] == [allocations(result) for result in inline]
+
+    totals = simulate.summarize(results)
+    assert list(totals) == ["default", "poly"]
+    assert totals["poly"].evaluated == 2 * results[1].evaluated
+    assert totals["poly"].fits == results[1].fits + results[3].fits
+
+    with pytest.raises(ValueError, match="Unknown models"):
+        simulate.replay_groups(groups, ["linear"])
+    with pytest.raises(ValueError, match="at least one job"):
+        simulate.replay_groups(groups, refit_every=0)
+
+
+def test_simulate(nupack_toml):
+    before = nupack_toml.db.read_bytes()
+    results = Slurmise(nupack_toml.toml).simulate(["default", "poly"], min_train=50, refit_every=400)
+
+    default, poly = results
+    assert (default.model, default.job_name, default.jobs) == ("default", "nupack", 874)
+    assert poly.fits == 3
+    assert poly.evaluated == default.evaluated > 0
+    # no models are saved and the database is unchanged
+    assert not (nupack_toml.db.parent / "PolynomialFit").exists()
+    assert nupack_toml.db.read_bytes() == before
+
+
+def test_simulate_sacct_recorded(simple_toml, fake_sacct_bin):
+    slurmise = Slurmise(simple_toml.toml)
+    for job_id in range(1, 6):
+        # sacct reports the elapsed seconds, half an hour for every job
+        fake_sacct_bin.add_job(
+            job_id,
+            generate_job_metadata(job_id=job_id, elapsed=1800),
+            generate_job_parsable(job_id=job_id, elapsed=1800),
+        )
+        slurmise.record("nupack monomer -T 2 -C simple", slurm_id=str(job_id))
+
+    (result,) = slurmise.simulate(["default"])
+    # the default time of an hour pads each job by half an hour
+    assert (result.evaluated, result.timeout_failures) == (5, 0)
+    assert result.padding_hours == pytest.approx(2.5)
+
+
+def test_simulate_cli(nupack_toml):
+    runner = CliRunner()
+    args = ["--toml", nupack_toml.toml, "simulate", "--model", "default", "--refit-every", "400"]
+    result = runner.invoke(main, [*args, "--json"])
+    assert result.exit_code == 0
+    assert [json.loads(line)["model"] for line in result.output.splitlines()] == ["default"]
+
+    result = runner.invoke(main, [*args, "--groups"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[1].split()[:2] == ["nupack", "default"]
+    assert lines[-1].split()[:2] == ["all", "default"]
@@ -1,4 +1,18 @@
-from slurmise.slurm import parse_slurm_job_metadata
+import datetime
+import json
+
+import pytest
+
+from slurmise.job_data import JobData
+from slurmise.slurm import (
+    SACCT_PARSABLE_FORMAT,
+    get_sacct_window,
+    outcome_from_state,
+    parse_sacct_job,
+    parse_sacct_parsable,
+    parse_slurm_job_metadata,
+    update_job_data,
+)
 
 
 def generate_job_metadata(**kargs):
@@ -69,6 +83,7 @@ def test_parse_slurm_job_metadata(monkeypatch):
         "slurm_id": 58976578,
         "state": "RUNNING",
         "step_id": "extern",
+        "metrics": {},
     }
 
     assert parse_slurm_job_metadata("58976578") == expected_metadata
@@ -103,7 +118,205 @@ def test_parse_slurm_job_metadata2(monkeypatch):
         "slurm_id": 58976578,
         "state": "RUNNING",
         "step_id": "extern",
+        "metrics": {},
     }
 
     assert parse_slurm_job_metadata("58976578") == expected_metadata
     assert parse_slurm_job_metadata("58976578", step_name="extern") == expected_metadata
+
+
+@pytest.mark.parametrize(
+    ("state", "outcome"),
+    [
+        ("COMPLETED", "completed"),
+        ("RUNNING", "completed"),
+        (None, "completed"),
+        ("OUT_OF_MEMORY", "oom"),
+        ("TIMEOUT", "timeout"),
+        ("FAILED", "failed"),
+        ("CANCELLED by 1234", "failed"),
+    ],
+)
+def test_outcome_from_state(state, outcome):
+    assert outcome_from_state(state) == outcome
+
+
+def test_get_sacct_window(monkeypatch):
+    calls = []
+
+    def mock_check_output(cmd):
+        calls.append(cmd)
+        return json.dumps(generate_job_metadata()).encode()
+
+    monkeypatch.setattr("slurmise.slurm.SACCT_CLIENT.check_output", mock_check_output)
+
+    start = datetime.datetime(2024, 1, 1)
+    end = datetime.datetime(2024, 1, 2, 12)
+    assert get_sacct_window(start, end) == generate_job_metadata()
+    assert calls[0] == ["sacct", "--json", "--starttime", "2024-01-01T00:00:00", "--endtime", "2024-01-02T12:00:00"]
+
+    get_sacct_window(start, end, user="me", partition="main")
+    assert calls[1][-4:] == ["--user", "me", "--partition", "main"]
+
+
+def test_get_sacct_window_parsable(monkeypatch):
+    output = (
+        "1001\x1fCOMPLETED\x1fwrap|1\x1fsbatch --wrap='nupack monomer | tee out'\n"
+        "1002\x1fCANCELLED by 1234\x1fnupack\x1fsbatch --wrap='first\n"
+        "second'\n"
+    )
+    calls = []
+
+    def mock_check_output(cmd):
+        calls.append(cmd)
+        return output.encode()
+
+    monkeypatch.setattr("slurmise.slurm.SACCT_CLIENT.check_output", mock_check_output)
+
+    window = get_sacct_window(datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 2), backend="parsable")
+    assert "--allocations" in calls[0]
+    assert "--format=JobIDRaw,State,JobName,SubmitLine" in calls[0]
+    # the name and submit line may contain |, lines continuing a submit line are skipped
+    assert window == {
+        "jobs": [
+            {
+                "job_id": 1001,
+                "name": "wrap|1",
+                "submit_line": "sbatch --wrap='nupack monomer | tee out'",
+                "state": {"current": ["COMPLETED"]},
+            },
+            {
+                "job_id": 1002,
+                "name": "nupack",
+                "submit_line": "sbatch --wrap='first",
+                "state": {"current": ["CANCELLED"]},
+            },
+        ]
+    }
+
+
+def generate_job_parsable(**kargs):
+    """The parsable sacct output matching generate_job_metadata."""
+    job_id = kargs.get("job_id", 58976578)
+    lines = [
+        (
+            f"{job_id}|{kargs.get('state', 'RUNNING')}|pli-c|97300|96|{kargs.get('req_mem', '729088M')}||||||"
+            f"{kargs.get('job_name', 'finetune_vicuna_7b')}"
+        ),
+        f"{job_id}.batch|RUNNING||97250|96||1|cpu=00:00:01,mem=1024||||batch",
+        (
+            f"{job_id}.extern|RUNNING||{kargs.get('elapsed', 97201)}|96||{kargs.get('task_count', 3)}|"
+            f"cpu=00:10:00,energy=0,fs/disk=5000,mem={kargs.get('mem_count', 24786677760)},pages=0||||extern"
+        ),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("task_count", [3, 5])
+def test_parse_slurm_job_metadata_parsable(monkeypatch, task_count):
+    monkeypatch.setattr(
+        "slurmise.slurm.get_slurm_job_sacct",
+        lambda slurm_id: generate_job_metadata(task_count=task_count),
+    )
+    monkeypatch.setattr(
+        "slurmise.slurm.get_slurm_job_sacct_parsable",
+        lambda slurm_id: generate_job_parsable(task_count=task_count),
+    )
+
+    expected = parse_slurm_job_metadata("58976578")
+    assert parse_slurm_job_metadata("58976578", backend="parsable") == expected
+    assert parse_slurm_job_metadata("58976578", step_name="extern", backend="parsable") == expected
+
+    batch = parse_slurm_job_metadata("58976578", step_name="batch", backend="parsable")
+    assert batch["step_id"] == "batch"
+    assert batch["max_rss"] == 1
+    assert batch["elapsed_seconds"] == 97250
+
+    # the job name is the last field, so it may contain the delimiter
+    monkeypatch.setattr(
+        "slurmise.slurm.get_slurm_job_sacct_parsable",
+        lambda slurm_id: generate_job_parsable(task_count=task_count, job_name="align|sample"),
+    )
+    assert parse_slurm_job_metadata("58976578", backend="parsable") == {**expected, "job_name": "align|sample"}
+
+    with pytest.raises(ValueError, match="Unknown sacct backend"):
+        parse_slurm_job_metadata("58976578", backend="xml")
+
+    monkeypatch.setattr("slurmise.slurm.get_slurm_job_sacct_parsable", lambda slurm_id: "")
+    with pytest.raises(ValueError, match="Could not parse output from sacct"):
+        parse_slurm_job_metadata("58976578", backend="parsable")
+
+
+@pytest.mark.parametrize(
+    ("req_mem", "per_cpu", "per_node"),
+    [
+        ("729088M", 0, 729088),
+        ("712G", 0, 729088),
+        ("4000Mc", 4000, 0),
+        ("8Gn", 0, 8192),
+        ("", 0, 0),
+    ],
+)
+def test_parse_sacct_parsable_req_mem(req_mem, per_cpu, per_node):
+    metadata = parse_sacct_parsable(generate_job_parsable(req_mem=req_mem, state="CANCELLED by 123"))
+    assert metadata["memory_per_cpu"]["number"] == per_cpu
+    assert metadata["memory_per_cpu"]["set"] == (per_cpu > 0)
+    assert metadata["memory_per_node"]["number"] == per_node
+    assert metadata["state"] == "CANCELLED"
+
+
+def test_get_slurm_job_sacct_parsable(monkeypatch):
+    from slurmise.slurm import get_slurm_job_sacct_parsable
+
+    calls = []
+
+    def mock_check_output(cmd):
+        calls.append(cmd)
+        return generate_job_parsable().encode()
+
+    monkeypatch.setattr("slurmise.slurm.SACCT_CLIENT.check_output", mock_check_output)
+    monkeypatch.setenv("SLURM_JOBID", "58976578")
+
+    assert get_slurm_job_sacct_parsable() == generate_job_parsable()
+    assert calls[0][:3] == ["sacct", "-j", "58976578"]
+    assert "--parsable2" in calls[0]
+    assert "--noconvert" in calls[0]
+    assert calls[0][-1] == f"--format={','.join(SACCT_PARSABLE_FORMAT)}"
+
+
+def test_parse_metrics():
+    metadata = generate_job_metadata(elapsed=100, task_count=2)
+    step = metadata["jobs"][0]["steps"][0]
+    step["time"]["total"] = {"seconds": 4800, "microseconds": 0}
+    step["tres"]["requested"]["max"].append({"type": "vmem", "name": "", "count": 3 * 2**30})
+    step["tres"]["requested"]["total"] = [{"type": "fs", "name": "disk", "count": 512 * 2**20}]
+    step["tres"]["consumed"] = {"total": [{"type": "fs", "name": "disk", "count": 2**30}]}
+
+    job_id = 58976578
+    parsable = "\n".join(
+        [
+            f"{job_id}|RUNNING|pli-c|100|96|729088M||||||finetune_vicuna_7b",
+            (
+                f"{job_id}.extern|RUNNING||100|96||2|mem=24786677760,vmem={3 * 2**30}|01:20:00|"
+                f"cpu=01:20:00,fs/disk={512 * 2**20}|fs/disk={2**30}|extern"
+            ),
+        ]
+    )
+
+    expected = {"cpu_efficiency": 0.5, "disk_read": 512, "disk_write": 1024, "max_vmem": 6144}
+    assert parse_sacct_job(metadata["jobs"][0])["metrics"] == expected
+    assert parse_sacct_parsable(parsable)["metrics"] == expected
+    # steps without accounting of these metrics
+    assert parse_sacct_parsable(generate_job_parsable())["metrics"] == {}
+
+
+def test_update_job_data_metrics():
+    metadata = {"slurm_id": 1, "step_id": "", "max_rss": 10, "elapsed_seconds": 120, "state": "COMPLETED"}
+    metadata["metrics"] = {"cpu_efficiency": 0.5, "disk_read": 512}
+
+    jd = update_job_data(JobData(job_name="test"), metadata)
+    assert jd.metrics == {}
+    jd = update_job_data(JobData(job_name="test"), metadata, metrics=["cpu_efficiency", "max_vmem"])
+    assert jd.metrics == {"cpu_efficiency": 0.5}
+    # sacct reports seconds, jobs are recorded in minutes
+    assert jd.runtime == 2
@@ -1,5 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
+import numpy as np
 import pytest
 
 import slurmise.extras.snake_parsers as sp
@@ -213,3 +214,144 @@ def test_ThreadScaler_exp_overheads():
     assert result_threads == 5  # ceiling value
     assert result_jd.runtime == int(20 * 1.1**4)  # 29
     assert result_jd.memory == int(45 * 1.2**4)  # 93
+
+
+def make_scaling_jobs(runtime_overhead, memory_overhead, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    jobs = []
+    for i in range(60):
+        threads = int(rng.integers(1, 9))
+        size = float(rng.uniform(10, 100))
+        complexity = ["low", "high"][i % 2]
+        base = 2 if complexity == "high" else 1
+        runtime = base * size / threads * runtime_overhead ** (threads - 1) * np.exp(rng.normal(0, noise))
+        memory = base * 10 * size * memory_overhead ** (threads - 1) * np.exp(rng.normal(0, noise))
+        jobs.append(
+            JobData(
+                job_name="scaled",
+                slurm_id=str(i),
+                categories={"complexity": complexity},
+                numerics={"threads": threads, "size": size},
+                runtime=runtime,
+                memory=memory,
+            )
+        )
+    return jobs
+
+
+def test_ThreadScaler_fit():
+    jobs = make_scaling_jobs(1.1, 1.05)
+    ts = sp.ThreadScaler.fit(jobs, "threads", thread_range=(1, 8))
+    assert ts.runtime_overhead == pytest.approx(1.1)
+    assert ts.memory_overhead == pytest.approx(1.05)
+    assert ts.thread_range == (1, 8)
+    memory_per_thread = [job.memory / job.numerics["threads"] for job in jobs]
+    assert ts.memory_per_thread == pytest.approx(np.median(memory_per_thread))
+
+    ts = sp.ThreadScaler.fit(make_scaling_jobs(1.2, 1.1, noise=0.05), "threads")
+    assert ts.runtime_overhead == pytest.approx(1.2, rel=0.02)
+    assert ts.memory_overhead == pytest.approx(1.1, rel=0.02)
+
+    # perfect scaling is clipped to no overhead
+    ts = sp.ThreadScaler.fit(make_scaling_jobs(0.9, 0.9), "threads")
+    assert ts.runtime_overhead == 1
+    assert ts.memory_overhead == 1
+
+
+def test_ThreadScaler_fractional():
+    # a fit overhead above 2 is still a fractional scale
+    ts = sp.ThreadScaler.fit(make_scaling_jobs(2.5, 1.05), "threads", thread_range=(1, 8))
+    assert ts.fractional
+    assert ts.runtime_overhead == pytest.approx(2.5)
+    runtime, memory = ts.scale(JobData(job_name="test", memory=100, runtime=60), 1, [1, 2, 3])
+    assert runtime == pytest.approx([60, 30 * 2.5, 20 * 2.5**2])
+    assert memory == pytest.approx([100, 105, 100 * 1.05**2])
+
+    # and small overheads can be set as offsets
+    ts = sp.ThreadScaler(memory_per_thread=10, runtime_overhead=1.5, memory_overhead=1.5, fractional=False)
+    runtime, memory = ts.scale(JobData(job_name="test", memory=100, runtime=60), 1, [1, 3])
+    assert runtime == pytest.approx([60, 20 + 3])
+    assert memory == pytest.approx([100, 103])
+
+
+def test_ThreadScaler_fit_not_enough_data():
+    jobs = make_scaling_jobs(1.1, 1.05)
+    assert sp.ThreadScaler.fit(jobs[:2], "threads") is None
+    assert sp.ThreadScaler.fit(jobs, "missing") is None
+
+    single_thread = [replace(job, numerics={**job.numerics, "threads": 4}) for job in jobs]
+    assert sp.ThreadScaler.fit(single_thread, "threads") is None
+
+    # only completed jobs are used
+    failed = [replace(job, outcome="oom") for job in jobs]
+    assert sp.ThreadScaler.fit(failed, "threads") is None
+
+
+def test_ThreadScaler_save_load(tmp_path):
+    ts = sp.ThreadScaler(memory_per_thread=12.5, runtime_overhead=1.1, memory_overhead=1.05, thread_range=(2, 8))
+    ts.save(tmp_path / "ThreadScaler" / "rule.json")
+    assert sp.ThreadScaler.load(tmp_path / "ThreadScaler" / "rule.json") == ts
+
+    ts = sp.ThreadScaler(memory_per_thread=12.5, runtime_overhead=3.2, fractional=True)
+    ts.save(tmp_path / "ThreadScaler" / "rule.json")
+    assert sp.ThreadScaler.load(tmp_path / "ThreadScaler" / "rule.json").fractional is True
+
+
+def brute_force_threads(ts, jd, current_threads):
+    best = None
+    for threads in range(ts.thread_range[0], ts.thread_range[1] + 1):
+        runtime = jd.runtime * current_threads / threads * ts.runtime_overhead ** (threads - 1)
+        core_hours = runtime * threads / 60
+        if ts.objective == "core_hours":
+            key = (core_hours,)
+        elif ts.core_hour_budget is not None and core_hours > ts.core_hour_budget:
+            key = (1, core_hours)
+        else:
+            key = (0, runtime)
+        if best is None or key < best[0]:
+            best = (key, threads)
+    return best[1]
+
+
+@pytest.mark.parametrize("runtime_overhead", [1, 1.02, 1.1, 1.5])
+@pytest.mark.parametrize(
+    ("objective", "core_hour_budget"),
+    [("core_hours", None), ("walltime", None), ("walltime", 2), ("walltime", 5), ("walltime", 0.1)],
+)
+def test_ThreadScaler_objectives(runtime_overhead, objective, core_hour_budget):
+    ts = sp.ThreadScaler(
+        memory_per_thread=10,
+        runtime_overhead=runtime_overhead,
+        objective=objective,
+        core_hour_budget=core_hour_budget,
+    )
+    for runtime in (30, 60, 240):
+        for current_threads in (1, 4):
+            jd = JobData(job_name="test", memory=100, runtime=runtime)
+            threads = ts.choose_threads(jd, current_threads)
+            assert threads == brute_force_threads(ts, jd, current_threads)
+
+            result_jd, result_threads = ts.update_job_data(jd, current_threads)
+            assert result_threads == threads
+            assert result_jd.runtime == int(runtime * current_threads / threads * runtime_overhead ** (threads - 1))
+            assert result_jd.memory == 100
+
+
+def test_ThreadScaler_core_hours():
+    # without overhead, all threads use the same core hours, take the fewest
+    ts = sp.ThreadScaler(memory_per_thread=10, objective="core_hours")
+    assert ts.choose_threads(JobData(job_name="test", memory=100, runtime=100), 4) == 1
+
+    # without overhead and a budget, use as many threads as possible
+    ts = sp.ThreadScaler(memory_per_thread=10, objective="walltime")
+    assert ts.choose_threads(JobData(job_name="test", memory=100, runtime=100), 4) == 20
+
+    # 1 hour on one thread, each thread adds 10%
+    ts = sp.ThreadScaler(memory_per_thread=10, runtime_overhead=1.1, objective="walltime", core_hour_budget=1.5)
+    runtime, _ = ts.scale(JobData(job_name="test", memory=100, runtime=60), 1, np.arange(1, 21))
+    threads = ts.choose_threads(JobData(job_name="test", memory=100, runtime=60), 1)
+    assert threads == 5  # 1.1 ** 4 = 1.46 core hours
+    assert runtime[threads - 1] == runtime[runtime * np.arange(1, 21) / 60 <= 1.5].min()
+
+    with pytest.raises(ValueError, match="Unknown thread objective 'fastest'"):
+        sp.ThreadScaler(memory_per_thread=10, objective="fastest")
@@ -274,9 +274,13 @@ patch_snakemake_workflow(
             "--snakefile",
             snakefile,
             f"{snake_rule}.txt",
-        ]
+        ],
+        capture_output=True,
+        text=True,
     )
     assert result.returncode == 0
+    # the job was predicted when the DAG was built
+    assert "SLURMISE: Predicted 1 jobs" in result.stderr
     outfile = snakefile.parent / f"{snake_rule}.txt"
     output = outfile.read_text().split("\n")
     assert output[0] == "runtime 30"
@@ -324,9 +328,13 @@ patch_snakemake_workflow(
             "--snakefile",
             snakefile,
             f"{snake_rule}.txt",
-        ]
+        ],
+        capture_output=True,
+        text=True,
     )
     assert result.returncode == 0
+    # the job was predicted when the DAG was built
+    assert "SLURMISE: Predicted 1 jobs" in result.stderr
     outfile = snakefile.parent / f"{snake_rule}.txt"
     output = outfile.read_text().split("\n")
     assert output[0] == "runtime 30"
@@ -571,3 +579,357 @@ patch_snakemake_workflow(
 # TODO: rules with
 # pipes
 # benchmarks  (should error)
+
+
+@pytest.mark.skipif(not has_snakemake(), reason="Requires snakemake")
+def test_prediction_memo(simple_toml):
+    from types import SimpleNamespace
+
+    # snakemake.workflow can only be imported after the api
+    import snakemake.api  # noqa: F401
+    from snakemake.io import InputFiles, Wildcards
+
+    from slurmise.extras.snake_patching import PredictionMemo
+
+    calls = {"variables": 0, "parse": 0, "predict": 0}
+    slurmise = Slurmise(simple_toml.toml)
+
+    class CountingSlurmise:
+        def job_data_from_dict(self, *args, **kwargs):
+            calls["parse"] += 1
+            return slurmise.job_data_from_dict(*args, **kwargs)
+
+        def raw_predict(self, *args, **kwargs):
+            calls["predict"] += 1
+            return slurmise.raw_predict(*args, **kwargs)
+
+    def get_threads(rule, wildcards, input):
+        calls["variables"] += 1
+        return int(wildcards.threads)
+
+    memo = PredictionMemo(CountingSlurmise())
+    rule = SimpleNamespace(name="nupack")
+    variables = {
+        "threads": get_threads,
+        "complexity": lambda rule, wildcards, input: "low",
+        "SLURMISE_memory_scale": 1,
+    }
+    wildcards = Wildcards(fromdict={"threads": "3"})
+    inputs = InputFiles(["in.txt"])
+
+    job_data = memo.job_data(variables, rule, wildcards, inputs)
+    assert job_data.numerics == {"threads": 3}
+    assert job_data.categories == {"complexity": "low"}
+    # callers can modify the result without changing the memo
+    job_data.numerics.clear()
+
+    for _ in range(3):
+        prediction = memo.prediction(variables, rule, wildcards, inputs)
+        assert prediction.numerics == {"threads": 3}
+        assert prediction.memory is not None
+        assert prediction.runtime is not None
+    assert calls == {"variables": 1, "parse": 1, "predict": 1}
+
+    # different wildcards are a new job
+    memo.prediction(variables, rule, Wildcards(fromdict={"threads": "4"}), inputs)
+    assert calls == {"variables": 2, "parse": 2, "predict": 2}
+
+    memo.clear()
+    memo.prediction(variables, rule, wildcards, inputs)
+    assert calls == {"variables": 3, "parse": 3, "predict": 3}
+
+
+@pytest.mark.skipif(not has_snakemake(), reason="Requires snakemake")
+def test_prediction_memo_prefetch(simple_toml):
+    from types import SimpleNamespace
+
+    # snakemake.workflow can only be imported after the api
+    import snakemake.api  # noqa: F401
+    from snakemake.io import InputFiles, Wildcards
+
+    from slurmise.extras.snake_patching import PredictionMemo
+
+    calls = {"parse": 0, "predict": 0, "batch": 0}
+    slurmise = Slurmise(simple_toml.toml)
+
+    class CountingSlurmise:
+        def job_data_from_dict(self, *args, **kwargs):
+            calls["parse"] += 1
+            return slurmise.job_data_from_dict(*args, **kwargs)
+
+        def raw_predict(self, *args, **kwargs):
+            calls["predict"] += 1
+            return slurmise.raw_predict(*args, **kwargs)
+
+        def batch_raw_predict(self, *args, **kwargs):
+            calls["batch"] += 1
+            return slurmise.batch_raw_predict(*args, **kwargs)
+
+    def get_threads(rule, wildcards, input):
+        if wildcards.threads == "bad":
+            raise ValueError("not a thread")
+        return int(wildcards.threads)
+
+    memo = PredictionMemo(CountingSlurmise())
+    rule = SimpleNamespace(name="nupack")
+    variables = {
+        "threads": get_threads,
+        "complexity": lambda rule, wildcards, input: "low",
+    }
+    inputs = InputFiles(["in.txt"])
+    jobs = [(variables, rule, Wildcards(fromdict={"threads": str(threads)}), inputs) for threads in range(1, 6)]
+
+    assert memo.prefetch([*jobs, (variables, rule, Wildcards(fromdict={"threads": "bad"}), inputs)]) == 5
+    assert calls == {"parse": 5, "predict": 0, "batch": 1}
+
+    for variables, rule, wildcards, inputs in jobs:
+        prediction = memo.prediction(variables, rule, wildcards, inputs)
+        assert prediction.numerics == {"threads": int(wildcards.threads)}
+        assert prediction.memory is not None
+    assert calls == {"parse": 5, "predict": 0, "batch": 1}
+
+    # predicted jobs are skipped
+    assert memo.prefetch(jobs) == 0
+
+    assert memo.refresh() == 5
+    assert calls == {"parse": 5, "predict": 0, "batch": 3}
+
+    # the failed job raises when snakemake evaluates it
+    with pytest.raises(ValueError, match="not a thread"):
+        memo.prediction(variables, rule, Wildcards(fromdict={"threads": "bad"}), inputs)
+
+
+@pytest.mark.skipif(not has_snakemake(), reason="Requires snakemake")
+def test_patch_unknown_model_refresh(simple_toml):
+    # snakemake.workflow can only be imported after the api
+    import snakemake.api  # noqa: F401
+
+    from slurmise.extras.snake_patching import patch_snakemake_workflow
+
+    with pytest.raises(ValueError, match="Unknown model_refresh 'sometimes'"):
+        patch_snakemake_workflow(Slurmise(simple_toml.toml), None, {}, model_refresh="sometimes")
+
+
+@pytest.mark.skipif(not has_snakemake(), reason="Requires snakemake")
+def test_patch_without_build_dag(simple_toml, monkeypatch):
+    from types import SimpleNamespace
+
+    # snakemake.workflow can only be imported after the api
+    import snakemake.api  # noqa: F401
+
+    from slurmise.extras import snake_patching
+
+    warnings = []
+    monkeypatch.setattr(snake_patching.logger, "warning", warnings.append)
+    workflow = SimpleNamespace(output_settings=SimpleNamespace(benchmark_extended=False))
+    for hook in ("onstart", "onsuccess", "onerror"):
+        setattr(workflow, f"_{hook}", lambda log: None)
+        setattr(workflow, hook, lambda func, hook=hook: setattr(workflow, f"_{hook}", func))
+
+    # jobs are predicted as snakemake requests them
+    snake_patching.patch_snakemake_workflow(Slurmise(simple_toml.toml), workflow, {})
+    assert not hasattr(workflow, "_build_dag")
+    assert len(warnings) == 1
+    assert "predicting each job" in warnings[0]
+    assert workflow.output_settings.benchmark_extended
+
+
+@pytest.mark.skipif(not has_snakemake(), reason="Requires snakemake")
+def test_record_benchmark_dir(simple_toml, tmp_path):
+    # snakemake.workflow can only be imported after the api
+    import snakemake.api  # noqa: F401
+
+    from slurmise.extras.snake_patching import record_benchmark_dir
+
+    benchmark_dir = tmp_path / "benchmarks"
+    (benchmark_dir / "nupack").mkdir(parents=True)
+    for threads in range(1, 6):
+        slurmise_data = {"categories": {"complexity": "simple"}, "numerics": {"SLURMISETHREAD_threads": 8}}
+        benchmark = {
+            "rule_name": "nupack",
+            "s": str(60 * threads),
+            "max_rss": "NA" if threads == 5 else str(100 * threads),
+            "threads": threads,
+            "params": {"slurmise_data": json.dumps(slurmise_data)},
+        }
+        (benchmark_dir / "nupack" / f"threads:{threads}.jsonl").write_text(json.dumps(benchmark))
+    (benchmark_dir / "nupack" / "truncated.jsonl").write_text('{"rule_name": "nu')
+    (benchmark_dir / "nupack" / "no_params.jsonl").write_text('{"rule_name": "nupack"}')
+    invalid = {"rule_name": "nupack", "s": "-", "max_rss": "100", "threads": 1, "params": {"slurmise_data": "{}"}}
+    (benchmark_dir / "nupack" / "invalid.jsonl").write_text(json.dumps(invalid))
+
+    slurmise = Slurmise(simple_toml.toml)
+    # the benchmark without a measured memory is skipped
+    assert record_benchmark_dir(slurmise, benchmark_dir, max_workers=2) == 4
+
+    with JobDatabase.get_database(slurmise.configuration.db_filename) as database:
+        db = list(database.iterate_database())
+    assert len(db) == 1
+    query, jobs = db[0]
+    assert query.categories == {"complexity": "simple"}
+    assert sorted((job.numerics["threads"], job.runtime, job.memory) for job in jobs) == [
+        (1, 1, 100),
+        (2, 2, 200),
+        (3, 3, 300),
+        (4, 4, 400),
+    ]
+
+    # already recorded
+    assert record_benchmark_dir(slurmise, benchmark_dir) == 0
+
+
+@pytest.mark.skipif(not has_snakemake(), reason="Requires snakemake")
+def test_snakemake_slurmise_records_failures(tmp_path):
+    toml = make_slurmise_toml(
+        tmp_path,
+        append="""
+[slurmise.job.flaky_rule]
+default_mem = 1000
+default_time = 30
+variables.sample = "category"
+
+[slurmise.job.failing_rule]
+default_mem = 1000
+default_time = 30
+variables.sample = "category"
+    """,
+    )
+    snakefile = make_snakefile(
+        tmp_path,
+        slurmise_toml=toml,
+        append="""
+# ran out of memory on the first attempt
+rule flaky_rule:
+    output:
+        "flaky_{sample}.txt"
+    log:
+        "logs/flaky_{sample}.log"
+    shell:
+        "if [ -e flaky_marker ]; then echo done > {output}; "
+        "else touch flaky_marker; echo 'slurmstepd: error: Detected 1 oom_kill event' > {log}; exit 1; fi"
+
+rule failing_rule:
+    output:
+        "failing_{sample}.txt"
+    log:
+        "logs/failing_{sample}.log"
+    shell:
+        "echo 'CANCELLED AT 2024-01-01 DUE TO TIME LIMIT' > {log}; exit 1"
+
+patch_snakemake_workflow(
+        slurmise,
+        workflow,
+        {
+            "flaky_rule": {
+                "sample": sp.wildcards("sample"),
+                "SLURMISE_runtime_scale": 1,
+                "SLURMISE_memory_scale": 1,
+            },
+            "failing_rule": {
+                "sample": sp.wildcards("sample"),
+                "SLURMISE_runtime_scale": 1,
+                "SLURMISE_memory_scale": 1,
+                "SLURMISE_attempt_exp": 2,
+            },
+        },
+        )
+""",
+    )
+
+    result = subprocess.run(
+        [
+            "snakemake",
+            "--cores",
+            "1",
+            "--retries",
+            "1",
+            "--keep-going",
+            "--snakefile",
+            snakefile,
+            "flaky_a.txt",
+            "failing_a.txt",
+        ],
+        check=False,
+    )
+    assert result.returncode != 0
+    assert (tmp_path / "flaky_a.txt").exists()
+
+    slurmise = Slurmise(toml)
+    with JobDatabase.get_database(slurmise.configuration.db_filename) as database:
+        jobs = {query.job_name: jobs for query, jobs in database.iterate_database()}
+
+    # completed job and its first attempt
+    assert sorted(
+        (job.outcome, job.memory, job.runtime) for job in jobs["flaky_rule"] if job.outcome != "completed"
+    ) == [("oom", 1000, 30)]
+    assert [job.outcome for job in jobs["flaky_rule"]].count("completed") == 1
+
+    # both attempts of the failing job
+    assert sorted((job.outcome, job.memory, job.runtime) for job in jobs["failing_rule"]) == [
+        ("timeout", 1000, 30),
+        ("timeout", 4000, 120),
+    ]
+    assert all(job.categories == {"sample": "a"} for job in jobs["failing_rule"])
+
+
+@pytest.mark.skipif(not has_snakemake(), reason="Requires snakemake")
+def test_snakemake_slurmise_thread_scaling(tmp_path):
+    toml = make_slurmise_toml(tmp_path)
+    snakefile = make_snakefile(
+        tmp_path,
+        slurmise_toml=toml,
+        append="""
+patch_snakemake_workflow(
+        slurmise,
+        workflow,
+        {
+            "shell_rule": {
+                "threads": sp.threads(),
+                "SLURMISE_runtime_scale": 1,
+                "SLURMISE_memory_scale": 1,
+                "SLURMISE_thread_scaling": 200,
+            },
+            "run_rule": {
+                "threads": sp.threads(),
+                "SLURMISE_runtime_scale": 1,
+                "SLURMISE_memory_scale": 1,
+                "SLURMISE_thread_scaling": sp.ThreadScaler(memory_per_thread=1, runtime_overhead=1.5),
+                "SLURMISE_thread_objective": "core_hours",
+            },
+        },
+        )
+""",
+    )
+
+    result = subprocess.run(
+        [
+            "snakemake",
+            "--cores",
+            "4",
+            "--snakefile",
+            snakefile,
+            "shell.txt",
+            "run.txt",
+        ],
+        check=False,
+    )
+    assert result.returncode == 0
+
+    # 5 threads from memory per thread, limited to 4 by the available cores
+    output = (tmp_path / "shell.txt").read_text().split("\n")
+    assert output[0] == "runtime 8"  # 30 minutes on 4 threads, rounded
+    assert output[1] == "memory 1000"
+    assert output[2] == "threads 4"
+
+    # any extra thread costs more core hours
+    output = (tmp_path / "run.txt").read_text().split("\n")
+    assert output[0] == "runtime 30"
+    assert output[1] == "memory 1000"
+    assert output[2] == "threads 1"
+
+    # the benchmark records the threads that were used
+    slurmise = Slurmise(toml)
+    with JobDatabase.get_database(slurmise.configuration.db_filename) as database:
+        jobs = {query.job_name: jobs for query, jobs in database.iterate_database()}
+    assert jobs["shell_rule"][0].numerics == {"threads": 4}
+    assert jobs["run_rule"][0].numerics == {"threads": 1}
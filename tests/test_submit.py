@@ -0,0 +1,149 @@
+import json
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from slurmise import submit
+from slurmise.__main__ import main
+from slurmise.api import Slurmise
+from tests.test_slurm import generate_job_metadata, generate_job_parsable
+
+FAKE_SBATCH = """#!{python}
+import json, os, sys
+with open(os.environ["FAKE_SBATCH_LOG"], "a") as log:
+    log.write(json.dumps(sys.argv[1:]) + "\\n")
+print("Submitted batch job 1234")
+"""
+
+
+@pytest.fixture
+def fake_sbatch_log(tmp_path, monkeypatch):
+    """A fake sbatch on PATH which logs its arguments to the returned file."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "sbatch"
+    script.write_text(FAKE_SBATCH.format(python=sys.executable))
+    script.chmod(0o755)
+    log = tmp_path / "sbatch.log"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_SBATCH_LOG", str(log))
+    return log
+
+
+def test_split_script():
+    args = ["-p", "cpu", "-c4", "--exclusive", "-vv", "--mem", "4G", "--requeue", "job.sh", "-t", "3"]
+    assert submit.split_script(args) == (args[:8], ["job.sh", "-t", "3"])
+    assert submit.split_script(["--account=abc", "-H"]) == (["--account=abc", "-H"], [])
+
+
+def test_sbatch_arguments():
+    args = ["-p", "cpu", "--mem-per-cpu=2G", "-t", "10", "--time", "1:00:00", "-t20", "job.sh", "--mem", "3"]
+    assert submit.sbatch_arguments(args, 1200, 72) == [
+        *("--mem=1200M", "--time=72", "-p", "cpu"),
+        *("job.sh", "--mem", "3"),
+    ]
+    assert submit.sbatch_arguments(["--mem", "4G", "-c", "2"], 1200, 72, wrap="nupack monomer") == [
+        *("--mem=1200M", "--time=72", "-c", "2"),
+        "--wrap=nupack monomer",
+    ]
+    with pytest.raises(ValueError, match="batch script"):
+        submit.sbatch_arguments(["job.sh"], 1200, 72, wrap="nupack monomer")
+
+
+def test_scale_allocation():
+    assert submit.scale_allocation(1000, 60) == (1000, 60)
+    assert submit.scale_allocation(1000.5, 0.1, memory_factor=1.2, time_factor=1.5) == (1201, 1)
+    assert submit.scale_allocation(1000, 60, 1.2, 1.5, escalation=2, attempt=3) == (4800, 360)
+    with pytest.raises(ValueError, match="counted from 1"):
+        submit.scale_allocation(1000, 60, attempt=0)
+
+
+def test_sbatch_command(simple_toml):
+    slurmise = Slurmise(simple_toml.toml)
+    command, warns = slurmise.sbatch_command("nupack monomer -T 2 -C simple", ["-c", "2", "job.sh"])
+    # defaults of 1000 MB and 60 minutes with the default factors
+    assert command == ["sbatch", "--mem=1200M", "--time=72", "-c", "2", "job.sh"]
+    assert warns
+
+    command, _ = slurmise.sbatch_command("nupack monomer -T 2 -C simple", attempt=2, wrap=True)
+    assert command == ["sbatch", "--mem=2400M", "--time=144", "--wrap=nupack monomer -T 2 -C simple"]
+
+
+def test_sbatch_command_factors(tmp_path):
+    toml = tmp_path / "slurmise.toml"
+    toml.write_text(
+        f"""
+    [slurmise]
+    base_dir = "{tmp_path / "slurmise_dir"}"
+    time_factor = 2
+    retry_escalation = 1.5
+
+    [slurmise.job.nupack]
+    job_spec = "monomer -T {{threads:numeric}}"
+    memory_factor = 1.0
+    default_mem = 500
+    """
+    )
+    command, _ = Slurmise(toml).sbatch_command("nupack monomer -T 2", attempt=2, wrap=True)
+    assert command[1:3] == ["--mem=750M", "--time=180"]
+
+
+def test_sbatch_command_model(nupack_toml):
+    slurmise = Slurmise(nupack_toml.toml)
+    slurmise.update_model("nupack monomer -c 2 -S 30", None)
+    predicted, _ = slurmise.predict("nupack monomer -c 2 -S 30", None)
+
+    command, _ = slurmise.sbatch_command("nupack monomer -c 2 -S 30", wrap=True)
+    assert command[1:3] == [
+        f"--mem={math.ceil(predicted.memory * 1.2)}M",
+        f"--time={math.ceil(predicted.runtime * 1.2)}",
+    ]
+
+
+def test_sbatch_command_sacct_recorded(simple_toml, fake_sacct_bin):
+    slurmise = Slurmise(simple_toml.toml)
+    for job_id in range(1, 21):
+        # sacct reports the elapsed seconds, one to five hours
+        elapsed = 3600 * (job_id * 7 % 5 + 1)
+        metadata = generate_job_metadata(job_id=job_id, elapsed=elapsed)
+        fake_sacct_bin.add_job(job_id, metadata, generate_job_parsable(job_id=job_id, elapsed=elapsed))
+        slurmise.record(f"nupack monomer -T {job_id % 4 + 1} -C simple", slurm_id=str(job_id))
+    slurmise.update_model("nupack monomer -T 2 -C simple", None)
+
+    predicted, warns = slurmise.predict("nupack monomer -T 2 -C simple", None)
+    assert not any("runtime" in warn.lower() for warn in warns)
+    assert 60 <= predicted.runtime <= 300
+    command, _ = slurmise.sbatch_command("nupack monomer -T 2 -C simple", wrap=True)
+    # the time is in minutes, with the default factor of 1.2
+    assert command[2] == f"--time={math.ceil(predicted.runtime * 1.2)}"
+
+
+def test_sbatch_cli(simple_toml, fake_sbatch_log):
+    runner = CliRunner()
+    args = ["--toml", simple_toml.toml, "sbatch", "--dry-run", "nupack monomer -T 2 -C simple", "--job-name", "x"]
+    result = runner.invoke(main, args)
+    assert result.exit_code == 0
+    # options after the command are passed to sbatch
+    assert result.stdout.strip() == "sbatch --mem=1200M --time=72 --job-name x"
+
+    result = runner.invoke(
+        main, ["--toml", simple_toml.toml, "sbatch", "--wrap", "nupack monomer -T 2 -C simple", "job.sh"]
+    )
+    assert result.exit_code == 2
+    assert "batch script" in result.output
+
+    # sbatch replaces the slurmise process
+    result = subprocess.run(
+        [sys.executable, "-m", "slurmise", "-t", simple_toml.toml, "sbatch", "--attempt", "2"]
+        + ["nupack monomer -T 2 -C simple", "-p", "cpu", "job.sh", "--mem", "1"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout == "Submitted batch job 1234\n"
+    calls = [json.loads(line) for line in fake_sbatch_log.read_text().splitlines()]
+    assert calls == [["--mem=2400M", "--time=144", "-p", "cpu", "job.sh", "--mem", "1"]]